@@ -1,27 +1,39 @@
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
 from datetime import datetime
-import json
-import os
+from policy_store import open_record_store, append_together
+from metrics import STORE_WRITE_SECONDS
+from tracing import span
 
 class ApprovalManager:
-    def __init__(self, approval_file='policy_approvals.json'):
+    def __init__(self, approval_file='policy_approvals.json', fsync=None, backend=None, db_path=None):
         self.approval_file = approval_file
-        self.approvals = self._load_approvals()
+        self.store = open_record_store(approval_file, 'approvals', fsync=fsync,
+                                       backend=backend, db_path=db_path)
     
-    def _load_approvals(self):
-        if os.path.exists(self.approval_file):
-            with open(self.approval_file, 'r') as f:
-                return json.load(f)
-        return []
-    
-    def _save_approvals(self):
-        with open(self.approval_file, 'w') as f:
-            json.dump(self.approvals, f, indent=2)
+    @property
+    def approvals(self) -> List[Dict]:
+        return self.store.all()
     
     def approve_policy(self, policy_data: Dict, user_feedback: str = "") -> int:
         """Approve a policy and save it"""
-        approval_entry = {
-            'id': len(self.approvals),
+        with span('persist', STORE_WRITE_SECONDS, operation='approve'):
+            return self.store.append(self._approval_entry(policy_data, user_feedback))
+    
+    def approve_with_history(self, policy_data: Dict, history, user_feedback: str = "") -> Tuple[int, int]:
+        """Approve a policy and record it in history together (atomically on SQLite)"""
+        with span('persist', STORE_WRITE_SECONDS, operation='approve_with_history'):
+            approval_id, history_id = append_together([
+                (self.store, self._approval_entry(policy_data, user_feedback)),
+                (history.store, history.new_entry(
+                    policy_data.get('requirement', ''),
+                    policy_data.get('policy', ''),
+                    policy_data.get('rationale', [])
+                ))
+            ])
+        return approval_id, history_id
+    
+    def _approval_entry(self, policy_data: Dict, user_feedback: str) -> Dict:
+        return {
             'timestamp': datetime.now().isoformat(),
             'status': 'APPROVED',
             'requirement': policy_data.get('requirement', ''),
@@ -30,15 +42,10 @@ class ApprovalManager:
             'validation': policy_data.get('validation', {}),
             'user_feedback': user_feedback
         }
-        
-        self.approvals.append(approval_entry)
-        self._save_approvals()
-        return approval_entry['id']
     
     def reject_policy(self, policy_data: Dict, rejection_reason: str) -> int:
         """Reject a policy with reason"""
         rejection_entry = {
-            'id': len(self.approvals),
             'timestamp': datetime.now().isoformat(),
             'status': 'REJECTED',
             'requirement': policy_data.get('requirement', ''),
@@ -48,15 +55,15 @@ class ApprovalManager:
             'rejection_reason': rejection_reason
         }
         
-        self.approvals.append(rejection_entry)
-        self._save_approvals()
-        return rejection_entry['id']
+        with span('persist', STORE_WRITE_SECONDS, operation='reject'):
+            return self.store.append(rejection_entry)
     
     def get_approval_stats(self) -> Dict:
         """Get approval/rejection statistics"""
-        total = len(self.approvals)
-        approved = len([a for a in self.approvals if a['status'] == 'APPROVED'])
-        rejected = len([a for a in self.approvals if a['status'] == 'REJECTED'])
+        counts = self.store.status_counts()
+        total = sum(counts.values())
+        approved = counts.get('APPROVED', 0)
+        rejected = counts.get('REJECTED', 0)
         
         return {
             'total_policies': total,
@@ -65,10 +72,15 @@ class ApprovalManager:
             'approval_rate': (approved / total * 100) if total > 0 else 0
         }
     
+    def get_approvals(self, status: str = None, since: str = None, cursor: int = None,
+                      limit: int = 100):
+        """Get one page of approvals, returning (entries, next_cursor)"""
+        return self.store.query(status=status, since=since, cursor=cursor, limit=limit)
+    
     def get_approved_policies(self) -> List[Dict]:
         """Get all approved policies"""
-        return [a for a in self.approvals if a['status'] == 'APPROVED']
+        return self.store.query(status='APPROVED')[0]
     
     def get_rejection_feedback(self) -> List[str]:
         """Get all rejection reasons for improvement"""
-        return [a.get('rejection_reason', '') for a in self.approvals if a['status'] == 'REJECTED' and a.get('rejection_reason')]
\ No newline at end of file
+        return [a.get('rejection_reason', '') for a in self.store.query(status='REJECTED')[0] if a.get('rejection_reason')]
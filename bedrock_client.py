@@ -1,32 +1,105 @@
-import boto3
 import json
 import os
+import threading
+import time
+from cassette import Cassette, replay_chunks
+from hedging import hedger
+from metrics import MODEL_CALLS
 
-def generate_text(prompt):
+MODEL_ID = 'anthropic.claude-3-haiku-20240307-v1:0'
+MAX_TOKENS = 1000
+# live (default), record (live calls are also written to the cassette) or replay
+BEDROCK_MODES = ('live', 'record', 'replay')
+
+_client = None
+_client_lock = threading.Lock()
+_cassettes = {}
+
+def get_client():
+    """Bedrock runtime client, created on first use.
+
+    boto3 takes a few hundred milliseconds to import, so it is only loaded
+    when a model call is actually made; the client is then reused.
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                import boto3
+                _client = boto3.client('bedrock-runtime', region_name='us-east-1')
+    return _client
+
+def bedrock_mode():
+    mode = os.environ.get('BEDROCK_MODE', 'live')
+    if mode not in BEDROCK_MODES:
+        raise ValueError(f"Unknown BEDROCK_MODE {mode!r}, expected one of {BEDROCK_MODES}")
+    return mode
+
+def get_cassette():
+    """Cassette named by BEDROCK_CASSETTE, shared by every call in the process"""
+    path = os.environ.get('BEDROCK_CASSETTE', 'bedrock_cassette.jsonl')
+    with _client_lock:
+        if path not in _cassettes:
+            _cassettes[path] = Cassette(path, fallback=os.environ.get('BEDROCK_REPLAY_FALLBACK'))
+        return _cassettes[path]
+
+def replay_timing():
+    return os.environ.get('BEDROCK_REPLAY_TIMING', '').lower() in ('1', 'true')
+
+def request_body(prompt, max_tokens=None):
+    return json.dumps({
+        "anthropic_version": "bedrock-2023-05-31",
+        "max_tokens": max_tokens or MAX_TOKENS,
+        "messages": [
+            {"role": "user", "content": prompt}
+        ]
+    })
+
+def invoke(prompt, model_id, max_tokens=None):
+    response = get_client().invoke_model(
+        body=request_body(prompt, max_tokens),
+        modelId=model_id,
+        contentType='application/json'
+    )
+    result = json.loads(response['body'].read())
+    return result['content'][0]['text']
+
+def generate_text(prompt, model_id=None, max_tokens=None):
+    """Model response for the prompt; model_id and max_tokens default to MODEL_ID and MAX_TOKENS"""
+    model_id = model_id or MODEL_ID
+    mode = bedrock_mode()
+    if mode == 'replay':
+        return ''.join(replay(prompt, model_id))
     try:
-        client = boto3.client('bedrock-runtime', region_name='us-east-1')
-        
-        body = json.dumps({
-            "anthropic_version": "bedrock-2023-05-31",
-            "max_tokens": 1000,
-            "messages": [
-                {"role": "user", "content": prompt}
-            ]
-        })
-        
-        response = client.invoke_model(
-            body=body,
-            modelId='anthropic.claude-3-haiku-20240307-v1:0',
-            contentType='application/json'
-        )
-        
-        result = json.loads(response['body'].read())
-        return result['content'][0]['text']
+        started = time.perf_counter()
+        # Slow calls are duplicated when BEDROCK_HEDGE_PERCENTILE is set
+        text = hedger.call(model_id, lambda: invoke(prompt, model_id, max_tokens))
+        MODEL_CALLS.inc(outcome='success')
+        if mode == 'record':
+            latency = time.perf_counter() - started
+            get_cassette().record(prompt, model_id, [{'t': round(latency, 4), 'text': text}], latency)
+        return text
         
     except Exception as e:
         # Fallback for demo without AWS credentials
+        MODEL_CALLS.inc(outcome='throttle' if is_throttle(e) else 'fallback')
         return generate_mock_policy(prompt)
 
+def replay(prompt, model_id=None):
+    """Chunks recorded for this prompt; the mock policy if it was never recorded"""
+    entry = get_cassette().lookup(prompt, model_id)
+    if entry is None:
+        MODEL_CALLS.inc(outcome='replay_miss')
+        return iter([generate_mock_policy(prompt)])
+    MODEL_CALLS.inc(outcome='replay')
+    return replay_chunks(entry, replay_timing())
+
+def is_throttle(error):
+    """Whether Bedrock refused the call for exceeding the request quota"""
+    response = getattr(error, 'response', None)
+    code = response.get('Error', {}).get('Code', '') if isinstance(response, dict) else ''
+    return code in ('ThrottlingException', 'TooManyRequestsException') or 'Throttl' in type(error).__name__
+
 def generate_mock_policy(prompt):
     """Generate mock policy for demo purposes when AWS is not available"""
     return """POLICY:
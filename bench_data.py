@@ -0,0 +1,122 @@
+"""Synthetic Cedar schemas, policy sets and histories for benchmarks.
+
+Everything is generated from a seeded ``random.Random``, so a given size and
+seed always produce the same data and benchmark runs stay comparable.
+"""
+
+import json
+import random
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List
+
+NOUNS = ['Account', 'Transaction', 'Document', 'Report', 'Loan', 'Card', 'Statement',
+         'Payment', 'Invoice', 'Ledger', 'Branch', 'Portfolio', 'Claim', 'Contract']
+AMOUNT_ATTRIBUTES = ['amount', 'balance', 'limit', 'riskScore', 'value']
+STRING_ATTRIBUTES = ['status', 'region', 'category', 'currency', 'channel']
+OWNER_ATTRIBUTES = ['ownerId', 'createdBy', 'assignedTo']
+ROLES = ['AccountHolder', 'Teller', 'Manager', 'Auditor', 'Admin']
+STATUSES = ['APPROVED', 'APPROVED', 'APPROVED', 'REJECTED', 'PENDING']
+HISTORY_START = datetime(2024, 1, 1)
+HISTORY_STEP = timedelta(seconds=30)
+
+
+def entity_names(count: int) -> List[str]:
+    """``count`` distinct entity type names; the first few are User, Role and the plain nouns"""
+    names = ['User', 'Role'] + NOUNS
+    suffix = 1
+    while len(names) < count:
+        names.extend(f'{noun}{suffix}' for noun in NOUNS)
+        suffix += 1
+    return names[:max(count, 2)]
+
+
+def make_schema(entities: int, seed: int = 0) -> Dict:
+    """Schema with ``entities`` entity types and View/Modify (and some Create) actions per resource type.
+
+    Users are members of Role; about a third of resource types belong to a
+    parent type, and each has a mix of Long, String and owner attributes.
+    """
+    rng = random.Random(seed)
+    names = entity_names(entities)
+    entity_types = {
+        'User': {'memberOfTypes': ['Role'], 'shape': {'type': 'Record', 'attributes': {
+            'userId': {'type': 'String'}, 'role': {'type': 'String'}, 'department': {'type': 'String'}}}},
+        'Role': {'memberOfTypes': [], 'shape': {'type': 'Record', 'attributes': {}}}
+    }
+    actions = {}
+    resources = names[2:]
+    for i, name in enumerate(resources):
+        attributes = {attr: {'type': 'Long'} for attr in rng.sample(AMOUNT_ATTRIBUTES, rng.randint(0, 2))}
+        attributes.update({attr: {'type': 'String'} for attr in rng.sample(STRING_ATTRIBUTES, rng.randint(1, 2))})
+        if rng.random() < 0.6:
+            attributes[rng.choice(OWNER_ATTRIBUTES)] = {'type': 'String'}
+        parents = [resources[rng.randrange(i)]] if i and rng.random() < 0.3 else []
+        entity_types[name] = {'memberOfTypes': parents, 'shape': {'type': 'Record', 'attributes': attributes}}
+
+        verbs = ['View', 'Modify'] + (['Create'] if rng.random() < 0.5 else [])
+        for verb in verbs:
+            actions[f'{verb}{name}'] = {'appliesTo': {'principalTypes': ['User'], 'resourceTypes': [name]}}
+    return {'entityTypes': entity_types, 'actions': actions}
+
+
+def write_schema(path: str, schema: Dict):
+    with open(path, 'w') as f:
+        json.dump(schema, f)
+
+
+def schema_context(schema: Dict) -> Dict:
+    """The dict SchemaParser.get_schema_context returns for ``schema``"""
+    return {
+        'entities': list(schema['entityTypes']),
+        'actions': list(schema['actions']),
+        'entity_details': schema['entityTypes'],
+        'action_details': schema['actions']
+    }
+
+
+def make_policy(rng: random.Random, schema: Dict, action: str = None) -> str:
+    action = action or rng.choice(list(schema['actions']))
+    resource_type = schema['actions'][action]['appliesTo']['resourceTypes'][0]
+    attributes = schema['entityTypes'][resource_type]['shape']['attributes']
+    effect = rng.choice(['permit', 'forbid'])
+    policy = f'{effect} (principal == User::"{rng.choice(ROLES)}", action == Action::"{action}", resource)'
+    longs = [name for name, attr in attributes.items() if attr['type'] == 'Long']
+    owners = [name for name in attributes if name in OWNER_ATTRIBUTES]
+    if longs and rng.random() < 0.7:
+        policy += f' when {{ resource.{rng.choice(longs)} >= {rng.randrange(100, 100000, 100)} }}'
+    elif owners:
+        policy += f' when {{ resource.{owners[0]} == principal.userId }}'
+    return policy + ';'
+
+
+def make_policies(schema: Dict, count: int, seed: int = 0, invalid_ratio: float = 0.1) -> List[str]:
+    """``count`` policies over the schema's actions; ``invalid_ratio`` of them reference unknown types"""
+    rng = random.Random(seed)
+    policies = []
+    for _ in range(count):
+        policy = make_policy(rng, schema)
+        if rng.random() < invalid_ratio:
+            policy = policy.replace('User::', 'Unknown::', 1)
+        policies.append(policy)
+    return policies
+
+
+def history_timestamp(index: int) -> str:
+    """Timestamp of the ``index``-th record from make_history"""
+    return (HISTORY_START + HISTORY_STEP * index).isoformat()
+
+
+def make_history(schema: Dict, count: int, seed: int = 0) -> Iterator[Dict]:
+    """``count`` history/approval records in timestamp order, generated lazily"""
+    rng = random.Random(seed)
+    actions = list(schema['actions'])
+    for i in range(count):
+        action = rng.choice(actions)
+        verb = 'Allow' if rng.random() < 0.5 else 'Deny'
+        yield {
+            'timestamp': history_timestamp(i),
+            'status': rng.choice(STATUSES),
+            'requirement': f'{verb} {rng.choice(ROLES)} to {action} when the amount is over {rng.randrange(100, 100000, 100)}',
+            'policy': make_policy(rng, schema, action),
+            'rationale': ['• Generated for benchmarks']
+        }
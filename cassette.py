@@ -0,0 +1,163 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional
+
+
+def prompt_hash(prompt: str) -> str:
+    return hashlib.sha256(prompt.encode('utf-8')).hexdigest()[:32]
+
+
+class Cassette:
+    """Recorded model calls in a JSON Lines file, for deterministic replays.
+
+    Each line holds the prompt hash, model id, the response as timed chunks
+    (``[{"t": seconds_since_request, "text": ...}]``; a non-streaming call
+    is one chunk) and the total latency. Replays look calls up by prompt
+    hash; a prompt recorded several times replays its responses in turn.
+    With ``fallback='cycle'``, prompts that were never recorded get the
+    recorded responses in file order, which replays real traffic against
+    different prompts.
+    """
+
+    def __init__(self, path: str, fallback: str = None):
+        self.path = path
+        self.fallback = fallback
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries = []
+        self._by_hash = {}
+        self._turns = {}
+        self._cycle = 0
+        self._loaded = False
+
+    def _load(self):
+        if self._loaded:
+            return
+        self._loaded = True
+        if not os.path.exists(self.path):
+            return
+        with open(self.path) as f:
+            for line in f:
+                try:
+                    self._add(json.loads(line))
+                except ValueError:
+                    continue
+
+    def _add(self, entry: Dict):
+        self._entries.append(entry)
+        self._by_hash.setdefault(entry['prompt_hash'], []).append(entry)
+
+    def __len__(self):
+        with self._lock:
+            self._load()
+            return len(self._entries)
+
+    def record(self, prompt: str, model_id: str, chunks: List[Dict], latency: float, **extra):
+        """Append one call; ``chunks`` are {'t', 'text'} dicts in arrival order"""
+        entry = {
+            'prompt_hash': prompt_hash(prompt),
+            'model_id': model_id,
+            'recorded_at': datetime.now().isoformat(),
+            'latency': round(latency, 4),
+            'chunks': chunks,
+            'prompt': prompt,
+            **extra
+        }
+        line = (json.dumps(entry) + '\n').encode('utf-8')
+        with self._lock:
+            self._load()
+            # One write on an O_APPEND descriptor, so lines from worker
+            # processes recording at the same time never interleave
+            fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, line)
+            finally:
+                os.close(fd)
+            self._add(entry)
+
+    def lookup(self, prompt: str, model_id: str = None) -> Optional[Dict]:
+        """Next recording of the prompt, preferring ones made with ``model_id``"""
+        with self._lock:
+            self._load()
+            key = prompt_hash(prompt)
+            entries = self._by_hash.get(key)
+            if entries and model_id:
+                same_model = [entry for entry in entries if entry.get('model_id') == model_id]
+                if same_model:
+                    entries = same_model
+                    key = (key, model_id)
+            if entries:
+                turn = self._turns.get(key, 0)
+                self._turns[key] = turn + 1
+                self.hits += 1
+                return entries[turn % len(entries)]
+            self.misses += 1
+            if self.fallback == 'cycle' and self._entries:
+                entry = self._entries[self._cycle % len(self._entries)]
+                self._cycle += 1
+                return entry
+            return None
+
+
+def replay_chunks(entry: Dict, timing: bool = False) -> Iterator[str]:
+    """Yield a recorded response's chunks, optionally at their original pace"""
+    started = time.perf_counter()
+    for chunk in entry['chunks']:
+        if timing:
+            delay = chunk['t'] - (time.perf_counter() - started)
+            if delay > 0:
+                time.sleep(delay)
+        yield chunk['text']
+    if timing:
+        remaining = entry.get('latency', 0) - (time.perf_counter() - started)
+        if remaining > 0:
+            time.sleep(remaining)
+
+
+def replay_text(entry: Dict, timing: bool = False) -> str:
+    return ''.join(replay_chunks(entry, timing))
+
+
+def seed_from_history(history_file: str, schema_file: str, path: str) -> int:
+    """Write a cassette whose responses are the policies already in history.
+
+    Prompts are rebuilt with the current prompt template, so replaying the
+    history's requirements serves the policies the model actually produced.
+    """
+    from history_manager import open_history_reader
+    from policy_generator import PolicyGenerator
+
+    generator = PolicyGenerator(schema_file)
+    schema_context = generator.parser.get_schema_context()
+    cassette = Cassette(path)
+    history = open_history_reader(history_file)
+    cursor = None
+    written = 0
+    while True:
+        page, cursor = history.query(cursor=cursor, limit=1000)
+        for entry in page:
+            rationale = entry.get('rationale') or []
+            if isinstance(rationale, str):
+                rationale = [rationale]
+            text = 'POLICY:\n' + entry.get('policy', '') + '\n\nRATIONALE:\n' + '\n'.join(rationale)
+            prompt = generator.build_prompt(entry.get('requirement', ''), '', schema_context)
+            cassette.record(prompt, 'history', [{'t': 0.0, 'text': text}], 0.0, source_id=entry.get('id'))
+            written += 1
+        if cursor is None:
+            return written
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Build a model response cassette from policy history')
+    parser.add_argument('--history', default='policy_history.json')
+    parser.add_argument('--schema', default='sample_banking_schema.json')
+    parser.add_argument('--out', default='bedrock_cassette.jsonl')
+    args = parser.parse_args()
+    print(f"Recorded {seed_from_history(args.history, args.schema, args.out)} responses to {args.out}")
@@ -1,67 +1,240 @@
 from typing import Dict, List, Optional
+from abc import ABC, abstractmethod
+from collections import OrderedDict, deque
 from datetime import datetime
+import os
+import sys
+import threading
 import uuid
+from conversation_context import default_builder, fold_message, new_summary
+
+DEFAULT_MAX_SESSIONS = int(os.environ.get('CHAT_MAX_SESSIONS', 1000))
+DEFAULT_MAX_MESSAGES = int(os.environ.get('CHAT_MAX_MESSAGES', 50))
+DEFAULT_IDLE_HOURS = float(os.environ.get('CHAT_IDLE_TIMEOUT_HOURS', 24))
+
+class ChatMessage:
+    """Compact chat message record; supports dict-style access for callers.
+
+    ``seq`` numbers the messages of a session from 1, in the order they
+    were added; it is assigned when the message joins a session.
+    """
+    __slots__ = ('role', 'content', 'timestamp', 'metadata', 'seq')
+    
+    def __init__(self, role: str, content: str, timestamp: str = None, metadata: Dict = None,
+                 seq: int = None):
+        self.role = role  # 'user' or 'assistant'
+        self.content = content
+        self.timestamp = timestamp or datetime.now().isoformat()
+        self.metadata = metadata or None
+        self.seq = seq
+    
+    def __getitem__(self, key):
+        if key == 'metadata':
+            return self.metadata or {}
+        return getattr(self, key)
+    
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except AttributeError:
+            return default
+    
+    def size(self) -> int:
+        """Approximate bytes held by this message"""
+        return (sys.getsizeof(self) + sys.getsizeof(self.content) + sys.getsizeof(self.timestamp)
+                + (sys.getsizeof(self.metadata) if self.metadata else 0))
+    
+    def to_dict(self) -> Dict:
+        return {
+            'role': self.role,
+            'content': self.content,
+            'timestamp': self.timestamp,
+            'metadata': self.metadata or {},
+            'seq': self.seq
+        }
 
 class ChatSession:
-    def __init__(self, session_id: str = None):
+    def __init__(self, session_id: str = None, max_messages: int = None, backend=None):
         self.session_id = session_id or str(uuid.uuid4())
-        self.messages = []
+        self.messages = deque(maxlen=max_messages or DEFAULT_MAX_MESSAGES)
         self.context = {}
         self.created_at = datetime.now()
         self.last_activity = datetime.now()
+        self.bytes_held = 0
+        self.last_seq = 0
+        # Shared backends persist each change as it happens
+        self._backend = backend
     
     def add_message(self, role: str, content: str, metadata: Dict = None):
-        """Add message to chat session"""
-        message = {
-            'role': role,  # 'user' or 'assistant'
-            'content': content,
-            'timestamp': datetime.now().isoformat(),
-            'metadata': metadata or {}
-        }
-        self.messages.append(message)
+        """Add message to chat session, dropping the oldest beyond the cap"""
+        message = ChatMessage(role, content, metadata=metadata)
+        if len(self.messages) == self.messages.maxlen:
+            # Keep what the dropped message said in the rolling summary
+            summary = self.get_context('summary') or new_summary()
+            if fold_message(summary, self.messages[0]):
+                default_builder.trim(summary)
+                self.update_context('summary', summary)
+        if self._backend is not None:
+            # Shared backends number the message across workers
+            self._backend.append_message(self.session_id, message, self.messages.maxlen)
+        self._append(message)
         self.last_activity = datetime.now()
     
-    def get_conversation_context(self) -> str:
-        """Get formatted conversation context for AI prompts"""
-        context_lines = []
-        for msg in self.messages[-5:]:  # Last 5 messages for context
-            role = "Human" if msg['role'] == 'user' else "Assistant"
-            context_lines.append(f"{role}: {msg['content']}")
-        return "\n".join(context_lines)
+    def _append(self, message: ChatMessage):
+        if message.seq is None:
+            message.seq = self.last_seq + 1
+        self.last_seq = max(self.last_seq, message.seq)
+        if len(self.messages) == self.messages.maxlen:
+            self.bytes_held -= self.messages[0].size()
+        self.messages.append(message)
+        self.bytes_held += message.size()
+    
+    def get_conversation_context(self, builder=None) -> str:
+        """Get formatted conversation context for AI prompts, within a token budget"""
+        return (builder or default_builder).build(self)
     
     def update_context(self, key: str, value):
         """Update session context"""
         self.context[key] = value
         self.last_activity = datetime.now()
+        if self._backend is not None:
+            self._backend.save_context(self.session_id, self.context)
     
     def get_context(self, key: str, default=None):
         """Get value from session context"""
         return self.context.get(key, default)
 
+class SessionBackend(ABC):
+    """Storage interface for chat sessions.
+
+    ``create`` stores a new session and ``get`` returns it (or None).
+    Backends shared between processes return a fresh ChatSession bound to
+    the backend, which then persists each message through
+    ``append_message`` instead of rewriting the whole session. They load
+    at most ``max_messages`` messages, the cap of the calling manager.
+    """
+    
+    @abstractmethod
+    def create(self, session: ChatSession):
+        pass
+    
+    @abstractmethod
+    def get(self, session_id: str, max_messages: int = None) -> Optional[ChatSession]:
+        pass
+    
+    def append_message(self, session_id: str, message: ChatMessage, max_messages: int):
+        pass
+    
+    def save_context(self, session_id: str, context: Dict):
+        pass
+    
+    @abstractmethod
+    def expire(self, cutoff: float) -> int:
+        """Delete sessions last active before the cutoff timestamp"""
+    
+    @abstractmethod
+    def stats(self) -> Dict:
+        pass
+
+class InMemorySessionBackend(SessionBackend):
+    """Bounded per-process session store in least-recently-used order.
+
+    Creating a session past ``max_sessions`` evicts the least recently used
+    one.
+    """
+    
+    def __init__(self, max_sessions: int = None):
+        self.max_sessions = max_sessions or DEFAULT_MAX_SESSIONS
+        self.sessions = OrderedDict()
+        self.evicted_sessions = 0
+        self._lock = threading.Lock()
+    
+    def create(self, session: ChatSession):
+        with self._lock:
+            self.sessions[session.session_id] = session
+            while len(self.sessions) > self.max_sessions:
+                self.sessions.popitem(last=False)
+                self.evicted_sessions += 1
+    
+    def get(self, session_id: str, max_messages: int = None) -> Optional[ChatSession]:
+        with self._lock:
+            session = self.sessions.get(session_id)
+            if session is not None:
+                self.sessions.move_to_end(session_id)
+            return session
+    
+    def expire(self, cutoff: float) -> int:
+        with self._lock:
+            expired_sessions = [
+                sid for sid, session in self.sessions.items()
+                if session.last_activity.timestamp() < cutoff
+            ]
+            
+            for sid in expired_sessions:
+                del self.sessions[sid]
+        return len(expired_sessions)
+    
+    def stats(self) -> Dict:
+        with self._lock:
+            sessions = list(self.sessions.values())
+        return {
+            'live_sessions': len(sessions),
+            'bytes_held': sum(s.bytes_held for s in sessions),
+            'max_sessions': self.max_sessions,
+            'evicted_sessions': self.evicted_sessions
+        }
+
 class ChatManager:
-    def __init__(self):
-        self.sessions = {}
+    """Creates and looks up chat sessions in a pluggable SessionBackend.
+
+    Defaults to a bounded in-memory backend. An optional background sweeper
+    expires sessions idle for ``idle_hours``.
+    """
+    
+    def __init__(self, max_sessions: int = None, max_messages: int = None, idle_hours: float = None,
+                 backend: SessionBackend = None):
+        self.max_messages = max_messages or DEFAULT_MAX_MESSAGES
+        self.idle_hours = idle_hours or DEFAULT_IDLE_HOURS
+        self.backend = backend or InMemorySessionBackend(max_sessions)
+        self.expired_sessions = 0
+        self._sweeper = None
+        self._stop = threading.Event()
     
     def create_session(self) -> str:
         """Create new chat session"""
-        session = ChatSession()
-        self.sessions[session.session_id] = session
+        session = ChatSession(max_messages=self.max_messages)
+        self.backend.create(session)
         return session.session_id
     
     def get_session(self, session_id: str) -> Optional[ChatSession]:
         """Get existing chat session"""
-        return self.sessions.get(session_id)
+        return self.backend.get(session_id, self.max_messages)
     
     def cleanup_old_sessions(self, max_age_hours: int = 24):
         """Remove sessions older than max_age_hours"""
         cutoff = datetime.now().timestamp() - (max_age_hours * 3600)
+        expired = self.backend.expire(cutoff)
+        self.expired_sessions += expired
+        return expired
+    
+    def start_sweeper(self, interval_seconds: float = 60):
+        """Expire idle sessions from a daemon thread every interval_seconds"""
+        if self._sweeper is not None and self._sweeper.is_alive():
+            return
+        self._stop.clear()
         
-        expired_sessions = [
-            sid for sid, session in self.sessions.items()
-            if session.last_activity.timestamp() < cutoff
-        ]
-        
-        for sid in expired_sessions:
-            del self.sessions[sid]
+        def sweep():
+            while not self._stop.wait(interval_seconds):
+                self.cleanup_old_sessions(self.idle_hours)
         
-        return len(expired_sessions)
\ No newline at end of file
+        self._sweeper = threading.Thread(target=sweep, name='chat-session-sweeper', daemon=True)
+        self._sweeper.start()
+    
+    def stop_sweeper(self):
+        self._stop.set()
+    
+    def get_stats(self) -> Dict:
+        """Gauges for live sessions and approximate memory held"""
+        stats = self.backend.stats()
+        stats['expired_sessions'] = self.expired_sessions
+        return stats
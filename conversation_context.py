@@ -0,0 +1,142 @@
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, List
+
+DEFAULT_TOKEN_BUDGET = int(os.environ.get('CHAT_CONTEXT_TOKENS', 1500))
+# Rough BPE approximation: long words split every four characters
+TOKEN_RE = re.compile(r'\w{1,4}|[^\w\s]')
+MAX_CONSTRAINT_CHARS = 300
+CACHE_SIZE = 1024
+
+
+def count_tokens(text: str) -> int:
+    """Approximate model token count without a tokenizer dependency"""
+    return len(TOKEN_RE.findall(text))
+
+
+def truncate_tokens(text: str, budget: int) -> str:
+    if count_tokens(text) <= budget:
+        return text
+    matches = list(TOKEN_RE.finditer(text))
+    if budget <= 0 or not matches:
+        return ''
+    return text[:matches[budget - 1].end()] + ' …'
+
+
+def new_summary() -> Dict:
+    return {'policy': '', 'constraints': [], 'folded_seq': 0}
+
+
+def fold_message(summary: Dict, message) -> bool:
+    """Fold one message into a rolling summary; returns False if already folded.
+
+    User messages become constraints; assistant messages replace the current
+    policy. Messages are identified by their sequence number in the session,
+    so folding is idempotent.
+    """
+    if message.seq <= summary.get('folded_seq', 0):
+        return False
+    if message.role == 'user':
+        constraint = ' '.join(message.content.split())[:MAX_CONSTRAINT_CHARS]
+        if constraint and constraint not in summary['constraints']:
+            summary['constraints'].append(constraint)
+    elif message.content.startswith('Policy:'):
+        summary['policy'] = message.content[len('Policy:'):].strip()
+    summary['folded_seq'] = message.seq
+    return True
+
+
+def render_summary(summary: Dict) -> str:
+    lines = ['Conversation summary:']
+    if summary['policy']:
+        lines.append(f"Current policy:\n{summary['policy']}")
+    if summary['constraints']:
+        lines.append('Requirements so far:')
+        lines.extend(f'- {constraint}' for constraint in summary['constraints'])
+    return '\n'.join(lines)
+
+
+def format_message(message) -> str:
+    role = "Human" if message.role == 'user' else "Assistant"
+    return f"{role}: {message.content}"
+
+
+class ContextBuilder:
+    """Builds prompt context for a chat session within a token budget.
+
+    The most recent messages are kept verbatim in up to ``token_budget -
+    summary_budget`` tokens. Older messages are folded once into a rolling
+    summary (latest policy plus accumulated requirements) kept in the
+    session context under ``summary``, which is trimmed to
+    ``summary_budget`` by dropping the oldest requirements first. Rendered
+    contexts are cached per session until a message is added.
+    """
+
+    def __init__(self, token_budget: int = None, summary_budget: int = None):
+        self.token_budget = token_budget or DEFAULT_TOKEN_BUDGET
+        self.summary_budget = summary_budget or self.token_budget // 3
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def build(self, session) -> str:
+        messages = list(session.messages)
+        last = messages[-1].seq if messages else 0
+        key = (session.session_id, len(messages), last)
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                self.cache_hits += 1
+                return self._cache[key]
+            self.cache_misses += 1
+
+        recent = self._recent_window(messages)
+        summary = self.fold(session, messages[:len(messages) - len(recent)])
+        lines = [format_message(m) for m in recent]
+        if len(recent) == 1 and count_tokens(lines[0]) > self.token_budget - self.summary_budget:
+            lines[0] = truncate_tokens(lines[0], self.token_budget - self.summary_budget)
+        if summary['policy'] or summary['constraints']:
+            lines = [render_summary(summary), '', 'Recent messages:'] + lines
+        context = '\n'.join(lines)
+
+        with self._lock:
+            self._cache[key] = context
+            if len(self._cache) > CACHE_SIZE:
+                self._cache.popitem(last=False)
+        return context
+
+    def fold(self, session, messages: List) -> Dict:
+        """Fold messages that left the verbatim window into the session summary"""
+        summary = session.get_context('summary') or new_summary()
+        changed = False
+        for message in messages:
+            changed = fold_message(summary, message) or changed
+        if changed:
+            self.trim(summary)
+            session.update_context('summary', summary)
+        return summary
+
+    def trim(self, summary: Dict):
+        while summary['constraints'] and count_tokens(render_summary(summary)) > self.summary_budget:
+            summary['constraints'].pop(0)
+        if count_tokens(render_summary(summary)) > self.summary_budget:
+            summary['policy'] = truncate_tokens(summary['policy'], self.summary_budget // 2)
+
+    def _recent_window(self, messages: List) -> List:
+        budget = self.token_budget - self.summary_budget
+        used = 0
+        start = len(messages)
+        for i in range(len(messages) - 1, -1, -1):
+            cost = count_tokens(format_message(messages[i]))
+            # Always keep the newest message, truncated if necessary
+            if used + cost > budget and start < len(messages):
+                break
+            used += cost
+            start = i
+        return messages[start:]
+
+
+default_builder = ContextBuilder()
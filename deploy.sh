@@ -36,4 +36,4 @@ echo "📍 Application will be available at: http://localhost:5000"
 echo "🛑 Press Ctrl+C to stop the application"
 echo ""
 
-python web_app.py
\ No newline at end of file
+gunicorn -c gunicorn.conf.py wsgi:app
\ No newline at end of file
@@ -0,0 +1,72 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, List
+
+DEFAULT_WINDOW = float(os.environ.get('POLICY_STORE_GROUP_COMMIT_MS', 2)) / 1000
+
+
+class GroupCommitter:
+    """Batches concurrent writes into a single flush.
+
+    ``submit`` blocks until the batch holding the item has been flushed. A
+    single writer thread waits up to ``window`` seconds after the first item
+    for more to arrive, so writes from concurrent request threads share one
+    write and one fsync. With ``window <= 0`` items are flushed inline.
+    """
+
+    def __init__(self, flush: Callable[[List], List], window: float = None, max_batch: int = 256):
+        self.flush = flush
+        self.window = DEFAULT_WINDOW if window is None else window
+        self.max_batch = max_batch
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+
+    def submit(self, item):
+        if self.window <= 0:
+            with self._lock:
+                return self.flush([item])[0]
+
+        future = Future()
+        self._ensure_writer()
+        self._queue.put((item, future))
+        return future.result()
+
+    def _ensure_writer(self):
+        # Threads do not survive fork(), so pre-forked workers start their own
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is None or self._pid != os.getpid():
+                self._queue = queue.Queue()
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name='group-commit', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        pending = self._queue
+        while True:
+            batch = [pending.get()]
+            deadline = time.monotonic() + self.window
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(pending.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            items = [item for item, _ in batch]
+            try:
+                results = self.flush(items)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
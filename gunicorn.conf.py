@@ -0,0 +1,38 @@
+# Production server settings: gunicorn -c gunicorn.conf.py wsgi:app
+import gc
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 5000)}"
+# One worker unless asked for more: async jobs, rate limits and metrics are
+# held per worker process (see "Production Server" in the README)
+workers = int(os.environ.get('WEB_CONCURRENCY', 1))
+# Requests mostly wait on model calls, so threads carry the concurrency
+threads = int(os.environ.get('WEB_THREADS', 16))
+worker_class = 'gthread'
+# Import and warm the app once in the master; workers inherit it copy-on-write
+preload_app = True
+# Model calls can take tens of seconds
+timeout = int(os.environ.get('WEB_TIMEOUT', 120))
+graceful_timeout = 30
+keepalive = 5
+accesslog = '-'
+
+
+def when_ready(server):
+    # Move the warm state out of the collector's generations so collections
+    # in the workers do not touch (and copy) the shared pages
+    gc.collect()
+    gc.freeze()
+
+
+def on_reload(server):
+    # SIGHUP (sent by a schema upload): reload the schema in the master so
+    # the replacement workers fork with it; old workers finish their requests
+    import web_app
+    web_app.reload_schema()
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    import web_app
+    web_app.server_pid = server.pid
@@ -0,0 +1,160 @@
+import math
+import os
+import queue
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, Optional
+from metrics import MODEL_HEDGES, MODEL_HEDGE_WINS
+
+# Percentile of recent latency after which a duplicate request is sent; 0 disables hedging
+DEFAULT_PERCENTILE = float(os.environ.get('BEDROCK_HEDGE_PERCENTILE', 0))
+# At most this fraction of calls is hedged
+DEFAULT_MAX_RATE = float(os.environ.get('BEDROCK_HEDGE_MAX_RATE', 0.05))
+DEFAULT_MIN_SAMPLES = int(os.environ.get('BEDROCK_HEDGE_MIN_SAMPLES', 20))
+LATENCY_SAMPLES = 512
+MAX_CREDIT = 5
+
+
+class Hedger:
+    """Sends a second, identical call when the first is slower than usual.
+
+    Latency of completed calls is tracked per key (the model id). Once a
+    key has ``min_samples`` samples, a call that has not returned after the
+    ``percentile`` latency is duplicated and whichever attempt finishes
+    first wins; the other is abandoned and its result discarded (Bedrock
+    calls cannot be aborted mid-flight). An attempt that fails waits for
+    the other. Every call earns ``max_rate`` of a hedge credit and each
+    hedge spends a whole one, so no more than that fraction of calls is
+    duplicated over time. A hedge is also only sent if ``admit()`` (when
+    set) allows one more model call; otherwise the call waits for its
+    primary and keeps the credit.
+    """
+
+    def __init__(self, percentile: float = None, max_rate: float = None, min_samples: int = None):
+        self.percentile = DEFAULT_PERCENTILE if percentile is None else percentile
+        self.max_rate = DEFAULT_MAX_RATE if max_rate is None else max_rate
+        self.min_samples = DEFAULT_MIN_SAMPLES if min_samples is None else min_samples
+        self._lock = threading.Lock()
+        self._latencies = {}
+        self._credit = 0.0
+        self._calls = 0
+        self._hedged = 0
+        self._capped = 0
+        self._rate_limited = 0
+        self._wins = 0
+        # Called before a hedge is sent; returning False waits for the primary instead
+        self.admit = None
+
+    @property
+    def enabled(self) -> bool:
+        return 0 < self.percentile < 100
+
+    def delay(self, key: str) -> Optional[float]:
+        """Seconds to wait before hedging a call for ``key``, or None until enough calls are seen"""
+        with self._lock:
+            samples = sorted(self._latencies.get(key, ()))
+        if len(samples) < max(self.min_samples, 1):
+            return None
+        return samples[min(len(samples) - 1, math.ceil(self.percentile / 100 * len(samples)) - 1)]
+
+    def call(self, key: str, fn: Callable):
+        """``fn()``, hedged with a second ``fn()`` if it runs past the hedge delay"""
+        if not self.enabled:
+            return fn()
+        with self._lock:
+            self._calls += 1
+            self._credit = min(MAX_CREDIT, self._credit + self.max_rate)
+        delay = self.delay(key)
+        if delay is None:
+            started = time.perf_counter()
+            result = fn()
+            self._observe(key, time.perf_counter() - started)
+            return result
+
+        results = queue.Queue()
+        self._start(key, fn, 'primary', results)
+        try:
+            return self._unwrap(results.get(timeout=delay))
+        except queue.Empty:
+            pass
+        if not self._spend():
+            MODEL_HEDGES.inc(outcome='capped')
+            return self._unwrap(results.get())
+        if self.admit is not None and not self.admit():
+            with self._lock:
+                self._credit = min(MAX_CREDIT, self._credit + 1)
+                self._hedged -= 1
+                self._rate_limited += 1
+            MODEL_HEDGES.inc(outcome='rate_limited')
+            return self._unwrap(results.get())
+        MODEL_HEDGES.inc(outcome='sent')
+        self._start(key, fn, 'hedge', results)
+        first = results.get()
+        if first[2] is not None:
+            second = results.get()
+            if second[2] is None:
+                first = second
+        if first[2] is None:
+            MODEL_HEDGE_WINS.inc(winner=first[0])
+            if first[0] == 'hedge':
+                with self._lock:
+                    self._wins += 1
+        return self._unwrap(first)
+
+    def _spend(self) -> bool:
+        with self._lock:
+            if self._credit < 1:
+                self._capped += 1
+                return False
+            self._credit -= 1
+            self._hedged += 1
+            return True
+
+    def _start(self, key: str, fn: Callable, name: str, results: queue.Queue):
+        def run():
+            started = time.perf_counter()
+            try:
+                value = fn()
+            except Exception as e:
+                results.put((name, None, e))
+                return
+            self._observe(key, time.perf_counter() - started)
+            results.put((name, value, None))
+        # Daemon threads, so an abandoned attempt never holds up shutdown
+        threading.Thread(target=run, name=f'hedge-{name}', daemon=True).start()
+
+    @staticmethod
+    def _unwrap(result):
+        _, value, error = result
+        if error is not None:
+            raise error
+        return value
+
+    def _observe(self, key: str, seconds: float):
+        with self._lock:
+            samples = self._latencies.get(key)
+            if samples is None:
+                samples = self._latencies[key] = deque(maxlen=LATENCY_SAMPLES)
+            samples.append(seconds)
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            keys = list(self._latencies)
+        delays = {key: self.delay(key) for key in keys}
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'percentile': self.percentile,
+                'max_rate': self.max_rate,
+                'calls': self._calls,
+                'hedged': self._hedged,
+                'capped': self._capped,
+                'rate_limited': self._rate_limited,
+                'hedge_wins': self._wins,
+                'hedge_rate': round(self._hedged / self._calls, 4) if self._calls else None,
+                'delay_ms': {key: round(delay * 1000, 1) for key, delay in delays.items() if delay is not None}
+            }
+
+
+hedger = Hedger()
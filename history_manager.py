@@ -1,37 +1,56 @@
-import json
 import os
 from datetime import datetime
+from jsonl_reader import JsonlReader
+from policy_store import open_record_store
+from metrics import STORE_WRITE_SECONDS
+from tracing import span
 
 class HistoryManager:
-    def __init__(self, history_file='policy_history.json'):
+    def __init__(self, history_file='policy_history.json', fsync=None, backend=None, db_path=None):
         self.history_file = history_file
-        self.history = self._load_history()
+        # History is only written for approved policies
+        self.store = open_record_store(history_file, 'history', fsync=fsync, backend=backend,
+                                       db_path=db_path, default_status='APPROVED')
     
-    def _load_history(self):
-        if os.path.exists(self.history_file):
-            with open(self.history_file, 'r') as f:
-                return json.load(f)
-        return []
+    @property
+    def history(self):
+        return self.store.all()
     
-    def save_policy(self, requirement, policy, rationale):
-        entry = {
+    def save_policy(self, requirement, policy, rationale, status='APPROVED'):
+        with span('persist', STORE_WRITE_SECONDS, operation='save_history'):
+            return self.store.append(self.new_entry(requirement, policy, rationale, status))
+    
+    def new_entry(self, requirement, policy, rationale, status='APPROVED'):
+        return {
             'timestamp': datetime.now().isoformat(),
             'requirement': requirement,
             'policy': policy,
-            'rationale': rationale
+            'rationale': rationale,
+            'status': status
         }
-        self.history.append(entry)
-        self._save_history()
-        return len(self.history) - 1
-    
-    def _save_history(self):
-        with open(self.history_file, 'w') as f:
-            json.dump(self.history, f, indent=2)
     
     def get_history(self):
-        return self.history
+        return self.store.all()
+    
+    def query_history(self, status=None, since=None, cursor=None, limit=100):
+        """Get one page of history, returning (entries, next_cursor)"""
+        return self.store.query(status=status, since=since, cursor=cursor, limit=limit)
+    
+    def count(self):
+        return self.store.count()
     
     def get_policy(self, index):
-        if 0 <= index < len(self.history):
-            return self.history[index]
-        return None
\ No newline at end of file
+        return self.store.get(index)
+
+
+def open_history_reader(history_file='policy_history.json', backend=None, db_path=None):
+    """Open history for reading without loading every entry into memory.
+
+    Returns an object with ``count()``, ``get(index)`` and paginated
+    ``query(cursor=..., limit=...)``.
+    """
+    backend = backend or os.environ.get('POLICY_STORE_BACKEND', 'jsonl')
+    if backend == 'jsonl':
+        return JsonlReader(history_file)
+    return open_record_store(history_file, 'history', backend=backend, db_path=db_path,
+                             default_status='APPROVED')
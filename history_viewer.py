@@ -1,32 +1,85 @@
 #!/usr/bin/env python3
-import sys
-from history_manager import HistoryManager
+import argparse
+from history_manager import open_history_reader
+
+def show_entry(history, index):
+    entry = history.get(index)
+    if entry:
+        print(f"Policy #{index}")
+        print(f"Timestamp: {entry['timestamp']}")
+        print(f"Requirement: {entry['requirement']}")
+        print(f"\nPolicy:\n{entry['policy']}")
+        print(f"\nRationale:")
+        for rationale in entry['rationale']:
+            print(rationale)
+    else:
+        print(f"Policy #{index} not found.")
+
+def list_entries(history, page=None, page_size=50):
+    """Print entries one page at a time so large histories stream"""
+    if page is not None:
+        cursor = page * page_size - 1 if page > 0 else None
+        entries, _ = history.query(cursor=cursor, limit=page_size)
+        for entry in entries:
+            print(f"#{entry['id']}: {entry['requirement'][:50]}... ({entry['timestamp'][:10]})")
+        return
+    
+    cursor = None
+    while True:
+        entries, cursor = history.query(cursor=cursor, limit=page_size)
+        for entry in entries:
+            print(f"#{entry['id']}: {entry['requirement'][:50]}... ({entry['timestamp'][:10]})")
+        if cursor is None:
+            break
+
+def search(args):
+    """Print ranked search results with facet counts"""
+    from approval_manager import ApprovalManager
+    from history_manager import HistoryManager
+    from policy_search import PolicySearchIndex
+    
+    index = PolicySearchIndex({'history': HistoryManager().store, 'approvals': ApprovalManager().store})
+    found = index.search(args.search, status=args.status, action=args.action,
+                         entity_type=args.entity_type, since=args.since, until=args.until,
+                         limit=args.page_size)
+    print(f"Found {found['total']} matching entries:")
+    for result in found['results']:
+        print(f"[{result['source']} #{result['id']}] {result['status'] or ''} "
+              f"{result['requirement'][:50]}... ({result['timestamp'][:10]}, score {result['score']})")
+    for facet, counts in found['facets'].items():
+        if counts:
+            summary = ', '.join(f"{value} ({n})" for value, n in counts.items())
+            print(f"  {facet}: {summary}")
 
 def main():
-    history = HistoryManager()
-    entries = history.get_history()
+    parser = argparse.ArgumentParser(description='View saved policy history')
+    parser.add_argument('index', nargs='?', type=int, help='show a single policy by number')
+    parser.add_argument('--page', type=int, help='list only this page (0-based)')
+    parser.add_argument('--page-size', type=int, default=50, help='entries per page (default 50)')
+    parser.add_argument('--search', metavar='QUERY', help='full-text search over history and approvals')
+    parser.add_argument('--status', help='with --search: only APPROVED or REJECTED entries')
+    parser.add_argument('--action', help='with --search: only policies referencing this action')
+    parser.add_argument('--entity-type', help='with --search: only policies referencing this entity type')
+    parser.add_argument('--since', help='with --search: earliest timestamp (e.g. 2024-01-01)')
+    parser.add_argument('--until', help='with --search: latest timestamp, inclusive')
+    args = parser.parse_args()
+    
+    if args.search is not None:
+        search(args)
+        return
+    
+    history = open_history_reader()
+    total = history.count()
     
-    if not entries:
+    if not total:
         print("No policy history found.")
         return
     
-    if len(sys.argv) > 1 and sys.argv[1].isdigit():
-        index = int(sys.argv[1])
-        entry = history.get_policy(index)
-        if entry:
-            print(f"Policy #{index}")
-            print(f"Timestamp: {entry['timestamp']}")
-            print(f"Requirement: {entry['requirement']}")
-            print(f"\nPolicy:\n{entry['policy']}")
-            print(f"\nRationale:")
-            for rationale in entry['rationale']:
-                print(rationale)
-        else:
-            print(f"Policy #{index} not found.")
+    if args.index is not None:
+        show_entry(history, args.index)
     else:
-        print("Policy History:")
-        for i, entry in enumerate(entries):
-            print(f"#{i}: {entry['requirement'][:50]}... ({entry['timestamp'][:10]})")
+        print(f"Policy History ({total} entries):")
+        list_entries(history, args.page, args.page_size)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
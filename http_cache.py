@@ -0,0 +1,119 @@
+import gzip
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Callable, Hashable, Optional
+
+GZIP_MIN_BYTES = int(os.environ.get('HTTP_GZIP_MIN_BYTES', 1024))
+CACHE_ENTRIES = 256
+
+
+def make_etag(*versions) -> str:
+    """Weak validator for a payload built from data at the given versions"""
+    return 'W/"%s"' % hashlib.sha1(repr(versions).encode('utf-8')).hexdigest()[:20]
+
+
+def http_date(timestamp: float) -> str:
+    return formatdate(timestamp, usegmt=True)
+
+
+def record_time(timestamp: str) -> Optional[float]:
+    """Epoch seconds for a record's ISO timestamp, None if it has none"""
+    try:
+        return datetime.fromisoformat(timestamp).timestamp() if timestamp else None
+    except ValueError:
+        return None
+
+
+def accepts_gzip(accept_encoding: str) -> bool:
+    for part in (accept_encoding or '').split(','):
+        coding, _, params = part.strip().partition(';')
+        if coding.strip().lower() in ('gzip', '*'):
+            return params.replace(' ', '') not in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000')
+    return False
+
+
+def not_modified(if_none_match: str, if_modified_since: str, etag: str,
+                 last_modified: Optional[float]) -> bool:
+    """Whether a conditional GET can be answered with 304.
+
+    If-None-Match wins over If-Modified-Since when both are sent.
+    """
+    if if_none_match:
+        tags = [tag.strip() for tag in if_none_match.split(',')]
+        opaque = etag[2:] if etag.startswith('W/') else etag
+        return '*' in tags or any((tag[2:] if tag.startswith('W/') else tag) == opaque for tag in tags)
+    if if_modified_since and last_modified is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+        return int(last_modified) <= since
+    return False
+
+
+class CachedPayload:
+    """Serialized body with its validators; gzip is computed once, on demand"""
+    __slots__ = ('etag', 'last_modified', 'body', '_gzipped')
+
+    def __init__(self, etag: str, last_modified: Optional[float], body: bytes):
+        self.etag = etag
+        self.last_modified = last_modified
+        self.body = body
+        self._gzipped = None
+
+    def gzipped(self) -> bytes:
+        if self._gzipped is None:
+            self._gzipped = gzip.compress(self.body, compresslevel=6)
+        return self._gzipped
+
+
+def build_payload(etag: str, last_modified: Optional[float], build: Callable,
+                  encode: Callable = None) -> CachedPayload:
+    """``build()`` JSON-encoded, or turned into bytes by ``encode``, with its validators"""
+    data = build()
+    return CachedPayload(etag, last_modified, encode(data) if encode else json.dumps(data).encode('utf-8'))
+
+
+class PayloadCache:
+    """Memoizes serialized payloads per key until their data version changes.
+
+    ``version`` is anything hashable that changes when the underlying data
+    does (store record counts, schema fingerprint), so writes from any
+    worker invalidate the entry without explicit calls. Least recently used
+    keys are dropped past ``max_entries``.
+    """
+
+    def __init__(self, max_entries: int = CACHE_ENTRIES):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, version: Hashable, build: Callable,
+            last_modified: Optional[float] = None, encode: Callable = None) -> CachedPayload:
+        """Payload for ``key`` at ``version``; ``build()`` is JSON-encoded unless ``encode`` is given"""
+        etag = make_etag(key, version)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.etag == etag:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+            self.misses += 1
+        entry = build_payload(etag, last_modified, build, encode)
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,160 @@
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional
+from scheduler import FairScheduler, QueueFullError
+from tracing import trace
+
+DEFAULT_WORKERS = int(os.environ.get('JOB_WORKERS', 4))
+DEFAULT_MAX_QUEUE = int(os.environ.get('JOB_MAX_QUEUE', 100))
+DEFAULT_RETENTION_SECONDS = float(os.environ.get('JOB_RETENTION_SECONDS', 600))
+
+class Job:
+    """A unit of background work and its outcome"""
+
+    def __init__(self, kind: str):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.status = 'queued'
+        self.result = None
+        self.error = None
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.timings = None
+        self.done = threading.Event()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ('succeeded', 'failed')
+
+    def to_dict(self) -> Dict:
+        data = {
+            'job_id': self.id,
+            'kind': self.kind,
+            'status': self.status,
+            'submitted_at': self.submitted_at,
+            'wait_seconds': round((self.started_at or time.time()) - self.submitted_at, 4)
+        }
+        if self.started_at:
+            data['run_seconds'] = round((self.finished_at or time.time()) - self.started_at, 4)
+        if self.timings:
+            data['timings_ms'] = self.timings
+        if self.status == 'succeeded':
+            data['result'] = self.result
+        elif self.status == 'failed':
+            data['error'] = self.error
+        return data
+
+class JobManager:
+    """Runs jobs on a bounded pool of worker threads.
+
+    Jobs wait for a slot in a FairScheduler, which decides the order across
+    sessions and refuses work over the rate or queue limits with
+    QueueFullError. Without a shared scheduler one is built with
+    ``max_workers`` slots, ``max_queue`` waiting jobs and no rate limits.
+    Finished jobs are kept for ``retention_seconds`` so clients can poll for
+    the result.
+    """
+
+    def __init__(self, max_workers: int = None, max_queue: int = None, retention_seconds: float = None,
+                 scheduler: FairScheduler = None):
+        max_queue = max_queue or DEFAULT_MAX_QUEUE
+        self.scheduler = scheduler or FairScheduler(
+            max_concurrent=max_workers or DEFAULT_WORKERS, max_queue=max_queue,
+            max_queue_per_key=max_queue, session_rate=0, global_rate=0
+        )
+        # Jobs only reach the pool once they hold a slot, so it never queues
+        self.max_workers = self.scheduler.max_concurrent
+        self.max_queue = self.scheduler.max_queue
+        self.retention_seconds = retention_seconds or DEFAULT_RETENTION_SECONDS
+        self.jobs = OrderedDict()
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='job')
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._running = 0
+        self._counts = {'submitted': 0, 'succeeded': 0, 'failed': 0, 'rejected': 0}
+        self._wait_total = 0.0
+        self._run_total = 0.0
+        self._wait_max = 0.0
+        self._run_max = 0.0
+
+    def submit(self, fn: Callable, *args, kind: str = 'generate', key: str = 'default', **kwargs) -> Job:
+        """Queue fn(*args, **kwargs) on behalf of session ``key`` and return its Job immediately"""
+        job = Job(kind)
+        with self._lock:
+            self._purge()
+            self._queued += 1
+            self.jobs[job.id] = job
+        try:
+            self.scheduler.submit(key, lambda ticket: self._executor.submit(self._run, job, ticket, fn, args, kwargs))
+        except QueueFullError:
+            with self._lock:
+                self._queued -= 1
+                del self.jobs[job.id]
+                self._counts['rejected'] += 1
+            raise
+        with self._lock:
+            self._counts['submitted'] += 1
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self.jobs.get(job_id)
+
+    def _run(self, job: Job, ticket, fn: Callable, args, kwargs):
+        job.started_at = time.time()
+        job.status = 'running'
+        wait = job.started_at - job.submitted_at
+        with self._lock:
+            self._queued -= 1
+            self._running += 1
+            self._wait_total += wait
+            self._wait_max = max(self._wait_max, wait)
+        try:
+            with trace(job.kind) as job_trace:
+                job.result = fn(*args, **kwargs)
+            job.status = 'succeeded'
+        except Exception as e:
+            job.error = str(e)
+            job.status = 'failed'
+        finally:
+            self.scheduler.release(ticket)
+        job.timings = job_trace.timings()
+        job.finished_at = time.time()
+        run = job.finished_at - job.started_at
+        with self._lock:
+            self._running -= 1
+            self._counts[job.status] += 1
+            self._run_total += run
+            self._run_max = max(self._run_max, run)
+        job.done.set()
+
+    def _purge(self):
+        cutoff = time.time() - self.retention_seconds
+        while self.jobs:
+            job = next(iter(self.jobs.values()))
+            if not job.finished or job.finished_at > cutoff:
+                break
+            self.jobs.popitem(last=False)
+
+    def get_stats(self) -> Dict:
+        """Queue depth, wait time and run time for monitoring"""
+        with self._lock:
+            started = self._counts['succeeded'] + self._counts['failed'] + self._running
+            finished = self._counts['succeeded'] + self._counts['failed']
+            return {
+                'queue_depth': self._queued,
+                'running': self._running,
+                'max_workers': self.max_workers,
+                'max_queue': self.max_queue,
+                **self._counts,
+                'avg_wait_seconds': round(self._wait_total / started, 4) if started else 0,
+                'max_wait_seconds': round(self._wait_max, 4),
+                'avg_run_seconds': round(self._run_total / finished, 4) if finished else 0,
+                'max_run_seconds': round(self._run_max, 4),
+                'scheduler': self.scheduler.get_stats()
+            }
@@ -0,0 +1,219 @@
+import json
+import mmap
+import os
+import struct
+from array import array
+from typing import Dict, Iterator, List, Optional, Tuple
+from jsonl_store import _decode
+
+try:
+    import fcntl
+except ImportError:  # Windows: concurrent index updates are not coordinated
+    fcntl = None
+
+INDEX_MAGIC = b'PHIDX001'
+# magic, data file inode, bytes indexed, highest seq seen, record count
+INDEX_HEADER = struct.Struct('<8sQQQQ')
+SEQ_MARKER = b'"_seq":'
+
+
+class OffsetIndex:
+    """Side index of record start offsets for one JSON Lines file.
+
+    Stored as ``<file>.idx``: a fixed header followed by little-endian uint64
+    offsets of every valid record line. Opening the index only scans lines
+    written since it was last updated, so the cost is independent of how
+    many records the file already holds. Writers drop the index on
+    compaction; an inode change or a shrunken file also forces a rebuild.
+    """
+
+    def __init__(self, data_path: str, min_seq: int = 0):
+        self.data_path = data_path
+        self.index_path = data_path + '.idx'
+        self.min_seq = min_seq
+        self.offsets = array('Q')
+        self.last_seq = 0
+        self._indexed = 0
+        self._ino = 0
+        self._update()
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def _update(self):
+        try:
+            st = os.stat(self.data_path)
+        except OSError:
+            return
+        self._load(st)
+        if st.st_size <= self._indexed:
+            return
+
+        new_offsets, new_indexed = self._scan(self._indexed, st.st_size)
+        if new_indexed == self._indexed:
+            return
+        start = len(self.offsets)
+        self.offsets.extend(new_offsets)
+        self._indexed = new_indexed
+        self._save(start)
+
+    def _load(self, st: os.stat_result):
+        self._ino = st.st_ino
+        try:
+            with open(self.index_path, 'rb') as f:
+                header = f.read(INDEX_HEADER.size)
+                if len(header) < INDEX_HEADER.size:
+                    return
+                magic, ino, indexed, last_seq, count = INDEX_HEADER.unpack(header)
+                if magic != INDEX_MAGIC or ino != st.st_ino or indexed > st.st_size:
+                    return
+                offsets = array('Q')
+                offsets.frombytes(f.read(count * offsets.itemsize))
+                if len(offsets) != count:
+                    return
+        except OSError:
+            return
+        self.offsets = offsets
+        self._indexed = indexed
+        self.last_seq = last_seq
+
+    def _scan(self, start: int, end: int) -> Tuple[List[int], int]:
+        """Find record lines in [start, end), stopping at a partial last line"""
+        offsets = []
+        with open(self.data_path, 'rb') as f:
+            f.seek(start)
+            pos = start
+            for line in f:
+                if not line.endswith(b'\n'):
+                    break
+                seq = self._line_seq(line)
+                if seq is not None and seq > self.min_seq:
+                    offsets.append(pos)
+                    self.last_seq = max(self.last_seq, seq)
+                pos += len(line)
+        return offsets, pos
+
+    @staticmethod
+    def _line_seq(line: bytes) -> Optional[int]:
+        # _encode always writes "_seq" last, so valid lines end with it
+        marker = line.rfind(SEQ_MARKER)
+        if marker < 0:
+            return None
+        digits = line[marker + len(SEQ_MARKER):].rstrip(b'}\r\n ')
+        return int(digits) if digits.isdigit() else None
+
+    def _save(self, start: int):
+        """Append new offsets, then publish them by rewriting the header"""
+        try:
+            fd = os.open(self.index_path, os.O_RDWR | os.O_CREAT, 0o644)
+        except OSError:
+            # Read-only deployments still work, they just rescan next time
+            return
+        try:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            header = INDEX_HEADER.pack(INDEX_MAGIC, self._ino, self._indexed,
+                                       self.last_seq, len(self.offsets))
+            if start == 0 or os.fstat(fd).st_size < INDEX_HEADER.size:
+                os.ftruncate(fd, 0)
+                os.pwrite(fd, header + self.offsets.tobytes(), 0)
+            else:
+                body_start = INDEX_HEADER.size + start * self.offsets.itemsize
+                os.ftruncate(fd, body_start)
+                os.pwrite(fd, self.offsets[start:].tobytes(), body_start)
+                os.pwrite(fd, header, 0)
+        except OSError:
+            pass
+        finally:
+            os.close(fd)
+
+
+class JsonlReader:
+    """Lazy, read-only access to a JsonlStore by record position.
+
+    Records are located through ``OffsetIndex`` side files and decoded one at
+    a time from memory-mapped data files, so opening a store and reading a
+    single entry does not parse the rest of it. The files are only read: a
+    legacy JSON array file is parsed in memory rather than converted, which
+    is left to the next ``JsonlStore`` that opens it for writing.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._maps = {}
+        self._legacy = self._load_legacy(path)
+        if self._legacy is not None:
+            self._segments = []
+            return
+        snapshot = OffsetIndex(path + '.snapshot')
+        log = OffsetIndex(path, min_seq=snapshot.last_seq)
+        self._segments = [(path + '.snapshot', snapshot), (path, log)]
+
+    @staticmethod
+    def _load_legacy(path: str) -> Optional[List[Dict]]:
+        try:
+            with open(path, 'r') as f:
+                if not f.read(64).lstrip().startswith('['):
+                    return None
+                f.seek(0)
+                return [dict(record, id=i) for i, record in enumerate(json.load(f))]
+        except (OSError, ValueError):
+            return None
+
+    def count(self) -> int:
+        if self._legacy is not None:
+            return len(self._legacy)
+        return sum(len(index) for _, index in self._segments)
+
+    def get(self, record_id: int) -> Optional[Dict]:
+        """The record at ``record_id``; None past the end or when its line is corrupt"""
+        if record_id < 0:
+            return None
+        if self._legacy is not None:
+            return self._legacy[record_id] if record_id < len(self._legacy) else None
+        base = record_id
+        for data_path, index in self._segments:
+            if base < len(index):
+                return self._read(data_path, index, base, record_id)
+            base -= len(index)
+        return None
+
+    def query(self, cursor: int = None, limit: int = None) -> Tuple[List[Dict], Optional[int]]:
+        """Return records with id > cursor, in id order, skipping corrupt lines"""
+        start = 0 if cursor is None else cursor + 1
+        count = self.count()
+        stop = count if not limit else min(count, start + limit)
+        page = list(self.iter_range(start, stop))
+        # A page can come up short on corrupt lines, so more follow while ids remain
+        next_cursor = stop - 1 if limit and stop < count else None
+        return page, next_cursor
+
+    def iter_range(self, start: int = 0, stop: int = None) -> Iterator[Dict]:
+        stop = self.count() if stop is None else stop
+        for record_id in range(max(start, 0), stop):
+            record = self.get(record_id)
+            if record is not None:
+                yield record
+
+    def close(self):
+        for mapped in self._maps.values():
+            mapped.close()
+        self._maps = {}
+
+    def _read(self, data_path: str, index: OffsetIndex, position: int, record_id: int) -> Optional[Dict]:
+        mapped = self._map(data_path)
+        start = index.offsets[position]
+        end = mapped.find(b'\n', start)
+        decoded = _decode(mapped[start:end].decode('utf-8', errors='replace'))
+        if decoded is None:
+            # The line ends like a record (which is all indexing checks) but does not parse
+            return None
+        _, record = decoded
+        record.setdefault('id', record_id)
+        return record
+
+    def _map(self, data_path: str) -> mmap.mmap:
+        if data_path not in self._maps:
+            with open(data_path, 'rb') as f:
+                self._maps[data_path] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._maps[data_path]
@@ -0,0 +1,505 @@
+import atexit
+import hashlib
+import json
+import os
+import threading
+import time
+import weakref
+from bisect import bisect_left, bisect_right
+from contextlib import ExitStack, contextmanager
+from itertools import islice
+from typing import Dict, Iterator, List, Optional, Tuple
+from group_commit import GroupCommitter
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to in-process locking only
+    fcntl = None
+
+FSYNC_POLICIES = ('always', 'interval', 'never')
+# Stores with an fsync deferred by the interval policy, synced at exit
+_unsynced = weakref.WeakSet()
+
+
+def import_legacy_json(path: str) -> int:
+    """Convert a legacy pretty-printed JSON array file to JSON Lines in place.
+
+    Returns the number of records imported, or 0 when the file is missing or
+    already in JSON Lines format.
+    """
+    if not os.path.exists(path):
+        return 0
+    with open(path, 'r') as f:
+        head = f.read(64).lstrip()
+    if not head.startswith('['):
+        return 0
+
+    with open(path, 'r') as f:
+        records = json.load(f)
+
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        for seq, record in enumerate(records, 1):
+            f.write(_encode(record, seq))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    return len(records)
+
+
+def _encode(record: Dict, seq: int) -> str:
+    line = dict(record)
+    line['_seq'] = seq
+    return json.dumps(line, separators=(',', ':')) + '\n'
+
+
+def _decode(line: str):
+    """Decode one log line, returning (seq, record) or None for torn lines"""
+    line = line.strip()
+    if not line:
+        return None
+    try:
+        record = json.loads(line)
+    except json.JSONDecodeError:
+        return None
+    seq = record.pop('_seq', 0)
+    return seq, record
+
+
+class JsonlStore:
+    """Append-only JSON Lines log with periodic snapshot compaction.
+
+    Each write appends whole lines, so its cost does not depend on how many
+    records are already stored. Every ``compact_threshold`` appends the log is
+    folded into ``<path>.snapshot`` and truncated. Snapshots carry the last
+    sequence number they contain, so a crash between writing the snapshot and
+    truncating the log never produces duplicates on reload.
+
+    Writers hold an exclusive ``flock`` on ``<path>.lock``, so several worker
+    processes can share one log. Readers only consume complete lines and pick
+    up records written by other processes through ``read_new``.
+
+    Under the ``interval`` fsync policy a write inside the interval is synced
+    by a timer when the interval ends (or at exit), so the last writes
+    before an idle period are not left unsynced.
+    """
+
+    def __init__(self, path: str, fsync: str = None, fsync_interval: float = 1.0,
+                 compact_threshold: int = None):
+        fsync = fsync or os.environ.get('POLICY_STORE_FSYNC', 'interval')
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"fsync must be one of {FSYNC_POLICIES}, got {fsync!r}")
+        if compact_threshold is None:
+            compact_threshold = int(os.environ.get('POLICY_STORE_COMPACT_THRESHOLD', 10000))
+
+        self.path = path
+        self.snapshot_path = path + '.snapshot'
+        self.lock_path = path + '.lock'
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
+        self.compact_threshold = compact_threshold
+
+        self._seq = 0
+        self._snapshot_seq = 0
+        self._snapshot_key = None
+        self._offset = 0
+        self._log_records = 0
+        self._last_fsync = time.monotonic()
+        self._file = None
+        self._sync_timer = None
+        self._thread_lock = threading.RLock()
+        self._lock_depth = 0
+        self._lock_file = None
+        self._pid = os.getpid()
+
+        with self.locked():
+            self.imported = import_legacy_json(path)
+
+    @contextmanager
+    def locked(self):
+        """Hold the cross-process write lock (re-entrant within a process)"""
+        with self._thread_lock:
+            self._lock_depth += 1
+            try:
+                if self._lock_depth == 1 and fcntl is not None:
+                    fcntl.flock(self._lock_fd(), fcntl.LOCK_EX)
+                yield
+            finally:
+                if self._lock_depth == 1 and fcntl is not None:
+                    fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_UN)
+                self._lock_depth -= 1
+
+    def _lock_fd(self) -> int:
+        # flock() is tied to the open file description, which a forked child
+        # shares with its parent, so each process opens its own
+        if self._lock_file is None or self._pid != os.getpid():
+            self._lock_file = open(self.lock_path, 'a')
+            if self._file is not None and self._pid != os.getpid():
+                self._file = None
+            self._pid = os.getpid()
+        return self._lock_file.fileno()
+
+    def load(self) -> List[Dict]:
+        """Read all records from the snapshot and the log, in write order"""
+        records = []
+        self._snapshot_key = self._file_key(self.snapshot_path)
+        self._snapshot_seq = 0
+        for seq, record in self._read_lines(self.snapshot_path):
+            self._snapshot_seq = max(self._snapshot_seq, seq)
+            records.append(record)
+
+        self._seq = self._snapshot_seq
+        self._offset = 0
+        self._log_records = 0
+        records.extend(self._read_log())
+        return records
+
+    def read_new(self) -> Tuple[bool, List[Dict]]:
+        """Return records appended by other processes since the last read.
+
+        Returns ``(True, records)`` with the full contents when the log was
+        compacted underneath us, otherwise ``(False, new_records)``.
+        """
+        if self._file_key(self.snapshot_path) != self._snapshot_key:
+            return True, self.load()
+        try:
+            size = os.path.getsize(self.path)
+        except OSError:
+            size = 0
+        if size < self._offset:
+            return True, self.load()
+        if size == self._offset:
+            return False, []
+        return False, self._read_log()
+
+    def append(self, record: Dict) -> int:
+        """Append one record to the log and return its sequence number"""
+        with self.locked():
+            self.read_new()
+            seq = self.write_batch([record])[0]
+            self.maybe_compact()
+        return seq
+
+    def write_batch(self, records: List[Dict], sync: bool = True) -> List[int]:
+        """Append records with one write and at most one fsync (none with ``sync=False``).
+
+        Must be called while holding ``locked()`` after catching up with
+        ``read_new``, so sequence numbers stay monotonic across processes.
+        """
+        f = self._open()
+        prefix = ''
+        # Anything past our offset while we hold the lock is a torn line left
+        # by a crash mid-write; terminate it so it is skipped as invalid.
+        if os.fstat(f.fileno()).st_size > self._offset:
+            prefix = '\n'
+        seqs = []
+        lines = []
+        for record in records:
+            self._seq += 1
+            seqs.append(self._seq)
+            lines.append(_encode(record, self._seq))
+        f.write(prefix + ''.join(lines))
+        f.flush()
+        if sync:
+            self._sync(f)
+        self._offset = os.fstat(f.fileno()).st_size
+        self._log_records += len(records)
+        return seqs
+
+    def maybe_compact(self):
+        if self.compact_threshold and self._log_records >= self.compact_threshold:
+            self.compact()
+
+    def compact(self):
+        """Fold the log into the snapshot file and truncate the log"""
+        with self.locked():
+            self.close()
+            tmp_path = self.snapshot_path + '.tmp'
+            with open(tmp_path, 'w') as out:
+                last_seq = 0
+                for path in (self.snapshot_path, self.path):
+                    for seq, record in self._read_lines(path):
+                        if seq and seq <= last_seq:
+                            continue
+                        out.write(_encode(record, seq))
+                        last_seq = max(last_seq, seq)
+                out.flush()
+                os.fsync(out.fileno())
+            os.replace(tmp_path, self.snapshot_path)
+
+            # The snapshot now holds every record; truncating the log is safe
+            # because any leftover lines have seq <= the snapshot's last seq.
+            with open(self.path, 'w') as f:
+                os.fsync(f.fileno())
+            # Offset indexes kept by JsonlReader no longer match either file
+            for index_path in (self.path + '.idx', self.snapshot_path + '.idx'):
+                if os.path.exists(index_path):
+                    os.remove(index_path)
+            self._snapshot_key = self._file_key(self.snapshot_path)
+            self._snapshot_seq = last_seq
+            self._offset = 0
+            self._log_records = 0
+
+    def close(self):
+        with self._thread_lock:
+            if self._sync_timer is not None:
+                self._sync_timer.cancel()
+                self._sync_timer = None
+            _unsynced.discard(self)
+            if self._file is not None:
+                self._file.flush()
+                os.fsync(self._file.fileno())
+                self._file.close()
+                self._file = None
+
+    def sync(self):
+        """Apply the fsync policy to writes made with ``sync=False``"""
+        if self._file is not None:
+            self._sync(self._file)
+
+    def _open(self):
+        if self._file is None:
+            self._file = open(self.path, 'a')
+        return self._file
+
+    def _sync(self, f):
+        if self.fsync == 'always':
+            os.fsync(f.fileno())
+        elif self.fsync == 'interval':
+            now = time.monotonic()
+            if now - self._last_fsync >= self.fsync_interval:
+                os.fsync(f.fileno())
+                self._last_fsync = now
+            elif self._sync_timer is None or not self._sync_timer.is_alive():
+                # Threads do not survive a fork, so a child schedules its own
+                self._sync_timer = threading.Timer(self.fsync_interval - (now - self._last_fsync),
+                                                   self._deferred_sync)
+                self._sync_timer.daemon = True
+                self._sync_timer.start()
+                _unsynced.add(self)
+
+    def _deferred_sync(self):
+        with self._thread_lock:
+            self._sync_timer = None
+            _unsynced.discard(self)
+            if self._file is not None and self._pid == os.getpid():
+                os.fsync(self._file.fileno())
+                self._last_fsync = time.monotonic()
+
+    def _read_log(self) -> List[Dict]:
+        """Decode complete lines after the current offset and advance it"""
+        if not os.path.exists(self.path):
+            return []
+        with open(self.path, 'rb') as f:
+            f.seek(self._offset)
+            data = f.read()
+        end = data.rfind(b'\n') + 1
+        records = []
+        for line in data[:end].decode('utf-8', errors='replace').split('\n'):
+            decoded = _decode(line)
+            if decoded is None:
+                continue
+            seq, record = decoded
+            if seq and seq <= self._snapshot_seq:
+                continue
+            records.append(record)
+            self._seq = max(self._seq, seq)
+        self._offset += end
+        self._log_records += len(records)
+        return records
+
+    @staticmethod
+    def _file_key(path: str):
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return st.st_ino, st.st_mtime_ns, st.st_size
+
+    @staticmethod
+    def _read_lines(path: str) -> Iterator:
+        if not os.path.exists(path):
+            return
+        with open(path, 'r') as f:
+            for line in f:
+                decoded = _decode(line)
+                if decoded is not None:
+                    yield decoded
+
+
+
+@atexit.register
+def _sync_at_exit():
+    for store in list(_unsynced):
+        store._deferred_sync()
+
+
+class JsonlRecordStore:
+    """In-memory indexed view over a JsonlStore log.
+
+    Records get a 0-based ``id`` equal to their position. Ids are assigned in
+    write order under the log's write lock, so they are unique across worker
+    processes and double as pagination cursors. Timestamps are taken before
+    the lock, so writers in other processes can leave them slightly out of
+    id order; ``since`` filters compare them per record once that happens.
+    Concurrent appends are group-committed into one write and one fsync.
+    """
+
+    def __init__(self, path: str, fsync: str = None, default_status: str = None,
+                 group_commit_window: float = None):
+        self.log = JsonlStore(path, fsync=fsync)
+        self.default_status = default_status
+        self._lock = threading.RLock()
+        self._committer = GroupCommitter(self._flush, window=group_commit_window)
+        self._reset(self.log.load())
+
+    def append(self, record: Dict) -> int:
+        return self._committer.submit(record)
+
+    def get(self, record_id: int) -> Optional[Dict]:
+        self._refresh()
+        if 0 <= record_id < len(self.records):
+            return self.records[record_id]
+        return None
+
+    def count(self) -> int:
+        self._refresh()
+        return len(self.records)
+
+    def status_counts(self) -> Dict[str, int]:
+        self._refresh()
+        return dict(self._counts)
+
+    def last_timestamp(self) -> str:
+        """Timestamp of the newest record, or '' when empty"""
+        self._refresh()
+        return self._newest
+
+    def all(self) -> List[Dict]:
+        self._refresh()
+        return self.records
+
+    def query(self, status: str = None, since: str = None, policy_hash: str = None,
+              cursor: int = None, limit: int = None) -> Tuple[List[Dict], Optional[int]]:
+        """Return records matching the filters with id > cursor, in id order"""
+        self._refresh()
+        start = -1 if cursor is None else cursor
+        # In timestamp order a time filter becomes an id bound; otherwise each id is checked
+        filter_since = since and not self._in_order
+        if since and self._in_order:
+            start = max(start, bisect_left(self._timestamps, since) - 1)
+
+        if status is not None or policy_hash is not None:
+            candidates = self._ids_by_status.get(status) if status is not None else None
+            if policy_hash is not None:
+                by_hash = self._ids_by_hash.get(policy_hash, [])
+                if candidates is None:
+                    candidates = by_hash
+                else:
+                    wanted = set(by_hash)
+                    candidates = [i for i in candidates if i in wanted]
+            candidates = candidates or []
+            pos = bisect_right(candidates, start)
+            if filter_since:
+                ids = (candidates[i] for i in range(pos, len(candidates)))
+            else:
+                ids = candidates[pos:pos + limit] if limit else candidates[pos:]
+        else:
+            stop = start + 1 + limit if limit and not filter_since else len(self.records)
+            ids = range(start + 1, min(stop, len(self.records)))
+        if filter_since:
+            timestamps = self._timestamps
+            ids = islice((i for i in ids if timestamps[i] >= since), limit)
+
+        page = [self.records[i] for i in ids]
+        next_cursor = page[-1]['id'] if limit and len(page) == limit else None
+        return page, next_cursor
+
+    def close(self):
+        self.log.close()
+
+    def _flush(self, batch: List[Dict]) -> List[int]:
+        with self._lock, self.log.locked():
+            ids = self._write(batch)
+            self.log.maybe_compact()
+        return ids
+
+    def _write(self, batch: List[Dict], sync: bool = True) -> List[int]:
+        # The caller holds both self._lock and self.log.locked()
+        self._catch_up()
+        next_id = len(self.records)
+        for offset, record in enumerate(batch):
+            record['id'] = next_id + offset
+            if self.default_status:
+                record.setdefault('status', self.default_status)
+        self.log.write_batch(batch, sync=sync)
+        for record in batch:
+            self._index(record)
+        return [record['id'] for record in batch]
+
+    def _refresh(self):
+        with self._lock:
+            self._catch_up()
+
+    def _catch_up(self):
+        reset, records = self.log.read_new()
+        if reset:
+            self._reset(records)
+        else:
+            for record in records:
+                self._index(record)
+
+    def _reset(self, records: List[Dict]):
+        self.records = []
+        self._timestamps = []
+        self._newest = ''
+        self._in_order = True
+        self._ids_by_status = {}
+        self._ids_by_hash = {}
+        self._counts = {}
+        for record in records:
+            self._index(record)
+
+    def _index(self, record: Dict):
+        record_id = len(self.records)
+        record['id'] = record_id
+        if self.default_status:
+            record.setdefault('status', self.default_status)
+        status = record.get('status')
+        self.records.append(record)
+        timestamp = record.get('timestamp', '')
+        if timestamp < self._newest:
+            self._in_order = False
+        else:
+            self._newest = timestamp
+        self._timestamps.append(timestamp)
+        self._ids_by_status.setdefault(status, []).append(record_id)
+        self._ids_by_hash.setdefault(hash_policy(record.get('policy', '')), []).append(record_id)
+        self._counts[status] = self._counts.get(status, 0) + 1
+
+
+def hash_policy(policy: str) -> str:
+    """Short stable hash of a policy body, ignoring surrounding whitespace"""
+    return hashlib.sha256(policy.strip().encode('utf-8')).hexdigest()[:16]
+
+
+def append_together(entries: List[Tuple[JsonlRecordStore, Dict]]) -> List[int]:
+    """Append one record to each store while holding every store's write lock.
+
+    All records are written before any log is synced, so no other writer
+    gets in between them and they reach disk together. Separate files
+    cannot be written atomically: a crash between two writes still leaves
+    the earlier records without the later ones.
+    """
+    stores = sorted({id(store): store for store, _ in entries}.values(), key=lambda store: store.log.path)
+    with ExitStack() as stack:
+        # Locks are always taken in path order, so two callers cannot deadlock
+        for store in stores:
+            stack.enter_context(store._lock)
+            stack.enter_context(store.log.locked())
+        ids = [store._write([record], sync=False)[0] for store, record in entries]
+        for store in stores:
+            store.log.sync()
+        for store in stores:
+            store.log.maybe_compact()
+    return ids
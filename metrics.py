@@ -0,0 +1,197 @@
+import math
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Tuple
+
+# Seconds; covers in-memory work through slow model calls
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _labels(names: Tuple[str, ...], values: Tuple) -> str:
+    if not names:
+        return ''
+    pairs = ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return '{' + pairs + '}'
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _number(value: float) -> str:
+    if value == math.inf:
+        return '+Inf'
+    if isinstance(value, int) or float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Counter:
+    """Monotonic count per label combination"""
+    kind = 'counter'
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(labels.get(name, '') for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(tuple(labels.get(name, '') for name in self.labels), 0)
+
+    def samples(self) -> List[Tuple[str, str, float]]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [(self.name, _labels(self.labels, key), value) for key, value in items]
+
+
+class Histogram:
+    """Bucketed observations (usually seconds) per label combination.
+
+    ``observe`` costs a bisect and three additions under a lock; cumulative
+    bucket counts are only computed when the registry is rendered.
+    """
+    kind = 'histogram'
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = (), buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(labels.get(name, '') for name in self.labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                series = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the duration of the with-block"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels) -> int:
+        series = self._values.get(tuple(labels.get(name, '') for name in self.labels))
+        return series[2] if series else 0
+
+    def samples(self) -> List[Tuple[str, str, float]]:
+        with self._lock:
+            items = sorted((key, (list(series[0]), series[1], series[2])) for key, series in self._values.items())
+        samples = []
+        names = self.labels + ('le',)
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets + (math.inf,), counts):
+                cumulative += n
+                samples.append((self.name + '_bucket', _labels(names, key + (_number(bound),)), cumulative))
+            samples.append((self.name + '_sum', _labels(self.labels, key), total))
+            samples.append((self.name + '_count', _labels(self.labels, key), count))
+        return samples
+
+
+class CallbackMetric:
+    """Gauge or counter read from ``callback`` at scrape time.
+
+    The callback returns a number, or a dict mapping label-value tuples to
+    numbers. Errors are swallowed so one broken source cannot fail a scrape.
+    """
+
+    def __init__(self, name: str, help: str, callback: Callable, labels: Tuple[str, ...] = (), kind: str = 'gauge'):
+        self.name = name
+        self.help = help
+        self.callback = callback
+        self.labels = tuple(labels)
+        self.kind = kind
+
+    def samples(self) -> List[Tuple[str, str, float]]:
+        try:
+            value = self.callback()
+        except Exception:
+            return []
+        if not isinstance(value, dict):
+            value = {(): value}
+        return [(self.name, _labels(self.labels, key if isinstance(key, tuple) else (key,)), v)
+                for key, v in sorted(value.items()) if v is not None]
+
+
+class Registry:
+    """Named metrics rendered together in the Prometheus text format"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            # Re-registering a name (e.g. a module reloaded in tests) replaces the old metric
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labels: Tuple[str, ...] = ()) -> Counter:
+        return self._register(Counter(name, help, labels))
+
+    def histogram(self, name: str, help: str, labels: Tuple[str, ...] = (),
+                  buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help, labels, buckets))
+
+    def gauge(self, name: str, help: str, callback: Callable, labels: Tuple[str, ...] = ()) -> CallbackMetric:
+        return self._register(CallbackMetric(name, help, callback, labels))
+
+    def callback_counter(self, name: str, help: str, callback: Callable, labels: Tuple[str, ...] = ()) -> CallbackMetric:
+        return self._register(CallbackMetric(name, help, callback, labels, kind='counter'))
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda m: m.name)
+        lines = []
+        for metric in metrics:
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            for name, labels, value in metric.samples():
+                lines.append(f'{name}{labels} {_number(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+STAGE_SECONDS = REGISTRY.histogram(
+    'policy_stage_seconds', 'Time spent in each step of policy generation', ('stage',))
+MODEL_CALLS = REGISTRY.counter(
+    'model_calls_total', 'Model invocations by outcome (success, throttle, fallback, replay, replay_miss)', ('outcome',))
+STORE_WRITE_SECONDS = REGISTRY.histogram(
+    'policy_store_write_seconds', 'Time to persist approvals and history entries', ('operation',))
+HTTP_REQUEST_SECONDS = REGISTRY.histogram(
+    'http_request_seconds', 'Web request latency by endpoint', ('endpoint', 'method'))
+HTTP_REQUESTS = REGISTRY.counter(
+    'http_requests_total', 'Web requests by endpoint and status code', ('endpoint', 'method', 'status'))
+MODEL_ROUTE_SECONDS = REGISTRY.histogram(
+    'model_route_seconds', 'Model call latency by route', ('route',))
+MODEL_ROUTE_RESULTS = REGISTRY.counter(
+    'model_route_results_total', 'Generations by route and validation outcome', ('route', 'outcome'))
+MODEL_ESCALATIONS = REGISTRY.counter(
+    'model_escalations_total', 'Failed fast-route results retried on the strong route')
+MODEL_HEDGES = REGISTRY.counter(
+    'model_hedges_total', 'Slow model calls that were duplicated (sent) or not because of the hedge rate cap (capped)',
+    ('outcome',))
+MODEL_HEDGE_WINS = REGISTRY.counter(
+    'model_hedge_wins_total', 'Hedged model calls by the attempt that answered first (primary or hedge)', ('winner',))
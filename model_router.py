@@ -0,0 +1,202 @@
+import math
+import os
+import re
+import threading
+from collections import deque
+from typing import Dict, List, Optional
+from bedrock_client import MODEL_ID
+from metrics import MODEL_ROUTE_SECONDS, MODEL_ROUTE_RESULTS, MODEL_ESCALATIONS
+from policy_search import tokenize
+
+# auto (route by complexity), or fast/strong to send everything to one route
+DEFAULT_MODE = os.environ.get('MODEL_ROUTING', 'auto')
+FAST_MODEL_ID = os.environ.get('MODEL_FAST_ID', MODEL_ID)
+FAST_MAX_TOKENS = int(os.environ.get('MODEL_FAST_MAX_TOKENS', 600))
+STRONG_MODEL_ID = os.environ.get('MODEL_STRONG_ID', 'anthropic.claude-3-5-sonnet-20240620-v1:0')
+STRONG_MAX_TOKENS = int(os.environ.get('MODEL_STRONG_MAX_TOKENS', 1500))
+# Milliseconds; 0 means requests have no latency budget unless they pass one
+DEFAULT_BUDGET_MS = float(os.environ.get('MODEL_LATENCY_BUDGET_MS', 0))
+LATENCY_SAMPLES = 256
+
+CONNECTIVES = {'and', 'or', 'unless', 'except', 'but', 'also', 'either', 'neither', 'nor', 'otherwise'}
+CONDITION_RE = re.compile(r'[<>]=?|==|!=|\b(?:over|above|under|below|exceed\w*|more than|less than|at least|'
+                          r'at most|between|after|before|during|outside|within|only if|when|while)\b', re.IGNORECASE)
+SIMPLE_MAX_WORDS = 30
+
+
+def stem(word: str) -> str:
+    """Crude suffix stripping so 'creating transactions' matches CreateTransaction"""
+    for suffix in ('ing', 'ed', 'es', 's', 'e'):
+        if word.endswith(suffix) and len(word) - len(suffix) >= 4:
+            return word[:-len(suffix)]
+    return word
+
+
+def stems(name: str) -> frozenset:
+    """Stems of an identifier's CamelCase parts, e.g. CreateTransaction -> {creat, transaction}"""
+    parts = tokenize(name)
+    return frozenset(stem(part) for part in (parts[1:] if len(parts) > 1 else parts))
+
+
+class Route:
+    """A model and the response size it is allowed"""
+    __slots__ = ('name', 'model_id', 'max_tokens')
+
+    def __init__(self, name: str, model_id: str, max_tokens: int):
+        self.name = name
+        self.model_id = model_id
+        self.max_tokens = max_tokens
+
+    def to_dict(self) -> Dict:
+        return {'route': self.name, 'model_id': self.model_id, 'max_tokens': self.max_tokens}
+
+
+class RequirementClassifier:
+    """Sorts requirements into ``simple`` and ``complex`` using the schema's names.
+
+    A requirement is simple when it mentions at most one action and two
+    entity types, has at most one condition and one connective (and, or,
+    unless...), and is short. Multi-action, multi-entity or compound
+    requirements are complex. Schema names are indexed by stem once.
+    """
+
+    def __init__(self, schema_context: Dict):
+        self._index = {}
+        for kind in ('actions', 'entities'):
+            for name in schema_context.get(kind) or ():
+                name_stems = stems(name)
+                for s in name_stems:
+                    self._index.setdefault(s, []).append((kind, name, name_stems))
+
+    def classify(self, requirement: str, conversation_context: str = '') -> Dict:
+        words = tokenize(requirement, split_identifiers=False)
+        found = {stem(word) for word in words}
+        mentioned = {'actions': set(), 'entities': set()}
+        for s in found:
+            for kind, name, name_stems in self._index.get(s, ()):
+                if name_stems <= found:
+                    mentioned[kind].add(name)
+        conditions = len(CONDITION_RE.findall(requirement))
+        connectives = sum(word in CONNECTIVES for word in words)
+        simple = (len(mentioned['actions']) <= 1 and len(mentioned['entities']) <= 2
+                  and conditions <= 1 and connectives <= 1 and len(words) <= SIMPLE_MAX_WORDS)
+        return {
+            'complexity': 'simple' if simple else 'complex',
+            'actions': sorted(mentioned['actions']),
+            'entities': sorted(mentioned['entities']),
+            'conditions': conditions,
+            'connectives': connectives,
+            'follow_up': bool(conversation_context)
+        }
+
+
+class ModelRouter:
+    """Chooses the model for each generation and learns how each route performs.
+
+    Simple requirements go to the ``fast`` route, complex ones to ``strong``.
+    A fast result that fails validation is retried on the strong route. With
+    a latency budget, the strong route is only used (first or as an
+    escalation) while its recent median latency still fits in what is left
+    of the budget, and only if ``admit()`` (when set) allows one more model
+    call. The budget only guides that choice: no timeout is put on the call
+    itself, so a slow model can still overrun it (``within_budget`` and the
+    ``over_budget`` count report when it does). Latency and validation pass
+    rates are kept per route for /models/stats and exported as metrics.
+    """
+
+    def __init__(self, routes: List[Route] = None, mode: str = None, default_budget: float = None):
+        routes = routes or [Route('fast', FAST_MODEL_ID, FAST_MAX_TOKENS),
+                            Route('strong', STRONG_MODEL_ID, STRONG_MAX_TOKENS)]
+        self.routes = {route.name: route for route in routes}
+        self.mode = mode or DEFAULT_MODE
+        if self.mode != 'auto' and self.mode not in self.routes:
+            raise ValueError(f"Unknown MODEL_ROUTING {self.mode!r}, expected auto or one of {sorted(self.routes)}")
+        self.default_budget = DEFAULT_BUDGET_MS / 1000 if default_budget is None else default_budget
+        self._lock = threading.Lock()
+        self._latencies = {name: deque(maxlen=LATENCY_SAMPLES) for name in self.routes}
+        self._counts = {name: {'calls': 0, 'valid': 0} for name in self.routes}
+        self._escalations = 0
+        self._refused = 0
+        self._over_budget = 0
+        # Called before an escalation; returning False skips the retry
+        self.admit = None
+
+    def choose(self, complexity: str, budget: float = None) -> Route:
+        if self.mode != 'auto':
+            return self.routes[self.mode]
+        if complexity == 'complex' and self.fits('strong', 0.0, budget):
+            return self.routes['strong']
+        return self.routes['fast']
+
+    def escalation(self, route: Route, elapsed: float, budget: float = None) -> Optional[Route]:
+        """The stronger route to retry a failed result on, or None if there is none, no time or no token"""
+        if self.mode != 'auto' or route.name != 'fast' or not self.fits('strong', elapsed, budget):
+            return None
+        if self.admit is not None and not self.admit():
+            with self._lock:
+                self._refused += 1
+            return None
+        with self._lock:
+            self._escalations += 1
+        MODEL_ESCALATIONS.inc()
+        return self.routes['strong']
+
+    def fits(self, name: str, elapsed: float, budget: float = None) -> bool:
+        """Whether the route's median latency fits in the rest of the budget (unknown fits)"""
+        if not budget:
+            return True
+        expected = self.expected_latency(name)
+        return expected is None or elapsed + expected <= budget
+
+    def expected_latency(self, name: str) -> Optional[float]:
+        with self._lock:
+            samples = sorted(self._latencies[name])
+        return samples[len(samples) // 2] if samples else None
+
+    def record(self, route: Route, seconds: float, valid: bool):
+        with self._lock:
+            self._latencies[route.name].append(seconds)
+            counts = self._counts[route.name]
+            counts['calls'] += 1
+            counts['valid'] += bool(valid)
+        MODEL_ROUTE_SECONDS.observe(seconds, route=route.name)
+        MODEL_ROUTE_RESULTS.inc(route=route.name, outcome='valid' if valid else 'invalid')
+
+    def record_total(self, seconds: float, budget: float = None) -> bool:
+        """Note a finished generation; returns whether it stayed within its budget"""
+        within = not budget or seconds <= budget
+        if not within:
+            with self._lock:
+                self._over_budget += 1
+        return within
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            routes = {}
+            for name, route in self.routes.items():
+                samples = sorted(self._latencies[name])
+                counts = self._counts[name]
+                routes[name] = {
+                    **route.to_dict(),
+                    'calls': counts['calls'],
+                    'pass_rate': round(counts['valid'] / counts['calls'], 4) if counts['calls'] else None,
+                    'latency_p50_ms': _percentile_ms(samples, 0.5),
+                    'latency_p95_ms': _percentile_ms(samples, 0.95)
+                }
+            return {
+                'mode': self.mode,
+                'default_budget_ms': round(self.default_budget * 1000) if self.default_budget else None,
+                'routes': routes,
+                'escalations': self._escalations,
+                'escalations_refused': self._refused,
+                'over_budget': self._over_budget
+            }
+
+
+def _percentile_ms(samples: List[float], q: float) -> Optional[float]:
+    if not samples:
+        return None
+    return round(samples[min(len(samples) - 1, math.ceil(q * len(samples)) - 1)] * 1000, 1)
+
+
+router = ModelRouter()
@@ -0,0 +1,352 @@
+"""Compiled bundles of approved policies for downstream authorizers.
+
+An export writes two files for the same bundle version:
+
+- ``<name>.cedar`` - the approved policies as canonical Cedar text, one
+  statement per line with an ``@id("approval-<id>")`` annotation (further
+  statements of the same approval get ``approval-<id>-<n>``)
+- ``<name>.bundle`` - the same policies pre-parsed into a little-endian
+  binary file that ``PolicyBundle`` memory-maps, so loading costs a header
+  read however many policies there are
+
+Binary layout::
+
+    header   magic, format, flags, version, base_version, counts, section offsets
+    strings  (count + 1) u32 offsets into a UTF-8 blob; every name, id and
+             policy text is stored once and referred to by index
+    policies 32-byte records: approval id, id/effect/text string indices,
+             start and counts of the policy's references
+    refs     u32 string indices: actions, then entity types, then attributes
+    indexes  action and entity type entries (string, postings start, count),
+             sorted by name, over u32 postings of policy numbers
+
+Policies that name no action (or entity type) are indexed under ``""`` and
+match every lookup. The version is one past the newest approval included;
+an incremental bundle built with ``since=N`` holds only policies approved
+at or after version ``N`` that are not already in the base bundle.
+"""
+
+import mmap
+import os
+import struct
+import sys
+from array import array
+from bisect import bisect_left
+from typing import Dict, List, Optional, Tuple
+from jsonl_store import hash_policy
+from policy_parser import canonical_policy, extract_references, split_policies
+
+MAGIC = b'CPB1'
+FORMAT = 1
+FLAG_INCREMENTAL = 1
+HEADER = struct.Struct('<4sHHqq11I')
+POLICY = struct.Struct('<qIIIIHHHH')
+INDEX_ENTRY = struct.Struct('<III')
+ANY = ''
+
+
+class BundleError(Exception):
+    """Raised when a bundle file is missing, truncated or in an unknown format"""
+
+
+def collect_policies(store, since: int = None) -> Tuple[List[Dict], int]:
+    """Approved policies (de-duplicated by text) and the bundle version they make up.
+
+    With ``since``, only policies approved at or after that version whose
+    text was not already approved before it are returned.
+    """
+    cursor = None if not since else since - 1
+    policies = []
+    seen = set()
+    version = since or 0
+    while True:
+        page, cursor = store.query(status='APPROVED', cursor=cursor, limit=1000)
+        for record in page:
+            version = max(version, record['id'] + 1)
+            policy_hash = hash_policy(record.get('policy', ''))
+            if policy_hash in seen:
+                continue
+            seen.add(policy_hash)
+            if since and _approved_before(store, policy_hash, since):
+                continue
+            statements = [canonical_policy(s) for s in split_policies(record.get('policy', ''))]
+            for n, text in enumerate(statements):
+                refs = extract_references(text)
+                policies.append({
+                    'id': f"approval-{record['id']}" + (f'-{n}' if n else ''),
+                    'approval_id': record['id'],
+                    'effect': refs['effects'][0] if refs['effects'] else ANY,
+                    'policy': text,
+                    'actions': refs['actions'],
+                    'entity_types': refs['entity_types'],
+                    'attributes': refs['attributes']
+                })
+        if cursor is None:
+            return policies, version
+
+
+def _approved_before(store, policy_hash: str, before: int) -> bool:
+    # Only the hash is indexed on its own; a policy has few records, so check their status here
+    cursor = None
+    while True:
+        page, cursor = store.query(policy_hash=policy_hash, cursor=cursor, limit=100)
+        for record in page:
+            if record['id'] >= before:
+                return False
+            if record.get('status') == 'APPROVED':
+                return True
+        if cursor is None:
+            return False
+
+
+def to_cedar(policies: List[Dict], version: int, base_version: int = 0) -> str:
+    header = f'// policy bundle version {version}'
+    if base_version:
+        header += f' (changes since {base_version})'
+    lines = [header]
+    for policy in policies:
+        lines.append(f'@id("{policy["id"]}") {policy["policy"]}')
+    return '\n'.join(lines) + '\n'
+
+
+def pack(policies: List[Dict], version: int, base_version: int = 0) -> bytes:
+    """Binary bundle for ``policies``; see the module docstring for the layout"""
+    strings = {}
+
+    def intern(value: str) -> int:
+        index = strings.get(value)
+        if index is None:
+            index = strings[value] = len(strings)
+        return index
+
+    records = bytearray()
+    refs = array('I')
+    by_action = {}
+    by_type = {}
+    for number, policy in enumerate(policies):
+        start = len(refs)
+        for kind in ('actions', 'entity_types', 'attributes'):
+            refs.extend(intern(name) for name in policy[kind])
+        records += POLICY.pack(policy['approval_id'], intern(policy['id']), intern(policy['effect']),
+                               intern(policy['policy']), start, len(policy['actions']),
+                               len(policy['entity_types']), len(policy['attributes']), 0)
+        for name in policy['actions'] or [ANY]:
+            by_action.setdefault(name, []).append(number)
+        for name in policy['entity_types'] or [ANY]:
+            by_type.setdefault(name, []).append(number)
+
+    postings = array('I')
+
+    def index(groups: Dict[str, List[int]]) -> bytes:
+        entries = bytearray()
+        for name in sorted(groups):
+            entries += INDEX_ENTRY.pack(intern(name), len(postings), len(groups[name]))
+            postings.extend(groups[name])
+        return bytes(entries)
+
+    action_index = index(by_action)
+    type_index = index(by_type)
+
+    blob = bytearray()
+    offsets = array('I', [0])
+    for value in strings:
+        blob += value.encode('utf-8')
+        offsets.append(len(blob))
+
+    sections = [_le(offsets), bytes(blob), bytes(records), _le(refs), action_index, type_index, _le(postings)]
+    positions = []
+    position = HEADER.size
+    for section in sections:
+        position += -position % 4
+        positions.append(position)
+        position += len(section)
+    flags = FLAG_INCREMENTAL if base_version else 0
+    out = bytearray(HEADER.pack(MAGIC, FORMAT, flags, version, base_version, len(policies), len(strings),
+                                positions[0], positions[1], positions[2], positions[3], positions[4],
+                                len(by_action), positions[5], len(by_type), positions[6]))
+    for position, section in zip(positions, sections):
+        out += b'\0' * (position - len(out))
+        out += section
+    return bytes(out)
+
+
+def _le(values: array) -> bytes:
+    if sys.byteorder != 'little':
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def _write_atomic(path: str, data):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb' if isinstance(data, bytes) else 'w') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def export_bundle(store, out: str, since: int = None) -> Dict:
+    """Write ``<out>.cedar`` and ``<out>.bundle``; returns what was written"""
+    policies, version = collect_policies(store, since)
+    base_version = since or 0
+    _write_atomic(out + '.cedar', to_cedar(policies, version, base_version))
+    data = pack(policies, version, base_version)
+    _write_atomic(out + '.bundle', data)
+    return {
+        'version': version,
+        'base_version': base_version,
+        'policies': len(policies),
+        'files': [out + '.cedar', out + '.bundle'],
+        'bytes': len(data)
+    }
+
+
+class PolicyBundle:
+    """Read-only view of a binary bundle, memory-mapped from a file or wrapping bytes.
+
+    Only the header is read up front; strings are decoded when first used
+    and index lookups binary-search the mapped sections.
+    """
+
+    def __init__(self, data):
+        self._mmap = None
+        self._buf = memoryview(data)
+        if len(self._buf) < HEADER.size:
+            raise BundleError('Bundle is truncated')
+        (magic, fmt, flags, self.version, self.base_version, self._count, self._string_count,
+         offsets_at, self._blob_at, self._records_at, self._refs_at, self._actions_at,
+         self._action_count, self._types_at, self._type_count, self._postings_at) = HEADER.unpack_from(self._buf)
+        if magic != MAGIC or fmt != FORMAT:
+            raise BundleError(f'Not a policy bundle (format {fmt})' if magic == MAGIC else 'Not a policy bundle')
+        self.incremental = bool(flags & FLAG_INCREMENTAL)
+        self._offsets = self._u32(offsets_at, self._string_count + 1)
+        self._strings = {}
+
+    @classmethod
+    def open(cls, path: str) -> 'PolicyBundle':
+        try:
+            with open(path, 'rb') as f:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError) as e:
+            raise BundleError(f'Cannot open bundle {path}: {e}')
+        bundle = cls(mapped)
+        bundle._mmap = mapped
+        return bundle
+
+    def close(self):
+        if isinstance(self._offsets, memoryview):
+            self._offsets.release()
+        self._buf.release()
+        if self._mmap is not None:
+            self._mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return self._count
+
+    def _u32(self, offset: int, count: int):
+        view = self._buf[offset:offset + 4 * count]
+        if sys.byteorder == 'little':
+            return view.cast('I')
+        values = array('I', view.tobytes())
+        values.byteswap()
+        return values
+
+    def string(self, index: int) -> str:
+        value = self._strings.get(index)
+        if value is None:
+            start = self._blob_at + self._offsets[index]
+            end = self._blob_at + self._offsets[index + 1]
+            value = self._strings[index] = str(self._buf[start:end], 'utf-8')
+        return value
+
+    def policy(self, number: int) -> Dict:
+        if not 0 <= number < self._count:
+            raise IndexError(number)
+        (approval_id, id_index, effect, text, start, actions, types,
+         attributes, _) = POLICY.unpack_from(self._buf, self._records_at + number * POLICY.size)
+        refs = [self.string(i) for i in self._u32(self._refs_at + 4 * start, actions + types + attributes)]
+        return {
+            'id': self.string(id_index),
+            'approval_id': approval_id,
+            'effect': self.string(effect),
+            'policy': self.string(text),
+            'actions': refs[:actions],
+            'entity_types': refs[actions:actions + types],
+            'attributes': refs[actions + types:]
+        }
+
+    def __iter__(self):
+        return (self.policy(number) for number in range(self._count))
+
+    def _postings(self, at: int, count: int, name: str) -> List[int]:
+        entries = _IndexNames(self, at, count)
+        pos = bisect_left(entries, name)
+        if pos == count or entries[pos] != name:
+            return []
+        _, start, length = INDEX_ENTRY.unpack_from(self._buf, at + pos * INDEX_ENTRY.size)
+        return list(self._u32(self._postings_at + 4 * start, length))
+
+    def _matching(self, at: int, count: int, name: Optional[str]) -> Optional[set]:
+        if name is None:
+            return None
+        return set(self._postings(at, count, name)) | set(self._postings(at, count, ANY))
+
+    def policies(self, action: str = None, entity_type: str = None) -> List[Dict]:
+        """Policies naming ``action`` and mentioning ``entity_type``, plus those naming none.
+
+        None matches anything. Entity types are matched as mentioned anywhere
+        in the policy (principal, resource or conditions), so the action
+        index is the precise one for selecting policies at request time.
+        """
+        numbers = None
+        for found in (self._matching(self._actions_at, self._action_count, action),
+                      self._matching(self._types_at, self._type_count, entity_type)):
+            if found is not None:
+                numbers = found if numbers is None else numbers & found
+        if numbers is None:
+            numbers = range(self._count)
+        return [self.policy(number) for number in sorted(numbers)]
+
+    def names(self, kind: str) -> List[str]:
+        """Indexed action or entity type names (``kind`` is 'actions' or 'entity_types')"""
+        at, count = ((self._actions_at, self._action_count) if kind == 'actions'
+                     else (self._types_at, self._type_count))
+        return [name for name in _IndexNames(self, at, count) if name != ANY]
+
+
+class _IndexNames:
+    """Sequence of an index's names, decoded on access so bisect can search it"""
+
+    def __init__(self, bundle: PolicyBundle, at: int, count: int):
+        self._bundle = bundle
+        self._at = at
+        self._count = count
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, pos: int) -> str:
+        if not 0 <= pos < self._count:
+            raise IndexError(pos)
+        string_index, _, _ = INDEX_ENTRY.unpack_from(self._bundle._buf, self._at + pos * INDEX_ENTRY.size)
+        return self._bundle.string(string_index)
+
+
+if __name__ == '__main__':
+    import argparse
+    from approval_manager import ApprovalManager
+
+    parser = argparse.ArgumentParser(description='Compile approved policies into a Cedar bundle')
+    parser.add_argument('--approvals', default='policy_approvals.json')
+    parser.add_argument('--out', default='policy_bundle', help='Writes <out>.cedar and <out>.bundle')
+    parser.add_argument('--since', type=int, help='Only policies approved at or after this bundle version')
+    args = parser.parse_args()
+    result = export_bundle(ApprovalManager(args.approvals).store, args.out, args.since)
+    kind = f"incremental since {result['base_version']}" if result['base_version'] else 'full'
+    print(f"Bundle version {result['version']} ({kind}): {result['policies']} policies, "
+          f"{result['bytes']} bytes -> {', '.join(result['files'])}")
@@ -0,0 +1,233 @@
+"""Which schema actions, entity types and attributes the approved policies govern.
+
+``ReferenceIndex`` counts what each distinct approved policy refers to. A
+refresh reads only the approvals recorded since the previous one, so
+keeping it current costs as much as the new policies. ``coverage`` joins
+the index with the schema: an action is covered when a policy names it
+or an action group it belongs to, an entity type when a policy names it
+or a covered action applies to it, and an attribute when a policy reads
+it from a principal or resource that can be of that type. The join works
+on the index's distinct references rather than on the policies, so it
+stays fast however many policies are approved.
+
+Policies with no action constraint apply to every action but are not
+counted as covering any; the report gives their number instead.
+"""
+
+import re
+import threading
+from collections import Counter
+from typing import Dict, List
+from jsonl_store import hash_policy
+from policy_parser import extract_references, split_policies
+
+# Types a policy pins its principal or resource to: ``== Type::"id"`` or ``is Type``
+SCOPE_TYPE_RE = re.compile(r'\b(principal|resource)\s*(?:==\s*(\w+)::"|is\s+(\w+))')
+APPLIES_TO = {'principal': 'principalTypes', 'resource': 'resourceTypes'}
+
+
+class ReferenceIndex:
+    """Counts of the actions, entity types and attributes approved policies refer to.
+
+    Attributes are counted per ``(scope, name, target)``, where the target
+    says which entity types the attribute can belong to: ``('type', T)``
+    when the policy pins the scope to T, ``('action', A)`` for each action
+    it names otherwise, or None when it constrains neither.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.version = 0
+        self.policies = 0
+        self.wildcard_policies = 0
+        self.actions = Counter()
+        self.entity_types = Counter()
+        self.attributes = Counter()
+        self._seen = set()
+
+    def refresh(self, store) -> int:
+        """Index the approvals recorded since the last refresh; returns the number of policies added"""
+        with self._lock:
+            if store.count() < self.version:
+                # The store was replaced by a shorter one; start over
+                self._reset()
+            added = 0
+            cursor = self.version - 1 if self.version else None
+            while True:
+                page, cursor = store.query(status='APPROVED', cursor=cursor, limit=1000)
+                for record in page:
+                    self.version = record['id'] + 1
+                    policy = record.get('policy', '')
+                    policy_hash = hash_policy(policy)
+                    if policy_hash in self._seen:
+                        continue
+                    self._seen.add(policy_hash)
+                    for statement in split_policies(policy):
+                        self._add(statement)
+                        added += 1
+                if cursor is None:
+                    return added
+
+    def add(self, policy: str):
+        """Index one policy statement directly, e.g. one not yet approved"""
+        with self._lock:
+            self._add(policy)
+
+    def _add(self, policy: str):
+        refs = extract_references(policy)
+        self.policies += 1
+        if not refs['actions']:
+            self.wildcard_policies += 1
+        self.actions.update(refs['actions'])
+        self.entity_types.update(refs['entity_types'])
+        pinned = {}
+        for scope, equal_type, is_type in SCOPE_TYPE_RE.findall(policy):
+            pinned.setdefault(scope, []).append(equal_type or is_type)
+        for attribute in refs['attributes']:
+            scope, name = attribute.split('.', 1)
+            if scope not in APPLIES_TO:
+                continue
+            if scope in pinned:
+                targets = [('type', entity_type) for entity_type in pinned[scope]]
+            elif refs['actions']:
+                targets = [('action', action) for action in refs['actions']]
+            else:
+                targets = [None]
+            self.attributes.update((scope, name, target) for target in dict.fromkeys(targets))
+
+
+def _action_groups(definition: Dict) -> List[str]:
+    groups = []
+    for parent in (definition or {}).get('memberOf') or ():
+        groups.append(parent.get('id') if isinstance(parent, dict) else parent)
+    return [group for group in groups if group]
+
+
+def _section(names: List[str], covered: set) -> Dict:
+    uncovered = [name for name in names if name not in covered]
+    total = len(names)
+    return {
+        'total': total,
+        'covered': total - len(uncovered),
+        'coverage': round((total - len(uncovered)) / total, 4) if total else 1.0,
+        'uncovered': uncovered
+    }
+
+
+def coverage(schema_context: Dict, index: ReferenceIndex) -> Dict:
+    """Coverage of the schema in ``schema_context`` by the policies in ``index``.
+
+    Uncovered names keep schema order; attributes are ``Type.attribute``.
+    Names policies refer to that the schema does not define are listed
+    under ``unknown``.
+    """
+    entity_details = schema_context.get('entity_details') or {name: {} for name in schema_context.get('entities', ())}
+    action_details = schema_context.get('action_details') or {name: {} for name in schema_context.get('actions', ())}
+    with index._lock:
+        referenced_actions = set(index.actions)
+        referenced_types = set(index.entity_types)
+        references = list(index.attributes)
+        totals = {'version': index.version, 'policies': index.policies,
+                  'wildcard_policies': index.wildcard_policies}
+
+    # Actions are covered through any action group they belong to, directly or not
+    covered_actions = referenced_actions & action_details.keys()
+    for action in action_details:
+        if action in covered_actions or not (action_details[action] or {}).get('memberOf'):
+            continue
+        stack, seen = [action], set()
+        while stack:
+            current = stack.pop()
+            if current in referenced_actions:
+                covered_actions.add(action)
+                break
+            if current not in seen:
+                seen.add(current)
+                stack.extend(_action_groups(action_details.get(current)))
+
+    covered_types = referenced_types & entity_details.keys()
+    for action in covered_actions:
+        applies = (action_details[action] or {}).get('appliesTo') or {}
+        covered_types.update(applies.get('principalTypes') or ())
+        covered_types.update(applies.get('resourceTypes') or ())
+
+    attributes = {}
+    types_with = {}
+    for entity_type, definition in entity_details.items():
+        names = (((definition or {}).get('shape') or {}).get('attributes') or {})
+        attributes[entity_type] = names
+        for name in names:
+            types_with.setdefault(name, []).append(entity_type)
+    covered_attributes = set()
+    for scope, name, target in references:
+        if target is None:
+            candidates = types_with.get(name, ())
+        elif target[0] == 'type':
+            candidates = (target[1],)
+        else:
+            applies = (action_details.get(target[1]) or {}).get('appliesTo') or {}
+            candidates = applies.get(APPLIES_TO[scope]) or ()
+        for entity_type in candidates:
+            if name in attributes.get(entity_type, ()):
+                covered_attributes.add(f'{entity_type}.{name}')
+
+    return {
+        **totals,
+        'actions': _section(list(action_details), covered_actions),
+        'entity_types': _section(list(entity_details), covered_types),
+        'attributes': _section([f'{entity_type}.{name}' for entity_type, names in attributes.items()
+                                for name in names], covered_attributes),
+        'unknown': {
+            'actions': sorted(referenced_actions - action_details.keys()),
+            'entity_types': sorted(referenced_types - entity_details.keys())
+        }
+    }
+
+
+def format_coverage(report: Dict, limit: int = 20) -> str:
+    lines = [f"{report['policies']} approved policies (version {report['version']}), "
+             f"{report['wildcard_policies']} without an action constraint"]
+    for key, label in (('actions', 'Actions'), ('entity_types', 'Entity types'), ('attributes', 'Attributes')):
+        section = report[key]
+        lines.append(f"{label}: {section['covered']}/{section['total']} covered ({section['coverage']:.0%})")
+        uncovered = section['uncovered']
+        if uncovered:
+            more = f' and {len(uncovered) - limit} more' if len(uncovered) > limit else ''
+            lines.append(f"  not governed: {', '.join(uncovered[:limit])}{more}")
+    for key, names in report['unknown'].items():
+        if names:
+            lines.append(f"  referenced but not in the schema ({key}): {', '.join(names[:limit])}")
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    import argparse
+    import json
+    from approval_manager import ApprovalManager
+    from policy_recommender import PolicyRecommender
+    from schema_parser import SchemaParser
+
+    parser = argparse.ArgumentParser(description='Show which parts of the schema no approved policy governs')
+    parser.add_argument('--schema', default='sample_banking_schema.json')
+    parser.add_argument('--approvals', default='policy_approvals.json')
+    parser.add_argument('--recommend', action='store_true', help='Also list recommendations for uncovered elements')
+    parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+    args = parser.parse_args()
+
+    schema = SchemaParser()
+    schema.load_schema(args.schema)
+    index = ReferenceIndex()
+    index.refresh(ApprovalManager(args.approvals).store)
+    result = coverage(schema.get_schema_context(), index)
+    if args.recommend:
+        recommender = PolicyRecommender(schema.get_schema_context(), schema.fingerprint)
+        result['recommendations'] = recommender.coverage_recommendations(result)
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        print(format_coverage(result))
+        for rec in result.get('recommendations', ()):
+            print(f"  → {rec['title']} [{rec['priority']}]: covers {', '.join(rec['covers'])}")
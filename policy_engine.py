@@ -0,0 +1,835 @@
+"""Evaluates Cedar policies against authorization requests.
+
+Covers the Cedar used by generated and approved policies: ``==``/``in``/
+``is`` scope constraints (including action lists), ``when``/``unless``
+conditions with ``&&``, ``||``, ``!``, comparisons, ``+ - *``, ``in``,
+``has``, ``like``, ``is``, ``if then else``, set and record literals, and
+the ``contains``/``containsAll``/``containsAny`` methods. Extension
+functions (``ip``, ``decimal``) parse but fail when evaluated.
+
+As in Cedar, a request is allowed when some permit policy is satisfied and
+no forbid policy is, and a policy whose condition fails to evaluate (a
+missing attribute, a type mismatch) is skipped and reported as an error.
+Entities and requests use Cedar's JSON format: ``{"type": ..., "id": ...}``
+or ``'Type::"id"'`` for uids, and ``{"__entity": {...}}`` in attributes.
+"""
+
+import re
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+from policy_parser import split_policies
+
+TOKEN_RE = re.compile(r'''
+    (?P<space>\s+|//[^\n]*)
+  | (?P<string>"(?:[^"\\]|\\.)*")
+  | (?P<int>\d+)
+  | (?P<ident>[A-Za-z_][A-Za-z0-9_]*)
+  | (?P<op>::|==|!=|<=|>=|&&|\|\||[<>!+\-*.,;:()\[\]{}@?])
+''', re.VERBOSE)
+RELATIONS = ('==', '!=', '<', '<=', '>', '>=', 'in')
+LONG_MIN, LONG_MAX = -2 ** 63, 2 ** 63 - 1
+VARIABLES = ('principal', 'action', 'resource', 'context')
+
+
+class PolicyParseError(ValueError):
+    """Raised for Cedar text outside the supported grammar"""
+
+
+class EvaluationError(Exception):
+    """A condition could not be evaluated; the policy does not apply"""
+
+
+class EntityUid(NamedTuple):
+    type: str
+    id: str
+
+    def __str__(self):
+        return f'{self.type}::"{self.id}"'
+
+
+def parse_uid(value) -> EntityUid:
+    """Uid from ``{"type", "id"}``, ``{"__entity": {...}}`` or ``'Type::"id"'``"""
+    if type(value) is dict:
+        value = value.get('__entity', value)
+        uid = value['id']
+        return EntityUid(value['type'], uid if type(uid) is str else str(uid))
+    if isinstance(value, EntityUid):
+        return value
+    if isinstance(value, str):
+        entity_type, sep, rest = value.partition('::')
+        if sep and len(rest) >= 2 and rest[0] == rest[-1] == '"':
+            return EntityUid(entity_type, rest[1:-1])
+    raise ValueError(f'Not an entity uid: {value!r}')
+
+
+def json_value(value):
+    """Cedar value for a JSON attribute: lists become sets, entity escapes become uids"""
+    if isinstance(value, list):
+        return frozenset_or_list([json_value(v) for v in value])
+    if isinstance(value, dict):
+        if '__entity' in value:
+            return parse_uid(value)
+        if '__extn' in value:
+            raise ValueError('Extension values are not supported')
+        return {k: json_value(v) for k, v in value.items()}
+    return value
+
+
+class RecordSet(tuple):
+    """A Cedar set whose members (records) cannot go in a frozenset"""
+
+
+def frozenset_or_list(values: List):
+    """Sets hold hashable members as a frozenset, others as a RecordSet"""
+    try:
+        return frozenset(values)
+    except TypeError:
+        return RecordSet(values)
+
+
+class Entities:
+    """Entity attributes and parents, with transitive ancestors computed on demand.
+
+    ``merged`` layers a request's own entities over a shared store without
+    copying it, so per-request entities cost only what they add.
+    """
+
+    def __init__(self, entities: Iterable[Dict] = (), base: 'Entities' = None):
+        self._base = base
+        self._attrs = {}
+        self._parents = {}
+        self._ancestors = {}
+        for entity in entities:
+            self.add(entity)
+
+    def add(self, entity: Dict):
+        uid = parse_uid(entity['uid'])
+        self._attrs[uid] = {k: json_value(v) for k, v in (entity.get('attrs') or {}).items()}
+        self._parents[uid] = [parse_uid(p) for p in entity.get('parents') or ()]
+        self._ancestors.clear()
+
+    def merged(self, entities: Iterable[Dict]) -> 'Entities':
+        """These entities plus ``entities`` (which win on conflicts), leaving this store unchanged"""
+        return Entities(entities, base=self)
+
+    def attrs(self, uid: EntityUid) -> Optional[Dict]:
+        found = self._attrs.get(uid)
+        if found is None and self._base is not None:
+            return self._base.attrs(uid)
+        return found
+
+    def parents(self, uid: EntityUid) -> List[EntityUid]:
+        found = self._parents.get(uid)
+        if found is None and self._base is not None:
+            return self._base.parents(uid)
+        return found or []
+
+    def ancestors(self, uid: EntityUid) -> frozenset:
+        found = self._ancestors.get(uid)
+        if found is None:
+            if self._base is not None and not self._parents:
+                return self._base.ancestors(uid)
+            seen = set()
+            stack = list(self.parents(uid))
+            while stack:
+                parent = stack.pop()
+                if parent not in seen:
+                    seen.add(parent)
+                    stack.extend(self.parents(parent))
+            found = self._ancestors[uid] = frozenset(seen)
+        return found
+
+    def is_in(self, uid: EntityUid, other: EntityUid) -> bool:
+        return uid == other or other in self.ancestors(uid)
+
+
+class Request(NamedTuple):
+    principal: EntityUid
+    action: EntityUid
+    resource: EntityUid
+    context: Dict
+    entities: Entities
+
+
+def make_request(data: Dict, entities: Entities = None) -> Request:
+    """Request from a log record; its ``entities`` are added to the shared ``entities``"""
+    extra = data.get('entities') or ()
+    if entities is None:
+        entities = Entities(extra)
+    elif extra:
+        entities = entities.merged(extra)
+    return Request(parse_uid(data['principal']), parse_uid(data['action']), parse_uid(data['resource']),
+                   json_value(data.get('context') or {}), entities)
+
+
+# Conditions compile to closures taking the request
+
+def _error(message: str):
+    raise EvaluationError(message)
+
+
+def _entity(value, what: str) -> EntityUid:
+    if not isinstance(value, EntityUid):
+        _error(f'{what} expects an entity, got {type(value).__name__}')
+    return value
+
+
+def _long(value, op: str) -> int:
+    if not isinstance(value, int) or isinstance(value, bool):
+        _error(f'{op} expects a Long, got {type(value).__name__}')
+    return value
+
+
+def _bool(value, op: str) -> bool:
+    if not isinstance(value, bool):
+        _error(f'{op} expects a Bool, got {type(value).__name__}')
+    return value
+
+
+def _set(value, op: str):
+    if not isinstance(value, (frozenset, RecordSet)):
+        _error(f'{op} expects a Set, got {type(value).__name__}')
+    return value
+
+
+def _checked(value: int) -> int:
+    if not LONG_MIN <= value <= LONG_MAX:
+        _error('Long overflow')
+    return value
+
+
+def _equal(a, b) -> bool:
+    if isinstance(a, bool) != isinstance(b, bool):
+        return False
+    if isinstance(a, RecordSet) or isinstance(b, RecordSet):
+        if not isinstance(a, (RecordSet, frozenset)) or not isinstance(b, (RecordSet, frozenset)):
+            return False
+        return all(any(_equal(x, y) for y in b) for x in a) and all(any(_equal(x, y) for y in a) for x in b)
+    return type(a) == type(b) and a == b
+
+
+def _in(request: Request, value, target) -> bool:
+    uid = _entity(value, 'in')
+    if isinstance(target, EntityUid):
+        return request.entities.is_in(uid, target)
+    return any(request.entities.is_in(uid, _entity(t, 'in')) for t in _set(target, 'in'))
+
+
+def _attribute(request: Request, value, name: str):
+    if isinstance(value, EntityUid):
+        attrs = request.entities.attrs(value)
+        if attrs is None:
+            _error(f'Entity {value} does not exist')
+        value = attrs
+    if not isinstance(value, dict):
+        _error(f'Cannot read attribute {name} of {type(value).__name__}')
+    if name not in value:
+        _error(f'Attribute {name} not found')
+    return value[name]
+
+
+def _has(request: Request, value, name: str) -> bool:
+    if isinstance(value, EntityUid):
+        value = request.entities.attrs(value) or {}
+    if not isinstance(value, dict):
+        _error(f'has expects an entity or record, got {type(value).__name__}')
+    return name in value
+
+
+def _like(value, pattern: re.Pattern) -> bool:
+    if not isinstance(value, str):
+        _error(f'like expects a String, got {type(value).__name__}')
+    return pattern.fullmatch(value) is not None
+
+
+METHODS = {
+    'contains': lambda s, args: any(_equal(x, args[0]) for x in _set(s, 'contains')),
+    'containsAll': lambda s, args: all(any(_equal(x, y) for y in _set(s, 'containsAll'))
+                                       for x in _set(args[0], 'containsAll')),
+    'containsAny': lambda s, args: any(any(_equal(x, y) for y in _set(s, 'containsAny'))
+                                       for x in _set(args[0], 'containsAny')),
+    'isEmpty': lambda s, args: len(_set(s, 'isEmpty')) == 0,
+}
+OPERATORS = {
+    '<': lambda a, b: _long(a, '<') < _long(b, '<'),
+    '<=': lambda a, b: _long(a, '<=') <= _long(b, '<='),
+    '>': lambda a, b: _long(a, '>') > _long(b, '>'),
+    '>=': lambda a, b: _long(a, '>=') >= _long(b, '>='),
+    '+': lambda a, b: _checked(_long(a, '+') + _long(b, '+')),
+    '-': lambda a, b: _checked(_long(a, '-') - _long(b, '-')),
+    '*': lambda a, b: _checked(_long(a, '*') * _long(b, '*')),
+}
+
+
+def _unescape(literal: str) -> str:
+    body = literal[1:-1]
+    if '\\' not in body:
+        return body
+    out = []
+    i = 0
+    while i < len(body):
+        ch = body[i]
+        if ch != '\\':
+            out.append(ch)
+            i += 1
+            continue
+        nxt = body[i + 1]
+        if nxt == 'u' and body[i + 2:i + 3] == '{':
+            end = body.index('}', i)
+            out.append(chr(int(body[i + 3:end], 16)))
+            i = end + 1
+            continue
+        out.append({'n': '\n', 'r': '\r', 't': '\t', '0': '\0'}.get(nxt, nxt))
+        i += 2
+    return ''.join(out)
+
+
+def _like_pattern(literal: str) -> re.Pattern:
+    """Regex for a ``like`` pattern; ``*`` matches anything and ``\\*`` a literal star"""
+    parts = re.split(r'(?<!\\)\*', literal[1:-1])
+    return re.compile('.*'.join(re.escape(_unescape('"' + part.replace('\\*', '*') + '"')) for part in parts),
+                      re.DOTALL)
+
+
+class _Parser:
+    """Recursive descent over one statement's tokens"""
+
+    def __init__(self, text: str):
+        self.tokens = []
+        pos = 0
+        while pos < len(text):
+            match = TOKEN_RE.match(text, pos)
+            if not match:
+                raise PolicyParseError(f'Unexpected character {text[pos]!r} at {pos}')
+            pos = match.end()
+            if match.lastgroup != 'space':
+                self.tokens.append((match.lastgroup, match.group()))
+        self.pos = 0
+
+    def peek(self, offset: int = 0) -> str:
+        index = self.pos + offset
+        return self.tokens[index][1] if index < len(self.tokens) else ''
+
+    def kind(self) -> str:
+        return self.tokens[self.pos][0] if self.pos < len(self.tokens) else ''
+
+    def take(self, expected: str = None) -> str:
+        if self.pos >= len(self.tokens):
+            raise PolicyParseError(f'Unexpected end of policy, expected {expected or "more"}')
+        value = self.tokens[self.pos][1]
+        if expected is not None and value != expected:
+            raise PolicyParseError(f'Expected {expected!r}, got {value!r}')
+        self.pos += 1
+        return value
+
+    def accept(self, value: str) -> bool:
+        if self.peek() == value:
+            self.pos += 1
+            return True
+        return False
+
+    def string(self) -> str:
+        if self.kind() != 'string':
+            raise PolicyParseError(f'Expected a string, got {self.peek()!r}')
+        return _unescape(self.take())
+
+    def path(self) -> str:
+        parts = [self.ident()]
+        while self.peek() == '::' and self.pos + 1 < len(self.tokens) and self.tokens[self.pos + 1][0] == 'ident':
+            self.pos += 1
+            parts.append(self.ident())
+        return '::'.join(parts)
+
+    def ident(self) -> str:
+        if self.kind() != 'ident':
+            raise PolicyParseError(f'Expected a name, got {self.peek()!r}')
+        return self.take()
+
+    def uid(self) -> EntityUid:
+        entity_type = self.path()
+        self.take('::')
+        return EntityUid(entity_type, self.string())
+
+    # Policy structure
+
+    def policy(self, default_id: str) -> 'Policy':
+        annotations = {}
+        while self.accept('@'):
+            name = self.ident()
+            self.take('(')
+            annotations[name] = self.string()
+            self.take(')')
+        effect = self.take()
+        if effect not in ('permit', 'forbid'):
+            raise PolicyParseError(f'Expected permit or forbid, got {effect!r}')
+        self.take('(')
+        principal = self.scope('principal')
+        self.take(',')
+        action = self.scope('action')
+        self.take(',')
+        resource = self.scope('resource')
+        self.take(')')
+        conditions = []
+        while self.peek() in ('when', 'unless'):
+            keyword = self.take()
+            self.take('{')
+            expr = self.expr()
+            self.take('}')
+            conditions.append(Condition(keyword == 'when', expr, compile_node(expr)))
+        self.accept(';')
+        if self.pos != len(self.tokens):
+            raise PolicyParseError(f'Unexpected {self.peek()!r} after policy')
+        return Policy(annotations.get('id', default_id), effect, principal, action, resource, conditions,
+                      annotations)
+
+    def scope(self, variable: str) -> 'Scope':
+        self.take(variable)
+        if self.accept('=='):
+            return Scope('==', [self.uid()])
+        if variable != 'action' and self.accept('is'):
+            entity_type = self.path()
+            if self.accept('in'):
+                return Scope('is_in', [self.uid()], entity_type)
+            return Scope('is', [], entity_type)
+        if self.accept('in'):
+            if variable == 'action' and self.accept('['):
+                uids = [self.uid()]
+                while self.accept(','):
+                    uids.append(self.uid())
+                self.take(']')
+                return Scope('in', uids)
+            return Scope('in', [self.uid()])
+        return Scope('any', [])
+
+    # Expressions, lowest precedence first
+
+    def expr(self) -> 'Node':
+        if self.accept('if'):
+            test = self.expr()
+            self.take('then')
+            then = self.expr()
+            self.take('else')
+            return Node('if', None, (test, then, self.expr()))
+        return self.or_expr()
+
+    def or_expr(self) -> 'Node':
+        left = self.and_expr()
+        while self.accept('||'):
+            left = Node('or', None, (left, self.and_expr()))
+        return left
+
+    def and_expr(self) -> 'Node':
+        left = self.relation()
+        while self.accept('&&'):
+            left = Node('and', None, (left, self.relation()))
+        return left
+
+    def relation(self) -> 'Node':
+        left = self.add()
+        op = self.peek()
+        if op in RELATIONS:
+            self.pos += 1
+            return Node('binary', op, (left, self.add()))
+        if self.accept('has'):
+            return Node('has', self.string() if self.kind() == 'string' else self.ident(), (left,))
+        if self.accept('like'):
+            if self.kind() != 'string':
+                raise PolicyParseError('like expects a pattern string')
+            return Node('like', self.take(), (left,))
+        if self.accept('is'):
+            entity_type = self.path()
+            if self.accept('in'):
+                return Node('is', entity_type, (left, self.add()))
+            return Node('is', entity_type, (left,))
+        return left
+
+    def add(self) -> 'Node':
+        left = self.mult()
+        while self.peek() in ('+', '-'):
+            op = self.take()
+            left = Node('binary', op, (left, self.mult()))
+        return left
+
+    def mult(self) -> 'Node':
+        left = self.unary()
+        while self.accept('*'):
+            left = Node('binary', '*', (left, self.unary()))
+        return left
+
+    def unary(self) -> 'Node':
+        if self.accept('!'):
+            return Node('not', None, (self.unary(),))
+        if self.peek() == '-':
+            self.pos += 1
+            if self.kind() == 'int':
+                return self.member(Node('lit', _checked(-int(self.take()))))
+            return Node('neg', None, (self.unary(),))
+        return self.member(self.primary())
+
+    def member(self, target: 'Node') -> 'Node':
+        while True:
+            if self.accept('.'):
+                name = self.ident()
+                if self.accept('('):
+                    if name not in METHODS:
+                        raise PolicyParseError(f'Unsupported method {name}')
+                    target = Node('call', name, (target, *self.expr_list(')')))
+                else:
+                    target = Node('attr', name, (target,))
+            elif self.peek() == '[':
+                self.pos += 1
+                name = self.string()
+                self.take(']')
+                target = Node('attr', name, (target,))
+            else:
+                return target
+
+    def primary(self) -> 'Node':
+        kind, value = self.kind(), self.peek()
+        if kind == 'int':
+            self.pos += 1
+            return Node('lit', _checked(int(value)))
+        if kind == 'string':
+            return Node('lit', self.string())
+        if value in ('true', 'false'):
+            self.pos += 1
+            return Node('lit', value == 'true')
+        if value in VARIABLES:
+            self.pos += 1
+            return Node('var', value)
+        if self.accept('('):
+            inner = self.expr()
+            self.take(')')
+            return inner
+        if self.accept('['):
+            return Node('set', None, tuple(self.expr_list(']')))
+        if self.accept('{'):
+            names = []
+            values = []
+            while not self.accept('}'):
+                names.append(self.string() if self.kind() == 'string' else self.ident())
+                self.take(':')
+                values.append(self.expr())
+                if not self.accept(','):
+                    self.take('}')
+                    break
+            return Node('record', tuple(names), tuple(values))
+        if kind == 'ident':
+            path = self.path()
+            if self.peek() == '::':
+                self.pos += 1
+                return Node('lit', EntityUid(path, self.string()))
+            if self.accept('('):
+                self.expr_list(')')
+                return Node('error', f'Extension function {path} is not supported')
+        raise PolicyParseError(f'Unexpected {value!r}' if value else 'Unexpected end of condition')
+
+    def expr_list(self, close: str) -> List['Node']:
+        items = []
+        if self.accept(close):
+            return items
+        items.append(self.expr())
+        while self.accept(','):
+            items.append(self.expr())
+        self.take(close)
+        return items
+
+
+class Node:
+    """A condition expression: ``kind``, a kind-specific ``value`` and child expressions.
+
+    Kinds are lit (value is the constant), var (variable name), attr and
+    has (attribute name), and, or, not, neg, if, binary (the operator),
+    like (the pattern literal), is (entity type; a second child for
+    ``is ... in``), set, record (field names), call (method name; the
+    first child is the target) and error (the message).
+    """
+    __slots__ = ('kind', 'value', 'children')
+
+    def __init__(self, kind: str, value=None, children: Tuple['Node', ...] = ()):
+        self.kind = kind
+        self.value = value
+        self.children = children
+
+    def __repr__(self):
+        return f'Node({self.kind}: {render(self)})'
+
+
+def compile_node(node: Node) -> Callable:
+    """Closure evaluating ``node`` for a request"""
+    kind, value = node.kind, node.value
+    args = [compile_node(child) for child in node.children]
+    if kind == 'lit':
+        return lambda r: value
+    if kind == 'var':
+        index = VARIABLES.index(value)
+        return lambda r: r[index]
+    if kind == 'error':
+        return lambda r: _error(value)
+    if kind == 'attr':
+        (target,) = args
+        return lambda r: _attribute(r, target(r), value)
+    if kind == 'has':
+        (target,) = args
+        return lambda r: _has(r, target(r), value)
+    if kind == 'and':
+        a, b = args
+        return lambda r: _bool(a(r), '&&') and _bool(b(r), '&&')
+    if kind == 'or':
+        a, b = args
+        return lambda r: _bool(a(r), '||') or _bool(b(r), '||')
+    if kind == 'not':
+        (a,) = args
+        return lambda r: not _bool(a(r), '!')
+    if kind == 'neg':
+        (a,) = args
+        return lambda r: _checked(-_long(a(r), '-'))
+    if kind == 'if':
+        test, then, other = args
+        return lambda r: then(r) if _bool(test(r), 'if') else other(r)
+    if kind == 'binary':
+        a, b = args
+        if value == '==':
+            return lambda r: _equal(a(r), b(r))
+        if value == '!=':
+            return lambda r: not _equal(a(r), b(r))
+        if value == 'in':
+            return lambda r: _in(r, a(r), b(r))
+        operator = OPERATORS[value]
+        return lambda r: operator(a(r), b(r))
+    if kind == 'like':
+        pattern = _like_pattern(value)
+        (a,) = args
+        return lambda r: _like(a(r), pattern)
+    if kind == 'is':
+        if len(args) == 2:
+            a, target = args
+            return lambda r: _entity(a(r), 'is').type == value and _in(r, a(r), target(r))
+        (a,) = args
+        return lambda r: _entity(a(r), 'is').type == value
+    if kind == 'set':
+        return lambda r: frozenset_or_list([item(r) for item in args])
+    if kind == 'record':
+        fields = list(zip(value, args))
+        return lambda r: {name: field(r) for name, field in fields}
+    if kind == 'call':
+        method = METHODS[value]
+        target, rest = args[0], args[1:]
+        return lambda r: method(target(r), [x(r) for x in rest])
+    raise ValueError(f'Unknown expression kind {kind}')
+
+
+PRECEDENCE = {'if': 0, 'or': 1, 'and': 2, 'binary_rel': 3, 'has': 3, 'like': 3, 'is': 3,
+              'binary_add': 4, 'binary_mult': 5, 'not': 6, 'neg': 6}
+
+
+def _precedence(node: Node) -> int:
+    if node.kind == 'binary':
+        if node.value in ('+', '-'):
+            return PRECEDENCE['binary_add']
+        return PRECEDENCE['binary_mult'] if node.value == '*' else PRECEDENCE['binary_rel']
+    return PRECEDENCE.get(node.kind, 7)
+
+
+def render_value(value) -> str:
+    """Cedar literal for a value"""
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, EntityUid):
+        return str(value)
+    if isinstance(value, str):
+        return '"' + value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"'
+    if isinstance(value, (frozenset, RecordSet)):
+        return '[' + ', '.join(sorted(render_value(v) for v in value)) + ']'
+    if isinstance(value, dict):
+        return '{' + ', '.join(f'{render_value(k)}: {render_value(v)}' for k, v in value.items()) + '}'
+    return str(value)
+
+
+def render(node: Node) -> str:
+    """Cedar text for an expression, with only the parentheses it needs"""
+    kind, value, children = node.kind, node.value, node.children
+
+    def sub(child: Node, minimum: int) -> str:
+        text = render(child)
+        return f'({text})' if _precedence(child) < minimum else text
+
+    own = _precedence(node)
+    if kind == 'lit':
+        return render_value(value)
+    if kind == 'var':
+        return value
+    if kind == 'error':
+        return f'error({render_value(value)})'
+    if kind == 'attr':
+        target = sub(children[0], 7)
+        return f'{target}.{value}' if re.fullmatch(r'[A-Za-z_]\w*', value) else f'{target}[{render_value(value)}]'
+    if kind == 'has':
+        return f'{sub(children[0], own + 1)} has {value}'
+    if kind in ('and', 'or'):
+        op = '&&' if kind == 'and' else '||'
+        return f'{sub(children[0], own)} {op} {sub(children[1], own + 1)}'
+    if kind == 'not':
+        return '!' + sub(children[0], own)
+    if kind == 'neg':
+        return '-' + sub(children[0], own)
+    if kind == 'if':
+        return f'if {render(children[0])} then {render(children[1])} else {render(children[2])}'
+    if kind == 'binary':
+        return f'{sub(children[0], own if own > 3 else own + 1)} {value} {sub(children[1], own + 1)}'
+    if kind == 'like':
+        return f'{sub(children[0], own + 1)} like {value}'
+    if kind == 'is':
+        text = f'{sub(children[0], own + 1)} is {value}'
+        return text + f' in {sub(children[1], own + 1)}' if len(children) == 2 else text
+    if kind == 'set':
+        return '[' + ', '.join(render(child) for child in children) + ']'
+    if kind == 'record':
+        return '{' + ', '.join(f'{render_value(name)}: {render(child)}' for name, child in zip(value, children)) + '}'
+    if kind == 'call':
+        return f'{sub(children[0], 7)}.{value}(' + ', '.join(render(child) for child in children[1:]) + ')'
+    raise ValueError(f'Unknown expression kind {kind}')
+
+
+class Condition(NamedTuple):
+    """A ``when`` (``when`` is True) or ``unless`` clause and its compiled form"""
+    when: bool
+    node: Node
+    evaluate: Callable
+
+
+class Scope(NamedTuple):
+    """One scope constraint: op is any, ==, in, is or is_in"""
+    op: str
+    uids: List[EntityUid]
+    entity_type: str = None
+
+    def matches(self, uid: EntityUid, entities: Entities) -> bool:
+        if self.op == 'any':
+            return True
+        if self.op == '==':
+            return uid == self.uids[0]
+        if self.op == 'is':
+            return uid.type == self.entity_type
+        if self.op == 'is_in' and uid.type != self.entity_type:
+            return False
+        return any(entities.is_in(uid, target) for target in self.uids)
+
+
+class Policy:
+    """A parsed Cedar policy"""
+    __slots__ = ('id', 'effect', 'principal', 'action', 'resource', 'conditions', 'annotations')
+
+    def __init__(self, policy_id: str, effect: str, principal: Scope, action: Scope, resource: Scope,
+                 conditions: List['Condition'], annotations: Dict = None):
+        self.id = policy_id
+        self.effect = effect
+        self.principal = principal
+        self.action = action
+        self.resource = resource
+        self.conditions = conditions
+        self.annotations = annotations or {}
+
+    def in_scope(self, request: Request) -> bool:
+        return (self.action.matches(request.action, request.entities)
+                and self.principal.matches(request.principal, request.entities)
+                and self.resource.matches(request.resource, request.entities))
+
+    def satisfied(self, request: Request) -> bool:
+        """Whether the policy applies; raises EvaluationError when a condition cannot be evaluated"""
+        if not self.in_scope(request):
+            return False
+        for condition in self.conditions:
+            if _bool(condition.evaluate(request), 'when' if condition.when else 'unless') != condition.when:
+                return False
+        return True
+
+    @property
+    def action_ids(self) -> Optional[List[str]]:
+        """Action ids the policy is limited to, or None when it can apply to any action"""
+        if self.action.op in ('==', 'in') and all(uid.type == 'Action' for uid in self.action.uids):
+            return [uid.id for uid in self.action.uids]
+        return None
+
+
+def parse_policy(text: str, policy_id: str = 'policy0') -> Policy:
+    return _Parser(text).policy(policy_id)
+
+
+def parse_policies(text: str, prefix: str = 'policy') -> List[Policy]:
+    """Every statement in ``text``; ids come from ``@id`` annotations or ``<prefix><n>``"""
+    return [parse_policy(statement, f'{prefix}{n}') for n, statement in enumerate(split_policies(text))]
+
+
+class Decision(NamedTuple):
+    decision: str
+    determining: List[str]
+    errors: List[Tuple[str, str]]
+
+    @property
+    def allowed(self) -> bool:
+        return self.decision == 'allow'
+
+
+class PolicySet:
+    """Policies indexed by action, so a request only evaluates the ones that can apply.
+
+    Policies are indexed under the action ids in their ``==`` or ``in``
+    constraint. A request looks up its own action id and those of the
+    action groups it belongs to (its ancestors in the request entities);
+    policies with no action constraint are checked for every request.
+    """
+
+    def __init__(self, policies: Iterable[Policy] = ()):
+        self.policies = []
+        self._by_action = {}
+        self._any_action = []
+        for policy in policies:
+            self.add(policy)
+
+    def add(self, policy: Policy):
+        self.policies.append(policy)
+        actions = policy.action_ids
+        if actions is None:
+            self._any_action.append(policy)
+            return
+        for action in dict.fromkeys(actions):
+            self._by_action.setdefault(action, []).append(policy)
+
+    def __len__(self):
+        return len(self.policies)
+
+    def may_apply(self, action: EntityUid, groups: Iterable[EntityUid] = ()) -> bool:
+        """Whether any policy can apply to ``action``, given the action groups it belongs to"""
+        if self._any_action:
+            return True
+        if action.type == 'Action' and action.id in self._by_action:
+            return True
+        return any(group.type == 'Action' and group.id in self._by_action for group in groups)
+
+    def candidates(self, request: Request) -> List[Policy]:
+        found = list(self._by_action.get(request.action.id, ())) if request.action.type == 'Action' else []
+        groups = [uid.id for uid in request.entities.ancestors(request.action) if uid.type == 'Action']
+        if groups:
+            seen = {id(p) for p in found}
+            for group in groups:
+                for policy in self._by_action.get(group, ()):
+                    if id(policy) not in seen:
+                        seen.add(id(policy))
+                        found.append(policy)
+        return found + self._any_action if self._any_action else found
+
+    def is_authorized(self, request: Request) -> Decision:
+        permits = []
+        forbids = []
+        errors = []
+        for policy in self.candidates(request):
+            try:
+                if policy.satisfied(request):
+                    (forbids if policy.effect == 'forbid' else permits).append(policy.id)
+            except EvaluationError as e:
+                errors.append((policy.id, str(e)))
+        if forbids:
+            return Decision('deny', forbids, errors)
+        if permits:
+            return Decision('allow', permits, errors)
+        return Decision('deny', [], errors)
@@ -2,21 +2,37 @@ from bedrock_client import generate_text
 from schema_parser import SchemaParser
 from policy_validator import PolicyValidator
 from policy_recommender import PolicyRecommender
+from model_router import RequirementClassifier, router as default_router
+from metrics import STAGE_SECONDS
+from tracing import span
 import json
+import time
 
 class PolicyGenerator:
-    def __init__(self, schema_path=None):
+    def __init__(self, schema_path=None, router=None):
         self.parser = SchemaParser()
         self.validator = PolicyValidator()
+        self.router = router or default_router
         if schema_path:
             self.parser.load_schema(schema_path)
-            self.recommender = PolicyRecommender(self.parser.get_schema_context())
+            self.recommender = PolicyRecommender(self.parser.get_schema_context(), self.parser.fingerprint)
+        self.classifier = RequirementClassifier(self.parser.get_schema_context())
     
-    def generate_policy(self, requirement, conversation_context=""):
-        schema_context = self.parser.get_schema_context()
+    def generate_policy(self, requirement, conversation_context="", route=None):
+        with span('schema', STAGE_SECONDS, stage='schema'):
+            schema_context = self.parser.get_schema_context()
+        with span('prompt', STAGE_SECONDS, stage='prompt'):
+            prompt = self.build_prompt(requirement, conversation_context, schema_context)
+        with span('model', STAGE_SECONDS, stage='model'):
+            if route is None:
+                return generate_text(prompt)
+            return generate_text(prompt, route.model_id, route.max_tokens)
+    
+    def build_prompt(self, requirement, conversation_context="", schema_context=None):
+        schema_context = schema_context or self.parser.get_schema_context()
         
         # Enhanced prompt with conversation context
-        prompt = f"""You are a Cedar policy expert for banking applications.
+        return f"""You are a Cedar policy expert for banking applications.
 
 Schema Context:
 - Available Entities: {schema_context['entities']}
@@ -54,21 +70,32 @@ RATIONALE:
 • [reason 1]
 • [reason 2]
 • [reason 3]"""
-
-        return generate_text(prompt)
     
-    def generate_and_validate_policy(self, requirement, conversation_context=""):
-        """Generate policy with validation before returning"""
-        response = self.generate_policy(requirement, conversation_context)
-        parsed = self.parse_response(response)
-        
-        # Validate the generated policy
-        schema_context = self.parser.get_schema_context()
-        is_valid, errors = self.validator.validate_policy(parsed['policy'], schema_context)
+    def generate_and_validate_policy(self, requirement, conversation_context="", latency_budget=None):
+        """Generate policy with validation before returning.
+
+        The model is chosen by the router from the requirement's complexity;
+        a result that fails validation on the fast model is regenerated on the
+        strong one if ``latency_budget`` (seconds) leaves time for it. The
+        budget steers routing only; model calls are not cut off when it runs out.
+        """
+        started = time.perf_counter()
+        budget = self.router.default_budget if latency_budget is None else latency_budget
+        classification = self.classifier.classify(requirement, conversation_context)
+        route = self.router.choose(classification['complexity'], budget)
+        parsed, is_valid, errors = self._attempt(requirement, conversation_context, route)
+        escalated = False
+        if not is_valid:
+            stronger = self.router.escalation(route, time.perf_counter() - started, budget)
+            if stronger is not None:
+                parsed, is_valid, errors = self._attempt(requirement, conversation_context, stronger)
+                route, escalated = stronger, True
         
         # Generate test cases
-        test_cases = self.validator.generate_test_cases(parsed['policy'])
+        with span('test_cases', STAGE_SECONDS, stage='test_cases'):
+            test_cases = self.validator.generate_test_cases(parsed['policy'])
         
+        elapsed = time.perf_counter() - started
         return {
             'policy': parsed['policy'],
             'rationale': parsed['rationale'],
@@ -76,12 +103,41 @@ RATIONALE:
                 'is_valid': is_valid,
                 'errors': errors,
                 'test_cases': test_cases
+            },
+            'routing': {
+                **route.to_dict(),
+                'complexity': classification['complexity'],
+                'escalated': escalated,
+                'latency_ms': round(elapsed * 1000, 1),
+                'budget_ms': round(budget * 1000) if budget else None,
+                'within_budget': self.router.record_total(elapsed, budget)
             }
         }
     
-    def get_recommendations(self):
-        """Get policy recommendations based on schema"""
+    def _attempt(self, requirement, conversation_context, route):
+        """One generation on ``route``: (parsed response, is_valid, errors)"""
+        model_started = time.perf_counter()
+        response = self.generate_policy(requirement, conversation_context, route)
+        model_seconds = time.perf_counter() - model_started
+        with span('parse', STAGE_SECONDS, stage='parse'):
+            parsed = self.parse_response(response)
+        
+        # Validate the generated policy
+        with span('validate', STAGE_SECONDS, stage='validate'):
+            schema_context = self.parser.get_schema_context()
+            is_valid, errors = self.validator.validate_policy(parsed['policy'], schema_context)
+        self.router.record(route, model_seconds, is_valid)
+        return parsed, is_valid, errors
+    
+    def get_recommendations(self, coverage=None):
+        """Get policy recommendations based on schema.
+
+        With a ``coverage`` report, only those that would govern an
+        uncovered schema element, plus candidates for uncovered actions.
+        """
         if hasattr(self, 'recommender'):
+            if coverage is not None:
+                return self.recommender.coverage_recommendations(coverage)
             return self.recommender.generate_recommendations()
         return []
     
@@ -1,15 +1,223 @@
 #!/usr/bin/env python3
 import sys
 import os
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 from policy_generator import PolicyGenerator
 from history_manager import HistoryManager
 from approval_manager import ApprovalManager
+from jsonl_store import hash_policy
+from scheduler import TokenBucket
+from policy_simulator import approved_texts, format_report, simulate
+from policy_coverage import ReferenceIndex, coverage, format_coverage
+from tracing import start_trace, end_trace, profiler
+
+DEFAULT_BATCH_RATE = float(os.environ.get('SCHEDULER_GLOBAL_RATE', 5))
+BATCH_FEEDBACK = 'auto-approved in batch'
+
+def pop_option(name, takes_value=False):
+    """Remove --name or --name=value from sys.argv; returns True, the value, or None"""
+    for i, arg in enumerate(sys.argv):
+        if arg == name:
+            del sys.argv[i]
+            if takes_value and i < len(sys.argv):
+                return sys.argv.pop(i)
+            return True
+        if arg.startswith(name + '='):
+            del sys.argv[i]
+            return arg.split('=', 1)[1]
+    return None
+
+def read_requirements(path):
+    """Yield (id, requirement) from JSON lines, or plain lines numbered from 1"""
+    with open(path) as f:
+        for number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith('{'):
+                item = json.loads(line)
+                yield str(item.get('id', number)), item['requirement']
+            else:
+                yield str(number), line
+
+def completed_ids(path):
+    """Ids already written to a batch output without an error"""
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path) as f:
+        for line in f:
+            try:
+                item = json.loads(line)
+            except ValueError:
+                # A run killed mid-write can leave a partial last line
+                continue
+            if 'error' not in item:
+                done.add(str(item['id']))
+    return done
+
+def batch_approval_id(store, policy, requirement):
+    """Id of an earlier batch approval of this policy for this requirement, or None.
+
+    A run killed after approving but before writing the result approves
+    the same item again on resume; this finds the first approval instead.
+    """
+    for record in store.query(policy_hash=hash_policy(policy))[0]:
+        if (record.get('status') == 'APPROVED' and record.get('requirement') == requirement
+                and record.get('user_feedback') == BATCH_FEEDBACK):
+            return record['id']
+    return None
+
+def run_batch(input_path, output_path, workers=4, rate=None, auto_approve=False,
+              generator=None, approval_manager=None, history=None, progress=None, latency_budget=None):
+    """Generate policies for every requirement in input_path, appending results to output_path.
+
+    Up to ``workers`` generations run at once, started no faster than
+    ``rate`` per second. Each result is written as one JSON line as soon as
+    it finishes, so an interrupted run resumes by skipping ids already in
+    the output. With ``auto_approve``, policies that pass validation are
+    approved and recorded in history, unless an earlier run already
+    approved the same policy for the requirement. ``latency_budget``
+    (seconds) is passed to each generation.
+    """
+    generator = generator or PolicyGenerator('sample_banking_schema.json')
+    if auto_approve:
+        approval_manager = approval_manager or ApprovalManager()
+        history = history or HistoryManager()
+    bucket = TokenBucket(rate or DEFAULT_BATCH_RATE, max(workers, 1))
+    bucket_lock = threading.Lock()
+    approve_lock = threading.Lock()
+    done = completed_ids(output_path)
+    summary = {'processed': 0, 'skipped': 0, 'valid': 0, 'approved': 0, 'failed': 0}
+    
+    def process(item_id, requirement):
+        while True:
+            with bucket_lock:
+                delay = bucket.take()
+            if not delay:
+                break
+            time.sleep(delay)
+        started = time.perf_counter()
+        record = {'id': item_id, 'requirement': requirement}
+        try:
+            if latency_budget:
+                result = generator.generate_and_validate_policy(requirement, latency_budget=latency_budget)
+            else:
+                result = generator.generate_and_validate_policy(requirement)
+            record.update(result)
+            if auto_approve and result['validation']['is_valid']:
+                with approve_lock:
+                    approval_id = batch_approval_id(approval_manager.store, result['policy'], requirement)
+                    if approval_id is None:
+                        approval_id, _ = approval_manager.approve_with_history(
+                            dict(result, requirement=requirement), history, BATCH_FEEDBACK)
+                record['approval_id'] = approval_id
+        except Exception as e:
+            record['error'] = str(e)
+        record['elapsed_ms'] = round((time.perf_counter() - started) * 1000, 1)
+        return record
+    
+    with open(output_path, 'a') as out, ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = set()
+        
+        def write(futures):
+            for future in futures:
+                record = future.result()
+                out.write(json.dumps(record) + '\n')
+                out.flush()
+                summary['processed'] += 1
+                if 'error' in record:
+                    summary['failed'] += 1
+                else:
+                    summary['valid'] += record['validation']['is_valid']
+                    summary['approved'] += 'approval_id' in record
+                if progress:
+                    progress(record, summary)
+        
+        for item_id, requirement in read_requirements(input_path):
+            if item_id in done:
+                summary['skipped'] += 1
+                continue
+            # Keep a bounded number queued so huge inputs stream through
+            if len(pending) >= workers * 2:
+                finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                write(finished)
+            pending.add(pool.submit(process, item_id, requirement))
+        write(wait(pending).done)
+    return summary
+
+def batch_main(input_path, budget=None):
+    output_path = pop_option('--out', takes_value=True) or os.path.splitext(input_path)[0] + '.results.jsonl'
+    workers = int(pop_option('--workers', takes_value=True) or 4)
+    rate = pop_option('--rate', takes_value=True)
+    schema_file = pop_option('--schema', takes_value=True) or 'sample_banking_schema.json'
+    auto_approve = bool(pop_option('--auto-approve'))
+    generator = PolicyGenerator(schema_file)
+    
+    def progress(record, summary):
+        status = 'error' if 'error' in record else ('valid' if record['validation']['is_valid'] else 'invalid')
+        print(f"[{summary['processed']}] {record['id']}: {status} ({record['elapsed_ms']:.0f}ms)", file=sys.stderr)
+    
+    started = time.perf_counter()
+    summary = run_batch(input_path, output_path, workers=workers, rate=float(rate) if rate else None,
+                        auto_approve=auto_approve, generator=generator, progress=progress,
+                        latency_budget=float(budget) / 1000 if budget else None)
+    elapsed = time.perf_counter() - started
+    print(f"\n📦 Batch complete: {summary['processed']} processed, {summary['skipped']} already done, "
+          f"{summary['valid']} valid, {summary['approved']} approved, {summary['failed']} failed "
+          f"in {elapsed:.1f}s → {output_path}")
+    print_routes(generator.router.get_stats())
+    return summary
+
+def print_routes(stats):
+    """Print per-route call counts, pass rates and latency to stderr"""
+    for name, route in stats['routes'].items():
+        if route['calls']:
+            print(f"🧭 {name} ({route['model_id']}): {route['calls']} calls, "
+                  f"{route['pass_rate']:.0%} valid, p50 {route['latency_p50_ms']}ms, "
+                  f"p95 {route['latency_p95_ms']}ms", file=sys.stderr)
+    if stats['escalations'] or stats['over_budget']:
+        print(f"🧭 {stats['escalations']} escalated, {stats['over_budget']} over budget", file=sys.stderr)
+
+def print_impact(log_path, entities_file, policy, approval_manager):
+    """Replay the authorization log with the policy added and print what changes"""
+    print("\nIMPACT:")
+    try:
+        impact = simulate(log_path, approved_texts(approval_manager.store), policy, entities_file)
+    except (OSError, ValueError) as e:
+        print(f"   ⚠️  Could not simulate: {e}")
+        return
+    for line in format_report(impact).splitlines():
+        print(f"   {line}")
+
+def print_timings(trace):
+    """Print a trace's per-span timings to stderr"""
+    timings = trace.timings()
+    print(f"\n⏱  {trace.name}: " + ', '.join(f"{name} {ms:.1f}ms" for name, ms in timings.items()), file=sys.stderr)
 
 def main():
+    show_trace = pop_option('--trace')
+    profile = pop_option('--profile')
+    budget = pop_option('--budget', takes_value=True)
+    simulate_log = pop_option('--simulate', takes_value=True)
+    entities_file = pop_option('--entities', takes_value=True)
+    batch = pop_option('--batch', takes_value=True)
+    
+    if batch:
+        summary = batch_main(batch, budget)
+        sys.exit(1 if summary['failed'] else 0)
+    
     if len(sys.argv) < 2:
-        print("Usage: python policy_helper.py '<requirement>' [schema_file] [--recommendations]")
+        print("Usage: python policy_helper.py '<requirement>' [schema_file] [--recommendations] [--trace] [--profile[=file]]")
+        print("                               [--budget ms] [--simulate authz_log.jsonl [--entities entities.json]]")
+        print("       python policy_helper.py --batch requirements.jsonl [--out results.jsonl] [--workers N]")
+        print("                               [--rate per_second] [--schema file] [--auto-approve] [--budget ms]")
         print("Example: python policy_helper.py 'Deny Account Holder from creating transactions >= 5000'")
         print("         python policy_helper.py --recommendations")
+        print("         python policy_helper.py --coverage [schema_file]")
         sys.exit(1)
     
     # Handle recommendations flag
@@ -17,6 +225,10 @@ def main():
         show_recommendations()
         return
     
+    if sys.argv[1] == '--coverage':
+        show_coverage(sys.argv[2] if len(sys.argv) > 2 else 'sample_banking_schema.json')
+        return
+    
     requirement = sys.argv[1]
     schema_file = sys.argv[2] if len(sys.argv) > 2 else 'sample_banking_schema.json'
     
@@ -33,7 +245,20 @@ def main():
         print("📋 Generating and validating Cedar policy...\n")
         
         # Generate with validation
-        result = generator.generate_and_validate_policy(requirement)
+        trace = start_trace('generate')
+        if profile:
+            profiler.configure(True, output=profile if isinstance(profile, str) else None)
+        with profiler.profile(force=bool(profile)):
+            result = generator.generate_and_validate_policy(
+                requirement, latency_budget=float(budget) / 1000 if budget else None)
+        end_trace()
+        if show_trace:
+            print_timings(trace)
+            routing = result['routing']
+            print(f"🧭 {routing['complexity']} requirement → {routing['route']} ({routing['model_id']})"
+                  f"{', escalated' if routing['escalated'] else ''}", file=sys.stderr)
+        if profile:
+            print(f"🔥 Stack samples written to {profiler.output}", file=sys.stderr)
         
         # Display validation status
         if result['validation']['is_valid']:
@@ -55,20 +280,21 @@ def main():
             for i, test in enumerate(result['validation']['test_cases'][:3], 1):
                 print(f"   {i}. {test['description']}")
         
+        if simulate_log:
+            print_impact(simulate_log, entities_file, result['policy'], approval_manager)
+        
         # Interactive approval
         print("\n" + "="*50)
         choice = input("Approve this policy? (y/n/feedback): ").lower().strip()
+        trace = start_trace('persist')
         
         if choice == 'y':
-            approval_id = approval_manager.approve_policy({
+            approval_id, history_id = approval_manager.approve_with_history({
                 'requirement': requirement,
                 'policy': result['policy'],
                 'rationale': result['rationale'],
                 'validation': result['validation']
-            })
-            
-            # Also save to history
-            history_id = history.save_policy(requirement, result['policy'], result['rationale'])
+            }, history)
             
             print(f"✅ Policy approved and saved (ID: {approval_id}, History: {history_id})")
             
@@ -85,16 +311,18 @@ def main():
             
         elif choice == 'feedback':
             feedback = input("Your feedback: ")
-            approval_id = approval_manager.approve_policy({
+            approval_id, history_id = approval_manager.approve_with_history({
                 'requirement': requirement,
                 'policy': result['policy'],
                 'rationale': result['rationale'],
                 'validation': result['validation']
-            }, feedback)
-            
-            history_id = history.save_policy(requirement, result['policy'], result['rationale'])
+            }, history, feedback)
             print(f"✅ Policy approved with feedback (ID: {approval_id}, History: {history_id})")
         
+        end_trace()
+        if show_trace and trace.spans:
+            print_timings(trace)
+        
         # Show stats
         stats = approval_manager.get_approval_stats()
         print(f"\n📊 Stats: {stats['approved']}/{stats['total_policies']} approved ({stats['approval_rate']:.1f}%)")
@@ -127,5 +355,26 @@ def show_recommendations():
     except Exception as e:
         print(f"❌ Error loading recommendations: {e}")
 
+def show_coverage(schema_file):
+    """Show which parts of the schema no approved policy governs, and what to add"""
+    try:
+        generator = PolicyGenerator(schema_file)
+        index = ReferenceIndex()
+        index.refresh(ApprovalManager().store)
+        report = coverage(generator.parser.get_schema_context(), index)
+        
+        print("\n🗺️  SCHEMA COVERAGE")
+        print("="*50)
+        print(format_coverage(report))
+        
+        recommendations = generator.get_recommendations(report)
+        if recommendations:
+            print("\n🎯 To cover the rest:")
+            for i, rec in enumerate(recommendations[:10], 1):
+                print(f"   {i}. {rec['title']} ({rec['priority']}) - covers {', '.join(rec['covers'])}")
+        
+    except Exception as e:
+        print(f"❌ Error computing coverage: {e}")
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,80 @@
+import re
+from typing import Dict, List
+
+EFFECT_RE = re.compile(r'\b(permit|forbid)\s*\(')
+ENTITY_RE = re.compile(r'(\w+)::"([^"]*)"')
+ACTION_RE = re.compile(r'Action::"(\w+)"')
+ATTRIBUTE_RE = re.compile(r'\b(principal|resource|context)\.(\w+)')
+IS_RE = re.compile(r'\b(principal|resource)\s+is\s+(\w+)')
+# String literals, comments, whitespace runs and everything else, in source order
+TOKEN_RE = re.compile(r'"(?:[^"\\]|\\.)*"|//[^\n]*|\s+|[^"/\s]+|/')
+NO_SPACE_AFTER = ('(', '[', '{', '.', '::')
+NO_SPACE_BEFORE = (')', ']', '}', ',', ';', '.', '::')
+
+def extract_references(policy: str) -> Dict[str, List[str]]:
+    """Collect effects, actions, entity types and attributes a policy mentions.
+
+    Attributes are reported as ``scope.name`` (e.g. ``resource.amount``).
+    Lists are de-duplicated and keep first-seen order.
+    """
+    entity_types = [t for t, _ in ENTITY_RE.findall(policy) if t != 'Action']
+    entity_types += [t for _, t in IS_RE.findall(policy)]
+    return {
+        'effects': _unique(EFFECT_RE.findall(policy)),
+        'actions': _unique(ACTION_RE.findall(policy)),
+        'entity_types': _unique(entity_types),
+        'attributes': _unique(f'{scope}.{name}' for scope, name in ATTRIBUTE_RE.findall(policy))
+    }
+
+def split_policies(text: str) -> List[str]:
+    """Split Cedar source into statements at top-level semicolons.
+
+    Semicolons inside string literals and comments do not end a statement.
+    Each statement keeps its terminating ``;``; blank trailing text is dropped.
+    """
+    statements = []
+    current = []
+    for token in TOKEN_RE.findall(text):
+        if token.startswith('"') or token.startswith('//') or ';' not in token:
+            current.append(token)
+            continue
+        parts = token.split(';')
+        for part in parts[:-1]:
+            current.append(part + ';')
+            statements.append(''.join(current).strip())
+            current = []
+        current.append(parts[-1])
+    rest = ''.join(current).strip()
+    if rest and not all(t.startswith('//') or t.isspace() for t in TOKEN_RE.findall(rest)):
+        statements.append(rest)
+    return [s for s in statements if s]
+
+def canonical_policy(policy: str) -> str:
+    """One-line canonical form of a Cedar statement.
+
+    Comments are dropped, whitespace outside string literals collapses to
+    single spaces, brackets and punctuation hug their neighbours
+    (``permit(principal, action == Action::"View", resource);``), and the
+    statement ends with ``;``. Policies that differ only in layout get the
+    same text.
+    """
+    words = []
+    for token in TOKEN_RE.findall(policy):
+        if token.startswith('//') or token.isspace():
+            continue
+        if token.startswith('"'):
+            words.append(token)
+            continue
+        words.extend(w for w in re.split(r'(::|[()\[\]{},;.])', token) if w)
+    out = ''
+    for word in words:
+        if out and not out.endswith(NO_SPACE_AFTER) and not word.startswith(NO_SPACE_BEFORE) \
+                and not (word == '(' and out.split(' ')[-1] in ('permit', 'forbid')):
+            out += ' '
+        out += word
+    if out and not out.endswith(';'):
+        out += ';'
+    return out
+
+def _unique(items) -> List[str]:
+    return list(dict.fromkeys(items))
@@ -0,0 +1,372 @@
+"""Partial evaluation of a policy set for a known principal and action.
+
+Enforcement points often ask about one principal and action across many
+resources. ``PartialEvaluator`` evaluates everything that depends only on
+what is known up front - the principal and action scopes, attributes and
+group membership of the principal, the context when it is given - and
+keeps, per policy that can still apply, a residual: the resource scope
+and whatever is left of the conditions. Policies whose scope or
+conditions rule them out are dropped. Residuals are cached per
+(principal, action[, context]), so repeated checks evaluate a handful of
+small expressions instead of the whole set.
+
+Residuals are exact: evaluating them gives the same decision, determining
+policies and errors as evaluating the full set. Expressions are only
+folded where that holds, so ``resource.owner == principal && false``
+stays as it is (its left side may still fail to evaluate). Known parts
+are read from the evaluator's entities; call ``clear()`` after they
+change. A request that brings its own entities is checked against the
+full set instead when one of them replaces an entity the folding read
+(the principal, the action, their groups, or anything reached through
+their attributes).
+"""
+
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, List, NamedTuple, Optional
+from policy_engine import (Condition, Decision, Entities, EntityUid, EvaluationError, Node, PolicySet, Request, Scope,
+                           _bool, compile_node, json_value, parse_policy, parse_uid, render)
+
+DEFAULT_CACHE_ENTRIES = int(os.environ.get('PARTIAL_CACHE_ENTRIES', 4096))
+# Kinds whose value is always a boolean, so ``true && x`` can become ``x``
+BOOLEAN_KINDS = ('and', 'or', 'not', 'has', 'like', 'is')
+BOOLEAN_OPERATORS = ('==', '!=', '<', '<=', '>', '>=', 'in')
+BOOLEAN_METHODS = ('contains', 'containsAll', 'containsAny', 'isEmpty')
+NEVER = Condition(True, Node('lit', False), lambda r: False)
+
+
+def _literal(node: Node) -> bool:
+    return node.kind == 'lit'
+
+
+def _boolean(node: Node) -> bool:
+    if node.kind == 'lit':
+        return isinstance(node.value, bool)
+    if node.kind == 'binary':
+        return node.value in BOOLEAN_OPERATORS
+    if node.kind == 'call':
+        return node.value in BOOLEAN_METHODS
+    return node.kind in BOOLEAN_KINDS
+
+
+class _Reads(Entities):
+    """The evaluator's entities, noting every uid whose attributes or parents are read"""
+
+    def __init__(self, entities: Entities):
+        super().__init__(base=entities)
+        self.uids = set()
+
+    def attrs(self, uid: EntityUid) -> Optional[Dict]:
+        self.uids.add(uid)
+        return super().attrs(uid)
+
+    def parents(self, uid: EntityUid) -> List[EntityUid]:
+        self.uids.add(uid)
+        return super().parents(uid)
+
+    def ancestors(self, uid: EntityUid) -> frozenset:
+        # The result depends on the parents of the uid and of every ancestor
+        found = super().ancestors(uid)
+        self.uids.add(uid)
+        self.uids.update(found)
+        return found
+
+
+class _Known:
+    """What is known about the requests a residual will be evaluated for"""
+
+    def __init__(self, principal: EntityUid, action: EntityUid, context: Optional[Dict], entities: Entities):
+        self.values = {'principal': principal, 'action': action}
+        if context is not None:
+            self.values['context'] = context
+        self.entities = _Reads(entities)
+        # Stands in for the request when folding; only literals are evaluated against it
+        self.request = Request(principal, action, None, context, self.entities)
+
+    def fold(self, node: Node) -> Node:
+        """Evaluate ``node`` (whose children are all literals), or an error node if it fails"""
+        try:
+            return Node('lit', compile_node(node)(self.request))
+        except EvaluationError as e:
+            return Node('error', str(e))
+
+    def reduce(self, node: Node) -> Node:
+        kind = node.kind
+        if kind == 'var':
+            return Node('lit', self.values[node.value]) if node.value in self.values else node
+        if kind in ('lit', 'error'):
+            return node
+        if kind in ('and', 'or'):
+            return self._logical(node)
+        if kind == 'if':
+            test = self.reduce(node.children[0])
+            if _literal(test):
+                try:
+                    return self.reduce(node.children[1 if _bool(test.value, 'if') else 2])
+                except EvaluationError as e:
+                    return Node('error', str(e))
+            if test.kind == 'error':
+                return test
+            return Node('if', None, (test, self.reduce(node.children[1]), self.reduce(node.children[2])))
+        children = []
+        for child in node.children:
+            child = self.reduce(child)
+            if child.kind == 'error' and all(_literal(before) for before in children):
+                # Children are evaluated in order, so nothing before it can fail first
+                return child
+            children.append(child)
+        reduced = Node(kind, node.value, tuple(children))
+        return self.fold(reduced) if all(_literal(child) for child in children) else reduced
+
+    def _logical(self, node: Node) -> Node:
+        # Cedar evaluates the right side only when the left does not decide,
+        # so a literal left side settles the expression or drops out
+        stop = node.kind == 'or'
+        left = self.reduce(node.children[0])
+        if left.kind == 'error':
+            return left
+        if _literal(left):
+            try:
+                if _bool(left.value, '||' if stop else '&&') == stop:
+                    return left
+            except EvaluationError as e:
+                return Node('error', str(e))
+            right = self.reduce(node.children[1])
+            if _literal(right):
+                return self.fold(Node(node.kind, None, (left, right)))
+            return right if _boolean(right) else Node(node.kind, None, (left, right))
+        right = self.reduce(node.children[1])
+        if _literal(right) and right.value is (not stop) and _boolean(left):
+            # x && true is x and x || false is x; x && false must still evaluate x
+            return left
+        return Node(node.kind, None, (left, right))
+
+
+class ResidualPolicy(NamedTuple):
+    """What is left of a policy once the principal and action are known"""
+    id: str
+    effect: str
+    resource: Scope
+    conditions: List[Condition]
+
+    def satisfied(self, request: Request) -> bool:
+        if not self.resource.matches(request.resource, request.entities):
+            return False
+        for condition in self.conditions:
+            if _bool(condition.evaluate(request), 'when' if condition.when else 'unless') != condition.when:
+                return False
+        return True
+
+    @property
+    def unconditional(self) -> bool:
+        return self.resource.op == 'any' and not self.conditions
+
+    def to_dict(self) -> Dict:
+        return {
+            'id': self.id,
+            'effect': self.effect,
+            'resource': _scope_text(self.resource),
+            'conditions': [('when ' if c.when else 'unless ') + '{ ' + render(c.node) + ' }'
+                           for c in self.conditions]
+        }
+
+
+def _scope_text(scope: Scope) -> str:
+    if scope.op == 'any':
+        return 'resource'
+    if scope.op == 'is':
+        return f'resource is {scope.entity_type}'
+    prefix = f'resource is {scope.entity_type} in' if scope.op == 'is_in' else f'resource {scope.op}'
+    targets = [str(uid) for uid in scope.uids]
+    return f'{prefix} {targets[0]}' if len(targets) == 1 else f"{prefix} [{', '.join(targets)}]"
+
+
+class ResidualSet:
+    """Residual policies for one principal and action.
+
+    ``decision`` is 'allow' or 'deny' when it does not depend on the
+    resource (an unconditional forbid, no permit left, or an unconditional
+    permit with no forbid left), None otherwise.
+    """
+
+    def __init__(self, principal: EntityUid, action: EntityUid, context: Optional[Dict],
+                 policies: List[ResidualPolicy], considered: int, entities: Entities,
+                 policy_set: PolicySet = None, reads: Iterable[EntityUid] = ()):
+        self.principal = principal
+        self.action = action
+        self.context = context
+        self.policies = policies
+        self.considered = considered
+        self.entities = entities
+        self.policy_set = policy_set
+        # Entities the residuals were folded from; request entities replacing one need the full set
+        self.reads = frozenset(reads) | {principal, action}
+        forbids = [p for p in policies if p.effect == 'forbid']
+        permits = [p for p in policies if p.effect != 'forbid']
+        if any(p.unconditional for p in forbids) or not permits:
+            self.decision = 'deny'
+        elif not forbids and any(p.unconditional for p in permits):
+            self.decision = 'allow'
+        else:
+            self.decision = None
+
+    def __len__(self):
+        return len(self.policies)
+
+    def is_authorized(self, resource, context: Dict = None, entities: Iterable[Dict] = None) -> Decision:
+        """Decision for ``resource``, with the request's own ``entities`` (Cedar JSON) if any.
+
+        ``context`` is only read when it was not known up front. When
+        ``entities`` replace one the residuals were folded from, the
+        request is evaluated against the full policy set.
+        """
+        if self.context is not None:
+            context = self.context
+        elif context is not None:
+            context = json_value(context)
+        entities = list(entities or ())
+        request = Request(self.principal, self.action, parse_uid(resource), context or {},
+                          self.entities.merged(entities) if entities else self.entities)
+        if self.policy_set is not None and any(parse_uid(entity['uid']) in self.reads for entity in entities):
+            return self.policy_set.is_authorized(request)
+        permits = []
+        forbids = []
+        errors = []
+        for policy in self.policies:
+            try:
+                if policy.satisfied(request):
+                    (forbids if policy.effect == 'forbid' else permits).append(policy.id)
+            except EvaluationError as e:
+                errors.append((policy.id, str(e)))
+        if forbids:
+            return Decision('deny', forbids, errors)
+        if permits:
+            return Decision('allow', permits, errors)
+        return Decision('deny', [], errors)
+
+    def to_dict(self) -> Dict:
+        return {
+            'principal': str(self.principal),
+            'action': str(self.action),
+            'decision': self.decision,
+            'considered': self.considered,
+            'policies': [policy.to_dict() for policy in self.policies]
+        }
+
+
+class PartialEvaluator:
+    """Residual policy sets per (principal, action[, context]), least recently used dropped first"""
+
+    def __init__(self, policy_set: PolicySet, entities: Entities = None, max_entries: int = DEFAULT_CACHE_ENTRIES):
+        self.policy_set = policy_set
+        self.entities = entities or Entities()
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def residuals(self, principal, action, context: Dict = None) -> ResidualSet:
+        """Residuals for ``principal`` and ``action``; with ``context``, it is folded in too.
+
+        ``principal`` and ``action`` are uids in any form ``parse_uid``
+        takes and ``context`` is a Cedar JSON record.
+        """
+        principal, action = parse_uid(principal), parse_uid(action)
+        key = (principal, action, None if context is None else json.dumps(context, sort_keys=True))
+        with self._lock:
+            found = self._entries.get(key)
+            if found is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return found
+            self.misses += 1
+        found = self._build(principal, action, None if context is None else json_value(context))
+        with self._lock:
+            self._entries[key] = found
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return found
+
+    def _build(self, principal: EntityUid, action: EntityUid, context: Optional[Dict]) -> ResidualSet:
+        known = _Known(principal, action, context, self.entities)
+        candidates = self.policy_set.candidates(known.request)
+        residuals = []
+        for policy in candidates:
+            if not (policy.action.matches(action, known.entities)
+                    and policy.principal.matches(principal, known.entities)):
+                continue
+            conditions = []
+            never = False
+            for condition in policy.conditions:
+                node = known.reduce(condition.node)
+                if _literal(node) and node.value is condition.when:
+                    continue
+                if _literal(node) and isinstance(node.value, bool):
+                    never = True
+                    break
+                conditions.append(Condition(condition.when, node, compile_node(node)))
+            if never:
+                if not conditions:
+                    continue
+                # The conditions before it can still fail with an error, which is reported
+                conditions.append(NEVER)
+            residuals.append(ResidualPolicy(policy.id, policy.effect, policy.resource, conditions))
+        return ResidualSet(principal, action, context, residuals, len(candidates), self.entities,
+                           self.policy_set, known.entities.uids)
+
+    def is_authorized(self, principal, action, resource, context: Dict = None,
+                      entities: Iterable[Dict] = None) -> Decision:
+        """Decision through the cached residuals; the context is part of the cache key only if it is folded"""
+        return self.residuals(principal, action).is_authorized(resource, context, entities)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            sizes = [len(entry) for entry in self._entries.values()]
+            return {
+                'policies': len(self.policy_set),
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'residual_policies': round(sum(sizes) / len(sizes), 2) if sizes else 0
+            }
+
+
+def approved_policy_set(store) -> PolicySet:
+    """The approved policies, with the ``approval-<id>`` ids bundles give them"""
+    from policy_bundle import collect_policies
+    policies = []
+    for record in collect_policies(store)[0]:
+        try:
+            policies.append(parse_policy(record['policy'], record['id']))
+        except ValueError:
+            continue
+    return PolicySet(policies)
+
+
+if __name__ == '__main__':
+    import argparse
+    from approval_manager import ApprovalManager
+
+    parser = argparse.ArgumentParser(description='Show the approved policies left for a principal and action')
+    parser.add_argument('principal', help='Principal uid, e.g. User::"alice"')
+    parser.add_argument('action', help='Action uid, e.g. Action::"view"')
+    parser.add_argument('--approvals', default='policy_approvals.json')
+    parser.add_argument('--entities', help='Cedar entities JSON')
+    parser.add_argument('--context', help='Context record as JSON, folded in when given')
+    args = parser.parse_args()
+
+    entities = None
+    if args.entities:
+        with open(args.entities) as f:
+            entities = Entities(json.load(f))
+    evaluator = PartialEvaluator(approved_policy_set(ApprovalManager(args.approvals).store), entities)
+    result = evaluator.residuals(args.principal, args.action, json.loads(args.context) if args.context else None)
+    print(json.dumps(result.to_dict(), indent=2))
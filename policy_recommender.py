@@ -1,9 +1,91 @@
-from typing import Dict, List
-import json
+from typing import Dict, List, Optional
+from collections import OrderedDict
+import re
+import threading
+
+PRIORITY_ORDER = {'HIGH': 0, 'MEDIUM': 1, 'LOW': 2}
+READ_VERBS = ('View', 'Read', 'Get', 'List', 'Describe', 'Search', 'Export')
+WRITE_VERBS = ('Create', 'Modify', 'Update', 'Delete', 'Approve', 'Write', 'Edit', 'Transfer', 'Put', 'Remove')
+OWNER_ATTRIBUTE = re.compile(r'^(owner|createdBy|created_by|assignedTo|assigned_to|customerId)', re.IGNORECASE)
+DEFAULT_THRESHOLD = 5000
+# Schema rules the banking patterns already recommend, so they are not repeated
+BANKING_COVERS = {
+    'high_value_tx': ('threshold:CreateTransaction:amount',),
+    'account_access': ('ownership:ViewAccount:ownerId',)
+}
+# Schema rules share their rationale; the title and description name the entity
+THRESHOLD_RATIONALE = [
+    '• Requires additional authorization above the threshold',
+    '• Limits the impact of a compromised or mistaken request'
+]
+OWNERSHIP_RATIONALE = [
+    '• Restricts the action to the principal who owns the resource',
+    '• Implements principle of least privilege'
+]
+SEPARATION_RATIONALE = [
+    '• Separates read access from the ability to change the resource',
+    '• Supports separation of duties requirements'
+]
+ROLE_RATIONALE = [
+    '• Manages access through group membership instead of per-principal policies',
+    '• Keeps grants consistent as principals join and leave groups'
+]
+COVERAGE_RATIONALE = [
+    '• States who may perform an action that no approved policy mentions',
+    '• Makes the default deny an explicit, reviewable decision'
+]
+# Compiled recommendations are kept for this many schemas (by fingerprint)
+CACHE_SCHEMAS = 8
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def action_verb(action: str) -> Optional[str]:
+    """'read' or 'write' from the action name's leading verb, None if it has neither"""
+    if action.startswith(READ_VERBS):
+        return 'read'
+    if action.startswith(WRITE_VERBS):
+        return 'write'
+    return None
+
+
+def attribute_rule(attribute: str, kind: str) -> str:
+    """'threshold' for Long attributes, 'ownership' for owner-style String ones, else ''"""
+    if kind == 'Long':
+        return 'threshold'
+    if kind == 'String' and OWNER_ATTRIBUTE.match(attribute):
+        return 'ownership'
+    return ''
+
+
+def action_list(actions: List[str]) -> str:
+    return ', '.join(f'Action::"{action}"' for action in actions)
+
+
+def principal_id_attribute(definition: Dict) -> str:
+    """Attribute of a principal type that owner attributes refer to, ``userId`` by default"""
+    attributes = ((definition or {}).get('shape') or {}).get('attributes') or {}
+    if 'userId' in attributes:
+        return 'userId'
+    return next((name for name in attributes if name.endswith('Id')), 'userId')
+
 
 class PolicyRecommender:
-    def __init__(self, schema_context: Dict):
+    """Recommends policies from patterns found in the schema.
+
+    The schema is scanned once: Long attributes give threshold rules on the
+    write actions of their entity type, owner attributes give ownership
+    rules, entity types with both read and write actions give separation of
+    duties rules, and memberOf hierarchies give role rules. The banking
+    patterns are recommended as before when their entities and actions are
+    present. Results are cached per schema ``fingerprint`` and indexed by id.
+    """
+
+    def __init__(self, schema_context: Dict, fingerprint: str = None):
         self.schema_context = schema_context
+        self.fingerprint = fingerprint
+        self._compiled = None
         self.banking_patterns = {
             'high_value_transactions': {
                 'priority': 'HIGH',
@@ -42,14 +124,82 @@ class PolicyRecommender:
                 ]
             }
         }
-    
+
     def generate_recommendations(self) -> List[Dict]:
         """Generate policy recommendations based on schema and banking patterns"""
+        return list(self._recommendations()[0])
+
+    def get_recommendation(self, recommendation_id: str) -> Optional[Dict]:
+        return self._recommendations()[1].get(recommendation_id)
+
+    def customize_recommendation(self, recommendation_id: str, parameters: Dict) -> str:
+        """Customize a recommendation template with specific parameters"""
+        rec = self.get_recommendation(recommendation_id)
+        if rec is None:
+            return None
+        template = rec['template']
+        for key, value in parameters.items():
+            template = template.replace(f'{{{key}}}', str(value))
+        return template
+
+    def coverage_recommendations(self, coverage: Dict) -> List[Dict]:
+        """Recommendations that would govern what ``coverage`` reports as uncovered.
+
+        ``coverage`` is a report from ``policy_coverage.coverage``. Each
+        recommendation touching an uncovered action, entity type or
+        attribute is returned as a copy whose ``covers`` lists them; uncovered
+        actions no recommendation touches get a permit candidate of their own.
+        Ordered by priority, then by how much each covers.
+        """
+        actions = set(coverage['actions']['uncovered'])
+        entity_types = set(coverage['entity_types']['uncovered'])
+        attributes = set(coverage['attributes']['uncovered'])
+        recommendations = []
+        touched = set()
+        for rec in self._recommendations()[0]:
+            covers = [action for action in rec.get('actions', ()) if action in actions]
+            entity = rec.get('entity')
+            if entity in entity_types:
+                covers.append(entity)
+            if rec.get('attribute') and f"{entity}.{rec['attribute']}" in attributes:
+                covers.append(f"{entity}.{rec['attribute']}")
+            if covers:
+                touched.update(covers)
+                recommendations.append(dict(rec, covers=covers))
+        action_details = self.schema_context.get('action_details') or {}
+        for action in coverage['actions']['uncovered']:
+            if action not in touched:
+                recommendations.append(self._coverage_rule(action, (action_details.get(action) or {}).get('appliesTo') or {}))
+        recommendations.sort(key=lambda rec: (PRIORITY_ORDER.get(rec['priority'], len(PRIORITY_ORDER)), -len(rec['covers'])))
+        return recommendations
+
+    def _recommendations(self):
+        if self._compiled is not None:
+            return self._compiled
+        if self.fingerprint is not None:
+            with _cache_lock:
+                compiled = _cache.get(self.fingerprint)
+                if compiled is not None:
+                    _cache.move_to_end(self.fingerprint)
+                    self._compiled = compiled
+                    return compiled
+        recommendations = self._banking_recommendations()
+        recommendations.extend(self._schema_recommendations({rec['id'] for rec in recommendations}))
+        recommendations.sort(key=lambda rec: PRIORITY_ORDER.get(rec['priority'], len(PRIORITY_ORDER)))
+        compiled = self._compiled = (recommendations, {rec['id']: rec for rec in recommendations})
+        if self.fingerprint is not None:
+            with _cache_lock:
+                _cache[self.fingerprint] = compiled
+                while len(_cache) > CACHE_SCHEMAS:
+                    _cache.popitem(last=False)
+        return compiled
+
+    def _banking_recommendations(self) -> List[Dict]:
         recommendations = []
-        
+
         entities = self.schema_context.get('entities', [])
         actions = self.schema_context.get('actions', [])
-        
+
         # High-value transaction protection
         if 'Transaction' in entities and 'CreateTransaction' in actions:
             recommendations.append({
@@ -59,9 +209,13 @@ class PolicyRecommender:
                 'description': 'Prevent unauthorized large transactions',
                 'template': self.banking_patterns['high_value_transactions']['template'],
                 'rationale': self.banking_patterns['high_value_transactions']['rationale'],
-                'parameters': {'threshold': 5000}
+                'parameters': {'threshold': DEFAULT_THRESHOLD},
+                'kind': 'threshold',
+                'entity': 'Transaction',
+                'actions': ['CreateTransaction'],
+                'attribute': 'amount'
             })
-        
+
         # Account access control
         if 'Account' in entities and 'ViewAccount' in actions:
             recommendations.append({
@@ -71,32 +225,173 @@ class PolicyRecommender:
                 'description': 'Restrict account access to owners only',
                 'template': self.banking_patterns['account_access_control']['template'],
                 'rationale': self.banking_patterns['account_access_control']['rationale'],
-                'parameters': {'role': 'AccountHolder'}
+                'parameters': {'role': 'AccountHolder'},
+                'kind': 'ownership',
+                'entity': 'Account',
+                'actions': ['ViewAccount'],
+                'attribute': 'ownerId'
             })
-        
+
         # Manager override capabilities
         if 'User' in entities:
             recommendations.append({
                 'id': 'manager_override',
                 'title': 'Manager Override Policy',
                 'priority': 'MEDIUM',
-                'description': 'Allow managers to override restrictions',
+                'description': 'Allow managers to override standard restrictions',
                 'template': self.banking_patterns['manager_override']['template'],
                 'rationale': self.banking_patterns['manager_override']['rationale'],
-                'parameters': {}
+                'parameters': {},
+                'kind': 'override'
             })
-        
+
         return recommendations
-    
-    def customize_recommendation(self, recommendation_id: str, parameters: Dict) -> str:
-        """Customize a recommendation template with specific parameters"""
-        recommendations = self.generate_recommendations()
-        
-        for rec in recommendations:
-            if rec['id'] == recommendation_id:
-                template = rec['template']
-                for key, value in parameters.items():
-                    template = template.replace(f'{{{key}}}', str(value))
-                return template
-        
-        return None
\ No newline at end of file
+
+    def _schema_recommendations(self, taken: set) -> List[Dict]:
+        """One pass over entity types and actions applying the schema rules"""
+        entity_details = self.schema_context.get('entity_details') or {}
+        action_details = self.schema_context.get('action_details') or {}
+        covered = {rule for rec_id in taken for rule in BANKING_COVERS.get(rec_id, ())}
+
+        # Actions per resource type as (all, reads, writes)
+        by_resource = {}
+        by_principal = {}
+        for action, definition in action_details.items():
+            applies = (definition or {}).get('appliesTo') or {}
+            verb = action_verb(action)
+            for resource_type in applies.get('resourceTypes') or ():
+                groups = by_resource.get(resource_type)
+                if groups is None:
+                    groups = by_resource[resource_type] = ([], [], [], applies.get('principalTypes') or ['User'])
+                groups[0].append(action)
+                if verb == 'read':
+                    groups[1].append(action)
+                elif verb == 'write':
+                    groups[2].append(action)
+            for principal_type in applies.get('principalTypes') or ():
+                by_principal.setdefault(principal_type, []).append(action)
+
+        # Attribute names repeat across entity types, so their rule kind is looked up once
+        rules = {}
+        principal_ids = {}
+        recommendations = []
+        append = recommendations.append
+        for entity, definition in entity_details.items():
+            definition = definition or {}
+            groups = by_resource.get(entity)
+            if groups is not None:
+                actions, reads, writes, principals = groups
+                attributes = (definition.get('shape') or {}).get('attributes') or {}
+                for attribute, spec in attributes.items():
+                    kind = spec.get('type') if isinstance(spec, dict) else None
+                    rule = rules.get((attribute, kind))
+                    if rule is None:
+                        rule = rules[(attribute, kind)] = attribute_rule(attribute, kind)
+                    if rule == 'threshold':
+                        targets = writes or actions
+                        if covered:
+                            targets = [a for a in targets if f'threshold:{a}:{attribute}' not in covered]
+                        if targets:
+                            append(self._threshold_rule(entity, attribute, targets))
+                    elif rule == 'ownership':
+                        targets = actions
+                        if covered:
+                            targets = [a for a in targets if f'ownership:{a}:{attribute}' not in covered]
+                        if targets:
+                            principal = principals[0]
+                            if principal not in principal_ids:
+                                principal_ids[principal] = principal_id_attribute(entity_details.get(principal))
+                            append(self._ownership_rule(entity, attribute, targets, principal, principal_ids[principal]))
+
+                if reads and writes:
+                    append(self._separation_rule(entity, writes))
+
+            if entity in by_principal:
+                for parent in definition.get('memberOfTypes') or ():
+                    append(self._role_rule(entity, parent, by_principal[entity]))
+        return recommendations
+
+    @staticmethod
+    def _threshold_rule(entity: str, attribute: str, actions: List[str]) -> Dict:
+        return {
+            'id': f'threshold:{entity}:{attribute}',
+            'title': f'{entity} {attribute} Limit',
+            'priority': 'HIGH',
+            'description': f'Require additional authorization for large {entity} {attribute} values',
+            'template': f'forbid (principal, action in [{action_list(actions)}], resource is {entity}) '
+                        f'when {{ resource.{attribute} >= {{threshold}} }};',
+            'rationale': THRESHOLD_RATIONALE,
+            'parameters': {'threshold': DEFAULT_THRESHOLD},
+            'kind': 'threshold',
+            'entity': entity,
+            'actions': actions,
+            'attribute': attribute
+        }
+
+    @staticmethod
+    def _ownership_rule(entity: str, attribute: str, actions: List[str],
+                        principal: str, id_attribute: str) -> Dict:
+        return {
+            'id': f'ownership:{entity}:{attribute}',
+            'title': f'{entity} Owner Access',
+            'priority': 'MEDIUM',
+            'description': f'Restrict {entity} access to the principal in {attribute}',
+            'template': f'permit (principal is {principal}, action in [{action_list(actions)}], resource is {entity}) '
+                        f'when {{ resource.{attribute} == principal.{id_attribute} }};',
+            'rationale': OWNERSHIP_RATIONALE,
+            'parameters': {},
+            'kind': 'ownership',
+            'entity': entity,
+            'actions': actions,
+            'attribute': attribute
+        }
+
+    @staticmethod
+    def _separation_rule(entity: str, writes: List[str]) -> Dict:
+        return {
+            'id': f'separation:{entity}',
+            'title': f'Separate Read and Write Access to {entity}',
+            'priority': 'MEDIUM',
+            'description': f'Only privileged principals may change {entity}; others keep read access',
+            'template': f'forbid (principal, action in [{action_list(writes)}], resource is {entity}) '
+                        f'unless {{ principal.role == "{{role}}" }};',
+            'rationale': SEPARATION_RATIONALE,
+            'parameters': {'role': 'Manager'},
+            'kind': 'separation',
+            'entity': entity,
+            'actions': writes
+        }
+
+    @staticmethod
+    def _coverage_rule(action: str, applies: Dict) -> Dict:
+        principals = applies.get('principalTypes') or ['User']
+        resources = applies.get('resourceTypes') or []
+        resource = f'resource is {resources[0]}' if len(resources) == 1 else 'resource'
+        return {
+            'id': f'coverage:{action}',
+            'title': f'Govern {action}',
+            'priority': 'MEDIUM',
+            'description': f'No approved policy permits or forbids {action}, so every request for it is denied',
+            'template': f'permit (principal == {principals[0]}::"{{principal}}", action == Action::"{action}", {resource});',
+            'rationale': COVERAGE_RATIONALE,
+            'parameters': {'principal': 'Manager'},
+            'kind': 'coverage',
+            'entity': resources[0] if len(resources) == 1 else None,
+            'actions': [action],
+            'covers': [action]
+        }
+
+    @staticmethod
+    def _role_rule(principal: str, parent: str, actions: List[str]) -> Dict:
+        return {
+            'id': f'role:{principal}:{parent}',
+            'title': f'{parent}-Based Access for {principal}',
+            'priority': 'LOW',
+            'description': f'Grant {principal} permissions through {parent} membership',
+            'template': f'permit (principal in {parent}::"{{group}}", action in [{action_list(actions)}], resource);',
+            'rationale': ROLE_RATIONALE,
+            'parameters': {'group': 'Default'},
+            'kind': 'role',
+            'entity': principal,
+            'actions': actions
+        }
@@ -0,0 +1,216 @@
+import heapq
+import math
+import re
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import Dict, List, Optional
+from policy_parser import extract_references
+
+WORD_RE = re.compile(r'[A-Za-z0-9]+')
+CAMEL_RE = re.compile(r'[A-Z]+(?![a-z])|[A-Z]?[a-z]+|[0-9]+')
+FACETS = ('status', 'source', 'action', 'entity_type')
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+
+def tokenize(text: str, split_identifiers: bool = True) -> List[str]:
+    """Lowercase word tokens; CamelCase identifiers also yield their parts"""
+    tokens = []
+    for word in WORD_RE.findall(text):
+        tokens.append(word.lower())
+        if split_identifiers:
+            parts = CAMEL_RE.findall(word)
+            if len(parts) > 1:
+                tokens.extend(part.lower() for part in parts)
+    return tokens
+
+
+class PolicySearchIndex:
+    """Inverted index with BM25 ranking and facets over history and approvals.
+
+    Documents are the records of one or more stores (``source`` name ->
+    record store). The index pulls records it has not seen yet by id cursor
+    before every search, so it stays current with writes from this and
+    other worker processes without re-reading old records. Documents are
+    numbered in arrival order, which is normally timestamp order and turns
+    date-range filters into a slice of document ids. A record another
+    process wrote earlier but committed later can arrive out of order; from
+    then on date ranges are resolved through the timestamp order instead.
+    """
+
+    def __init__(self, stores: Dict[str, object]):
+        self.stores = stores
+        self._cursors = {source: None for source in stores}
+        self._lock = threading.Lock()
+        self._postings = {}
+        self._facets = {}
+        self._docs = []
+        # Sorted timestamps and the document at each position
+        self._timestamps = []
+        self._order = array('I')
+        self._in_order = True
+        self._lengths = array('I')
+        self._total_length = 0
+        self._refresh()
+
+    def __len__(self):
+        return len(self._docs)
+
+    def _add(self, source: str, record: Dict):
+        """Index one record as the next document"""
+        refs = extract_references(record.get('policy', ''))
+        rationale = record.get('rationale', [])
+        if isinstance(rationale, list):
+            rationale = ' '.join(rationale)
+        text = ' '.join([record.get('requirement', ''), record.get('policy', ''), rationale])
+        tokens = tokenize(text)
+
+        doc = len(self._docs)
+        self._docs.append({
+            'source': source,
+            'id': record.get('id'),
+            'timestamp': record.get('timestamp', ''),
+            'status': record.get('status'),
+            'requirement': record.get('requirement', ''),
+            'actions': refs['actions'],
+            'entity_types': refs['entity_types']
+        })
+        timestamp = record.get('timestamp', '')
+        position = bisect_right(self._timestamps, timestamp)
+        if position < len(self._timestamps):
+            self._in_order = False
+        self._timestamps.insert(position, timestamp)
+        self._order.insert(position, doc)
+        self._lengths.append(len(tokens))
+        self._total_length += len(tokens)
+
+        counts = {}
+        for token in tokens:
+            counts[token] = counts.get(token, 0) + 1
+        for token, tf in counts.items():
+            docs, tfs = self._postings.setdefault(token, (array('I'), array('H')))
+            docs.append(doc)
+            tfs.append(min(tf, 65535))
+
+        facet_values = [('status', record.get('status')), ('source', source)]
+        facet_values += [('action', a) for a in refs['actions']]
+        facet_values += [('entity_type', t) for t in refs['entity_types']]
+        for key in facet_values:
+            if key[1] is not None:
+                self._facets.setdefault(key, array('I')).append(doc)
+
+    def search(self, query: str = '', status: str = None, source: str = None,
+               action: str = None, entity_type: str = None, since: str = None,
+               until: str = None, limit: int = 20) -> Dict:
+        """Ranked search restricted by facets and an inclusive date range"""
+        self._refresh()
+        with self._lock:
+            lo = bisect_left(self._timestamps, since) if since else 0
+            hi = bisect_right(self._timestamps, until + '\uffff') if until else len(self._docs)
+            allowed = None
+            if not self._in_order and (lo, hi) != (0, len(self._docs)):
+                # Positions in timestamp order are not document ids here
+                allowed = set(self._order[lo:hi])
+                lo, hi = 0, len(self._docs)
+
+            for facet, value in (('status', status), ('source', source),
+                                 ('action', action), ('entity_type', entity_type)):
+                if value is None:
+                    continue
+                docs = self._facets.get((facet, value), ())
+                ids = set(docs[bisect_left(docs, lo):bisect_left(docs, hi)])
+                allowed = ids if allowed is None else allowed & ids
+
+            # Whole query words only; documents are indexed under both forms
+            terms = list(dict.fromkeys(tokenize(query, split_identifiers=False)))
+            if terms:
+                scores = self._score(terms, lo, hi, allowed)
+                matched = scores.keys()
+                top = heapq.nlargest(limit, scores.items(), key=lambda item: (item[1], item[0]))
+            else:
+                # No text: newest matching documents first
+                if allowed is not None:
+                    matched = allowed
+                    newest = heapq.nlargest(limit, matched, key=self._recency)
+                else:
+                    matched = range(lo, hi)
+                    newest = range(hi - 1, max(lo, hi - limit) - 1, -1)
+                    if not self._in_order:
+                        newest = [self._order[i] for i in newest]
+                top = [(doc, 0.0) for doc in newest]
+
+            results = []
+            for doc, score in top:
+                result = dict(self._docs[doc])
+                result['score'] = round(score, 4)
+                results.append(result)
+            return {
+                'total': len(matched),
+                'results': results,
+                'facets': self._facet_counts(matched)
+            }
+
+    def _recency(self, doc: int):
+        return (self._docs[doc]['timestamp'], doc) if not self._in_order else doc
+
+    def _score(self, terms: List[str], lo: int, hi: int, allowed: Optional[set]) -> Dict[int, float]:
+        n = len(self._docs)
+        avg_length = self._total_length / n if n else 0
+        scores = {}
+        for term in terms:
+            posting = self._postings.get(term)
+            if not posting:
+                continue
+            docs, tfs = posting
+            idf = math.log(1 + (n - len(docs) + 0.5) / (len(docs) + 0.5))
+            start, stop = bisect_left(docs, lo), bisect_left(docs, hi)
+            for i in range(start, stop):
+                doc = docs[i]
+                if allowed is not None and doc not in allowed:
+                    continue
+                tf = tfs[i]
+                norm = K1 * (1 - B + B * self._lengths[doc] / avg_length) if avg_length else K1
+                scores[doc] = scores.get(doc, 0.0) + idf * tf * (K1 + 1) / (tf + norm)
+        return scores
+
+    def _facet_counts(self, matched, top: int = 10) -> Dict[str, Dict[str, int]]:
+        counts = {facet: {} for facet in FACETS}
+        if isinstance(matched, range):
+            # Unfiltered date range: count straight from the facet postings
+            for (facet, value), docs in self._facets.items():
+                n = bisect_left(docs, matched.stop) - bisect_left(docs, matched.start)
+                if n:
+                    counts[facet][value] = n
+            matched = ()
+        for doc in matched:
+            info = self._docs[doc]
+            values = [('status', info['status']), ('source', info['source'])]
+            values += [('action', a) for a in info['actions']]
+            values += [('entity_type', t) for t in info['entity_types']]
+            for facet, value in values:
+                if value is not None:
+                    counts[facet][value] = counts[facet].get(value, 0) + 1
+        return {facet: dict(heapq.nlargest(top, values.items(), key=lambda item: item[1]))
+                for facet, values in counts.items()}
+
+    def _refresh(self):
+        """Index records written since the last refresh, merged by timestamp"""
+        with self._lock:
+            pending = []
+            for source, store in self.stores.items():
+                cursor = self._cursors[source]
+                while True:
+                    page, next_cursor = store.query(cursor=cursor, limit=1000)
+                    pending.extend((record.get('timestamp', ''), source, record) for record in page)
+                    if page:
+                        cursor = page[-1]['id']
+                    if next_cursor is None:
+                        break
+                self._cursors[source] = cursor
+            if len(self.stores) > 1:
+                pending.sort(key=lambda item: item[0])
+            for _, source, record in pending:
+                self._add(source, record)
@@ -0,0 +1,276 @@
+"""Replays an authorization log against the approved policies with and without a candidate.
+
+Each log line is one JSON request: ``principal``, ``action`` and
+``resource`` uids, an optional ``context`` record and optional
+``entities`` (Cedar entity JSON). A shared entities file can supply the
+entities most requests refer to.
+
+The log is split into byte ranges that worker processes read on their
+own, so memory stays flat however long the log is and nothing but the
+small per-range reports crosses processes. Adding policies can only
+change a decision when one of them applies, so each request is checked
+against the candidate first and the approved set is only evaluated for
+the requests the candidate matches.
+"""
+
+import json
+import math
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Tuple
+from policy_engine import Entities, EntityUid, PolicySet, make_request, parse_policies, parse_policy, parse_uid
+from policy_parser import split_policies
+
+DEFAULT_WORKERS = int(os.environ.get('SIMULATION_WORKERS', os.cpu_count() or 1))
+DEFAULT_SAMPLES = 5
+# Byte ranges per worker, so a slow range does not leave the others idle
+SHARDS_PER_WORKER = 4
+MIN_SHARD_BYTES = 1 << 20
+
+_worker = None
+_decode = json.JSONDecoder().decode
+
+
+class Simulation:
+    """The approved set and the candidate, parsed once per process"""
+
+    def __init__(self, approved: List[str], candidate: str, entities_file: str = None, samples: int = DEFAULT_SAMPLES):
+        self.unparsed = []
+        policies = []
+        for n, text in enumerate(approved):
+            for m, statement in enumerate(split_policies(text)):
+                try:
+                    policies.append(parse_policy(statement, f'approved{n}' + (f'-{m}' if m else '')))
+                except ValueError as e:
+                    self.unparsed.append(str(e))
+        self.approved = PolicySet(policies)
+        self.candidate = PolicySet(parse_policies(candidate, 'candidate'))
+        self.samples = samples
+        self.entities = Entities()
+        if entities_file:
+            with open(entities_file) as f:
+                self.entities = Entities(json.load(f))
+
+    def run(self, lines: Iterator[Tuple[int, bytes]], limit: int = None) -> Dict:
+        report = empty_report()
+        for offset, line in lines:
+            if limit is not None and report['requests'] + report['invalid_lines'] >= limit:
+                break
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                data = _decode(line.decode('utf-8'))
+                if not self.may_apply(data):
+                    report['requests'] += 1
+                    continue
+                request = make_request(data, self.entities)
+            except (ValueError, KeyError, TypeError, AttributeError):
+                report['invalid_lines'] += 1
+                continue
+            report['requests'] += 1
+            self.evaluate(request, offset, report)
+        return report
+
+    def may_apply(self, data: Dict) -> bool:
+        """Cheap check on the action alone, so most requests skip building entities"""
+        action = parse_uid(data['action'])
+        if any(parse_uid(entity['uid']).type == 'Action' for entity in data.get('entities') or ()):
+            return True
+        return self.candidate.may_apply(action, self.entities.ancestors(action))
+
+    def evaluate(self, request, offset: int, report: Dict):
+        after = self.candidate.is_authorized(request)
+        report['candidate_errors'] += len(after.errors)
+        if not after.determining:
+            return
+        report['candidate_matched'] += 1
+        before = self.approved.is_authorized(request)
+        # A satisfied candidate forbid always denies; a candidate permit only
+        # matters when nothing in the approved set permitted or forbade
+        if after.decision == 'deny' and after.determining:
+            decided = 'deny'
+        elif after.allowed and before.decision == 'deny' and not before.determining:
+            decided = 'allow'
+        else:
+            return
+        if decided == before.decision:
+            return
+        kind = f'{before.decision}_to_{decided}'
+        report['changed'] += 1
+        report['flips'][kind] += 1
+        by_action = report['by_action'].setdefault(request.action.id, {'allow_to_deny': 0, 'deny_to_allow': 0})
+        by_action[kind] += 1
+        samples = report['samples'][kind]
+        if len(samples) < self.samples:
+            samples.append({
+                'offset': offset,
+                'principal': str(request.principal),
+                'action': str(request.action),
+                'resource': str(request.resource),
+                'context': _jsonable(request.context),
+                'before': before.decision,
+                'after': decided,
+                'approved_determining': before.determining,
+                'candidate_determining': after.determining
+            })
+
+
+def empty_report() -> Dict:
+    return {
+        'requests': 0,
+        'invalid_lines': 0,
+        'candidate_matched': 0,
+        'candidate_errors': 0,
+        'changed': 0,
+        'flips': {'allow_to_deny': 0, 'deny_to_allow': 0},
+        'by_action': {},
+        'samples': {'allow_to_deny': [], 'deny_to_allow': []}
+    }
+
+
+def merge_reports(total: Dict, part: Dict, samples: int) -> Dict:
+    for key in ('requests', 'invalid_lines', 'candidate_matched', 'candidate_errors', 'changed'):
+        total[key] += part[key]
+    for kind in ('allow_to_deny', 'deny_to_allow'):
+        total['flips'][kind] += part['flips'][kind]
+        total['samples'][kind].extend(part['samples'][kind][:samples - len(total['samples'][kind])])
+        total['samples'][kind].sort(key=lambda sample: sample['offset'])
+    for action, counts in part['by_action'].items():
+        merged = total['by_action'].setdefault(action, {'allow_to_deny': 0, 'deny_to_allow': 0})
+        for kind, count in counts.items():
+            merged[kind] += count
+    return total
+
+
+def _jsonable(value):
+    if isinstance(value, EntityUid):
+        return {'__entity': {'type': value.type, 'id': value.id}}
+    if isinstance(value, dict):
+        return {k: _jsonable(v) for k, v in value.items()}
+    if isinstance(value, (frozenset, tuple)):
+        return [_jsonable(v) for v in value]
+    return value
+
+
+def read_range(path: str, start: int, end: int) -> Iterator[Tuple[int, bytes]]:
+    """Lines that begin in [start, end), with their byte offsets"""
+    with open(path, 'rb') as f:
+        if start:
+            # Skip the line that straddles the boundary; the previous range owns it
+            f.seek(start - 1)
+            f.readline()
+        while True:
+            offset = f.tell()
+            if offset >= end:
+                return
+            line = f.readline()
+            if not line:
+                return
+            yield offset, line
+
+
+def shard_ranges(size: int, shards: int) -> List[Tuple[int, int]]:
+    step = max(math.ceil(size / max(shards, 1)), 1)
+    return [(start, min(start + step, size)) for start in range(0, size, step)] or [(0, 0)]
+
+
+def _init_worker(approved: List[str], candidate: str, entities_file: str, samples: int):
+    global _worker
+    _worker = Simulation(approved, candidate, entities_file, samples)
+
+
+def _run_range(path: str, start: int, end: int, limit: int = None) -> Dict:
+    return _worker.run(read_range(path, start, end), limit)
+
+
+def simulate(log_path: str, approved: List[str], candidate: str, entities_file: str = None,
+             workers: int = None, samples: int = DEFAULT_SAMPLES, max_lines: int = None) -> Dict:
+    """Decision changes the candidate would cause on the logged requests.
+
+    ``approved`` is the current policy texts. Raises ValueError (a
+    PolicyParseError) when the candidate cannot be parsed. With
+    ``max_lines``, about that many lines are read, spread evenly over the
+    log. ``workers`` <= 1 runs in this process.
+    """
+    started = time.perf_counter()
+    workers = DEFAULT_WORKERS if workers is None else workers
+    size = os.path.getsize(log_path)
+    shards = max(1, min(workers * SHARDS_PER_WORKER, size // MIN_SHARD_BYTES)) if workers > 1 else 1
+    ranges = shard_ranges(size, shards)
+    limit = math.ceil(max_lines / len(ranges)) if max_lines else None
+
+    local = Simulation(approved, candidate, entities_file, samples)
+    if not len(local.candidate):
+        raise ValueError('Candidate has no policies')
+    total = empty_report()
+    if workers <= 1 or len(ranges) == 1:
+        merge_reports(total, local.run(read_range(log_path, 0, size), max_lines), samples)
+    else:
+        # Spawned rather than forked: the caller may be a threaded server holding locks
+        with ProcessPoolExecutor(min(workers, len(ranges)), mp_context=multiprocessing.get_context('spawn'),
+                                 initializer=_init_worker,
+                                 initargs=(approved, candidate, entities_file, samples)) as pool:
+            futures = [pool.submit(_run_range, log_path, start, end, limit) for start, end in ranges]
+            for future in futures:
+                merge_reports(total, future.result(), samples)
+
+    seconds = time.perf_counter() - started
+    total['approved_policies'] = len(local.approved)
+    total['unparsed_approved'] = len(local.unparsed)
+    total['candidate_policies'] = len(local.candidate)
+    total['seconds'] = round(seconds, 3)
+    total['requests_per_second'] = round(total['requests'] / seconds) if seconds else None
+    total['changed_ratio'] = round(total['changed'] / total['requests'], 6) if total['requests'] else 0.0
+    return total
+
+
+def approved_texts(store) -> List[str]:
+    """Canonical texts of the currently approved policies"""
+    from policy_bundle import collect_policies
+    return [policy['policy'] for policy in collect_policies(store)[0]]
+
+
+def format_report(report: Dict) -> str:
+    flips = report['flips']
+    lines = [
+        f"{report['requests']} requests ({report['invalid_lines']} unreadable lines) in {report['seconds']}s; "
+        f"candidate applies to {report['candidate_matched']}",
+        f"{report['changed']} decisions change: {flips['allow_to_deny']} allow → deny, "
+        f"{flips['deny_to_allow']} deny → allow"
+    ]
+    for action, counts in sorted(report['by_action'].items(), key=lambda item: -sum(item[1].values()))[:10]:
+        lines.append(f"  {action}: {counts['allow_to_deny']} allow → deny, {counts['deny_to_allow']} deny → allow")
+    for kind, samples in report['samples'].items():
+        for sample in samples:
+            lines.append(f"  e.g. {sample['principal']} {sample['action']} {sample['resource']}: "
+                         f"{sample['before']} → {sample['after']} (byte {sample['offset']})")
+    if report['candidate_errors']:
+        lines.append(f"  {report['candidate_errors']} candidate evaluation errors")
+    if report['unparsed_approved']:
+        lines.append(f"  {report['unparsed_approved']} approved policies could not be parsed and were ignored")
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    import argparse
+    from approval_manager import ApprovalManager
+
+    parser = argparse.ArgumentParser(description='Replay an authorization log against a candidate policy')
+    parser.add_argument('log', help='JSON Lines authorization log')
+    parser.add_argument('candidate', help='File with the candidate Cedar policy, or - for stdin')
+    parser.add_argument('--approvals', default='policy_approvals.json')
+    parser.add_argument('--entities', help='Cedar entities JSON shared by all requests')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS)
+    parser.add_argument('--samples', type=int, default=DEFAULT_SAMPLES)
+    parser.add_argument('--max-lines', type=int)
+    parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+    args = parser.parse_args()
+
+    candidate_text = sys.stdin.read() if args.candidate == '-' else open(args.candidate).read()
+    result = simulate(args.log, approved_texts(ApprovalManager(args.approvals).store), candidate_text,
+                      args.entities, args.workers, args.samples, args.max_lines)
+    print(json.dumps(result, indent=2) if args.json else format_report(result))
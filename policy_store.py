@@ -0,0 +1,45 @@
+import os
+from jsonl_store import JsonlRecordStore, append_together as append_jsonl_together
+from sqlite_store import SqliteRecordStore
+
+STORE_BACKENDS = ('jsonl', 'sqlite')
+
+def open_record_store(path: str, table: str, fsync: str = None, backend: str = None,
+                      db_path: str = None, default_status: str = None):
+    """Open the record store for approvals or history.
+
+    ``backend`` defaults to ``POLICY_STORE_BACKEND`` (``jsonl``). The SQLite
+    backend keeps every table in ``POLICY_STORE_DB`` and imports the existing
+    JSON store at ``path`` the first time a table is opened empty.
+    """
+    backend = backend or os.environ.get('POLICY_STORE_BACKEND', 'jsonl')
+    if backend == 'jsonl':
+        return JsonlRecordStore(path, fsync=fsync, default_status=default_status)
+    if backend == 'sqlite':
+        db_path = db_path or os.environ.get('POLICY_STORE_DB', 'policy_store.db')
+        store = SqliteRecordStore(db_path, table, default_status=default_status)
+        if store.count() == 0 and os.path.exists(path):
+            legacy = JsonlRecordStore(path, fsync=fsync, default_status=default_status)
+            store.import_records(legacy.all())
+            legacy.close()
+        return store
+    raise ValueError(f"Unknown store backend {backend!r}, expected one of {STORE_BACKENDS}")
+
+
+
+def append_together(entries) -> list:
+    """Append records to several stores together.
+
+    When every store lives in the same SQLite database the records are
+    committed in a single transaction. JSON Lines stores are separate files:
+    the records are written under all of the stores' locks and synced
+    together, but a crash between the writes can keep the first without
+    the rest, so only SQLite makes them atomic.
+    """
+    first = entries[0][0]
+    if all(isinstance(store, SqliteRecordStore) and store.db_path == first.db_path
+           for store, _ in entries):
+        return first.append_transaction(entries)
+    if all(isinstance(store, JsonlRecordStore) for store, _ in entries):
+        return append_jsonl_together(entries)
+    return [store.append(record) for store, record in entries]
@@ -51,9 +51,9 @@ class PolicyValidator:
         entities = re.findall(r'(\w+)::"(\w+)"', policy)
         actions = re.findall(r'Action::"(\w+)"', policy)
         
-        # Validate entities
+        # Validate entities (Action::"..." references are checked as actions below)
         for entity_type, entity_name in entities:
-            if entity_type not in schema_context.get('entities', []):
+            if entity_type != 'Action' and entity_type not in schema_context.get('entities', []):
                 errors.append(f"Unknown entity type: {entity_type}")
         
         # Validate actions
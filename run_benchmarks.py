@@ -0,0 +1,435 @@
+#!/usr/bin/env python3
+"""
+Benchmarks for schema loading, validation, recommendations, the record
+stores, policy bundles, partial evaluation, schema coverage and the web endpoints, over synthetic data from bench_data.py.
+
+    python run_benchmarks.py --size default --out bench_results.json
+    python run_benchmarks.py --baseline bench_baseline.json --threshold 0.25 --threshold 'store.*=0.5'
+
+Results are written as JSON. With --baseline, medians are compared against
+the stored run and the exit code is 1 if any benchmark regressed.
+"""
+
+import argparse
+import fnmatch
+import itertools
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Callable, Dict, List
+
+import bench_data
+
+SIZES = {
+    'smoke': {'entities': [10, 100], 'policies': [100], 'history': [1000]},
+    'default': {'entities': [10, 1000], 'policies': [100, 10000], 'history': [10000, 100000]},
+    'full': {'entities': [10, 100, 1000, 10000], 'policies': [100, 1000, 10000, 100000],
+             'history': [10000, 100000, 1000000]}
+}
+DEFAULT_THRESHOLD = 0.25
+# Medians closer than this to the baseline are treated as noise
+DEFAULT_MIN_MS = 0.5
+APPENDS = 200
+
+
+class Suite:
+    """Times benchmark cases and collects their statistics by name"""
+
+    def __init__(self, only: List[str] = None, repeat: int = 5, verbose: bool = True):
+        self.only = only
+        self.repeat = repeat
+        self.verbose = verbose
+        self.results = {}
+
+    def wanted(self, name: str) -> bool:
+        return not self.only or any(fnmatch.fnmatch(name, pattern) for pattern in self.only)
+
+    def wants_group(self, group: str) -> bool:
+        """Whether any benchmark named ``<group>.*`` can match, so its data is worth generating"""
+        return not self.only or any(fnmatch.fnmatch(group, pattern.split('.', 1)[0]) for pattern in self.only)
+
+    def time(self, name: str, fn: Callable, ops: int = 1, repeat: int = None, setup: Callable = None):
+        """Run ``fn`` ``repeat`` times; ``ops`` is how many operations one run performs.
+
+        ``setup`` runs untimed before each run and its result is passed to ``fn``.
+        """
+        if not self.wanted(name):
+            return
+        times = []
+        for _ in range(repeat or self.repeat):
+            arg = setup() if setup else None
+            start = time.perf_counter()
+            fn(arg) if setup else fn()
+            times.append((time.perf_counter() - start) * 1000)
+        times.sort()
+        median = statistics.median(times)
+        self.results[name] = {
+            'median_ms': round(median, 4),
+            'min_ms': round(times[0], 4),
+            'max_ms': round(times[-1], 4),
+            'repeat': len(times),
+            'ops': ops,
+            'ops_per_second': round(ops / (median / 1000), 1) if median else None
+        }
+        if self.verbose:
+            print(f'{name:<60} {median:>12.3f} ms', flush=True)
+
+
+def bench_schema(suite: Suite, workdir: str, sizes: Dict):
+    from schema_parser import SchemaParser
+    for n in sizes['entities']:
+        path = os.path.join(workdir, f'schema_{n}.json')
+        bench_data.write_schema(path, bench_data.make_schema(n))
+        suite.time(f'schema.load_schema[entities={n}]', lambda: SchemaParser().load_schema(path))
+
+
+def bench_validator(suite: Suite, workdir: str, sizes: Dict):
+    from policy_validator import PolicyValidator
+    schema = bench_data.make_schema(100)
+    context = bench_data.schema_context(schema)
+    validator = PolicyValidator()
+    for n in sizes['policies']:
+        policies = bench_data.make_policies(schema, n)
+        suite.time(f'validator.validate_policy[policies={n}]',
+                   lambda: [validator.validate_policy(p, context) for p in policies], ops=n)
+
+
+def bench_recommender(suite: Suite, workdir: str, sizes: Dict):
+    from policy_recommender import PolicyRecommender
+    for n in sizes['entities']:
+        context = bench_data.schema_context(bench_data.make_schema(n))
+        suite.time(f'recommender.generate_recommendations[entities={n}]',
+                   lambda: PolicyRecommender(context).generate_recommendations())
+        recommender = PolicyRecommender(context, fingerprint=f'bench-{n}')
+        recommendations = recommender.generate_recommendations()
+        suite.time(f'recommender.cached_recommendations[entities={n}]',
+                   lambda: PolicyRecommender(context, fingerprint=f'bench-{n}').generate_recommendations())
+        if recommendations:
+            first = recommendations[0]
+            suite.time(f'recommender.customize_recommendation[entities={n}]',
+                       lambda: recommender.customize_recommendation(first['id'], first['parameters']))
+
+
+def fill_jsonl(path: str, records) -> int:
+    """Write records straight into a JSON Lines store, in batches"""
+    from jsonl_store import JsonlStore
+    log = JsonlStore(path, fsync='never', compact_threshold=0)
+    written = 0
+    batch = []
+    with log.locked():
+        for record in records:
+            batch.append(record)
+            if len(batch) == 10000:
+                written += len(log.write_batch(batch))
+                batch = []
+        if batch:
+            written += len(log.write_batch(batch))
+    log.close()
+    return written
+
+
+def bench_stores(suite: Suite, workdir: str, sizes: Dict):
+    from jsonl_store import JsonlRecordStore
+    from sqlite_store import SqliteRecordStore
+    schema = bench_data.make_schema(100)
+
+    def append_run(store):
+        for i in range(APPENDS):
+            store.append({'timestamp': datetime.now().isoformat(), 'status': 'APPROVED',
+                          'requirement': f'append {i}', 'policy': 'permit (principal, action, resource);'})
+        store.close()
+
+    counter = iter(range(1000000))
+    suite.time('store.append[jsonl]', append_run, ops=APPENDS,
+               setup=lambda: JsonlRecordStore(os.path.join(workdir, f'append_{next(counter)}.json'), fsync='never'))
+    suite.time('store.append[sqlite]', append_run, ops=APPENDS,
+               setup=lambda: SqliteRecordStore(os.path.join(workdir, f'append_{next(counter)}.db'), 'history'))
+
+    for n in sizes['history']:
+        path = os.path.join(workdir, f'history_{n}.json')
+        fill_jsonl(path, bench_data.make_history(schema, n))
+        suite.time(f'store.load[jsonl,records={n}]',
+                   lambda: JsonlRecordStore(path, fsync='never').close(), repeat=3)
+        db = SqliteRecordStore(os.path.join(workdir, f'history_{n}.db'), 'history')
+        records = bench_data.make_history(schema, n)
+        while db.import_records(list(itertools.islice(records, 10000))):
+            pass
+        jsonl = JsonlRecordStore(path, fsync='never')
+        since = bench_data.history_timestamp(n // 2)
+        for backend, store in (('jsonl', jsonl), ('sqlite', db)):
+            suite.time(f'store.count[{backend},records={n}]', store.count)
+            suite.time(f'store.get[{backend},records={n}]', lambda: store.get(n // 2))
+            suite.time(f'store.query_page[{backend},records={n}]',
+                       lambda: store.query(cursor=n // 2, limit=100))
+            suite.time(f'store.query_status[{backend},records={n}]',
+                       lambda: store.query(status='REJECTED', limit=100))
+            suite.time(f'store.query_since[{backend},records={n}]',
+                       lambda: store.query(since=since, limit=100))
+            store.close()
+
+
+def bench_bundle(suite: Suite, workdir: str, sizes: Dict):
+    from jsonl_store import JsonlRecordStore
+    from policy_bundle import PolicyBundle, export_bundle
+    from policy_parser import extract_references
+    schema = bench_data.make_schema(100)
+    action = next(iter(schema['actions']))
+    for n in sizes['policies']:
+        path = os.path.join(workdir, f'approvals_{n}.json')
+        fill_jsonl(path, bench_data.make_history(schema, n, seed=2))
+        store = JsonlRecordStore(path, fsync='never')
+        out = os.path.join(workdir, f'bundle_{n}')
+        suite.time(f'bundle.export[policies={n}]', lambda: export_bundle(store, out), repeat=3)
+        store.close()
+
+        def reparse():
+            # What downstream services do without a bundle
+            approvals = JsonlRecordStore(path, fsync='never')
+            [extract_references(r['policy']) for r in approvals.query(status='APPROVED')[0]]
+            approvals.close()
+        suite.time(f'bundle.load_json_reparse[policies={n}]', reparse, repeat=3)
+        suite.time(f'bundle.open[policies={n}]', lambda: PolicyBundle.open(out + '.bundle').close())
+        bundle = PolicyBundle.open(out + '.bundle')
+        suite.time(f'bundle.lookup_action[policies={n}]', lambda: bundle.policies(action=action))
+        bundle.close()
+
+
+def bench_partial(suite: Suite, workdir: str, sizes: Dict):
+    from policy_engine import Entities, PolicySet, Request, parse_policies, parse_uid
+    from policy_partial import PartialEvaluator
+    schema = bench_data.make_schema(100)
+    action = next(iter(schema['actions']))
+    resource_type = schema['actions'][action]['appliesTo']['resourceTypes'][0]
+    attributes = schema['entityTypes'][resource_type]['shape']['attributes']
+    rng = random.Random(3)
+    resources = [{
+        'uid': {'type': resource_type, 'id': str(i)},
+        'attrs': {name: rng.randrange(0, 100000) if attr['type'] == 'Long' else 'user'
+                  for name, attr in attributes.items()}
+    } for i in range(100)]
+    principal = {'uid': {'type': 'User', 'id': bench_data.ROLES[0]}, 'attrs': {'userId': 'user'}}
+    entities = Entities(resources + [principal])
+    uids = [parse_uid(r['uid']) for r in resources]
+    who, what = parse_uid(principal['uid']), parse_uid({'type': 'Action', 'id': action})
+    for n in sizes['policies']:
+        # Every policy names the action, as when one enforcement point's rules pile up
+        policies = PolicySet(parse_policies('\n'.join(bench_data.make_policy(rng, schema, action) for _ in range(n))))
+
+        def full():
+            for uid in uids:
+                policies.is_authorized(Request(who, what, uid, {}, entities))
+        suite.time(f'partial.full_set_100_resources[policies={n}]', full)
+        suite.time(f'partial.build[policies={n}]', lambda: PartialEvaluator(policies, entities).residuals(who, what))
+        residuals = PartialEvaluator(policies, entities).residuals(who, what)
+
+        def residual():
+            for uid in uids:
+                residuals.is_authorized(uid)
+        suite.time(f'partial.residual_100_resources[policies={n}]', residual)
+
+
+def bench_coverage(suite: Suite, workdir: str, sizes: Dict):
+    from approval_manager import ApprovalManager
+    from policy_coverage import ReferenceIndex, coverage
+    schema = bench_data.make_schema(max(sizes['entities']))
+    context = bench_data.schema_context(schema)
+    for n in sizes['policies']:
+        path = os.path.join(workdir, f'coverage_{n}.json')
+        fill_jsonl(path, bench_data.make_history(schema, n, seed=4))
+        approvals = ApprovalManager(path)
+        suite.time(f'coverage.index_build[policies={n}]', lambda: ReferenceIndex().refresh(approvals.store), repeat=3)
+        index = ReferenceIndex()
+        index.refresh(approvals.store)
+        rng = random.Random(n)
+
+        def approve_and_refresh():
+            approvals.approve_policy({'policy': bench_data.make_policy(rng, schema) + f' // {rng.random()}'})
+            index.refresh(approvals.store)
+        suite.time(f'coverage.approve_and_refresh[policies={n}]', approve_and_refresh)
+        suite.time(f'coverage.report[policies={n},entities={len(schema["entityTypes"])}]',
+                   lambda: coverage(context, index))
+
+
+def bench_web(suite: Suite, workdir: str, sizes: Dict):
+    schema = bench_data.make_schema(max(sizes['entities']))
+    webdir = os.path.join(workdir, 'web')
+    os.makedirs(webdir)
+    schema_path = os.path.join(webdir, 'schema.json')
+    bench_data.write_schema(schema_path, schema)
+    records = max(sizes['history'])
+    fill_jsonl(os.path.join(webdir, 'policy_history.json'), bench_data.make_history(schema, records))
+    fill_jsonl(os.path.join(webdir, 'policy_approvals.json'),
+               bench_data.make_history(schema, max(records // 10, 1), seed=1))
+
+    cwd = os.getcwd()
+    os.chdir(webdir)
+    try:
+        import web_app
+        web_app.DEFAULT_SCHEMA = schema_path
+        web_app.SCHEMA_POINTER = os.path.join(webdir, 'active_schema')
+        web_app._state.clear()
+        web_app.payload_cache.clear()
+        suite.time(f'web.warm_up[records={records}]', web_app.warm_up, repeat=1)
+        client = web_app.app.test_client()
+        etag = client.get('/stats').headers.get('ETag')
+        for name, url, headers in (
+                ('recommendations', '/recommendations', {}),
+                ('stats', '/stats', {}),
+                ('stats_304', '/stats', {'If-None-Match': etag}),
+                ('history', '/history?limit=100', {}),
+                ('history_status', '/history?limit=100&status=REJECTED', {}),
+                ('search', '/history/search?q=transaction+amount', {}),
+                ('search_facets', '/history/search?q=deny&status=APPROVED', {})):
+            suite.time(f'web.{name}[records={records}]', lambda: client.get(url, headers=headers), repeat=20)
+    finally:
+        os.chdir(cwd)
+
+
+BENCHMARKS = {
+    'schema': bench_schema,
+    'validator': bench_validator,
+    'recommender': bench_recommender,
+    'store': bench_stores,
+    'bundle': bench_bundle,
+    'partial': bench_partial,
+    'coverage': bench_coverage,
+    'web': bench_web
+}
+
+
+def run_suite(sizes: Dict, only: List[str] = None, repeat: int = 5, verbose: bool = True) -> Dict:
+    """Run every benchmark group whose names match ``only`` and return the results document"""
+    suite = Suite(only, repeat, verbose)
+    workdir = tempfile.mkdtemp(prefix='policy-bench-')
+    try:
+        for group, bench in BENCHMARKS.items():
+            if suite.wants_group(group):
+                bench(suite, workdir, sizes)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return {
+        'meta': {
+            'timestamp': datetime.now().isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'sizes': sizes
+        },
+        'results': suite.results
+    }
+
+
+def threshold_for(name: str, default: float, thresholds: Dict[str, float]) -> float:
+    """Most specific matching pattern wins: an exact name, then the longest glob"""
+    if name in thresholds:
+        return thresholds[name]
+    matches = [pattern for pattern in thresholds if fnmatch.fnmatch(name, pattern)]
+    return thresholds[max(matches, key=len)] if matches else default
+
+
+def compare(results: Dict, baseline: Dict, threshold: float = DEFAULT_THRESHOLD,
+            thresholds: Dict[str, float] = None, min_ms: float = DEFAULT_MIN_MS) -> List[Dict]:
+    """Compare medians of benchmarks present in both runs.
+
+    A benchmark regressed when its median is more than its threshold (a
+    fraction, 0.25 = 25% slower) above the baseline and at least ``min_ms``
+    slower. Per-benchmark thresholds come from the baseline's
+    ``thresholds`` and then ``thresholds``, keyed by name or glob.
+    """
+    merged = dict(baseline.get('thresholds', {}))
+    merged.update(thresholds or {})
+    rows = []
+    for name, current in sorted(results['results'].items()):
+        before = baseline['results'].get(name)
+        if before is None:
+            continue
+        limit = threshold_for(name, threshold, merged)
+        base_ms, now_ms = before['median_ms'], current['median_ms']
+        ratio = now_ms / base_ms if base_ms else float('inf')
+        rows.append({
+            'name': name,
+            'baseline_ms': base_ms,
+            'current_ms': now_ms,
+            'change': round(ratio - 1, 4),
+            'threshold': limit,
+            'regressed': ratio > 1 + limit and now_ms - base_ms >= min_ms
+        })
+    return rows
+
+
+def print_comparison(rows: List[Dict]):
+    for row in rows:
+        flag = 'REGRESSED' if row['regressed'] else ''
+        print(f"{row['name']:<60} {row['baseline_ms']:>10.3f} -> {row['current_ms']:>10.3f} ms "
+              f"{row['change']:>+8.1%} {flag}")
+
+
+def parse_thresholds(values: List[str]):
+    """``0.3`` sets the default; ``pattern=0.5`` sets it for matching benchmarks"""
+    default = DEFAULT_THRESHOLD
+    per_name = {}
+    for value in values or []:
+        pattern, sep, number = value.rpartition('=')
+        if sep:
+            per_name[pattern] = float(number)
+        else:
+            default = float(number)
+    return default, per_name
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run Policy Helper benchmarks')
+    parser.add_argument('--size', choices=sorted(SIZES), default='default')
+    parser.add_argument('--entities', help='Comma-separated schema sizes, overriding --size')
+    parser.add_argument('--policies', help='Comma-separated policy set sizes, overriding --size')
+    parser.add_argument('--history', help='Comma-separated history sizes, overriding --size')
+    parser.add_argument('--only', action='append', help='Run only benchmarks matching this glob (repeatable)')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--out', default='bench_results.json')
+    parser.add_argument('--baseline', help='Results file to compare against')
+    parser.add_argument('--threshold', action='append',
+                        help='Allowed slowdown, e.g. 0.25 or "store.*=0.5" (repeatable)')
+    parser.add_argument('--min-ms', type=float, default=DEFAULT_MIN_MS)
+    parser.add_argument('--save-baseline', action='store_true', help='Also write the results to --baseline')
+    args = parser.parse_args(argv)
+
+    sizes = {key: list(values) for key, values in SIZES[args.size].items()}
+    for key in sizes:
+        override = getattr(args, key)
+        if override:
+            sizes[key] = [int(n) for n in override.split(',')]
+
+    results = run_suite(sizes, args.only, args.repeat)
+    with open(args.out, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f'\nWrote {len(results["results"])} results to {args.out}')
+
+    if not args.baseline:
+        return 0
+    if args.save_baseline:
+        shutil.copyfile(args.out, args.baseline)
+        print(f'Saved baseline to {args.baseline}')
+        return 0
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    default, per_name = parse_thresholds(args.threshold)
+    rows = compare(results, baseline, default, per_name, args.min_ms)
+    print()
+    print_comparison(rows)
+    regressed = [row['name'] for row in rows if row['regressed']]
+    if regressed:
+        print(f'\n{len(regressed)} benchmark(s) regressed')
+        return 1
+    print('\nNo regressions')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
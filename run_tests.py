@@ -109,7 +109,7 @@ RATIONALE:
     print("   • Web interface with tabbed functionality")
     
     # Cleanup test files
-    test_files = ['test_approvals.json']
+    test_files = ['test_approvals.json', 'test_approvals.json.lock']
     for file in test_files:
         if os.path.exists(file):
             os.remove(file)
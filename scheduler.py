@@ -0,0 +1,246 @@
+import math
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from typing import Callable, Dict
+
+DEFAULT_MAX_CONCURRENT = int(os.environ.get('SCHEDULER_MAX_CONCURRENT', os.environ.get('JOB_WORKERS', 4)))
+DEFAULT_MAX_QUEUE = int(os.environ.get('SCHEDULER_MAX_QUEUE', os.environ.get('JOB_MAX_QUEUE', 100)))
+DEFAULT_MAX_QUEUE_PER_KEY = int(os.environ.get('SCHEDULER_SESSION_QUEUE', 10))
+# Requests per second; 0 disables the bucket
+DEFAULT_SESSION_RATE = float(os.environ.get('SCHEDULER_SESSION_RATE', 0.5))
+DEFAULT_SESSION_BURST = float(os.environ.get('SCHEDULER_SESSION_BURST', 5))
+# The global bucket protects the service-wide quota, so each of the
+# WEB_CONCURRENCY worker processes enforces its share of it
+WORKER_PROCESSES = max(1, int(os.environ.get('WEB_CONCURRENCY', 1)))
+DEFAULT_GLOBAL_RATE = float(os.environ.get('SCHEDULER_GLOBAL_RATE', 5)) / WORKER_PROCESSES
+DEFAULT_GLOBAL_BURST = float(os.environ.get('SCHEDULER_GLOBAL_BURST', 20)) / WORKER_PROCESSES
+DEFAULT_WAIT_SECONDS = float(os.environ.get('SCHEDULER_WAIT_SECONDS', 30))
+MAX_TRACKED_KEYS = 10000
+WAIT_SAMPLES = 1024
+
+
+class QueueFullError(Exception):
+    """Raised when work is submitted while the queue is at capacity"""
+
+    def __init__(self, message: str, retry_after: float = 1.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class RateLimitedError(QueueFullError):
+    """Raised when a session or the whole service is over its request rate"""
+
+
+class TokenBucket:
+    """Allows ``rate`` requests per second with bursts of up to ``capacity``.
+
+    Not thread-safe on its own; FairScheduler calls it under its lock.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = max(capacity, 1)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def take(self, now: float = None) -> float:
+        """Take one token; returns 0 on success or the seconds until one is available"""
+        now = time.monotonic() if now is None else now
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def refund(self):
+        self.tokens = min(self.capacity, self.tokens + 1)
+
+
+class Ticket:
+    """A request waiting for, or holding, a model slot"""
+    __slots__ = ('key', 'grant', 'enqueued_at', 'granted_at')
+
+    def __init__(self, key: str, grant: Callable):
+        self.key = key
+        self.grant = grant
+        self.enqueued_at = time.monotonic()
+        self.granted_at = None
+
+
+class FairScheduler:
+    """Admission control and fair queuing in front of model calls.
+
+    A request is first checked against its session's token bucket and a
+    global one; over the rate it is refused with RateLimitedError. Admitted
+    requests get one of ``max_concurrent`` slots, or wait in a per-session
+    queue. Freed slots go to the waiting sessions in round-robin order, so a
+    session that queued many requests only gets every n-th slot while others
+    are waiting. The wait queue holds at most ``max_queue`` requests in total
+    and ``max_queue_per_key`` per session; beyond that QueueFullError is
+    raised with an estimated ``retry_after``.
+    """
+
+    def __init__(self, max_concurrent: int = None, max_queue: int = None, max_queue_per_key: int = None,
+                 session_rate: float = None, session_burst: float = None,
+                 global_rate: float = None, global_burst: float = None, wait_seconds: float = None):
+        self.max_concurrent = max_concurrent or DEFAULT_MAX_CONCURRENT
+        self.max_queue = max_queue or DEFAULT_MAX_QUEUE
+        self.max_queue_per_key = min(max_queue_per_key or DEFAULT_MAX_QUEUE_PER_KEY, self.max_queue)
+        self.session_rate = DEFAULT_SESSION_RATE if session_rate is None else session_rate
+        self.session_burst = session_burst or DEFAULT_SESSION_BURST
+        global_rate = DEFAULT_GLOBAL_RATE if global_rate is None else global_rate
+        self.global_bucket = TokenBucket(global_rate, global_burst or DEFAULT_GLOBAL_BURST) if global_rate > 0 else None
+        self.wait_seconds = wait_seconds or DEFAULT_WAIT_SECONDS
+        self._buckets = OrderedDict()
+        self._queues = OrderedDict()
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._running = 0
+        self._last_key = None
+        self._service_time = 1.0
+        self._waits = deque(maxlen=WAIT_SAMPLES)
+        self._counts = {'admitted': 0, 'rate_limited': 0, 'queue_full': 0, 'timed_out': 0,
+                        'extra_calls': 0, 'extra_refused': 0}
+
+    def submit(self, key: str, grant: Callable) -> Ticket:
+        """Admit a request for ``key``; ``grant(ticket)`` is called once it holds a slot.
+
+        The grant may run immediately in the calling thread or later in the
+        thread that releases a slot. The holder must call ``release(ticket)``.
+        """
+        ticket = Ticket(key, grant)
+        with self._lock:
+            self._admit(key)
+            if self._running < self.max_concurrent and not self._queued:
+                self._running += 1
+                self._granted(ticket)
+                granted = [ticket]
+            else:
+                self._queues.setdefault(key, deque()).append(ticket)
+                self._queued += 1
+                granted = []
+        for t in granted:
+            t.grant(t)
+        return ticket
+
+    def release(self, ticket: Ticket):
+        """Free the ticket's slot and hand it to the next session in turn"""
+        with self._lock:
+            self._running -= 1
+            # Smoothed run time for Retry-After estimates
+            self._service_time += 0.2 * (time.monotonic() - ticket.granted_at - self._service_time)
+            granted = self._dispatch()
+        for t in granted:
+            t.grant(t)
+
+    def cancel(self, ticket: Ticket) -> bool:
+        """Withdraw a waiting ticket; False if it already holds a slot"""
+        with self._lock:
+            if ticket.granted_at is not None:
+                return False
+            queue = self._queues.get(ticket.key)
+            if queue is not None and ticket in queue:
+                queue.remove(ticket)
+                self._queued -= 1
+                if not queue:
+                    del self._queues[ticket.key]
+            return True
+
+    def take_extra(self) -> bool:
+        """Take a global rate token for an extra model call made while holding a slot.
+
+        Retries and hedges send more than one call for a request admitted
+        once; they go ahead only if the global bucket has a token to spare.
+        """
+        with self._lock:
+            if self.global_bucket is not None and self.global_bucket.take():
+                self._counts['extra_refused'] += 1
+                return False
+            self._counts['extra_calls'] += 1
+            return True
+
+    @contextmanager
+    def slot(self, key: str, timeout: float = None):
+        """Hold a model slot for the duration of a synchronous request"""
+        granted = threading.Event()
+        ticket = self.submit(key, lambda t: granted.set())
+        if not granted.wait(self.wait_seconds if timeout is None else timeout) and self.cancel(ticket):
+            with self._lock:
+                self._counts['timed_out'] += 1
+                retry_after = self._retry_after()
+            raise QueueFullError('Timed out waiting for a model slot, try again later', retry_after)
+        try:
+            yield
+        finally:
+            self.release(ticket)
+
+    def _admit(self, key: str):
+        if self._queued >= self.max_queue or len(self._queues.get(key, ())) >= self.max_queue_per_key:
+            self._counts['queue_full'] += 1
+            raise QueueFullError('Too many requests queued, try again later', self._retry_after())
+        now = time.monotonic()
+        bucket = None
+        if self.session_rate > 0:
+            bucket = self._buckets.pop(key, None) or TokenBucket(self.session_rate, self.session_burst)
+            self._buckets[key] = bucket
+            if len(self._buckets) > MAX_TRACKED_KEYS:
+                self._buckets.popitem(last=False)
+            wait = bucket.take(now)
+            if wait:
+                self._counts['rate_limited'] += 1
+                raise RateLimitedError('Rate limit exceeded for this session', wait)
+        if self.global_bucket is not None:
+            wait = self.global_bucket.take(now)
+            if wait:
+                if bucket is not None:
+                    bucket.refund()
+                self._counts['rate_limited'] += 1
+                raise RateLimitedError('Service is busy, try again later', wait)
+        self._counts['admitted'] += 1
+
+    def _dispatch(self):
+        granted = []
+        while self._running < self.max_concurrent and self._queues:
+            if len(self._queues) > 1 and next(iter(self._queues)) == self._last_key:
+                # The session served last goes behind the others that are waiting
+                self._queues.move_to_end(self._last_key)
+            key, queue = next(iter(self._queues.items()))
+            ticket = queue.popleft()
+            if queue:
+                self._queues.move_to_end(key)
+            else:
+                del self._queues[key]
+            self._queued -= 1
+            self._running += 1
+            self._granted(ticket)
+            granted.append(ticket)
+        return granted
+
+    def _granted(self, ticket: Ticket):
+        ticket.granted_at = time.monotonic()
+        self._last_key = ticket.key
+        self._waits.append(ticket.granted_at - ticket.enqueued_at)
+
+    def _retry_after(self) -> float:
+        return max(1.0, (self._queued + 1) * self._service_time / self.max_concurrent)
+
+    def get_stats(self) -> Dict:
+        """Queue depth, slot use, rejections and wait-time percentiles"""
+        with self._lock:
+            waits = sorted(self._waits)
+            stats = {
+                'queue_depth': self._queued,
+                'queued_sessions': len(self._queues),
+                'in_flight': self._running,
+                'max_concurrent': self.max_concurrent,
+                'max_queue': self.max_queue,
+                **self._counts
+            }
+        for name, q in (('p50', 0.5), ('p99', 0.99)):
+            stats[f'wait_{name}_seconds'] = round(waits[min(len(waits) - 1, math.ceil(q * len(waits)) - 1)], 4) if waits else 0
+        return stats
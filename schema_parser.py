@@ -1,14 +1,22 @@
+import hashlib
 import json
+import os
 
 class SchemaParser:
     def __init__(self):
         self.schema = None
         self.entities = {}
         self.actions = {}
+        # Identifies the loaded schema content, e.g. for HTTP cache validators
+        self.fingerprint = None
+        self.modified = None
     
     def load_schema(self, schema_path):
-        with open(schema_path, 'r') as f:
-            self.schema = json.load(f)
+        with open(schema_path, 'rb') as f:
+            raw = f.read()
+        self.schema = json.loads(raw)
+        self.fingerprint = hashlib.sha256(raw).hexdigest()[:16]
+        self.modified = os.path.getmtime(schema_path)
         self._parse_entities()
         self._parse_actions()
     
@@ -0,0 +1,247 @@
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Dict, Optional
+from chat_session import (ChatMessage, ChatSession, InMemorySessionBackend, SessionBackend,
+                          DEFAULT_MAX_MESSAGES)
+
+SESSION_BACKENDS = ('memory', 'sqlite', 'redis')
+
+
+class SqliteSessionBackend(SessionBackend):
+    """Chat sessions shared between worker processes through one SQLite file.
+
+    Messages are rows, so adding one is a single insert (plus trimming rows
+    past the per-session cap) rather than a rewrite of the whole session.
+    """
+
+    def __init__(self, db_path: str, max_messages: int = None):
+        self.db_path = db_path
+        self.max_messages = max_messages or DEFAULT_MAX_MESSAGES
+        self._local = threading.local()
+        conn = self._connect()
+        conn.execute("""CREATE TABLE IF NOT EXISTS chat_sessions (
+            id TEXT PRIMARY KEY,
+            created_at REAL NOT NULL,
+            last_activity REAL NOT NULL,
+            context TEXT NOT NULL DEFAULT '{}'
+        )""")
+        conn.execute('CREATE INDEX IF NOT EXISTS chat_sessions_activity ON chat_sessions(last_activity)')
+        conn.execute("""CREATE TABLE IF NOT EXISTS chat_messages (
+            session_id TEXT NOT NULL,
+            seq INTEGER NOT NULL,
+            role TEXT NOT NULL,
+            content TEXT NOT NULL,
+            timestamp TEXT NOT NULL,
+            metadata TEXT,
+            PRIMARY KEY (session_id, seq)
+        )""")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def create(self, session: ChatSession):
+        self._connect().execute(
+            'INSERT INTO chat_sessions (id, created_at, last_activity, context) VALUES (?, ?, ?, ?)',
+            (session.session_id, session.created_at.timestamp(),
+             session.last_activity.timestamp(), json.dumps(session.context))
+        )
+        session._backend = self
+
+    def get(self, session_id: str, max_messages: int = None) -> Optional[ChatSession]:
+        max_messages = max_messages or self.max_messages
+        conn = self._connect()
+        row = conn.execute(
+            'SELECT created_at, last_activity, context FROM chat_sessions WHERE id = ?', (session_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        session = ChatSession(session_id, max_messages=max_messages, backend=self)
+        session.created_at = datetime.fromtimestamp(row[0])
+        session.last_activity = datetime.fromtimestamp(row[1])
+        session.context = json.loads(row[2])
+        rows = conn.execute(
+            """SELECT role, content, timestamp, metadata, seq FROM chat_messages
+               WHERE session_id = ? ORDER BY seq DESC LIMIT ?""",
+            (session_id, max_messages)
+        ).fetchall()
+        for role, content, timestamp, metadata, seq in reversed(rows):
+            session._append(ChatMessage(role, content, timestamp,
+                                        json.loads(metadata) if metadata else None, seq))
+        return session
+
+    def append_message(self, session_id: str, message: ChatMessage, max_messages: int):
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            (seq,) = conn.execute(
+                'SELECT COALESCE(MAX(seq), 0) + 1 FROM chat_messages WHERE session_id = ?', (session_id,)
+            ).fetchone()
+            message.seq = seq
+            conn.execute(
+                'INSERT INTO chat_messages VALUES (?, ?, ?, ?, ?, ?)',
+                (session_id, seq, message.role, message.content, message.timestamp,
+                 json.dumps(message.metadata) if message.metadata else None)
+            )
+            conn.execute('DELETE FROM chat_messages WHERE session_id = ? AND seq <= ?',
+                         (session_id, seq - max_messages))
+            conn.execute('UPDATE chat_sessions SET last_activity = ? WHERE id = ?',
+                         (datetime.now().timestamp(), session_id))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def save_context(self, session_id: str, context: Dict):
+        self._connect().execute(
+            'UPDATE chat_sessions SET context = ?, last_activity = ? WHERE id = ?',
+            (json.dumps(context), datetime.now().timestamp(), session_id)
+        )
+
+    def expire(self, cutoff: float) -> int:
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute("""DELETE FROM chat_messages WHERE session_id IN
+                            (SELECT id FROM chat_sessions WHERE last_activity < ?)""", (cutoff,))
+            expired = conn.execute('DELETE FROM chat_sessions WHERE last_activity < ?', (cutoff,)).rowcount
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return expired
+
+    def stats(self) -> Dict:
+        conn = self._connect()
+        (live,) = conn.execute('SELECT COUNT(*) FROM chat_sessions').fetchone()
+        (size,) = conn.execute('SELECT COALESCE(SUM(LENGTH(content)), 0) FROM chat_messages').fetchone()
+        return {'live_sessions': live, 'bytes_held': size}
+
+
+class RedisSessionBackend(SessionBackend):
+    """Chat sessions in Redis (or any server speaking the same commands).
+
+    Each session is a hash of metadata plus a capped list of JSON messages;
+    appending is RPUSH + LTRIM, numbered by a counter in the metadata hash.
+    A sorted set of session ids by last activity supports the idle sweeper,
+    and keys also carry a TTL as a backstop. Expiry runs as one Lua script,
+    so a session cannot be deleted after a message made it active again.
+    ``client`` is a ``redis.Redis``-compatible object.
+    """
+
+    def __init__(self, client, prefix: str = 'policyhelper:chat:', max_messages: int = None,
+                 ttl_seconds: int = 7 * 24 * 3600):
+        self.client = client
+        self.prefix = prefix
+        self.max_messages = max_messages or DEFAULT_MAX_MESSAGES
+        self.ttl_seconds = ttl_seconds
+        self.index_key = prefix + 'sessions'
+
+    def _meta_key(self, session_id: str) -> str:
+        return f'{self.prefix}{session_id}:meta'
+
+    def _messages_key(self, session_id: str) -> str:
+        return f'{self.prefix}{session_id}:messages'
+
+    def create(self, session: ChatSession):
+        now = session.last_activity.timestamp()
+        pipe = self.client.pipeline()
+        pipe.hset(self._meta_key(session.session_id), mapping={
+            'created_at': session.created_at.timestamp(),
+            'last_activity': now,
+            'context': json.dumps(session.context)
+        })
+        pipe.expire(self._meta_key(session.session_id), self.ttl_seconds)
+        pipe.zadd(self.index_key, {session.session_id: now})
+        pipe.execute()
+        session._backend = self
+
+    def get(self, session_id: str, max_messages: int = None) -> Optional[ChatSession]:
+        max_messages = max_messages or self.max_messages
+        meta = {_text(k): _text(v) for k, v in self.client.hgetall(self._meta_key(session_id)).items()}
+        if 'created_at' not in meta:
+            # Missing, or only touched by a write that raced with its expiry
+            return None
+        session = ChatSession(session_id, max_messages=max_messages, backend=self)
+        session.created_at = datetime.fromtimestamp(float(meta['created_at']))
+        session.last_activity = datetime.fromtimestamp(float(meta['last_activity']))
+        session.context = json.loads(meta.get('context') or '{}')
+        for raw in self.client.lrange(self._messages_key(session_id), -max_messages, -1):
+            data = json.loads(_text(raw))
+            session._append(ChatMessage(data['role'], data['content'], data['timestamp'],
+                                        data.get('metadata'), data.get('seq')))
+        return session
+
+    def append_message(self, session_id: str, message: ChatMessage, max_messages: int):
+        now = datetime.now().timestamp()
+        key = self._messages_key(session_id)
+        message.seq = self.client.hincrby(self._meta_key(session_id), 'seq', 1)
+        pipe = self.client.pipeline()
+        pipe.rpush(key, json.dumps(message.to_dict()))
+        pipe.ltrim(key, -max_messages, -1)
+        pipe.expire(key, self.ttl_seconds)
+        pipe.hset(self._meta_key(session_id), mapping={'last_activity': now})
+        pipe.expire(self._meta_key(session_id), self.ttl_seconds)
+        pipe.zadd(self.index_key, {session_id: now})
+        pipe.execute()
+
+    def save_context(self, session_id: str, context: Dict):
+        now = datetime.now().timestamp()
+        pipe = self.client.pipeline()
+        pipe.hset(self._meta_key(session_id), mapping={'context': json.dumps(context), 'last_activity': now})
+        pipe.zadd(self.index_key, {session_id: now})
+        pipe.execute()
+
+    def expire(self, cutoff: float) -> int:
+        return int(self.client.eval(EXPIRE_SCRIPT, 1, self.index_key, cutoff, self.prefix))
+
+    def stats(self) -> Dict:
+        return {'live_sessions': self.client.zcard(self.index_key), 'bytes_held': None}
+
+
+# KEYS[1]: session index; ARGV: cutoff, key prefix. Selecting and deleting
+# in one script keeps appends (a MULTI/EXEC pipeline) from interleaving.
+EXPIRE_SCRIPT = """
+local expired = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1])
+for _, session_id in ipairs(expired) do
+    redis.call('DEL', ARGV[2] .. session_id .. ':meta', ARGV[2] .. session_id .. ':messages')
+    redis.call('ZREM', KEYS[1], session_id)
+end
+return #expired
+"""
+
+
+def _text(value) -> str:
+    return value.decode('utf-8') if isinstance(value, bytes) else str(value)
+
+
+def create_session_backend(kind: str = None, max_messages: int = None) -> SessionBackend:
+    """Build the session backend named by ``CHAT_SESSION_BACKEND``.
+
+    ``memory`` (default) keeps sessions per process; ``sqlite`` shares them
+    through ``CHAT_SESSION_DB``; ``redis`` connects to ``REDIS_URL`` and
+    needs the optional ``redis`` package. Shared backends keep at most
+    ``max_messages`` per session, normally the ChatManager's cap.
+    """
+    kind = kind or os.environ.get('CHAT_SESSION_BACKEND', 'memory')
+    if kind == 'memory':
+        return InMemorySessionBackend()
+    if kind == 'sqlite':
+        return SqliteSessionBackend(os.environ.get('CHAT_SESSION_DB', 'chat_sessions.db'), max_messages)
+    if kind == 'redis':
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("CHAT_SESSION_BACKEND=redis requires the 'redis' package")
+        return RedisSessionBackend(redis.Redis.from_url(os.environ.get('REDIS_URL', 'redis://localhost:6379/0')),
+                                   max_messages=max_messages)
+    raise ValueError(f"Unknown chat session backend {kind!r}, expected one of {SESSION_BACKENDS}")
@@ -0,0 +1,172 @@
+import json
+import os
+import sqlite3
+import threading
+from typing import Dict, List, Optional, Tuple
+from group_commit import GroupCommitter
+from jsonl_store import hash_policy
+
+class SqliteRecordStore:
+    """SQLite-backed record store with the same interface as JsonlRecordStore.
+
+    Each table keeps the full record as JSON plus indexed columns for status,
+    timestamp and policy hash. Per-status counters live in a ``counters`` table
+    and are updated in the same transaction as the insert, so stats never scan
+    the records. WAL mode lets readers proceed while a write is in progress.
+
+    Ids are allocated inside ``BEGIN IMMEDIATE`` transactions, which SQLite
+    serialises across processes, and concurrent appends are group-committed
+    into a single transaction.
+    """
+
+    def __init__(self, db_path: str, table: str, default_status: str = None,
+                 group_commit_window: float = None):
+        if not table.isidentifier():
+            raise ValueError(f"Invalid table name: {table}")
+        self.db_path = db_path
+        self.table = table
+        self.default_status = default_status
+        self._local = threading.local()
+        self._committer = GroupCommitter(self._flush, window=group_commit_window)
+        self._create_schema()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        # Connections must not be shared with a forked child
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _create_schema(self):
+        conn = self._connect()
+        t = self.table
+        conn.execute(f"""CREATE TABLE IF NOT EXISTS {t} (
+            id INTEGER PRIMARY KEY,
+            timestamp TEXT NOT NULL,
+            status TEXT,
+            policy_hash TEXT,
+            record TEXT NOT NULL
+        )""")
+        conn.execute(f'CREATE INDEX IF NOT EXISTS {t}_status ON {t}(status, id)')
+        conn.execute(f'CREATE INDEX IF NOT EXISTS {t}_timestamp ON {t}(timestamp)')
+        conn.execute(f'CREATE INDEX IF NOT EXISTS {t}_policy_hash ON {t}(policy_hash, id)')
+        conn.execute("""CREATE TABLE IF NOT EXISTS counters (
+            name TEXT NOT NULL,
+            key TEXT NOT NULL,
+            value INTEGER NOT NULL,
+            PRIMARY KEY (name, key)
+        )""")
+
+    def append(self, record: Dict) -> int:
+        return self.append_transaction([(self, record)])[0]
+
+    def append_transaction(self, entries: List[Tuple['SqliteRecordStore', Dict]]) -> List[int]:
+        """Insert records into one or more tables of this database atomically"""
+        for store, _ in entries:
+            if store.db_path != self.db_path:
+                raise ValueError('All stores in a transaction must share one database')
+        return self._committer.submit(entries)
+
+    def _flush(self, batch: List[List[Tuple['SqliteRecordStore', Dict]]]) -> List[List[int]]:
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            results = [[store._insert(conn, record) for store, record in entries] for entries in batch]
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return results
+
+    def _insert(self, conn: sqlite3.Connection, record: Dict) -> int:
+        t = self.table
+        if self.default_status:
+            record.setdefault('status', self.default_status)
+        (record_id,) = conn.execute(f'SELECT COALESCE(MAX(id), -1) + 1 FROM {t}').fetchone()
+        record['id'] = record_id
+        status = record.get('status')
+        conn.execute(
+            f'INSERT INTO {t} (id, timestamp, status, policy_hash, record) VALUES (?, ?, ?, ?, ?)',
+            (record_id, record.get('timestamp', ''), status,
+             hash_policy(record.get('policy', '')), json.dumps(record))
+        )
+        conn.execute(
+            """INSERT INTO counters (name, key, value) VALUES (?, ?, 1)
+               ON CONFLICT (name, key) DO UPDATE SET value = value + 1""",
+            (t, status or '')
+        )
+        return record_id
+
+    def get(self, record_id: int) -> Optional[Dict]:
+        row = self._connect().execute(
+            f'SELECT record FROM {self.table} WHERE id = ?', (record_id,)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def count(self) -> int:
+        return sum(self.status_counts().values())
+
+    def status_counts(self) -> Dict[str, int]:
+        rows = self._connect().execute(
+            'SELECT key, value FROM counters WHERE name = ?', (self.table,)
+        ).fetchall()
+        return {(key or None): value for key, value in rows}
+
+    def last_timestamp(self) -> str:
+        """Timestamp of the newest record, or '' when empty"""
+        row = self._connect().execute(f'SELECT MAX(timestamp) FROM {self.table}').fetchone()
+        return row[0] or ''
+
+    def all(self) -> List[Dict]:
+        return self.query()[0]
+
+    def query(self, status: str = None, since: str = None, policy_hash: str = None,
+              cursor: int = None, limit: int = None) -> Tuple[List[Dict], Optional[int]]:
+        """Return records matching the filters with id > cursor, in id order"""
+        conn = self._connect()
+        t = self.table
+        start = -1 if cursor is None else cursor
+        sql = f'SELECT record FROM {t} WHERE id > ?'
+        params = [start]
+        if since:
+            # Writers in other processes can commit timestamps out of id order,
+            # so the filter is on the timestamp itself rather than an id bound
+            sql += ' AND timestamp >= ?'
+            params.append(since)
+        if status is not None:
+            sql += ' AND status = ?'
+            params.append(status)
+        if policy_hash is not None:
+            sql += ' AND policy_hash = ?'
+            params.append(policy_hash)
+        sql += ' ORDER BY id'
+        if limit:
+            sql += ' LIMIT ?'
+            params.append(limit)
+
+        page = [json.loads(row[0]) for row in conn.execute(sql, params)]
+        next_cursor = page[-1]['id'] if limit and len(page) == limit else None
+        return page, next_cursor
+
+    def import_records(self, records: List[Dict]) -> int:
+        """Bulk-load records (e.g. an existing JSON store) in one transaction"""
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            for record in records:
+                self._insert(conn, dict(record))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return len(records)
+
+    def close(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Tests for policy_helper.py batch mode
+"""
+
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+import policy_helper
+from approval_manager import ApprovalManager
+from history_manager import HistoryManager
+from policy_helper import BATCH_FEEDBACK, run_batch
+
+class FakeGenerator:
+    """Stands in for PolicyGenerator without calling the model"""
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.calls = []
+        self.active = 0
+        self.max_active = 0
+        self._lock = threading.Lock()
+
+    def generate_and_validate_policy(self, requirement, conversation_context=""):
+        with self._lock:
+            self.calls.append(requirement)
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        time.sleep(self.delay)
+        with self._lock:
+            self.active -= 1
+        if requirement == 'boom':
+            raise RuntimeError('model unavailable')
+        valid = 'invalid' not in requirement
+        return {
+            'policy': 'permit (principal, action, resource);',
+            'rationale': ['• reason'],
+            'validation': {'is_valid': valid, 'errors': [], 'test_cases': []}
+        }
+
+class TestBatch(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.input = os.path.join(self.tmp.name, 'requirements.jsonl')
+        self.output = os.path.join(self.tmp.name, 'results.jsonl')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def write_input(self, requirements):
+        with open(self.input, 'w') as f:
+            for i, requirement in enumerate(requirements):
+                f.write(json.dumps({'id': f'r{i}', 'requirement': requirement}) + '\n')
+
+    def read_output(self):
+        with open(self.output) as f:
+            return [json.loads(line) for line in f]
+
+    def test_runs_concurrently_and_streams_every_result(self):
+        self.write_input([f'requirement {i}' for i in range(12)])
+        generator = FakeGenerator(delay=0.02)
+        summary = run_batch(self.input, self.output, workers=4, rate=1000, generator=generator)
+
+        self.assertEqual(summary['processed'], 12)
+        self.assertGreater(generator.max_active, 1)
+        self.assertLessEqual(generator.max_active, 4)
+        self.assertEqual(sorted(r['id'] for r in self.read_output()), sorted(f'r{i}' for i in range(12)))
+
+    def test_resume_skips_completed_and_retries_failures(self):
+        self.write_input(['first', 'boom', 'third'])
+        summary = run_batch(self.input, self.output, workers=2, rate=1000, generator=FakeGenerator())
+        self.assertEqual(summary['failed'], 1)
+
+        generator = FakeGenerator()
+        summary = run_batch(self.input, self.output, workers=2, rate=1000, generator=generator)
+        self.assertEqual(summary['skipped'], 2)
+        self.assertEqual(generator.calls, ['boom'])
+
+    def managers(self):
+        return (ApprovalManager(os.path.join(self.tmp.name, 'approvals.json'), fsync='never'),
+                HistoryManager(os.path.join(self.tmp.name, 'history.json'), fsync='never'))
+
+    def test_auto_approve_only_valid_policies(self):
+        self.write_input(['good', 'invalid one'])
+        approvals, history = self.managers()
+        summary = run_batch(self.input, self.output, workers=2, rate=1000, auto_approve=True,
+                            generator=FakeGenerator(), approval_manager=approvals, history=history)
+        self.assertEqual([a['requirement'] for a in approvals.approvals], ['good'])
+        self.assertEqual(history.count(), 1)
+        self.assertEqual(summary['approved'], 1)
+        results = {r['requirement']: r for r in self.read_output()}
+        self.assertIn('approval_id', results['good'])
+        self.assertNotIn('approval_id', results['invalid one'])
+
+    def test_resume_after_approval_does_not_approve_twice(self):
+        self.write_input(['good'])
+        approvals, history = self.managers()
+        # The previous run approved the item, then died before writing its result
+        approval_id, _ = approvals.approve_with_history(
+            {'requirement': 'good', 'policy': 'permit (principal, action, resource);'}, history, BATCH_FEEDBACK)
+        summary = run_batch(self.input, self.output, workers=1, rate=1000, auto_approve=True,
+                            generator=FakeGenerator(), approval_manager=approvals, history=history)
+        self.assertEqual(summary['approved'], 1)
+        self.assertEqual(len(approvals.approvals), 1)
+        self.assertEqual(self.read_output()[0]['approval_id'], approval_id)
+
+    def test_rate_limit(self):
+        self.write_input([f'requirement {i}' for i in range(4)])
+        started = time.perf_counter()
+        run_batch(self.input, self.output, workers=1, rate=20, generator=FakeGenerator())
+        # One token up front, then one every 50ms
+        self.assertGreaterEqual(time.perf_counter() - started, 0.14)
+
+    def test_cli_passes_the_budget_to_the_batch(self):
+        self.write_input(['good'])
+        summary = {'processed': 1, 'skipped': 0, 'valid': 1, 'approved': 0, 'failed': 0}
+        argv = ['policy_helper.py', '--batch', self.input, '--out', self.output, '--budget', '2000']
+        with mock.patch.object(sys, 'argv', argv), \
+                mock.patch.object(policy_helper, 'run_batch', return_value=summary) as run, \
+                mock.patch('sys.stdout'), mock.patch('sys.stderr'):
+            with self.assertRaises(SystemExit) as exit:
+                policy_helper.main()
+        self.assertEqual(exit.exception.code, 0)
+        self.assertEqual(run.call_args.kwargs['latency_budget'], 2.0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Tests for the benchmark data generators and regression comparison
+"""
+
+import os
+import tempfile
+import unittest
+import bench_data
+from policy_validator import PolicyValidator
+from run_benchmarks import compare, parse_thresholds, run_suite
+from schema_parser import SchemaParser
+
+def results(**medians):
+    return {'results': {name: {'median_ms': ms} for name, ms in medians.items()}}
+
+class TestBenchData(unittest.TestCase):
+    def test_schema_loads_with_requested_size(self):
+        schema = bench_data.make_schema(500)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, 'schema.json')
+            bench_data.write_schema(path, schema)
+            parser = SchemaParser()
+            parser.load_schema(path)
+        self.assertEqual(len(parser.entities), 500)
+        self.assertIn('ViewAccount', parser.actions)
+        self.assertEqual(bench_data.make_schema(500), schema)
+
+    def test_some_policies_reference_unknown_types(self):
+        schema = bench_data.make_schema(50)
+        context = bench_data.schema_context(schema)
+        policies = bench_data.make_policies(schema, 200, invalid_ratio=0.1)
+        validator = PolicyValidator()
+        unknown = [p for p in policies
+                   if 'Unknown entity type: Unknown' in validator.validate_policy(p, context)[1]]
+        self.assertTrue(0 < len(unknown) < 50)
+        self.assertTrue(all(p.endswith(';') for p in policies))
+
+    def test_history_is_in_timestamp_order(self):
+        records = list(bench_data.make_history(bench_data.make_schema(20), 100))
+        self.assertEqual(len(records), 100)
+        self.assertEqual(records[10]['timestamp'], bench_data.history_timestamp(10))
+        self.assertEqual(sorted(r['timestamp'] for r in records), [r['timestamp'] for r in records])
+
+class TestCompare(unittest.TestCase):
+    def test_flags_slowdowns_past_threshold(self):
+        rows = compare(results(a=13.0, b=11.0, new=5.0), results(a=10.0, b=10.0), threshold=0.25)
+        flagged = {row['name']: row['regressed'] for row in rows}
+        self.assertEqual(flagged, {'a': True, 'b': False})
+
+    def test_per_name_thresholds_and_noise_floor(self):
+        baseline = results(**{'store.load': 10.0, 'web.stats': 0.1})
+        baseline['thresholds'] = {'store.*': 0.5}
+        rows = compare(results(**{'store.load': 14.0, 'web.stats': 0.3}), baseline, threshold=0.1, min_ms=0.5)
+        self.assertFalse(any(row['regressed'] for row in rows))
+
+        rows = compare(results(**{'store.load': 14.0}), baseline, thresholds={'store.load': 0.2})
+        self.assertTrue(rows[0]['regressed'])
+
+    def test_parse_thresholds(self):
+        self.assertEqual(parse_thresholds(['0.3', 'store.*=0.5']), (0.3, {'store.*': 0.5}))
+
+class TestRunSuite(unittest.TestCase):
+    def test_smoke_run_produces_results(self):
+        sizes = {'entities': [10], 'policies': [20], 'history': [50]}
+        doc = run_suite(sizes, only=['schema.*', 'validator.*', 'store.get*'], repeat=1, verbose=False)
+        self.assertEqual(sorted(doc['results']), [
+            'schema.load_schema[entities=10]',
+            'store.get[jsonl,records=50]',
+            'store.get[sqlite,records=50]',
+            'validator.validate_policy[policies=20]'
+        ])
+        self.assertEqual(doc['results']['validator.validate_policy[policies=20]']['ops'], 20)
+        self.assertEqual(doc['meta']['sizes'], sizes)
+
+if __name__ == '__main__':
+    unittest.main()
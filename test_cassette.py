@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Tests for recording and replaying model responses
+"""
+
+import io
+import json
+import multiprocessing
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+import bedrock_client
+from cassette import Cassette, prompt_hash, replay_chunks, replay_text
+from metrics import MODEL_CALLS
+
+class FakeBedrock:
+    """Answers invoke_model with canned text"""
+
+    def __init__(self, text='POLICY:\npermit (principal, action, resource);'):
+        self.text = text
+        self.calls = 0
+
+    def invoke_model(self, body, modelId, contentType):
+        self.calls += 1
+        payload = json.dumps({'content': [{'text': self.text}]}).encode('utf-8')
+        return {'body': io.BytesIO(payload)}
+
+def record_many(path, worker, count):
+    cassette = Cassette(path)
+    for i in range(count):
+        cassette.record(f'prompt {worker} {i}', 'model', [{'t': 0, 'text': 'x' * 20000}], 0)
+
+class TestCassette(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, 'cassette.jsonl')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_replays_by_prompt_hash(self):
+        cassette = Cassette(self.path)
+        cassette.record('prompt a', 'model', [{'t': 0.1, 'text': 'answer a'}], 0.2)
+        cassette.record('prompt b', 'model', [{'t': 0.1, 'text': 'answer b'}], 0.2)
+
+        reloaded = Cassette(self.path)
+        self.assertEqual(len(reloaded), 2)
+        self.assertEqual(replay_text(reloaded.lookup('prompt b')), 'answer b')
+        self.assertEqual(reloaded.lookup('prompt b')['prompt_hash'], prompt_hash('prompt b'))
+        self.assertIsNone(reloaded.lookup('prompt c'))
+        self.assertEqual((reloaded.hits, reloaded.misses), (2, 1))
+
+    def test_repeated_prompt_replays_in_turn(self):
+        cassette = Cassette(self.path)
+        for text in ('first', 'second'):
+            cassette.record('same', 'model', [{'t': 0, 'text': text}], 0)
+
+        replies = [replay_text(cassette.lookup('same')) for _ in range(3)]
+        self.assertEqual(replies, ['first', 'second', 'first'])
+
+    def test_cycle_fallback_serves_recorded_responses(self):
+        cassette = Cassette(self.path)
+        for text in ('one', 'two'):
+            cassette.record(text, 'model', [{'t': 0, 'text': text}], 0)
+
+        cycling = Cassette(self.path, fallback='cycle')
+        replies = [replay_text(cycling.lookup(f'unseen {i}')) for i in range(3)]
+        self.assertEqual(replies, ['one', 'two', 'one'])
+        self.assertEqual(cycling.misses, 3)
+
+    def test_concurrent_processes_write_whole_lines(self):
+        workers = [multiprocessing.Process(target=record_many, args=(self.path, worker, 25)) for worker in range(4)]
+        for process in workers:
+            process.start()
+        for process in workers:
+            process.join()
+        with open(self.path) as f:
+            lines = [json.loads(line) for line in f]
+        self.assertEqual(len(lines), 100)
+        self.assertEqual(len(Cassette(self.path)), 100)
+
+    def test_replay_timing_follows_recorded_offsets(self):
+        entry = {'chunks': [{'t': 0.0, 'text': 'a'}, {'t': 0.05, 'text': 'b'}], 'latency': 0.08}
+
+        start = time.perf_counter()
+        self.assertEqual(list(replay_chunks(entry)), ['a', 'b'])
+        self.assertLess(time.perf_counter() - start, 0.05)
+
+        start = time.perf_counter()
+        self.assertEqual(list(replay_chunks(entry, timing=True)), ['a', 'b'])
+        self.assertGreaterEqual(time.perf_counter() - start, 0.08)
+
+class TestBedrockModes(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, 'cassette.jsonl')
+        self.env = mock.patch.dict(os.environ, {'BEDROCK_CASSETTE': self.path})
+        self.env.start()
+        self.fake = FakeBedrock()
+        self.client = mock.patch.object(bedrock_client, '_client', self.fake)
+        self.client.start()
+
+    def tearDown(self):
+        self.client.stop()
+        self.env.stop()
+        bedrock_client._cassettes.pop(self.path, None)
+        self.tmpdir.cleanup()
+
+    def test_record_then_replay_without_model(self):
+        os.environ['BEDROCK_MODE'] = 'record'
+        recorded = bedrock_client.generate_text('deny large transfers')
+        self.assertEqual(recorded, self.fake.text)
+
+        os.environ['BEDROCK_MODE'] = 'replay'
+        replays = MODEL_CALLS.value(outcome='replay')
+        self.assertEqual(bedrock_client.generate_text('deny large transfers'), recorded)
+        self.assertEqual(self.fake.calls, 1)
+        self.assertEqual(MODEL_CALLS.value(outcome='replay'), replays + 1)
+
+    def test_replay_miss_falls_back_to_mock(self):
+        os.environ['BEDROCK_MODE'] = 'replay'
+        misses = MODEL_CALLS.value(outcome='replay_miss')
+        text = bedrock_client.generate_text('never recorded')
+        self.assertIn('POLICY:', text)
+        self.assertEqual(self.fake.calls, 0)
+        self.assertEqual(MODEL_CALLS.value(outcome='replay_miss'), misses + 1)
+
+    def test_unknown_mode_is_rejected(self):
+        os.environ['BEDROCK_MODE'] = 'rewind'
+        with self.assertRaises(ValueError):
+            bedrock_client.generate_text('anything')
+
+if __name__ == '__main__':
+    unittest.main()
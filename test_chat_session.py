@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+"""
+Tests for bounded chat session management
+"""
+
+import unittest
+import abc
+import os
+import tempfile
+import time
+from chat_session import ChatMessage, ChatSession, ChatManager
+from conversation_context import ContextBuilder, count_tokens
+from session_backends import SqliteSessionBackend, RedisSessionBackend, _text
+
+class TestChatSession(unittest.TestCase):
+    def test_message_cap(self):
+        session = ChatSession(max_messages=3)
+        for i in range(5):
+            session.add_message('user', f'message {i}')
+        
+        self.assertEqual([m['content'] for m in session.messages], ['message 2', 'message 3', 'message 4'])
+        self.assertEqual(session.bytes_held, sum(m.size() for m in session.messages))
+    
+    def test_message_dict_access(self):
+        session = ChatSession()
+        session.add_message('assistant', 'Policy: permit', {'valid': True})
+        message = session.messages[0]
+        self.assertEqual(message['role'], 'assistant')
+        self.assertEqual(message['metadata'], {'valid': True})
+        self.assertEqual(message.to_dict()['content'], 'Policy: permit')
+        self.assertFalse(hasattr(message, '__dict__'))
+
+class TestConversationContext(unittest.TestCase):
+    def test_short_conversation_is_verbatim(self):
+        session = ChatSession()
+        session.add_message('user', 'Create a policy')
+        session.add_message('assistant', 'Here is your policy')
+        
+        context = session.get_conversation_context()
+        self.assertEqual(context, 'Human: Create a policy\nAssistant: Here is your policy')
+    
+    def test_context_stays_within_budget(self):
+        builder = ContextBuilder(token_budget=200, summary_budget=80)
+        session = ChatSession(max_messages=500)
+        for i in range(100):
+            session.add_message('user', f'Constraint {i}: deny transfers over {i * 100} dollars')
+            session.add_message('assistant', 'Policy: forbid (principal, action, resource) when { resource.amount >= %d };' % i)
+            self.assertLessEqual(count_tokens(session.get_conversation_context(builder)), 200)
+        
+        context = session.get_conversation_context(builder)
+        self.assertIn('Conversation summary:', context)
+        self.assertIn('Constraint 99', context)
+        self.assertIn('resource.amount >= 9', context)
+    
+    def test_summary_is_incremental_and_cached(self):
+        builder = ContextBuilder(token_budget=60, summary_budget=30)
+        session = ChatSession()
+        session.add_message('user', 'Only managers may approve transactions over the limit')
+        session.add_message('assistant', 'Policy: permit (principal == User::"Manager", action, resource);')
+        session.add_message('user', 'Also block weekend transfers for every single account type')
+        
+        first = session.get_conversation_context(builder)
+        self.assertIn('User::"Manager"', session.get_context('summary')['policy'])
+        self.assertEqual(session.get_conversation_context(builder), first)
+        self.assertEqual(builder.cache_hits, 1)
+    
+    def test_messages_dropped_by_cap_are_summarised(self):
+        session = ChatSession(max_messages=2)
+        session.add_message('user', 'Require dual approval for wires')
+        session.add_message('assistant', 'Policy: forbid (principal, action, resource);')
+        session.add_message('user', 'And log everything')
+        
+        self.assertIn('Require dual approval for wires', session.get_context('summary')['constraints'])
+        self.assertIn('Require dual approval for wires', session.get_conversation_context())
+
+    def test_messages_with_the_same_timestamp_are_all_folded(self):
+        session = ChatSession()
+        for i in range(3):
+            session._append(ChatMessage('user', f'Constraint {i}', '2024-01-01T00:00:00'))
+        summary = ContextBuilder().fold(session, list(session.messages))
+        self.assertEqual(summary['constraints'], ['Constraint 0', 'Constraint 1', 'Constraint 2'])
+        # Folding again is a no-op
+        self.assertEqual(ContextBuilder().fold(session, list(session.messages))['constraints'], summary['constraints'])
+
+class TestChatManager(unittest.TestCase):
+    def test_lru_eviction(self):
+        manager = ChatManager(max_sessions=2)
+        first = manager.create_session()
+        second = manager.create_session()
+        manager.get_session(first)  # first is now most recently used
+        manager.create_session()
+        
+        self.assertIsNotNone(manager.get_session(first))
+        self.assertIsNone(manager.get_session(second))
+        self.assertEqual(manager.get_stats()['evicted_sessions'], 1)
+    
+    def test_sweeper_expires_idle_sessions(self):
+        manager = ChatManager(idle_hours=1)
+        session_id = manager.create_session()
+        session = manager.get_session(session_id)
+        session.last_activity = session.last_activity.replace(year=2020)
+        
+        manager.start_sweeper(interval_seconds=0.01)
+        deadline = time.time() + 2
+        while manager.get_session(session_id) is not None and time.time() < deadline:
+            time.sleep(0.01)
+        manager.stop_sweeper()
+        self.assertIsNone(manager.get_session(session_id))
+        self.assertEqual(manager.get_stats()['live_sessions'], 0)
+    
+    def test_memory_stays_flat(self):
+        manager = ChatManager(max_sessions=10, max_messages=5)
+        for _ in range(100):
+            session = manager.get_session(manager.create_session())
+            for i in range(20):
+                session.add_message('user', 'x' * 100)
+        
+        stats = manager.get_stats()
+        self.assertEqual(stats['live_sessions'], 10)
+        self.assertLess(stats['bytes_held'], 10 * 5 * 1000)
+
+class LocalRedis:
+    """In-process stand-in for the Redis commands RedisSessionBackend uses"""
+    
+    def __init__(self):
+        self.data = {}
+    
+    def pipeline(self):
+        return LocalPipeline(self)
+    
+    def hset(self, key, mapping):
+        self.data.setdefault(key, {}).update({k: str(v).encode() for k, v in mapping.items()})
+    
+    def hincrby(self, key, field, amount):
+        values = self.data.setdefault(key, {})
+        values[field] = str(int(values.get(field, 0)) + amount).encode()
+        return int(values[field])
+    
+    def hgetall(self, key):
+        return dict(self.data.get(key, {}))
+    
+    def rpush(self, key, value):
+        self.data.setdefault(key, []).append(value.encode())
+    
+    def ltrim(self, key, start, end):
+        items = self.data.get(key, [])
+        self.data[key] = items[start:] if end == -1 else items[start:end + 1]
+    
+    def lrange(self, key, start, end):
+        items = self.data.get(key, [])
+        return items[start:] if end == -1 else items[start:end + 1]
+    
+    def expire(self, key, seconds):
+        pass
+    
+    def zadd(self, key, mapping):
+        self.data.setdefault(key, {}).update(mapping)
+    
+    def zrem(self, key, member):
+        self.data.get(key, {}).pop(member, None)
+    
+    def zcard(self, key):
+        return len(self.data.get(key, {}))
+    
+    def zrangebyscore(self, key, low, high):
+        return [m.encode() for m, score in self.data.get(key, {}).items() if score <= high]
+    
+    def eval(self, script, numkeys, index_key, cutoff, prefix):
+        # EXPIRE_SCRIPT; a single call is atomic here as it is on the server
+        expired = [_text(sid) for sid in self.zrangebyscore(index_key, '-inf', cutoff)]
+        for session_id in expired:
+            self.delete(f'{prefix}{session_id}:meta', f'{prefix}{session_id}:messages')
+            self.zrem(index_key, session_id)
+        return len(expired)
+    
+    def delete(self, *keys):
+        for key in keys:
+            self.data.pop(key, None)
+
+class LocalPipeline:
+    def __init__(self, client):
+        self.client = client
+        self.calls = []
+    
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self.calls.append((name, args, kwargs))
+    
+    def execute(self):
+        return [getattr(self.client, name)(*args, **kwargs) for name, args, kwargs in self.calls]
+
+class SharedBackendTests(abc.ABC):
+    @abc.abstractmethod
+    def make_backend(self):
+        pass
+    
+    def test_session_visible_to_other_workers(self):
+        worker_a = ChatManager(backend=self.make_backend())
+        worker_b = ChatManager(backend=self.make_backend())
+        session_id = worker_a.create_session()
+        worker_a.get_session(session_id).add_message('user', 'Block large transactions')
+        
+        session = worker_b.get_session(session_id)
+        self.assertIsNotNone(session)
+        session.add_message('assistant', 'Policy: forbid', {'valid': True})
+        session.update_context('policy', 'forbid')
+        
+        reloaded = worker_a.get_session(session_id)
+        self.assertEqual([m['content'] for m in reloaded.messages],
+                         ['Block large transactions', 'Policy: forbid'])
+        self.assertEqual(reloaded.messages[1]['metadata'], {'valid': True})
+        self.assertEqual(reloaded.get_context('policy'), 'forbid')
+        self.assertIsNone(worker_b.get_session('missing'))
+    
+    def test_message_cap_and_expiry(self):
+        # The manager's cap applies whatever the backend was built with
+        manager = ChatManager(max_messages=3, backend=self.make_backend())
+        session_id = manager.create_session()
+        session = manager.get_session(session_id)
+        for i in range(5):
+            session.add_message('user', f'message {i}')
+        self.assertEqual([m['content'] for m in manager.get_session(session_id).messages],
+                         ['message 2', 'message 3', 'message 4'])
+        
+        self.assertEqual(manager.get_stats()['live_sessions'], 1)
+        self.assertEqual(manager.backend.expire(time.time() + 1), 1)
+        self.assertIsNone(manager.get_session(session_id))
+
+class TestSqliteSessionBackend(SharedBackendTests, unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+    
+    def tearDown(self):
+        self.tmpdir.cleanup()
+    
+    def make_backend(self):
+        return SqliteSessionBackend(os.path.join(self.tmpdir.name, 'sessions.db'))
+
+class TestRedisSessionBackend(SharedBackendTests, unittest.TestCase):
+    def setUp(self):
+        self.server = LocalRedis()
+    
+    def make_backend(self):
+        return RedisSessionBackend(self.server)
+    
+    def test_write_racing_expiry_does_not_revive_a_session(self):
+        backend = self.make_backend()
+        manager = ChatManager(backend=backend)
+        session = manager.get_session(manager.create_session())
+        backend.expire(time.time() + 1)
+        session.add_message('user', 'late message')
+        self.assertIsNone(manager.get_session(session.session_id))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Tests for hedged model calls
+"""
+
+import threading
+import time
+import unittest
+from hedging import MAX_CREDIT, Hedger
+from metrics import MODEL_HEDGES, MODEL_HEDGE_WINS
+from scheduler import FairScheduler
+
+class SlowThenFast:
+    """Answers the first call after ``slow`` seconds and later calls after ``fast``"""
+
+    def __init__(self, slow, fast=0.0, fail_first=False):
+        self.slow = slow
+        self.fast = fast
+        self.fail_first = fail_first
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def __call__(self):
+        with self._lock:
+            self.calls += 1
+            call = self.calls
+        time.sleep(self.slow if call == 1 else self.fast)
+        if call == 1 and self.fail_first:
+            raise RuntimeError('first attempt failed')
+        return f'answer {call}'
+
+class TestHedger(unittest.TestCase):
+    def warm(self, hedger, seconds=0.01, count=5):
+        for _ in range(count):
+            hedger._observe('model', seconds)
+
+    def test_disabled_calls_once(self):
+        hedger = Hedger(percentile=0)
+        fn = SlowThenFast(0.0)
+        self.assertEqual(hedger.call('model', fn), 'answer 1')
+        self.assertEqual(hedger.get_stats()['calls'], 0)
+
+    def test_no_hedge_until_enough_samples(self):
+        hedger = Hedger(percentile=90, max_rate=1, min_samples=5)
+        self.assertIsNone(hedger.delay('model'))
+        for _ in range(5):
+            hedger.call('model', lambda: 'ok')
+        self.assertIsNotNone(hedger.delay('model'))
+        self.assertEqual(hedger.get_stats()['hedged'], 0)
+
+    def test_fast_call_is_not_hedged(self):
+        hedger = Hedger(percentile=90, max_rate=1, min_samples=5)
+        self.warm(hedger, seconds=1.0)
+        fn = SlowThenFast(0.0)
+        self.assertEqual(hedger.call('model', fn), 'answer 1')
+        self.assertEqual(fn.calls, 1)
+
+    def test_slow_call_is_hedged_and_hedge_wins(self):
+        hedger = Hedger(percentile=90, max_rate=1, min_samples=5)
+        self.warm(hedger)
+        sent = MODEL_HEDGES.value(outcome='sent')
+        wins = MODEL_HEDGE_WINS.value(winner='hedge')
+
+        started = time.perf_counter()
+        self.assertEqual(hedger.call('model', SlowThenFast(2.0)), 'answer 2')
+        self.assertLess(time.perf_counter() - started, 1.0)
+        self.assertEqual(MODEL_HEDGES.value(outcome='sent'), sent + 1)
+        self.assertEqual(MODEL_HEDGE_WINS.value(winner='hedge'), wins + 1)
+        self.assertEqual(hedger.get_stats()['hedge_wins'], 1)
+
+    def test_failed_attempt_waits_for_the_other(self):
+        hedger = Hedger(percentile=90, max_rate=1, min_samples=5)
+        self.warm(hedger)
+        self.assertEqual(hedger.call('model', SlowThenFast(0.1, fast=0.2, fail_first=True)), 'answer 2')
+
+        def always_fails():
+            time.sleep(0.05)
+            raise RuntimeError('down')
+        with self.assertRaises(RuntimeError):
+            hedger.call('model', always_fails)
+
+    def test_rate_cap(self):
+        hedger = Hedger(percentile=50, max_rate=0.5, min_samples=5)
+        self.warm(hedger, seconds=0.001)
+        # Two calls earn one hedge; the next slow call has to wait for its primary
+        fns = [SlowThenFast(0.05) for _ in range(3)]
+        results = [hedger.call('model', fn) for fn in fns]
+        self.assertEqual(results, ['answer 1', 'answer 2', 'answer 1'])
+        self.assertEqual([fn.calls for fn in fns], [1, 2, 1])
+        stats = hedger.get_stats()
+        self.assertEqual((stats['calls'], stats['hedged'], stats['capped']), (3, 1, 2))
+
+    def test_no_hedge_without_a_spare_token(self):
+        hedger = Hedger(percentile=50, max_rate=1, min_samples=5)
+        scheduler = FairScheduler(session_rate=0, global_rate=0.001, global_burst=1)
+        hedger.admit = scheduler.take_extra
+        self.warm(hedger, seconds=0.001)
+        limited = MODEL_HEDGES.value(outcome='rate_limited')
+        first, second = SlowThenFast(0.05), SlowThenFast(0.05)
+        # The one token in the bucket pays for the first hedge only
+        self.assertEqual(hedger.call('model', first), 'answer 2')
+        self.assertEqual(hedger.call('model', second), 'answer 1')
+        self.assertEqual(second.calls, 1)
+        stats = hedger.get_stats()
+        self.assertEqual((stats['hedged'], stats['rate_limited']), (1, 1))
+        self.assertEqual(MODEL_HEDGES.value(outcome='rate_limited'), limited + 1)
+        self.assertEqual(scheduler.get_stats()['extra_refused'], 1)
+
+    def test_refused_hedges_do_not_raise_the_credit_cap(self):
+        hedger = Hedger(percentile=50, max_rate=1, min_samples=5)
+        hedger.admit = lambda: False
+        self.warm(hedger, seconds=0.001)
+        for _ in range(8):
+            hedger.call('model', SlowThenFast(0.01))
+        self.assertLessEqual(hedger._credit, MAX_CREDIT)
+
+if __name__ == '__main__':
+    unittest.main()
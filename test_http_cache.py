@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Tests for HTTP validators, gzip negotiation and payload memoization
+"""
+
+import gzip
+import json
+import unittest
+from http_cache import PayloadCache, accepts_gzip, http_date, not_modified, record_time
+
+class TestConditionalRequests(unittest.TestCase):
+    def test_etag_match(self):
+        etag = 'W/"abc"'
+        self.assertTrue(not_modified('W/"abc"', None, etag, None))
+        self.assertTrue(not_modified('"xyz", "abc"', None, etag, None))
+        self.assertTrue(not_modified('*', None, etag, None))
+        self.assertFalse(not_modified('W/"old"', None, etag, None))
+
+    def test_if_modified_since(self):
+        modified = 1700000000.5
+        self.assertTrue(not_modified(None, http_date(modified), 'W/"abc"', modified))
+        self.assertFalse(not_modified(None, http_date(modified - 10), 'W/"abc"', modified))
+        self.assertFalse(not_modified(None, 'not a date', 'W/"abc"', modified))
+        # If-None-Match takes precedence
+        self.assertFalse(not_modified('W/"old"', http_date(modified), 'W/"abc"', modified))
+
+    def test_accepts_gzip(self):
+        self.assertTrue(accepts_gzip('gzip, deflate, br'))
+        self.assertTrue(accepts_gzip('*'))
+        self.assertFalse(accepts_gzip('gzip;q=0'))
+        self.assertFalse(accepts_gzip('deflate'))
+        self.assertFalse(accepts_gzip(None))
+
+    def test_record_time(self):
+        self.assertIsNone(record_time(''))
+        self.assertIsNotNone(record_time('2024-01-02T03:04:05.123456'))
+
+class TestPayloadCache(unittest.TestCase):
+    def test_rebuilds_only_when_version_changes(self):
+        cache = PayloadCache()
+        builds = []
+
+        def build():
+            builds.append(1)
+            return {'total': len(builds)}
+
+        first = cache.get('stats', (1, 't1'), build)
+        again = cache.get('stats', (1, 't1'), build)
+        self.assertIs(first, again)
+        self.assertEqual(json.loads(first.body), {'total': 1})
+
+        changed = cache.get('stats', (2, 't2'), build)
+        self.assertNotEqual(changed.etag, first.etag)
+        self.assertEqual(json.loads(changed.body), {'total': 2})
+        self.assertEqual((cache.hits, cache.misses), (1, 2))
+
+    def test_gzip_is_memoized(self):
+        payload = PayloadCache().get('history', 1, lambda: {'history': ['x' * 100] * 50})
+        self.assertIs(payload.gzipped(), payload.gzipped())
+        self.assertEqual(gzip.decompress(payload.gzipped()), payload.body)
+
+    def test_entries_are_bounded(self):
+        cache = PayloadCache(max_entries=2)
+        for page in range(3):
+            cache.get(('history', page), 1, lambda: {})
+        self.assertEqual(list(cache._entries), [('history', 1), ('history', 2)])
+
+if __name__ == '__main__':
+    unittest.main()
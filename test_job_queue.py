@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""
+Tests for the background job queue
+"""
+
+import unittest
+import threading
+from job_queue import JobManager, QueueFullError
+
+class TestJobManager(unittest.TestCase):
+    def test_job_runs_in_background(self):
+        manager = JobManager(max_workers=1)
+        release = threading.Event()
+        job = manager.submit(lambda: release.wait(5) and {'policy': 'permit'})
+        self.assertIn(job.status, ('queued', 'running'))
+        
+        release.set()
+        self.assertTrue(job.done.wait(5))
+        self.assertEqual(manager.get(job.id).to_dict()['result'], {'policy': 'permit'})
+        self.assertEqual(manager.get_stats()['succeeded'], 1)
+    
+    def test_failure_is_reported(self):
+        manager = JobManager(max_workers=1)
+        
+        def fail():
+            raise ValueError('model unavailable')
+        
+        job = manager.submit(fail)
+        job.done.wait(5)
+        self.assertEqual(job.to_dict()['status'], 'failed')
+        self.assertEqual(job.to_dict()['error'], 'model unavailable')
+    
+    def test_queue_is_bounded(self):
+        manager = JobManager(max_workers=1, max_queue=2)
+        release = threading.Event()
+        running = manager.submit(release.wait, 5)
+        while running.status != 'running':
+            running.done.wait(0.01)
+        manager.submit(release.wait, 5)
+        manager.submit(release.wait, 5)
+        
+        with self.assertRaises(QueueFullError):
+            manager.submit(release.wait, 5)
+        stats = manager.get_stats()
+        self.assertEqual(stats['queue_depth'], 2)
+        self.assertEqual(stats['rejected'], 1)
+        release.set()
+
+if __name__ == '__main__':
+    unittest.main()
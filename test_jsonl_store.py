@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+Tests for the append-only JSON Lines policy store
+"""
+
+import unittest
+import json
+import os
+import tempfile
+import time
+from unittest import mock
+from jsonl_store import JsonlStore
+from jsonl_reader import JsonlReader
+from approval_manager import ApprovalManager
+from history_manager import HistoryManager
+
+class TestJsonlStore(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, 'store.json')
+    
+    def tearDown(self):
+        self.tmpdir.cleanup()
+    
+    def test_append_and_reload(self):
+        store = JsonlStore(self.path, fsync='never')
+        store.load()
+        store.append({'requirement': 'a'})
+        store.append({'requirement': 'b'})
+        store.close()
+        
+        records = JsonlStore(self.path).load()
+        self.assertEqual([r['requirement'] for r in records], ['a', 'b'])
+    
+    def test_append_writes_one_line(self):
+        store = JsonlStore(self.path, fsync='never')
+        store.load()
+        store.append({'requirement': 'a'})
+        size = os.path.getsize(self.path)
+        store.append({'requirement': 'b'})
+        self.assertEqual(os.path.getsize(self.path), size * 2)
+    
+    def test_legacy_json_import(self):
+        with open(self.path, 'w') as f:
+            json.dump([{'id': 0, 'status': 'APPROVED'}, {'id': 1, 'status': 'REJECTED'}], f, indent=2)
+        
+        manager = ApprovalManager(self.path)
+        self.assertEqual(manager.store.log.imported, 2)
+        self.assertEqual(manager.get_approval_stats()['total_policies'], 2)
+        self.assertEqual(manager.approve_policy({'policy': 'permit (principal, action, resource);'}), 2)
+        self.assertEqual(len(ApprovalManager(self.path).approvals), 3)
+    
+    def test_compaction(self):
+        store = JsonlStore(self.path, fsync='never', compact_threshold=3)
+        store.load()
+        for i in range(7):
+            store.append({'n': i})
+        store.close()
+        
+        self.assertTrue(os.path.exists(store.snapshot_path))
+        records = JsonlStore(self.path).load()
+        self.assertEqual([r['n'] for r in records], list(range(7)))
+    
+    def test_crash_between_snapshot_and_truncate(self):
+        store = JsonlStore(self.path, fsync='never', compact_threshold=0)
+        store.load()
+        for i in range(3):
+            store.append({'n': i})
+        store.close()
+        with open(self.path) as f:
+            log = f.read()
+        store.compact()
+        # Simulate a crash that left the old log lines behind
+        with open(self.path, 'w') as f:
+            f.write(log)
+        
+        records = JsonlStore(self.path).load()
+        self.assertEqual([r['n'] for r in records], [0, 1, 2])
+    
+    def test_interval_sync_happens_without_a_later_write(self):
+        store = JsonlStore(self.path, fsync='interval', fsync_interval=0.05)
+        store.load()
+        with mock.patch('os.fsync') as fsync:
+            store.append({'requirement': 'a'})
+            self.assertEqual(fsync.call_count, 0)
+            # No further writes arrive; the interval still ends in a sync
+            deadline = time.monotonic() + 2
+            while not fsync.call_count and time.monotonic() < deadline:
+                time.sleep(0.01)
+            self.assertEqual(fsync.call_count, 1)
+        store.close()
+    
+    def test_torn_trailing_line(self):
+        history = HistoryManager(self.path)
+        history.save_policy('first', 'permit (principal, action, resource);', [])
+        history.store.close()
+        with open(self.path, 'a') as f:
+            f.write('{"requirement": "tor')
+        
+        history = HistoryManager(self.path)
+        self.assertEqual(len(history.get_history()), 1)
+        self.assertEqual(history.save_policy('second', '', []), 1)
+        history.store.close()
+        self.assertEqual(len(HistoryManager(self.path).get_history()), 2)
+
+class TestJsonlReader(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, 'history.json')
+        self.history = HistoryManager(self.path, fsync='never')
+        for i in range(5):
+            self.history.save_policy(f'requirement {i}', 'permit (principal, action, resource);', [])
+    
+    def tearDown(self):
+        self.tmpdir.cleanup()
+    
+    def test_reads_by_position(self):
+        reader = JsonlReader(self.path)
+        self.assertEqual(reader.count(), 5)
+        self.assertEqual(reader.get(3)['requirement'], 'requirement 3')
+        self.assertIsNone(reader.get(5))
+        self.assertTrue(os.path.exists(self.path + '.idx'))
+        
+        page, cursor = reader.query(cursor=1, limit=2)
+        self.assertEqual([e['id'] for e in page], [2, 3])
+        self.assertEqual(cursor, 3)
+    
+    def test_index_catches_up_with_new_records(self):
+        JsonlReader(self.path).close()
+        self.history.save_policy('requirement 5', '', [])
+        with open(self.path, 'a') as f:
+            f.write('{"requirement": "torn')
+        
+        reader = JsonlReader(self.path)
+        self.assertEqual(reader.count(), 6)
+        self.assertEqual(reader.get(5)['requirement'], 'requirement 5')
+    
+    def test_reads_across_compaction(self):
+        JsonlReader(self.path).close()
+        self.history.store.log.compact()
+        self.history.save_policy('requirement 5', '', [])
+        
+        reader = JsonlReader(self.path)
+        self.assertEqual([e['requirement'] for e in reader.iter_range()],
+                         [f'requirement {i}' for i in range(6)])
+    
+    def test_corrupt_line_is_skipped(self):
+        self.history.store.close()
+        with open(self.path, 'a') as f:
+            f.write('{"requirement": "garbled\x00, "_seq":99}\n')
+        self.history.save_policy('requirement 6', '', [])
+        
+        reader = JsonlReader(self.path)
+        self.assertEqual(reader.count(), 7)
+        self.assertIsNone(reader.get(5))
+        self.assertEqual(reader.get(6)['requirement'], 'requirement 6')
+        page, cursor = reader.query(cursor=3, limit=2)
+        self.assertEqual(([e['requirement'] for e in page], cursor), (['requirement 4'], 5))
+        page, cursor = reader.query(cursor=cursor, limit=2)
+        self.assertEqual(([e['requirement'] for e in page], cursor), (['requirement 6'], None))
+    
+    def test_legacy_file(self):
+        legacy = os.path.join(self.tmpdir.name, 'legacy.json')
+        with open(legacy, 'w') as f:
+            json.dump([{'timestamp': '2024-01-01', 'requirement': 'old', 'policy': '', 'rationale': []}], f, indent=2)
+        self.assertEqual(JsonlReader(legacy).get(0)['requirement'], 'old')
+        # Viewing leaves the file as it is and creates no lock or index files
+        with open(legacy) as f:
+            self.assertTrue(f.read().startswith('['))
+        self.assertFalse(os.path.exists(legacy + '.lock'))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+Tests for the metrics registry and Prometheus rendering
+"""
+
+import unittest
+from metrics import Registry
+
+class TestMetrics(unittest.TestCase):
+    def setUp(self):
+        self.registry = Registry()
+
+    def test_counter_by_label(self):
+        calls = self.registry.counter('calls_total', 'Calls', ('outcome',))
+        calls.inc(outcome='success')
+        calls.inc(outcome='success')
+        calls.inc(outcome='throttle')
+        text = self.registry.render()
+        self.assertIn('# TYPE calls_total counter', text)
+        self.assertIn('calls_total{outcome="success"} 2', text)
+        self.assertIn('calls_total{outcome="throttle"} 1', text)
+
+    def test_histogram_buckets_are_cumulative(self):
+        latency = self.registry.histogram('stage_seconds', 'Latency', ('stage',), buckets=(0.1, 1.0))
+        latency.observe(0.05, stage='parse')
+        latency.observe(0.5, stage='parse')
+        latency.observe(5, stage='parse')
+        text = self.registry.render()
+        self.assertIn('stage_seconds_bucket{stage="parse",le="0.1"} 1', text)
+        self.assertIn('stage_seconds_bucket{stage="parse",le="1"} 2', text)
+        self.assertIn('stage_seconds_bucket{stage="parse",le="+Inf"} 3', text)
+        self.assertIn('stage_seconds_count{stage="parse"} 3', text)
+        self.assertIn('stage_seconds_sum{stage="parse"} 5.55', text)
+
+    def test_timer(self):
+        latency = self.registry.histogram('work_seconds', 'Latency')
+        with latency.time():
+            pass
+        self.assertEqual(latency.count(), 1)
+
+    def test_callback_gauges_read_at_scrape(self):
+        sizes = {'history': 3}
+        self.registry.gauge('records', 'Records', lambda: {(k,): v for k, v in sizes.items()}, ('store',))
+        self.registry.gauge('broken', 'Fails', lambda: 1 / 0)
+        sizes['history'] = 4
+        text = self.registry.render()
+        self.assertIn('records{store="history"} 4', text)
+        self.assertNotIn('\nbroken ', text)
+
+    def test_label_values_are_escaped(self):
+        calls = self.registry.counter('calls_total', 'Calls', ('path',))
+        calls.inc(path='a"b\\c')
+        self.assertIn('calls_total{path="a\\"b\\\\c"} 1', self.registry.render())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Tests for complexity-based model routing
+"""
+
+import unittest
+from unittest import mock
+from model_router import ModelRouter, RequirementClassifier, Route
+from policy_generator import PolicyGenerator
+from policy_validator import PolicyValidator
+from scheduler import FairScheduler
+
+VALID = '''POLICY:
+forbid (principal, action == Action::"CreateTransaction", resource) when { resource.amount >= 5000 };
+
+RATIONALE:
+• reason'''
+INVALID = '''POLICY:
+forbid (principal == Teller::"x", action == Action::"CreateTransaction", resource);
+
+RATIONALE:
+• reason'''
+
+def routes():
+    return [Route('fast', 'fast-model', 300), Route('strong', 'strong-model', 1500)]
+
+class TestClassifier(unittest.TestCase):
+    def setUp(self):
+        self.classifier = PolicyGenerator('sample_banking_schema.json').classifier
+
+    def test_single_action_threshold_is_simple(self):
+        result = self.classifier.classify('Deny Account Holder from creating transactions >= 5000')
+        self.assertEqual(result['complexity'], 'simple')
+        self.assertEqual(result['actions'], ['CreateTransaction'])
+
+    def test_compound_rules_are_complex(self):
+        result = self.classifier.classify(
+            'Managers can approve transactions over 10000 and view accounts, '
+            'but tellers may only view accounts they own')
+        self.assertEqual(result['complexity'], 'complex')
+        self.assertEqual(result['actions'], ['ApproveTransaction', 'ViewAccount'])
+
+    def test_unknown_schema_names(self):
+        result = RequirementClassifier({}).classify('Allow admins to do everything')
+        self.assertEqual(result['complexity'], 'simple')
+        self.assertEqual(result['actions'], [])
+
+class TestModelRouter(unittest.TestCase):
+    def test_routes_by_complexity_within_budget(self):
+        router = ModelRouter(routes(), mode='auto', default_budget=0)
+        self.assertEqual(router.choose('simple').name, 'fast')
+        self.assertEqual(router.choose('complex').name, 'strong')
+
+        # Once the strong route is known to take 2s it no longer fits a 1s budget
+        for _ in range(3):
+            router.record(router.routes['strong'], 2.0, True)
+        self.assertEqual(router.choose('complex', budget=1.0).name, 'fast')
+        self.assertEqual(router.choose('complex', budget=5.0).name, 'strong')
+
+    def test_pinned_mode(self):
+        router = ModelRouter(routes(), mode='fast')
+        self.assertEqual(router.choose('complex').name, 'fast')
+        self.assertIsNone(router.escalation(router.routes['fast'], 0.0))
+        with self.assertRaises(ValueError):
+            ModelRouter(routes(), mode='fastest')
+
+class TestRoutedGeneration(unittest.TestCase):
+    def setUp(self):
+        self.router = ModelRouter(routes(), mode='auto', default_budget=0)
+        self.generator = PolicyGenerator('sample_banking_schema.json', router=self.router)
+        self.calls = []
+
+    def model(self, responses):
+        def generate_text(prompt, model_id=None, max_tokens=None):
+            self.calls.append((model_id, max_tokens))
+            return responses[model_id]
+        return mock.patch('policy_generator.generate_text', side_effect=generate_text)
+
+    def test_simple_requirement_uses_fast_route(self):
+        with self.model({'fast-model': VALID}):
+            result = self.generator.generate_and_validate_policy('Deny creating transactions >= 5000')
+        self.assertTrue(result['validation']['is_valid'])
+        self.assertEqual(self.calls, [('fast-model', 300)])
+        self.assertEqual(result['routing']['route'], 'fast')
+        self.assertFalse(result['routing']['escalated'])
+
+    def test_failed_validation_escalates(self):
+        with self.model({'fast-model': INVALID, 'strong-model': VALID}):
+            result = self.generator.generate_and_validate_policy('Deny creating transactions >= 5000')
+        self.assertEqual([c[0] for c in self.calls], ['fast-model', 'strong-model'])
+        self.assertTrue(result['validation']['is_valid'])
+        self.assertTrue(result['routing']['escalated'])
+
+        stats = self.router.get_stats()
+        self.assertEqual(stats['escalations'], 1)
+        self.assertEqual(stats['routes']['fast']['pass_rate'], 0.0)
+        self.assertEqual(stats['routes']['strong']['pass_rate'], 1.0)
+
+    def test_no_escalation_without_time_left(self):
+        self.router.record(self.router.routes['strong'], 10.0, True)
+        with self.model({'fast-model': INVALID, 'strong-model': VALID}):
+            result = self.generator.generate_and_validate_policy('Deny creating transactions >= 5000',
+                                                                 latency_budget=2.0)
+        self.assertEqual([c[0] for c in self.calls], ['fast-model'])
+        self.assertFalse(result['validation']['is_valid'])
+        self.assertEqual(result['routing']['budget_ms'], 2000)
+        self.assertTrue(result['routing']['within_budget'])
+
+    def test_no_escalation_without_a_spare_token(self):
+        scheduler = FairScheduler(session_rate=0, global_rate=1, global_burst=1)
+        self.router.admit = scheduler.take_extra
+        with self.model({'fast-model': INVALID, 'strong-model': VALID}):
+            with scheduler.slot('client'):
+                result = self.generator.generate_and_validate_policy('Deny creating transactions >= 5000')
+        # The request took the only token, so the retry is skipped
+        self.assertEqual([c[0] for c in self.calls], ['fast-model'])
+        self.assertFalse(result['routing']['escalated'])
+        self.assertEqual(self.router.get_stats()['escalations_refused'], 1)
+        self.assertEqual(scheduler.get_stats()['extra_refused'], 1)
+
+class TestValidatorActions(unittest.TestCase):
+    def test_action_references_are_not_entity_types(self):
+        is_valid, errors = PolicyValidator().validate_policy(
+            'permit (principal == User::"a", action == Action::"ViewAccount", resource);',
+            {'entities': ['User'], 'actions': ['ViewAccount']})
+        self.assertTrue(is_valid, errors)
+
+if __name__ == '__main__':
+    unittest.main()
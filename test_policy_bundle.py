@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Tests for canonical Cedar text and compiled policy bundles
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+from approval_manager import ApprovalManager
+from policy_bundle import BundleError, PolicyBundle, collect_policies, export_bundle, pack
+from policy_parser import canonical_policy, split_policies
+
+THRESHOLD = '''forbid(
+  principal,
+  action == Action::"CreateTransaction",
+  resource
+)
+when {
+  resource.amount >= 5000
+};'''
+OWNER = 'permit (principal, action, resource is Account) when { resource.ownerId == principal.userId };'
+VIEW = 'permit(principal == User::"a;b", action == Action::"ViewAccount", resource);'
+
+class TestCanonicalText(unittest.TestCase):
+    def test_layout_does_not_matter(self):
+        self.assertEqual(canonical_policy(THRESHOLD),
+                         'forbid(principal, action == Action::"CreateTransaction", resource) '
+                         'when {resource.amount >= 5000};')
+        spaced = '// threshold\n' + THRESHOLD.replace('\n', '\n\n  ')
+        self.assertEqual(canonical_policy(spaced), canonical_policy(THRESHOLD))
+
+    def test_string_literals_are_kept(self):
+        self.assertIn('"a  b"', canonical_policy('permit(principal, action, resource) when { context.x == "a  b" }'))
+
+    def test_split_at_top_level_semicolons(self):
+        statements = split_policies(THRESHOLD + '\n' + VIEW + '\n// trailing comment\n')
+        self.assertEqual(len(statements), 2)
+        self.assertEqual(statements[1], VIEW)
+
+class TestPolicyBundle(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.approvals = ApprovalManager(os.path.join(self.tmp, 'approvals.json'))
+        self.approvals.approve_policy({'policy': THRESHOLD})
+        self.approvals.reject_policy({'policy': 'permit(principal, action, resource);'}, 'too broad')
+        self.approvals.approve_policy({'policy': OWNER + '\n' + VIEW})
+        self.approvals.approve_policy({'policy': THRESHOLD})
+        self.out = os.path.join(self.tmp, 'bundle')
+
+    def tearDown(self):
+        self.approvals.store.close()
+        shutil.rmtree(self.tmp)
+
+    def test_export_writes_cedar_and_binary(self):
+        result = export_bundle(self.approvals.store, self.out)
+        self.assertEqual((result['version'], result['base_version'], result['policies']), (4, 0, 3))
+        with open(self.out + '.cedar') as f:
+            lines = f.read().splitlines()
+        self.assertEqual(lines[0], '// policy bundle version 4')
+        self.assertEqual([line.split(' ', 1)[0] for line in lines[1:]],
+                         ['@id("approval-0")', '@id("approval-2")', '@id("approval-2-1")'])
+
+        with PolicyBundle.open(self.out + '.bundle') as bundle:
+            self.assertEqual((bundle.version, len(bundle), bundle.incremental), (4, 3, False))
+            self.assertEqual([p['policy'] for p in bundle], [line.split(' ', 1)[1] for line in lines[1:]])
+            view = bundle.policy(2)
+            self.assertEqual(view['actions'], ['ViewAccount'])
+            self.assertEqual(view['entity_types'], ['User'])
+
+    def test_index_lookups(self):
+        export_bundle(self.approvals.store, self.out)
+        with PolicyBundle.open(self.out + '.bundle') as bundle:
+            self.assertEqual(bundle.names('actions'), ['CreateTransaction', 'ViewAccount'])
+            # The ownership policy names no action, so it matches every action
+            self.assertEqual([p['id'] for p in bundle.policies(action='ViewAccount')],
+                             ['approval-2', 'approval-2-1'])
+            self.assertEqual([p['id'] for p in bundle.policies(action='DeleteAccount')], ['approval-2'])
+            self.assertEqual([p['id'] for p in bundle.policies(action='ViewAccount', entity_type='Account')],
+                             ['approval-2'])
+            self.assertEqual(len(bundle.policies()), 3)
+
+    def test_incremental_bundle(self):
+        version = export_bundle(self.approvals.store, self.out)['version']
+        self.approvals.approve_policy({'policy': 'forbid(principal, action == Action::"DeleteAccount", resource);'})
+        self.approvals.approve_policy({'policy': THRESHOLD})
+
+        policies, new_version = collect_policies(self.approvals.store, since=version)
+        self.assertEqual(new_version, 6)
+        self.assertEqual([p['id'] for p in policies], ['approval-4'])
+        bundle = PolicyBundle(pack(policies, new_version, version))
+        self.assertTrue(bundle.incremental)
+        self.assertEqual((bundle.version, bundle.base_version), (6, 4))
+
+        self.assertEqual(collect_policies(self.approvals.store, since=new_version), ([], 6))
+
+    def test_rejects_other_files(self):
+        with self.assertRaises(BundleError):
+            PolicyBundle(b'not a bundle' * 10)
+        with self.assertRaises(BundleError):
+            PolicyBundle.open(os.path.join(self.tmp, 'missing.bundle'))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Tests for schema coverage by approved policies
+"""
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+import bench_data
+from approval_manager import ApprovalManager
+from policy_coverage import ReferenceIndex, coverage, format_coverage
+from run_benchmarks import fill_jsonl
+
+SCHEMA = {
+    'entityTypes': {
+        'User': {'memberOfTypes': ['Team'], 'shape': {'type': 'Record', 'attributes': {
+            'userId': {'type': 'String'}, 'level': {'type': 'Long'}}}},
+        'Team': {'shape': {'type': 'Record', 'attributes': {}}},
+        'Invoice': {'shape': {'type': 'Record', 'attributes': {
+            'total': {'type': 'Long'}, 'createdBy': {'type': 'String'}}}},
+        'Report': {'shape': {'type': 'Record', 'attributes': {'title': {'type': 'String'}, 'total': {'type': 'Long'}}}},
+        'Archive': {'shape': {'type': 'Record', 'attributes': {'title': {'type': 'String'}}}}
+    },
+    'actions': {
+        'ReadAll': {},
+        'ViewInvoice': {'memberOf': [{'id': 'ReadAll'}],
+                        'appliesTo': {'principalTypes': ['User'], 'resourceTypes': ['Invoice']}},
+        'PayInvoice': {'appliesTo': {'principalTypes': ['User'], 'resourceTypes': ['Invoice']}},
+        'ViewReport': {'memberOf': [{'id': 'ReadAll'}],
+                       'appliesTo': {'principalTypes': ['User'], 'resourceTypes': ['Report']}},
+        'DeleteArchive': {'appliesTo': {'principalTypes': ['User'], 'resourceTypes': ['Archive']}}
+    }
+}
+
+class TestCoverage(unittest.TestCase):
+    def setUp(self):
+        self.context = bench_data.schema_context(SCHEMA)
+        self.index = ReferenceIndex()
+
+    def test_actions_through_groups(self):
+        self.index.add('permit(principal, action in Action::"ReadAll", resource);')
+        report = coverage(self.context, self.index)
+        self.assertEqual(report['actions']['uncovered'], ['PayInvoice', 'DeleteArchive'])
+        self.assertEqual(report['actions']['covered'], 3)
+        # A covered action covers the types it applies to
+        self.assertEqual(report['entity_types']['uncovered'], ['Team', 'Archive'])
+
+    def test_attributes_join_on_the_scope_type(self):
+        self.index.add('forbid(principal, action == Action::"PayInvoice", resource) when { resource.total > 100 };')
+        self.index.add('permit(principal, action, resource is Report) when { resource.title like "Q*" };')
+        self.index.add('permit(principal == User::"a", action, resource) when { principal.level > 2 };')
+        report = coverage(self.context, self.index)
+        uncovered = report['attributes']['uncovered']
+        self.assertNotIn('Invoice.total', uncovered)
+        self.assertNotIn('Report.title', uncovered)
+        self.assertNotIn('User.level', uncovered)
+        # The same attribute name on types the policies cannot apply to stays uncovered
+        self.assertIn('Report.total', uncovered)
+        self.assertIn('Archive.title', uncovered)
+        self.assertEqual(report['wildcard_policies'], 2)
+
+    def test_unconstrained_attribute_reads_cover_every_type_with_the_name(self):
+        self.index.add('forbid(principal, action, resource) when { resource.title == "x" };')
+        uncovered = coverage(self.context, self.index)['attributes']['uncovered']
+        self.assertNotIn('Report.title', uncovered)
+        self.assertNotIn('Archive.title', uncovered)
+
+    def test_unknown_names(self):
+        self.index.add('permit(principal, action == Action::"Gone", resource is Ledger);')
+        report = coverage(self.context, self.index)
+        self.assertEqual(report['unknown'], {'actions': ['Gone'], 'entity_types': ['Ledger']})
+        self.assertIn('not in the schema', format_coverage(report))
+
+    def test_empty_index(self):
+        report = coverage(self.context, self.index)
+        self.assertEqual(report['policies'], 0)
+        self.assertEqual(report['actions']['coverage'], 0.0)
+        self.assertEqual(len(report['attributes']['uncovered']), 7)
+
+class TestIncrementalRefresh(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.manager = ApprovalManager(os.path.join(self.tmpdir, 'approvals.json'))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    def approve(self, policy):
+        self.manager.approve_policy({'policy': policy, 'requirement': 'test'})
+
+    def test_reads_only_new_approvals(self):
+        index = ReferenceIndex()
+        self.approve('permit(principal, action == Action::"ViewInvoice", resource);')
+        self.manager.reject_policy({'policy': 'permit(principal, action == Action::"PayInvoice", resource);'}, 'no')
+        self.assertEqual(index.refresh(self.manager.store), 1)
+        self.assertEqual(index.refresh(self.manager.store), 0)
+        # Approving the same text again does not count it twice
+        self.approve('permit(principal, action == Action::"ViewInvoice", resource);')
+        self.approve('permit(principal, action == Action::"PayInvoice", resource); '
+                     'forbid(principal, action == Action::"DeleteArchive", resource);')
+        self.assertEqual(index.refresh(self.manager.store), 2)
+        self.assertEqual(index.version, 4)
+        self.assertEqual(index.actions['ViewInvoice'], 1)
+        report = coverage(bench_data.schema_context(SCHEMA), index)
+        self.assertEqual(report['actions']['uncovered'], ['ReadAll', 'ViewReport'])
+
+    def test_refresh_after_one_approval_is_cheap_on_a_large_set(self):
+        schema = bench_data.make_schema(200)
+        path = os.path.join(self.tmpdir, 'large.json')
+        fill_jsonl(path, bench_data.make_history(schema, 5000))
+        self.manager = ApprovalManager(path)
+        store = self.manager.store
+        index = ReferenceIndex()
+        index.refresh(store)
+        self.approve('permit(principal, action == Action::"ViewAccount", resource);')
+        started = time.perf_counter()
+        self.assertEqual(index.refresh(store), 1)
+        coverage(bench_data.schema_context(schema), index)
+        self.assertLess(time.perf_counter() - started, 0.5)
+
+if __name__ == '__main__':
+    unittest.main()
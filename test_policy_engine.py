@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Tests for the Cedar policy evaluator
+"""
+
+import unittest
+from policy_engine import (Entities, PolicyParseError, PolicySet, make_request, parse_policies,
+                           parse_policy, parse_uid)
+
+ENTITIES = [
+    {'uid': {'type': 'User', 'id': 'alice'}, 'attrs': {'userId': 'alice', 'level': 3, 'tags': ['ops', 'audit']},
+     'parents': [{'type': 'Role', 'id': 'Teller'}]},
+    {'uid': {'type': 'Role', 'id': 'Teller'}, 'parents': [{'type': 'Role', 'id': 'Staff'}]},
+    {'uid': {'type': 'Action', 'id': 'ViewAccount'}, 'parents': [{'type': 'Action', 'id': 'Read'}]},
+    {'uid': {'type': 'Account', 'id': 'a1'}, 'attrs': {'ownerId': 'alice', 'status': 'closed-2024',
+                                                       'owner': {'__entity': {'type': 'User', 'id': 'alice'}}}},
+    {'uid': {'type': 'Transaction', 'id': 't1'}, 'attrs': {'amount': 9000}}
+]
+
+def request(principal, action, resource, context=None, entities=ENTITIES):
+    return make_request({'principal': principal, 'action': action, 'resource': resource,
+                         'context': context or {}}, Entities(entities))
+
+def satisfied(policy, req):
+    return parse_policy(policy).satisfied(req)
+
+class TestParsing(unittest.TestCase):
+    def test_uids(self):
+        self.assertEqual(parse_uid('User::"alice"'), parse_uid({'type': 'User', 'id': 'alice'}))
+        self.assertEqual(str(parse_uid({'__entity': {'type': 'Account', 'id': 'a1'}})), 'Account::"a1"')
+        with self.assertRaises(ValueError):
+            parse_uid('alice')
+
+    def test_annotations_and_ids(self):
+        policies = parse_policies('@id("limit") forbid(principal, action, resource);\npermit(principal, action, resource);')
+        self.assertEqual([p.id for p in policies], ['limit', 'policy1'])
+        self.assertEqual(policies[0].effect, 'forbid')
+
+    def test_rejects_unsupported_text(self):
+        for text in ('allow(principal, action, resource);', 'permit(principal, action, resource',
+                     'permit(principal, action, resource) when { resource.x.frobnicate() };',
+                     'permit(principal, action, resource) when { resource.amount > };'):
+            with self.assertRaises(PolicyParseError):
+                parse_policy(text)
+
+class TestEvaluation(unittest.TestCase):
+    def setUp(self):
+        self.view = request('User::"alice"', 'Action::"ViewAccount"', 'Account::"a1"', {'mfa': True, 'risk': 4})
+        self.create = request('User::"alice"', 'Action::"CreateTransaction"', 'Transaction::"t1"')
+
+    def test_scope(self):
+        self.assertTrue(satisfied('permit(principal in Role::"Staff", action, resource);', self.view))
+        self.assertTrue(satisfied('permit(principal, action in Action::"Read", resource is Account);', self.view))
+        self.assertTrue(satisfied('permit(principal, action in [Action::"X", Action::"ViewAccount"], resource);', self.view))
+        self.assertFalse(satisfied('permit(principal == User::"bob", action, resource);', self.view))
+        self.assertFalse(satisfied('permit(principal, action, resource is Transaction);', self.view))
+
+    def test_conditions(self):
+        for condition, expected in (
+                ('resource.ownerId == principal.userId', True),
+                ('resource.owner == principal && resource.owner in Role::"Teller"', True),
+                ('context.mfa && context.risk < 5 && principal.level * 2 + 1 >= 7', True),
+                ('principal.tags.contains("audit") && principal.tags.containsAny(["x", "ops"])', True),
+                ('resource.status like "closed-*"', True),
+                ('resource has status && !(resource has balance)', True),
+                ('if context has region then false else context["risk"] == 4', True),
+                ('principal is User && resource is Account in Account::"a1"', True),
+                ('{a: 1, b: [1, 2]} == {b: [2, 1], a: 1}', True),
+                ('resource.ownerId != "alice" || principal.level > 5', False)):
+            with self.subTest(condition=condition):
+                self.assertEqual(satisfied(f'permit(principal, action, resource) when {{ {condition} }};',
+                                           self.view), expected)
+        self.assertFalse(satisfied('permit(principal, action, resource) unless { context.mfa };', self.view))
+
+    def test_errors_skip_the_policy(self):
+        policies = PolicySet(parse_policies(
+            'forbid(principal, action, resource) when { resource.missing > 1 };\n'
+            'permit(principal, action, resource) when { resource.amount >= 5000 };'))
+        decision = policies.is_authorized(self.create)
+        self.assertEqual(decision.decision, 'allow')
+        self.assertEqual([policy_id for policy_id, _ in decision.errors], ['policy0'])
+
+    def test_forbid_overrides_permit(self):
+        policies = PolicySet(parse_policies(
+            'permit(principal in Role::"Teller", action, resource);\n'
+            '@id("limit") forbid(principal, action == Action::"CreateTransaction", resource) '
+            'when { resource.amount >= 5000 };'))
+        self.assertEqual(policies.is_authorized(self.create).determining, ['limit'])
+        self.assertTrue(policies.is_authorized(self.view).allowed)
+        nobody = request('User::"bob"', 'Action::"ViewAccount"', 'Account::"a1"')
+        self.assertEqual(policies.is_authorized(nobody).decision, 'deny')
+
+    def test_action_index_and_groups(self):
+        policies = PolicySet(parse_policies(
+            'permit(principal, action == Action::"CreateTransaction", resource);\n'
+            'permit(principal, action in Action::"Read", resource);'))
+        self.assertEqual([p.id for p in policies.candidates(self.view)], ['policy1'])
+        self.assertEqual([p.id for p in policies.candidates(self.create)], ['policy0'])
+        self.assertFalse(policies.may_apply(parse_uid('Action::"Delete"')))
+        self.assertTrue(policies.may_apply(parse_uid('Action::"ViewAccount"'), [parse_uid('Action::"Read"')]))
+
+    def test_request_entities_overlay_shared_ones(self):
+        shared = Entities(ENTITIES)
+        req = make_request({'principal': 'User::"alice"', 'action': 'Action::"ViewAccount"',
+                            'resource': 'Account::"a2"',
+                            'entities': [{'uid': {'type': 'Account', 'id': 'a2'}, 'attrs': {'ownerId': 'alice'}}]},
+                           shared)
+        self.assertTrue(satisfied('permit(principal in Role::"Staff", action, resource) '
+                                  'when { resource.ownerId == principal.userId };', req))
+        self.assertIsNone(shared.attrs(parse_uid('Account::"a2"')))
+
+if __name__ == '__main__':
+    unittest.main()
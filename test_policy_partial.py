@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+Tests for partial evaluation of policy sets
+"""
+
+import random
+import unittest
+from policy_engine import Entities, PolicySet, Request, json_value, parse_policies, parse_policy, parse_uid, render
+from policy_partial import PartialEvaluator
+
+ENTITIES = [
+    {'uid': 'User::"alice"', 'attrs': {'userId': 'alice', 'level': 5, 'roles': ['admin']},
+     'parents': ['Role::"Teller"']},
+    {'uid': 'User::"bob"', 'attrs': {'userId': 'bob', 'level': 1, 'roles': []}},
+    {'uid': 'Action::"ViewAccount"', 'parents': ['Action::"Read"']},
+    {'uid': 'Account::"a1"', 'attrs': {'ownerId': 'alice', 'branch': 'north', 'public': False}},
+    {'uid': 'Account::"a2"', 'attrs': {'ownerId': 'bob', 'branch': 'south', 'public': True}},
+    {'uid': 'Account::"a3"', 'attrs': {}},
+    {'uid': 'Transaction::"t1"', 'attrs': {'amount': 9000}}
+]
+
+POLICIES = '''
+permit(principal in Role::"Teller", action in Action::"Read", resource) when { principal.level > 3 && resource.branch == "north" };
+permit(principal, action == Action::"ViewAccount", resource) when { resource.public || principal.roles.contains("admin") };
+forbid(principal, action, resource is Account) when { context.mfa == false && principal.level >= 5 } unless { resource.ownerId == principal.userId };
+permit(principal == User::"bob", action == Action::"EditAccount", resource) when { if principal.level > 0 then resource.public else principal.missing };
+permit(principal, action, resource) when { principal.missing == 1 };
+permit(principal, action, resource) when { resource.ownerId == principal.userId && 1 > 2 };
+permit(principal, action == Action::"EditAccount", resource is Transaction) when { resource.amount < 100 * principal.level };
+'''
+
+PRINCIPALS = ['User::"alice"', 'User::"bob"']
+ACTIONS = ['Action::"ViewAccount"', 'Action::"EditAccount"', 'Action::"Transfer"']
+RESOURCES = ['Account::"a1"', 'Account::"a2"', 'Account::"a3"', 'Transaction::"t1"']
+
+def full_decision(policies, entities, principal, action, resource, context):
+    return policies.is_authorized(Request(parse_uid(principal), parse_uid(action), parse_uid(resource),
+                                          json_value(context), entities))
+
+class TestPartialEvaluation(unittest.TestCase):
+    def setUp(self):
+        self.entities = Entities(ENTITIES)
+        self.policies = PolicySet(parse_policies(POLICIES))
+        self.evaluator = PartialEvaluator(self.policies, self.entities)
+
+    def conditions(self, residuals):
+        return {p['id']: p['conditions'] for p in residuals.to_dict()['policies']}
+
+    def test_known_parts_are_folded(self):
+        residuals = self.evaluator.residuals('User::"alice"', 'Action::"ViewAccount"', {'mfa': False})
+        conditions = self.conditions(residuals)
+        self.assertEqual(conditions['policy0'], ['when { resource.branch == "north" }'])
+        self.assertEqual(conditions['policy1'], ['when { resource.public || true }'])
+        self.assertEqual(conditions['policy2'], ['unless { resource.ownerId == "alice" }'])
+        self.assertEqual(conditions['policy4'], ['when { error("Attribute missing not found") }'])
+        # The resource side may still fail, so "&& false" is kept rather than dropping the policy
+        self.assertEqual(conditions['policy5'], ['when { resource.ownerId == "alice" && false }'])
+
+    def test_irrelevant_policies_are_dropped(self):
+        residuals = self.evaluator.residuals('User::"bob"', 'Action::"ViewAccount"', {'mfa': True})
+        self.assertEqual(sorted(self.conditions(residuals)), ['policy1', 'policy4', 'policy5'])
+        # resource.public is not known to be a Boolean, so "|| false" still checks that it is
+        self.assertEqual(self.conditions(residuals)['policy1'], ['when { resource.public || false }'])
+        self.assertEqual(residuals.considered, 5)
+
+    def test_unknown_context_stays_residual(self):
+        residuals = self.evaluator.residuals('User::"alice"', 'Action::"Transfer"')
+        self.assertEqual(self.conditions(residuals)['policy2'],
+                         ['when { context.mfa == false }', 'unless { resource.ownerId == "alice" }'])
+        self.assertEqual(residuals.is_authorized('Account::"a2"', {'mfa': False}).determining, ['policy2'])
+        self.assertEqual(residuals.is_authorized('Account::"a1"', {'mfa': False}).determining, [])
+
+    def test_static_decisions(self):
+        evaluator = PartialEvaluator(PolicySet(parse_policies(
+            'permit(principal, action == Action::"Read", resource);'
+            'forbid(principal == User::"bob", action, resource) when { principal.level < 2 };')), self.entities)
+        self.assertEqual(evaluator.residuals('User::"alice"', 'Action::"Read"').decision, 'allow')
+        self.assertEqual(evaluator.residuals('User::"bob"', 'Action::"Read"').decision, 'deny')
+        self.assertEqual(evaluator.residuals('User::"alice"', 'Action::"Write"').decision, 'deny')
+        self.assertEqual(len(evaluator.residuals('User::"alice"', 'Action::"Write"')), 0)
+
+    def test_matches_full_evaluation(self):
+        for principal in PRINCIPALS:
+            for action in ACTIONS:
+                for context in (None, {'mfa': False}, {'mfa': True}):
+                    residuals = self.evaluator.residuals(principal, action, context)
+                    for resource in RESOURCES:
+                        with self.subTest(principal=principal, action=action, context=context, resource=resource):
+                            self.assertEqual(residuals.is_authorized(resource, context or {'mfa': False}),
+                                             full_decision(self.policies, self.entities, principal, action,
+                                                           resource, context or {'mfa': False}))
+
+    def test_matches_full_evaluation_on_random_conditions(self):
+        rng = random.Random(7)
+        operands = ['principal.level', 'resource.amount', 'context.risk', '3', '100 * principal.level',
+                    'resource.amount - 50', 'principal.missing']
+        booleans = ['principal in Role::"Teller"', 'resource has ownerId', 'context.mfa',
+                    'resource.ownerId == principal.userId', 'principal.roles.contains("admin")',
+                    'resource.public', 'true', 'false']
+
+        def condition(depth):
+            choice = rng.random()
+            if depth > 2 or choice < 0.3:
+                return rng.choice(booleans)
+            if choice < 0.5:
+                return f'{rng.choice(operands)} {rng.choice(["<", ">=", "==", "!="])} {rng.choice(operands)}'
+            if choice < 0.6:
+                return f'!({condition(depth + 1)})'
+            if choice < 0.7:
+                return f'if {condition(depth + 1)} then {condition(depth + 1)} else {condition(depth + 1)}'
+            return f'({condition(depth + 1)}) {rng.choice(["&&", "||"])} ({condition(depth + 1)})'
+
+        policies = PolicySet(parse_policies('\n'.join(
+            f'{rng.choice(["permit", "forbid"])}(principal, action, resource) '
+            f'{rng.choice(["when", "unless"])} {{ {condition(0)} }};' for _ in range(60))))
+        evaluator = PartialEvaluator(policies, self.entities)
+        for principal in PRINCIPALS:
+            for context in ({'mfa': True, 'risk': 2}, {'mfa': False, 'risk': 300}, {'risk': 1}):
+                for known in (None, context):
+                    residuals = evaluator.residuals(principal, 'Action::"ViewAccount"', known)
+                    for resource in RESOURCES:
+                        expected = full_decision(policies, self.entities, principal, 'Action::"ViewAccount"',
+                                                 resource, context)
+                        self.assertEqual(residuals.is_authorized(resource, context), expected)
+
+    def test_rendered_residuals_parse_back(self):
+        residuals = self.evaluator.residuals('User::"alice"', 'Action::"EditAccount"', {'mfa': False})
+        for policy in residuals.policies:
+            for condition in policy.conditions:
+                if condition.node.kind != 'error':
+                    text = render(condition.node)
+                    reparsed = parse_policy(f'permit(principal, action, resource) when {{ {text} }};')
+                    self.assertEqual(render(reparsed.conditions[0].node), text)
+
+    def test_request_entities_are_used_for_the_resource(self):
+        residuals = self.evaluator.residuals('User::"bob"', 'Action::"ViewAccount"', {'mfa': True})
+        extra = [{'uid': 'Account::"new"', 'attrs': {'public': True, 'ownerId': 'x'}}]
+        self.assertTrue(residuals.is_authorized('Account::"new"', entities=extra).allowed)
+        self.assertFalse(residuals.is_authorized('Account::"a1"', entities=extra).allowed)
+
+    def test_request_entities_replacing_folded_ones_use_the_full_set(self):
+        evaluator = PartialEvaluator(PolicySet(parse_policies(
+            'permit(principal, action == Action::"ViewAccount", resource) when { principal.level > 3 };'
+            'forbid(principal, action in Action::"Write", resource);')), self.entities)
+        promoted = [{'uid': 'User::"bob"', 'attrs': {'level': 5}}]
+        self.assertFalse(evaluator.is_authorized('User::"bob"', 'Action::"ViewAccount"', 'Account::"a1"').allowed)
+        self.assertTrue(evaluator.is_authorized('User::"bob"', 'Action::"ViewAccount"', 'Account::"a1"',
+                                                entities=promoted).allowed)
+        # Action groups given with the request are honoured too
+        grouped = [{'uid': 'Action::"EditAccount"', 'parents': ['Action::"Write"']}]
+        decision = evaluator.is_authorized('User::"bob"', 'Action::"EditAccount"', 'Account::"a1"', entities=grouped)
+        self.assertEqual((decision.decision, decision.determining), ('deny', ['policy1']))
+        for principal in PRINCIPALS:
+            for action in ('Action::"ViewAccount"', 'Action::"EditAccount"'):
+                for extra in (promoted, grouped, [{'uid': 'Role::"Teller"', 'parents': ['Role::"Other"']}]):
+                    with self.subTest(principal=principal, action=action, extra=extra):
+                        request = Request(parse_uid(principal), parse_uid(action), parse_uid('Account::"a1"'),
+                                          {}, self.entities.merged(extra))
+                        self.assertEqual(evaluator.is_authorized(principal, action, 'Account::"a1"', entities=extra),
+                                         evaluator.policy_set.is_authorized(request))
+
+    def test_cache(self):
+        evaluator = PartialEvaluator(self.policies, self.entities, max_entries=2)
+        first = evaluator.residuals('User::"alice"', 'Action::"ViewAccount"')
+        self.assertIs(evaluator.residuals({'type': 'User', 'id': 'alice'}, 'Action::"ViewAccount"'), first)
+        self.assertIsNot(evaluator.residuals('User::"alice"', 'Action::"ViewAccount"', {'mfa': True}), first)
+        evaluator.residuals('User::"bob"', 'Action::"ViewAccount"')
+        self.assertIsNot(evaluator.residuals('User::"alice"', 'Action::"ViewAccount"'), first)
+        stats = evaluator.get_stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['entries']), (1, 4, 2))
+        self.assertTrue(evaluator.is_authorized('User::"alice"', 'Action::"ViewAccount"', 'Account::"a2"',
+                                                {'mfa': True}).allowed)
+        evaluator.clear()
+        self.assertEqual(evaluator.get_stats()['entries'], 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Tests for schema-driven policy recommendations
+"""
+
+import unittest
+import bench_data
+from policy_generator import PolicyGenerator
+from policy_coverage import ReferenceIndex, coverage
+from policy_recommender import PolicyRecommender
+
+SCHEMA = {
+    'entityTypes': {
+        'User': {'memberOfTypes': ['Team'], 'shape': {'type': 'Record', 'attributes': {
+            'employeeId': {'type': 'String'}}}},
+        'Team': {'memberOfTypes': [], 'shape': {'type': 'Record', 'attributes': {}}},
+        'Invoice': {'memberOfTypes': [], 'shape': {'type': 'Record', 'attributes': {
+            'total': {'type': 'Long'},
+            'createdBy': {'type': 'String'},
+            'currency': {'type': 'String'}}}},
+        'Report': {'memberOfTypes': [], 'shape': {'type': 'Record', 'attributes': {
+            'title': {'type': 'String'}}}}
+    },
+    'actions': {
+        'ViewInvoice': {'appliesTo': {'principalTypes': ['User'], 'resourceTypes': ['Invoice']}},
+        'PayInvoice': {'appliesTo': {'principalTypes': ['User'], 'resourceTypes': ['Invoice']}},
+        'UpdateInvoice': {'appliesTo': {'principalTypes': ['User'], 'resourceTypes': ['Invoice']}},
+        'ViewReport': {'appliesTo': {'principalTypes': ['User'], 'resourceTypes': ['Report']}}
+    }
+}
+
+class TestPolicyRecommender(unittest.TestCase):
+    def setUp(self):
+        self.recommender = PolicyRecommender(bench_data.schema_context(SCHEMA))
+        self.by_id = {rec['id']: rec for rec in self.recommender.generate_recommendations()}
+
+    def test_threshold_rules_cover_write_actions(self):
+        rec = self.by_id['threshold:Invoice:total']
+        self.assertEqual(rec['priority'], 'HIGH')
+        self.assertEqual(rec['actions'], ['UpdateInvoice'])
+        self.assertIn('resource.total >= 7500',
+                      self.recommender.customize_recommendation(rec['id'], {'threshold': 7500}))
+
+    def test_ownership_rules_use_the_principal_id(self):
+        rec = self.by_id['ownership:Invoice:createdBy']
+        self.assertEqual(rec['actions'], ['ViewInvoice', 'PayInvoice', 'UpdateInvoice'])
+        self.assertIn('resource.createdBy == principal.employeeId', rec['template'])
+        self.assertNotIn('ownership:Invoice:currency', self.by_id)
+
+    def test_separation_needs_read_and_write_actions(self):
+        self.assertEqual(self.by_id['separation:Invoice']['actions'], ['UpdateInvoice'])
+        self.assertNotIn('separation:Report', self.by_id)
+
+    def test_role_rules_from_member_of(self):
+        rec = self.by_id['role:User:Team']
+        self.assertIn('principal in Team::"{group}"', rec['template'])
+        self.assertEqual(len(rec['actions']), 4)
+
+    def test_sorted_by_priority_with_unique_ids(self):
+        recs = self.recommender.generate_recommendations()
+        order = {'HIGH': 0, 'MEDIUM': 1, 'LOW': 2}
+        self.assertEqual([order[r['priority']] for r in recs], sorted(order[r['priority']] for r in recs))
+        self.assertEqual(len(recs), len(self.by_id))
+
+    def test_banking_patterns_are_kept(self):
+        generator = PolicyGenerator('sample_banking_schema.json')
+        recs = generator.get_recommendations()
+        ids = [rec['id'] for rec in recs]
+        self.assertEqual(ids[0], 'high_value_tx')
+        self.assertIn('account_access', ids)
+        self.assertIn('manager_override', ids)
+        # Covered by high_value_tx, so the generic rule only adds ApproveTransaction
+        self.assertEqual(generator.recommender.get_recommendation('threshold:Transaction:amount')['actions'],
+                         ['ApproveTransaction'])
+        self.assertIn('10000', generator.recommender.customize_recommendation('high_value_tx', {'threshold': 10000}))
+        self.assertIsNone(generator.recommender.customize_recommendation('missing', {}))
+
+    def test_names_only_context(self):
+        recommender = PolicyRecommender({
+            'entities': ['User', 'Account', 'Transaction'],
+            'actions': ['CreateTransaction', 'ViewAccount', 'ModifyAccount']
+        })
+        ids = [rec['id'] for rec in recommender.generate_recommendations()]
+        self.assertEqual(ids, ['high_value_tx', 'account_access', 'manager_override'])
+
+    def test_coverage_recommendations(self):
+        index = ReferenceIndex()
+        index.add('forbid(principal, action == Action::"UpdateInvoice", resource) when { resource.total > 10 };')
+        recs = self.recommender.coverage_recommendations(coverage(bench_data.schema_context(SCHEMA), index))
+        by_id = {rec['id']: rec for rec in recs}
+        # The threshold rule's only action and attribute are already governed
+        self.assertNotIn('threshold:Invoice:total', by_id)
+        self.assertEqual(by_id['ownership:Invoice:createdBy']['covers'],
+                         ['ViewInvoice', 'PayInvoice', 'Invoice.createdBy'])
+        self.assertEqual(by_id['role:User:Team']['covers'], ['ViewInvoice', 'PayInvoice', 'ViewReport'])
+        self.assertNotIn('coverage:ViewReport', by_id)
+        self.assertNotIn('covers', self.by_id['ownership:Invoice:createdBy'])
+
+        # Without the role rule nothing touches ViewReport, so it gets a candidate of its own
+        schema = dict(SCHEMA, entityTypes=dict(SCHEMA['entityTypes'], User={'memberOfTypes': []}))
+        context = bench_data.schema_context(schema)
+        recs = PolicyRecommender(context).coverage_recommendations(coverage(context, index))
+        candidate = next(rec for rec in recs if rec['id'] == 'coverage:ViewReport')
+        self.assertEqual(candidate['covers'], ['ViewReport'])
+        self.assertIn('action == Action::"ViewReport", resource is Report', candidate['template'])
+
+    def test_cached_by_fingerprint(self):
+        context = bench_data.schema_context(bench_data.make_schema(2000))
+        first = PolicyRecommender(context, fingerprint='bench-2000')
+        recs = first.generate_recommendations()
+        self.assertEqual(len({rec['id'] for rec in recs}), len(recs))
+
+        # A new recommender for the same schema reuses the compiled rules
+        second = PolicyRecommender({}, fingerprint='bench-2000')
+        self.assertIs(second.get_recommendation(recs[-1]['id']), recs[-1])
+        self.assertEqual(len(second.generate_recommendations()), len(recs))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Tests for full-text and faceted policy search
+"""
+
+import unittest
+import os
+import tempfile
+from approval_manager import ApprovalManager
+from history_manager import HistoryManager
+from policy_search import PolicySearchIndex, tokenize
+
+HIGH_VALUE = 'forbid (principal, action == Action::"CreateTransaction", resource) when { resource.amount >= 5000 };'
+VIEW_OWN = 'permit (principal == User::"Alice", action == Action::"ViewAccount", resource) when { resource.ownerId == principal.userId };'
+
+class TestPolicySearch(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.approvals = ApprovalManager(os.path.join(self.tmpdir.name, 'approvals.json'), fsync='never')
+        self.history = HistoryManager(os.path.join(self.tmpdir.name, 'history.json'), fsync='never')
+        self.approvals.approve_with_history(
+            {'requirement': 'Block large transactions', 'policy': HIGH_VALUE,
+             'rationale': ['• Reduces fraud risk']}, self.history)
+        self.approvals.reject_policy(
+            {'requirement': 'Owners can view their accounts', 'policy': VIEW_OWN,
+             'rationale': ['• Least privilege']}, 'wrong principal')
+        self.index = PolicySearchIndex({'history': self.history.store, 'approvals': self.approvals.store})
+    
+    def tearDown(self):
+        self.tmpdir.cleanup()
+    
+    def test_tokenize_splits_identifiers(self):
+        self.assertEqual(tokenize('CreateTransaction'), ['createtransaction', 'create', 'transaction'])
+    
+    def test_ranked_text_query(self):
+        found = self.index.search('fraud transaction')
+        self.assertEqual(found['total'], 2)
+        self.assertEqual({r['source'] for r in found['results']}, {'history', 'approvals'})
+        self.assertTrue(all(r['actions'] == ['CreateTransaction'] for r in found['results']))
+    
+    def test_facet_filters(self):
+        found = self.index.search(status='REJECTED')
+        self.assertEqual([r['requirement'] for r in found['results']], ['Owners can view their accounts'])
+        
+        found = self.index.search('account', entity_type='User', source='approvals')
+        self.assertEqual(found['total'], 1)
+        self.assertEqual(found['facets']['action'], {'ViewAccount': 1})
+        
+        self.assertEqual(self.index.search(action='ViewAccount', since='2999-01-01')['total'], 0)
+    
+    def test_picks_up_new_records(self):
+        self.history.save_policy('Managers approve transfers', 'permit (principal, action == Action::"ApproveTransaction", resource);', [])
+        found = self.index.search('managers')
+        self.assertEqual(found['total'], 1)
+        self.assertEqual(found['results'][0]['id'], 1)
+        self.assertEqual(self.index.search()['facets']['source'], {'history': 2, 'approvals': 2})
+    
+    def test_records_arriving_out_of_timestamp_order(self):
+        # Another worker took its timestamp first but committed last
+        entry = self.history.new_entry('Auditors read ledgers', 'permit (principal, action, resource);', [])
+        entry['timestamp'] = '2000-01-01T00:00:00'
+        self.history.store.append(entry)
+        self.assertEqual(self.index.search(until='2000-12-31')['total'], 1)
+        self.assertEqual(self.index.search('auditors', until='2000-12-31')['total'], 1)
+        self.assertEqual(self.index.search(since='2001-01-01')['total'], 3)
+        self.assertEqual(self.index.search('ledgers', since='2001-01-01')['total'], 0)
+        newest = self.index.search(limit=5)['results']
+        self.assertEqual(newest[-1]['requirement'], 'Auditors read ledgers')
+        self.assertEqual(self.index.search(source='history', limit=1)['results'][0]['requirement'],
+                         'Block large transactions')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Tests for replaying authorization logs against candidate policies
+"""
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+import policy_simulator
+from policy_simulator import read_range, shard_ranges, simulate
+
+APPROVED = [
+    'permit(principal in Role::"Teller", action in [Action::"CreateTransaction", Action::"ViewAccount"], resource);',
+    'forbid(principal, action == Action::"DeleteAccount", resource);'
+]
+LIMIT = 'forbid(principal, action == Action::"CreateTransaction", resource) when { resource.amount >= 5000 };'
+MANAGERS = 'permit(principal in Role::"Manager", action == Action::"ApproveTransaction", resource);'
+
+def log_line(i):
+    action = ['CreateTransaction', 'ViewAccount', 'ApproveTransaction'][i % 3]
+    resource = {'type': 'Transaction', 'id': f't{i}'}
+    return json.dumps({
+        'principal': {'type': 'User', 'id': 'teller' if i % 2 else 'manager'},
+        'action': {'type': 'Action', 'id': action},
+        'resource': resource,
+        'entities': [{'uid': resource, 'attrs': {'amount': i * 100}}]
+    })
+
+class TestSimulator(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.log = os.path.join(self.tmp, 'authz.jsonl')
+        with open(self.log, 'w') as f:
+            for i in range(300):
+                f.write(log_line(i) + '\n')
+            f.write('not json\n\n')
+        self.entities = os.path.join(self.tmp, 'entities.json')
+        with open(self.entities, 'w') as f:
+            json.dump([{'uid': {'type': 'User', 'id': 'teller'}, 'parents': [{'type': 'Role', 'id': 'Teller'}]},
+                       {'uid': {'type': 'User', 'id': 'manager'}, 'parents': [{'type': 'Role', 'id': 'Manager'}]}], f)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def expected_limit_flips(self):
+        # Teller (odd i) CreateTransaction (i % 3 == 0) with amount >= 5000 goes from allow to deny
+        return sum(1 for i in range(300) if i % 2 and i % 3 == 0 and i * 100 >= 5000)
+
+    def test_forbid_flips_allowed_requests(self):
+        report = simulate(self.log, APPROVED, LIMIT, self.entities, workers=1)
+        self.assertEqual(report['requests'], 300)
+        self.assertEqual(report['invalid_lines'], 1)
+        self.assertEqual(report['flips'], {'allow_to_deny': self.expected_limit_flips(), 'deny_to_allow': 0})
+        self.assertEqual(list(report['by_action']), ['CreateTransaction'])
+        sample = report['samples']['allow_to_deny'][0]
+        self.assertEqual((sample['before'], sample['after'], sample['candidate_determining']),
+                         ('allow', 'deny', ['candidate0']))
+        with open(self.log, 'rb') as f:
+            f.seek(sample['offset'])
+            self.assertEqual(json.loads(f.readline())['resource']['id'], sample['resource'].split('"')[1])
+
+    def test_permit_only_flips_default_denies(self):
+        report = simulate(self.log, APPROVED, MANAGERS, self.entities, workers=1, samples=2)
+        self.assertEqual(report['flips']['deny_to_allow'], len([i for i in range(300) if i % 3 == 2 and i % 2 == 0]))
+        self.assertEqual(len(report['samples']['deny_to_allow']), 2)
+
+        # An approved forbid still wins over the candidate permit
+        report = simulate(self.log, APPROVED + ['forbid(principal, action, resource);'], MANAGERS,
+                          self.entities, workers=1)
+        self.assertEqual(report['changed'], 0)
+        self.assertGreater(report['candidate_matched'], 0)
+
+    def test_worker_processes_match_in_process_run(self):
+        with mock.patch.object(policy_simulator, 'MIN_SHARD_BYTES', 1024):
+            report = simulate(self.log, APPROVED, LIMIT, self.entities, workers=2, samples=3)
+        self.assertEqual(report['requests'], 300)
+        self.assertEqual(report['changed'], self.expected_limit_flips())
+        offsets = [sample['offset'] for sample in report['samples']['allow_to_deny']]
+        self.assertEqual(offsets, sorted(offsets))
+        self.assertEqual(len(offsets), 3)
+
+    def test_max_lines(self):
+        report = simulate(self.log, APPROVED, LIMIT, self.entities, workers=1, max_lines=50)
+        self.assertEqual(report['requests'], 50)
+
+    def test_unparseable_candidate(self):
+        with self.assertRaises(ValueError):
+            simulate(self.log, APPROVED, 'allow everything', workers=1)
+
+    def test_ranges_cover_every_line_once(self):
+        size = os.path.getsize(self.log)
+        for shards in (1, 3, 7, 50):
+            lines = [line for start, end in shard_ranges(size, shards) for _, line in read_range(self.log, start, end)]
+            with open(self.log, 'rb') as f:
+                self.assertEqual(lines, f.readlines())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+Tests for the JSON Lines and SQLite policy store backends
+"""
+
+import unittest
+import json
+import multiprocessing
+import os
+import tempfile
+import threading
+from unittest import mock
+from approval_manager import ApprovalManager
+from history_manager import HistoryManager
+
+class StoreBackendTests:
+    backend = None
+    
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.approval_file = os.path.join(self.tmpdir.name, 'approvals.json')
+        self.history_file = os.path.join(self.tmpdir.name, 'history.json')
+        self.db_path = os.path.join(self.tmpdir.name, 'store.db')
+    
+    def tearDown(self):
+        self.tmpdir.cleanup()
+    
+    def approvals(self):
+        return ApprovalManager(self.approval_file, fsync='never', backend=self.backend, db_path=self.db_path)
+    
+    def history(self):
+        return HistoryManager(self.history_file, fsync='never', backend=self.backend, db_path=self.db_path)
+    
+    def test_ids_and_stats(self):
+        manager = self.approvals()
+        policy = {'policy': 'permit (principal, action, resource);'}
+        self.assertEqual(manager.approve_policy(policy), 0)
+        self.assertEqual(manager.reject_policy(policy, 'too broad'), 1)
+        self.assertEqual(manager.approve_policy(policy), 2)
+        
+        stats = manager.get_approval_stats()
+        self.assertEqual(stats['total_policies'], 3)
+        self.assertEqual(stats['approved'], 2)
+        self.assertEqual(stats['rejected'], 1)
+        self.assertEqual(manager.get_rejection_feedback(), ['too broad'])
+        self.assertEqual(self.approvals().get_approval_stats(), stats)
+    
+    def test_pagination(self):
+        history = self.history()
+        for i in range(25):
+            history.save_policy(f'requirement {i}', 'permit (principal, action, resource);', [])
+        
+        seen = []
+        cursor = None
+        while True:
+            page, cursor = history.query_history(cursor=cursor, limit=10)
+            seen.extend(entry['requirement'] for entry in page)
+            if cursor is None:
+                break
+        self.assertEqual(seen, [f'requirement {i}' for i in range(25)])
+        self.assertEqual(history.get_policy(3)['requirement'], 'requirement 3')
+        self.assertIsNone(history.get_policy(25))
+    
+    def test_filters(self):
+        manager = self.approvals()
+        policy = {'policy': 'permit (principal, action, resource);'}
+        for i in range(10):
+            if i % 3 == 0:
+                manager.reject_policy(policy, f'reason {i}')
+            else:
+                manager.approve_policy(policy)
+        
+        rejected, cursor = manager.get_approvals(status='REJECTED', limit=2)
+        self.assertEqual([a['id'] for a in rejected], [0, 3])
+        rejected, cursor = manager.get_approvals(status='REJECTED', cursor=cursor, limit=2)
+        self.assertEqual([a['id'] for a in rejected], [6, 9])
+        
+        since = manager.store.get(7)['timestamp']
+        recent, _ = manager.get_approvals(since=since)
+        self.assertEqual(recent[0]['id'], min(a['id'] for a in manager.approvals if a['timestamp'] >= since))
+
+    def test_since_with_timestamps_out_of_id_order(self):
+        # Writers in other processes can commit an earlier timestamp after a later one
+        store = self.approvals().store
+        for day in (3, 1, 4, 2):
+            store.append({'timestamp': f'2024-01-0{day}T00:00:00', 'status': 'APPROVED', 'policy': str(day)})
+        since = '2024-01-02T00:00:00'
+        page, _ = store.query(since=since)
+        self.assertEqual([r['id'] for r in page], [0, 2, 3])
+        page, cursor = store.query(status='APPROVED', since=since, limit=2)
+        self.assertEqual(([r['id'] for r in page], cursor), ([0, 2], 2))
+        page, cursor = store.query(status='APPROVED', since=since, cursor=cursor, limit=2)
+        self.assertEqual(([r['id'] for r in page], cursor), ([3], None))
+        self.assertEqual(store.last_timestamp(), '2024-01-04T00:00:00')
+    
+    def test_concurrent_threads_get_unique_ids(self):
+        manager = self.approvals()
+        ids = []
+        
+        def approve():
+            for _ in range(20):
+                ids.append(manager.approve_policy({'policy': 'permit (principal, action, resource);'}))
+        
+        threads = [threading.Thread(target=approve) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        
+        self.assertEqual(sorted(ids), list(range(160)))
+        self.assertEqual(self.approvals().get_approval_stats()['approved'], 160)
+    
+    def test_concurrent_processes_get_unique_ids(self):
+        self.approvals()
+        ctx = multiprocessing.get_context('fork')
+        queue = ctx.Queue()
+        workers = [ctx.Process(target=_approve_in_process, args=(self, queue)) for _ in range(4)]
+        for w in workers:
+            w.start()
+        ids = [queue.get(timeout=30) for _ in range(4 * 25)]
+        for w in workers:
+            w.join()
+        
+        self.assertEqual(sorted(ids), list(range(100)))
+        records = self.approvals().approvals
+        self.assertEqual([r['id'] for r in records], list(range(100)))
+    
+    def test_approve_with_history(self):
+        manager = self.approvals()
+        history = self.history()
+        history.save_policy('earlier', '', [])
+        
+        approval_id, history_id = manager.approve_with_history(
+            {'requirement': 'req', 'policy': 'permit (principal, action, resource);'}, history, 'ok')
+        self.assertEqual((approval_id, history_id), (0, 1))
+        self.assertEqual(self.history().get_policy(1)['requirement'], 'req')
+        self.assertEqual(self.approvals().store.get(0)['user_feedback'], 'ok')
+
+class TestJsonlBackendWrites(unittest.TestCase):
+    def test_approval_and_history_are_written_before_either_is_synced(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            manager = ApprovalManager(os.path.join(tmpdir, 'approvals.json'), fsync='always', backend='jsonl')
+            history = HistoryManager(os.path.join(tmpdir, 'history.json'), fsync='always', backend='jsonl')
+            events = []
+            real_write = manager.store.log.write_batch.__func__
+
+            def write_batch(log, records, sync=True):
+                events.append(('write', os.path.basename(log.path)))
+                return real_write(log, records, sync)
+            with mock.patch('jsonl_store.JsonlStore.write_batch', write_batch), \
+                    mock.patch('os.fsync', side_effect=lambda fd: events.append(('fsync', fd))):
+                approval_id, history_id = manager.approve_with_history(
+                    {'requirement': 'req', 'policy': 'permit (principal, action, resource);'}, history)
+            self.assertEqual((approval_id, history_id), (0, 0))
+            self.assertEqual([kind for kind, _ in events], ['write', 'write', 'fsync', 'fsync'])
+            self.assertEqual(history.get_policy(0)['requirement'], 'req')
+
+def _approve_in_process(test, queue):
+    manager = test.approvals()
+    for _ in range(25):
+        queue.put(manager.approve_policy({'policy': 'permit (principal, action, resource);'}))
+
+class TestJsonlBackend(StoreBackendTests, unittest.TestCase):
+    backend = 'jsonl'
+
+class TestSqliteBackend(StoreBackendTests, unittest.TestCase):
+    backend = 'sqlite'
+    
+    def test_imports_existing_json_store(self):
+        with open(self.approval_file, 'w') as f:
+            json.dump([{'id': 0, 'timestamp': '2024-01-01T00:00:00', 'status': 'APPROVED', 'policy': ''}], f)
+        
+        manager = self.approvals()
+        self.assertEqual(manager.get_approval_stats()['approved'], 1)
+        self.assertEqual(manager.approve_policy({'policy': ''}), 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Tests for admission control and fair queuing
+"""
+
+import os
+import subprocess
+import sys
+import unittest
+from scheduler import FairScheduler, QueueFullError, RateLimitedError, TokenBucket
+
+class TestTokenBucket(unittest.TestCase):
+    def test_burst_then_refill(self):
+        bucket = TokenBucket(rate=2, capacity=3)
+        now = bucket.updated
+        self.assertEqual([bucket.take(now) for _ in range(3)], [0, 0, 0])
+        self.assertAlmostEqual(bucket.take(now), 0.5)
+        self.assertEqual(bucket.take(now + 0.5), 0)
+
+class TestFairScheduler(unittest.TestCase):
+    def setUp(self):
+        self.granted = []
+
+    def grant(self, ticket):
+        self.granted.append(ticket)
+
+    def test_round_robin_across_sessions(self):
+        scheduler = FairScheduler(max_concurrent=1, max_queue=10, session_rate=0, global_rate=0)
+        scheduler.submit('heavy', self.grant)
+        for _ in range(3):
+            scheduler.submit('heavy', self.grant)
+        scheduler.submit('light', self.grant)
+
+        order = []
+        while self.granted:
+            ticket = self.granted.pop(0)
+            order.append(ticket.key)
+            scheduler.release(ticket)
+        # The light session is served right after the request in flight
+        self.assertEqual(order, ['heavy', 'light', 'heavy', 'heavy', 'heavy'])
+
+    def test_queue_limits(self):
+        scheduler = FairScheduler(max_concurrent=1, max_queue=3, max_queue_per_key=2,
+                                  session_rate=0, global_rate=0)
+        scheduler.submit('a', self.grant)
+        scheduler.submit('a', self.grant)
+        scheduler.submit('a', self.grant)
+        with self.assertRaises(QueueFullError) as caught:
+            scheduler.submit('a', self.grant)
+        self.assertGreaterEqual(caught.exception.retry_after, 1)
+
+        scheduler.submit('b', self.grant)
+        with self.assertRaises(QueueFullError):
+            scheduler.submit('c', self.grant)
+        stats = scheduler.get_stats()
+        self.assertEqual(stats['queue_depth'], 3)
+        self.assertEqual(stats['queue_full'], 2)
+
+    def test_session_rate_limit(self):
+        scheduler = FairScheduler(max_concurrent=10, session_rate=1, session_burst=2, global_rate=0)
+        scheduler.submit('a', self.grant)
+        scheduler.submit('a', self.grant)
+        with self.assertRaises(RateLimitedError) as caught:
+            scheduler.submit('a', self.grant)
+        self.assertGreater(caught.exception.retry_after, 0)
+        # Other sessions have their own bucket
+        scheduler.submit('b', self.grant)
+        self.assertEqual(scheduler.get_stats()['rate_limited'], 1)
+
+    def test_global_rate_limit_refunds_session(self):
+        scheduler = FairScheduler(max_concurrent=10, session_rate=1, session_burst=1,
+                                  global_rate=1, global_burst=1)
+        scheduler.submit('a', self.grant)
+        with self.assertRaises(RateLimitedError):
+            scheduler.submit('b', self.grant)
+        self.assertEqual(scheduler._buckets['b'].tokens, 1)
+
+    def test_slot_times_out(self):
+        scheduler = FairScheduler(max_concurrent=1, session_rate=0, global_rate=0)
+        scheduler.submit('a', self.grant)
+        with self.assertRaises(QueueFullError):
+            with scheduler.slot('b', timeout=0.01):
+                pass
+        stats = scheduler.get_stats()
+        self.assertEqual(stats['timed_out'], 1)
+        self.assertEqual(stats['queue_depth'], 0)
+
+        scheduler.release(self.granted.pop())
+        with scheduler.slot('b'):
+            self.assertEqual(scheduler.get_stats()['in_flight'], 1)
+        self.assertEqual(scheduler.get_stats()['in_flight'], 0)
+
+    def test_global_rate_is_shared_across_worker_processes(self):
+        env = dict(os.environ, WEB_CONCURRENCY='4', SCHEDULER_GLOBAL_RATE='8', SCHEDULER_GLOBAL_BURST='20')
+        out = subprocess.run(
+            [sys.executable, '-c', 'from scheduler import FairScheduler; b = FairScheduler().global_bucket; '
+                                   'print(b.rate, b.capacity)'],
+            env=env, capture_output=True, text=True, check=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+        self.assertEqual(out.stdout.split(), ['2.0', '5.0'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+"""
+Startup benchmarks: entry points must import quickly and without boto3
+"""
+
+import os
+import subprocess
+import sys
+import unittest
+
+# Generous multiple of the measured import time, so only real regressions fail
+BUDGET_MS = float(os.environ.get('STARTUP_BUDGET_MS', 300))
+
+def import_profile(module, check='pass'):
+    """Import module in a fresh interpreter; returns (import ms, stdout lines)"""
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import sys, {module}; {check}'],
+        capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)), check=True
+    )
+    for line in result.stderr.splitlines():
+        parts = [part.strip() for part in line.split('|')]
+        if len(parts) == 3 and parts[2] == module:
+            return int(parts[1]) / 1000, result.stdout.split()
+    raise AssertionError(f'{module} not found in import profile')
+
+class TestStartup(unittest.TestCase):
+    def test_cli_entry_points_are_fast(self):
+        for module in ('policy_helper', 'history_viewer'):
+            elapsed, _ = import_profile(module)
+            self.assertLess(elapsed, BUDGET_MS, f'{module} took {elapsed:.0f}ms to import')
+
+    def test_model_sdk_is_imported_lazily(self):
+        for module in ('policy_helper', 'history_viewer', 'policy_generator', 'web_app'):
+            _, output = import_profile(module, "print('boto3' in sys.modules, 'botocore' in sys.modules)")
+            self.assertEqual(output, ['False', 'False'], f'{module} imports boto3 at load time')
+
+    def test_web_app_defers_schema_and_stores(self):
+        _, output = import_profile('web_app', 'print(len(web_app._state))')
+        self.assertEqual(output, ['0'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Tests for request tracing and the sampling profiler
+"""
+
+import os
+import tempfile
+import threading
+import time
+import unittest
+from metrics import Registry
+from tracing import SamplingProfiler, end_trace, span, start_trace, trace
+
+class TestTracing(unittest.TestCase):
+    def test_spans_feed_trace_and_histogram(self):
+        latency = Registry().histogram('stage_seconds', 'Latency', ('stage',))
+        current = start_trace('generate')
+        with span('model', latency, stage='model'):
+            pass
+        with span('persist'):
+            pass
+        with span('persist'):
+            pass
+        self.assertIs(end_trace(), current)
+
+        timings = current.timings()
+        self.assertEqual(list(timings), ['model', 'persist', 'total'])
+        self.assertEqual(latency.count(stage='model'), 1)
+        self.assertTrue(current.server_timing().startswith('model;dur='))
+
+    def test_spans_without_trace_are_ignored(self):
+        with span('model'):
+            pass
+        self.assertIsNone(end_trace())
+
+    def test_nested_trace_restores_outer(self):
+        outer = start_trace('request')
+        with trace('job') as inner:
+            with span('model'):
+                pass
+        with span('persist'):
+            pass
+        end_trace()
+        self.assertEqual([name for name, _ in inner.spans], ['model'])
+        self.assertEqual([name for name, _ in outer.spans], ['persist'])
+
+class TestSamplingProfiler(unittest.TestCase):
+    def test_profiled_thread_is_sampled(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            output = os.path.join(tmp, 'profile.collapsed')
+            profiler = SamplingProfiler(output=output, interval=0.001)
+
+            def busy_work():
+                deadline = time.time() + 0.05
+                while time.time() < deadline:
+                    pass
+
+            # Not enabled: nothing is selected
+            with profiler.profile() as selected:
+                self.assertFalse(selected)
+
+            with profiler.profile(force=True) as selected:
+                self.assertTrue(selected)
+                busy_work()
+            profiler.configure(False)
+
+            with open(output) as f:
+                lines = f.read().splitlines()
+            self.assertTrue(any('busy_work' in line for line in lines))
+            stack, count = lines[0].rsplit(' ', 1)
+            self.assertGreater(int(count), 0)
+            self.assertEqual(profiler.get_stats()['profiled_requests'], 1)
+
+    def test_only_selected_threads_are_sampled(self):
+        profiler = SamplingProfiler(output=os.devnull)
+        stop = threading.Event()
+        other = threading.Thread(target=stop.wait, args=(5,))
+        other.start()
+        profiler.select(force=True)
+        profiler.sample_once()
+        profiler._threads.clear()
+        profiler.configure(False)
+        stop.set()
+        other.join()
+        self.assertEqual(profiler.samples, 1)
+
+    def test_forked_workers_write_their_own_profile(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            profiler = SamplingProfiler(output=os.path.join(tmp, 'profile-{pid}.collapsed'))
+            pid = os.fork()
+            if pid == 0:
+                profiler.flush()
+                os._exit(0)
+            os.waitpid(pid, 0)
+            profiler.flush()
+            self.assertEqual(sorted(os.listdir(tmp)),
+                             sorted([f'profile-{pid}.collapsed', f'profile-{os.getpid()}.collapsed']))
+
+if __name__ == '__main__':
+    unittest.main()
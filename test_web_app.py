@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+"""
+Route tests for the web app through Flask's test client
+"""
+
+import gzip
+import json
+import os
+import tempfile
+import unittest
+import web_app
+from unittest import mock
+from approval_manager import ApprovalManager
+from history_manager import HistoryManager
+from http_cache import GZIP_MIN_BYTES
+from policy_bundle import PolicyBundle
+from policy_generator import PolicyGenerator
+
+SCHEMA = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sample_banking_schema.json')
+VIEW_OWN = 'permit (principal, action == Action::"ViewAccount", resource) when { resource.ownerId == principal.userId };'
+
+class WebAppTestCase(unittest.TestCase):
+    """Serves the app from stores in a temporary directory"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.approvals = ApprovalManager(os.path.join(self.tmpdir.name, 'approvals.json'), fsync='never')
+        self.history = HistoryManager(os.path.join(self.tmpdir.name, 'history.json'), fsync='never')
+        web_app._state.clear()
+        web_app._state.update(approvals=self.approvals, history=self.history, generator=PolicyGenerator(SCHEMA))
+        web_app.payload_cache.clear()
+        self.client = web_app.app.test_client()
+
+    def tearDown(self):
+        web_app._state.clear()
+        web_app.payload_cache.clear()
+        self.tmpdir.cleanup()
+
+    def approve(self, policy, requirement='test'):
+        return self.approvals.approve_with_history({'policy': policy, 'requirement': requirement}, self.history)
+
+class TestConditionalGet(WebAppTestCase):
+    def test_if_none_match(self):
+        first = self.client.get('/stats')
+        self.assertEqual(first.status_code, 200)
+        etag = first.headers['ETag']
+        again = self.client.get('/stats', headers={'If-None-Match': etag})
+        self.assertEqual(again.status_code, 304)
+        self.assertEqual(again.data, b'')
+        self.assertEqual(again.headers['ETag'], etag)
+        # A write in any worker changes the store version and so the ETag
+        self.approve(VIEW_OWN)
+        changed = self.client.get('/stats', headers={'If-None-Match': etag})
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed.headers['ETag'], etag)
+        self.assertEqual(changed.get_json()['approved'], 1)
+
+    def test_if_modified_since(self):
+        self.approve(VIEW_OWN)
+        first = self.client.get('/history')
+        again = self.client.get('/history', headers={'If-Modified-Since': first.headers['Last-Modified']})
+        self.assertEqual(again.status_code, 304)
+
+class TestCompression(WebAppTestCase):
+    def test_gzip_negotiation(self):
+        plain = self.client.get('/recommendations')
+        self.assertGreaterEqual(len(plain.data), GZIP_MIN_BYTES)
+        self.assertNotIn('Content-Encoding', plain.headers)
+        self.assertIn('Accept-Encoding', plain.headers['Vary'])
+
+        packed = self.client.get('/recommendations', headers={'Accept-Encoding': 'gzip, br'})
+        self.assertEqual(packed.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(json.loads(gzip.decompress(packed.data)), plain.get_json())
+
+        refused = self.client.get('/recommendations', headers={'Accept-Encoding': 'gzip;q=0'})
+        self.assertNotIn('Content-Encoding', refused.headers)
+
+    def test_small_bodies_are_not_compressed(self):
+        response = self.client.get('/stats', headers={'Accept-Encoding': 'gzip'})
+        self.assertLess(len(response.data), GZIP_MIN_BYTES)
+        self.assertNotIn('Content-Encoding', response.headers)
+
+class TestLatencyBudget(WebAppTestCase):
+    def test_invalid_budgets_are_rejected(self):
+        for value in ('fast', -5, True, 'nan'):
+            with self.subTest(value=value):
+                response = self.client.post('/generate', json={'requirement': 'x', 'latency_budget_ms': value})
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('latency_budget_ms', response.get_json()['error'])
+
+class TestBundle(WebAppTestCase):
+    def test_incremental_bundles_and_revalidation(self):
+        self.approve(VIEW_OWN)
+        full = self.client.get('/bundle?format=cedar')
+        self.assertEqual(full.status_code, 200)
+        self.assertIn('@id("approval-0")', full.get_data(as_text=True))
+        self.assertEqual(self.client.get('/bundle?format=cedar',
+                                         headers={'If-None-Match': full.headers['ETag']}).status_code, 304)
+
+        self.approve('forbid (principal, action, resource) when { resource.frozen };')
+        # Approving a policy again does not make it new
+        self.approve(VIEW_OWN)
+        delta = self.client.get('/bundle?format=cedar&since=1').get_data(as_text=True)
+        self.assertIn('@id("approval-1")', delta)
+        self.assertNotIn('approval-0', delta)
+        self.assertNotIn('approval-2', delta)
+        # Bundle bodies are not memoized
+        self.assertEqual(len(web_app.payload_cache._entries), 0)
+
+    def test_binary_bundle(self):
+        self.approve(VIEW_OWN)
+        path = os.path.join(self.tmpdir.name, 'approved.bundle')
+        with open(path, 'wb') as f:
+            f.write(self.client.get('/bundle').data)
+        with PolicyBundle.open(path) as bundle:
+            self.assertEqual(bundle.version, 1)
+            self.assertEqual(len(bundle.policies(action='ViewAccount')), 1)
+
+    def test_invalid_arguments(self):
+        for query in ('since=abc', 'since=-1', 'since=1.5', 'format=yaml'):
+            with self.subTest(query=query):
+                response = self.client.get(f'/bundle?{query}')
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('error', response.get_json())
+
+PERMIT_VIEW = 'permit (principal, action == Action::"ViewAccount", resource);'
+FORBID_VIEW = 'forbid (principal, action == Action::"ViewAccount", resource);'
+
+class TestSimulation(WebAppTestCase):
+    def setUp(self):
+        super().setUp()
+        self.log = os.path.join(self.tmpdir.name, 'authz.jsonl')
+        with open(self.log, 'w') as f:
+            for user in ('alice', 'bob', 'carol'):
+                f.write(json.dumps({'principal': {'type': 'User', 'id': user},
+                                    'action': {'type': 'Action', 'id': 'ViewAccount'},
+                                    'resource': {'type': 'Account', 'id': 'a1'}}) + '\n')
+        patcher = mock.patch.object(web_app, 'SIMULATION_LOG', self.log)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.approve(PERMIT_VIEW)
+
+    def job_result(self, response):
+        self.assertEqual(response.status_code, 202)
+        job = web_app.job_manager.get(response.get_json()['job_id'])
+        self.assertTrue(job.done.wait(10))
+        status = self.client.get(response.get_json()['status_url']).get_json()
+        self.assertEqual(status['status'], 'succeeded', status.get('error'))
+        return status['result']
+
+    def test_simulate_runs_as_a_job(self):
+        impact = self.job_result(self.client.post('/simulate', json={'policy': FORBID_VIEW}))
+        self.assertEqual(impact['requests'], 3)
+        self.assertEqual(impact['flips']['allow_to_deny'], 3)
+
+    def test_approval_over_max_changes_is_blocked(self):
+        result = self.job_result(self.client.post('/approve', json={
+            'policy': FORBID_VIEW, 'requirement': 'test', 'simulate': True, 'max_changes': 2}))
+        self.assertEqual(result['status'], 'blocked')
+        self.assertEqual(self.approvals.get_approval_stats()['approved'], 1)
+
+        result = self.job_result(self.client.post('/approve', json={
+            'policy': FORBID_VIEW, 'requirement': 'test', 'simulate': True, 'max_changes': 3}))
+        self.assertEqual((result['status'], result['impact']['changed']), ('approved', 3))
+        self.assertEqual(self.approvals.get_approval_stats()['approved'], 2)
+
+    def test_invalid_max_changes(self):
+        for value in ('1', -1, True, 1.5):
+            with self.subTest(value=value):
+                response = self.client.post('/approve', json={'policy': FORBID_VIEW, 'simulate': True,
+                                                              'max_changes': value})
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('max_changes', response.get_json()['error'])
+
+    def test_unavailable_log(self):
+        for log, status in ((None, 400), (os.path.join(self.tmpdir.name, 'missing.jsonl'), 503)):
+            with mock.patch.object(web_app, 'SIMULATION_LOG', log):
+                for path, body in (('/simulate', {'policy': FORBID_VIEW}),
+                                   ('/approve', {'policy': FORBID_VIEW, 'simulate': True})):
+                    with self.subTest(log=log, path=path):
+                        response = self.client.post(path, json=body)
+                        self.assertEqual(response.status_code, status)
+                        self.assertIn('error', response.get_json())
+
+MFA_VIEW = 'permit (principal, action == Action::"ViewAccount", resource) when { context.mfa == true };'
+
+class TestResiduals(WebAppTestCase):
+    QUERY = '/residuals?principal=User::"alice"&action=Action::"ViewAccount"'
+
+    def test_context_is_folded_in(self):
+        self.approve(MFA_VIEW)
+        residuals = self.client.get(self.QUERY).get_json()
+        self.assertIsNone(residuals['decision'])
+        self.assertEqual(residuals['policies'][0]['conditions'], ['when { context.mfa == true }'])
+        self.assertEqual(self.client.get(self.QUERY + '&context={"mfa": true}').get_json()['decision'], 'allow')
+        self.assertEqual(self.client.get(self.QUERY + '&context={"mfa": false}').get_json()['decision'], 'deny')
+
+    def test_approvals_invalidate_the_residuals(self):
+        self.approve(MFA_VIEW)
+        first = self.client.get(self.QUERY)
+        self.assertEqual(self.client.get(self.QUERY, headers={'If-None-Match': first.headers['ETag']}).status_code, 304)
+        self.approve('forbid (principal == User::"alice", action, resource);')
+        changed = self.client.get(self.QUERY, headers={'If-None-Match': first.headers['ETag']})
+        self.assertEqual(changed.status_code, 200)
+        self.assertEqual(changed.get_json()['decision'], 'deny')
+
+    def test_invalid_arguments(self):
+        for query in ('/residuals?action=Action::"ViewAccount"', self.QUERY + '&context=[1]',
+                      self.QUERY + '&context={mfa'):
+            with self.subTest(query=query):
+                response = self.client.get(query)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('error', response.get_json())
+
+class TestCoverage(WebAppTestCase):
+    def test_approvals_update_the_report(self):
+        first = self.client.get('/coverage')
+        report = first.get_json()
+        self.assertEqual((report['actions']['total'], report['actions']['covered']), (4, 0))
+        self.assertEqual(self.client.get('/coverage', headers={'If-None-Match': first.headers['ETag']}).status_code, 304)
+
+        self.approve(VIEW_OWN)
+        changed = self.client.get('/coverage', headers={'If-None-Match': first.headers['ETag']})
+        self.assertEqual(changed.status_code, 200)
+        report = changed.get_json()
+        self.assertEqual(report['policies'], 1)
+        self.assertNotIn('ViewAccount', report['actions']['uncovered'])
+        self.assertNotIn('Account.ownerId', report['attributes']['uncovered'])
+
+if __name__ == '__main__':
+    unittest.main()
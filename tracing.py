@@ -0,0 +1,236 @@
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+
+TRACE_LOG = os.environ.get('TRACE_LOG', '').lower() in ('1', 'true', 'json')
+DEFAULT_PROFILE_OUTPUT = os.environ.get('PROFILE_OUTPUT', 'profile-{pid}.collapsed')
+DEFAULT_PROFILE_INTERVAL = float(os.environ.get('PROFILE_INTERVAL_SECONDS', 0.005))
+
+logger = logging.getLogger('policy_helper.trace')
+_current = ContextVar('trace', default=None)
+
+
+class Trace:
+    """Timed spans recorded while handling one request or CLI run"""
+
+    def __init__(self, name: str):
+        self.id = uuid.uuid4().hex[:16]
+        self.name = name
+        self.started = time.perf_counter()
+        self.duration = None
+        self.spans = []
+
+    def add(self, name: str, seconds: float):
+        self.spans.append((name, seconds))
+
+    def finish(self) -> float:
+        if self.duration is None:
+            self.duration = time.perf_counter() - self.started
+        return self.duration
+
+    def timings(self) -> Dict[str, float]:
+        """Milliseconds per span name, summed over repeats, plus ``total``"""
+        totals = {}
+        for name, seconds in self.spans:
+            totals[name] = totals.get(name, 0.0) + seconds
+        totals['total'] = self.finish()
+        return {name: round(seconds * 1000, 3) for name, seconds in totals.items()}
+
+    def server_timing(self) -> str:
+        """Value for the Server-Timing response header"""
+        return ', '.join(f'{name};dur={ms}' for name, ms in self.timings().items())
+
+    def to_dict(self) -> Dict:
+        return {'trace_id': self.id, 'name': self.name, 'timings_ms': self.timings()}
+
+
+def start_trace(name: str) -> Trace:
+    """Make a new trace current for this thread or task"""
+    trace = Trace(name)
+    _current.set(trace)
+    return trace
+
+
+def end_trace() -> Optional[Trace]:
+    """Finish the current trace, log it if TRACE_LOG is set, and return it"""
+    trace = _current.get()
+    if trace is None:
+        return None
+    _current.set(None)
+    trace.finish()
+    if TRACE_LOG:
+        logger.info(json.dumps(trace.to_dict()))
+    return trace
+
+
+def current_trace() -> Optional[Trace]:
+    return _current.get()
+
+
+@contextmanager
+def trace(name: str):
+    """Run the with-block under its own trace, restoring the previous one after"""
+    token = _current.set(Trace(name))
+    try:
+        yield _current.get()
+    finally:
+        t = _current.get()
+        _current.reset(token)
+        t.finish()
+        if TRACE_LOG:
+            logger.info(json.dumps(t.to_dict()))
+
+
+@contextmanager
+def span(name: str, histogram=None, **labels):
+    """Time the with-block as a span of the current trace.
+
+    The duration is also observed in ``histogram`` with ``labels`` when
+    given, so one timer feeds both the per-request breakdown and /metrics.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        t = _current.get()
+        if t is not None:
+            t.add(name, elapsed)
+        if histogram is not None:
+            histogram.observe(elapsed, **labels)
+
+
+class SamplingProfiler:
+    """Samples the stacks of selected threads into collapsed-stack counts.
+
+    A sampler thread reads the frames of the threads registered through
+    ``profile()`` every ``interval`` seconds. ``sample_rate`` is the fraction
+    of requests that get registered. Counts accumulate across requests and
+    are rewritten to ``output`` after each profiled request in the
+    ``frame;frame;frame count`` format read by flamegraph.pl and speedscope.
+    ``{pid}`` in ``output`` is filled in when the file is written, so each
+    worker forked from a preloaded app writes its own. The sampler only runs
+    while the profiler is enabled.
+    """
+
+    def __init__(self, output: str = None, interval: float = None):
+        self._output = output or DEFAULT_PROFILE_OUTPUT
+        self.interval = interval or DEFAULT_PROFILE_INTERVAL
+        self.enabled = False
+        self.sample_rate = 0.0
+        self.samples = 0
+        self.profiled_requests = 0
+        self._stacks = {}
+        self._threads = set()
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._sampler = None
+
+    def configure(self, enabled: bool, sample_rate: float = None, output: str = None):
+        with self._lock:
+            if sample_rate is not None:
+                self.sample_rate = min(max(float(sample_rate), 0.0), 1.0)
+            if output:
+                self._output = output
+            self.enabled = bool(enabled)
+        if self.enabled and (self._sampler is None or not self._sampler.is_alive()):
+            self._stop.clear()
+            self._sampler = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+            self._sampler.start()
+        elif not self.enabled:
+            self._stop.set()
+
+    @property
+    def output(self) -> str:
+        return self._output.format(pid=os.getpid())
+
+    def select(self, force: bool = False) -> bool:
+        """Start sampling the calling thread if this request is picked; returns whether it was"""
+        if not (force or (self.enabled and random.random() < self.sample_rate)):
+            return False
+        if force and (self._sampler is None or not self._sampler.is_alive()):
+            self.configure(True, self.sample_rate)
+        with self._lock:
+            self._threads.add(threading.get_ident())
+            self.profiled_requests += 1
+        return True
+
+    def release(self):
+        """Stop sampling the calling thread and write the accumulated stacks"""
+        with self._lock:
+            self._threads.discard(threading.get_ident())
+        self.flush()
+
+    @contextmanager
+    def profile(self, force: bool = False):
+        """Sample the calling thread during the with-block if it is selected"""
+        selected = self.select(force)
+        try:
+            yield selected
+        finally:
+            if selected:
+                self.release()
+
+    def sample_once(self):
+        frames = sys._current_frames()
+        with self._lock:
+            for ident in self._threads:
+                frame = frames.get(ident)
+                if frame is None:
+                    continue
+                stack = ';'.join(reversed(_frame_names(frame)))
+                self._stacks[stack] = self._stacks.get(stack, 0) + 1
+                self.samples += 1
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            if self._threads:
+                self.sample_once()
+
+    def flush(self):
+        with self._lock:
+            lines = [f'{stack} {count}\n' for stack, count in sorted(self._stacks.items())]
+            output = self.output
+        with self._write_lock:
+            tmp = f'{output}.tmp'
+            with open(tmp, 'w') as f:
+                f.writelines(lines)
+            os.replace(tmp, output)
+
+    def reset(self):
+        with self._lock:
+            self._stacks.clear()
+            self.samples = 0
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'sample_rate': self.sample_rate,
+                'interval_seconds': self.interval,
+                'output': self.output,
+                'profiled_requests': self.profiled_requests,
+                'samples': self.samples,
+                'distinct_stacks': len(self._stacks)
+            }
+
+
+def _frame_names(frame) -> List[str]:
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+        frame = frame.f_back
+    return names
+
+
+profiler = SamplingProfiler()
@@ -1,42 +1,402 @@
 #!/usr/bin/env python3
-from flask import Flask, render_template, request, jsonify, session
+from flask import Flask, Response, g, render_template, request, jsonify, session, url_for
 from policy_generator import PolicyGenerator
 from history_manager import HistoryManager
 from approval_manager import ApprovalManager
-from chat_session import ChatManager
+from chat_session import ChatManager, DEFAULT_MAX_MESSAGES
+from session_backends import create_session_backend
 from schema_validator import SchemaValidator
+from policy_search import PolicySearchIndex
+from job_queue import JobManager
+from scheduler import FairScheduler, QueueFullError
+from model_router import router
+from hedging import hedger
+from policy_bundle import collect_policies, pack, to_cedar
+from policy_simulator import approved_texts, simulate
+from policy_partial import PartialEvaluator, approved_policy_set
+from policy_engine import Entities, parse_uid
+from policy_coverage import ReferenceIndex, coverage
+from conversation_context import default_builder
+from metrics import REGISTRY, CONTENT_TYPE, HTTP_REQUEST_SECONDS, HTTP_REQUESTS
+from tracing import start_trace, end_trace, profiler
+from http_cache import (PayloadCache, GZIP_MIN_BYTES, accepts_gzip, build_payload, http_date, make_etag,
+                        not_modified, record_time)
+import gzip
+import hmac
+import math
 import os
+import signal
+import threading
+import time
 import uuid
 import json
 
 app = Flask(__name__)
 app.secret_key = 'policy-helper-secret-key'
-generator = PolicyGenerator('sample_banking_schema.json')
-history = HistoryManager()
-approval_manager = ApprovalManager()
-chat_manager = ChatManager()
 schema_validator = SchemaValidator()
+# Model calls from requests and background jobs share one fair queue
+scheduler = FairScheduler()
+job_manager = JobManager(scheduler=scheduler)
+# Escalation retries are extra model calls within one slot; each needs a spare global token
+router.admit = scheduler.take_extra
+hedger.admit = scheduler.take_extra
+payload_cache = PayloadCache()
+
+DEFAULT_SCHEMA = os.environ.get('POLICY_SCHEMA', 'sample_banking_schema.json')
+# Names the schema every worker should serve; rewritten on upload
+SCHEMA_POINTER = os.environ.get('SCHEMA_POINTER_FILE', 'active_schema')
+# Authorization log that /simulate and {"simulate": true} approvals replay
+SIMULATION_LOG = os.environ.get('APPROVAL_SIMULATION_LOG')
+SIMULATION_ENTITIES = os.environ.get('APPROVAL_SIMULATION_ENTITIES')
+SIMULATION_MAX_LINES = int(os.environ.get('APPROVAL_SIMULATION_MAX_LINES', 1000000))
+# Cedar entities /residuals reads principals and action groups from
+AUTHORIZATION_ENTITIES = os.environ.get('AUTHORIZATION_ENTITIES', SIMULATION_ENTITIES)
+
+# Schema and stores are loaded on first use so importing the app stays cheap
+_state = {}
+_state_lock = threading.RLock()
+ready = threading.Event()
+# Set by gunicorn.conf.py in each worker so a schema upload can reload them all
+server_pid = None
+
+def _lazy(name, factory):
+    value = _state.get(name)
+    if value is None:
+        with _state_lock:
+            value = _state.get(name)
+            if value is None:
+                value = _state[name] = factory()
+    return value
+
+def active_schema_path():
+    """Schema named by the pointer file, falling back to POLICY_SCHEMA"""
+    try:
+        with open(SCHEMA_POINTER) as f:
+            path = f.read().strip()
+        if path and os.path.exists(path):
+            return path
+    except FileNotFoundError:
+        pass
+    return DEFAULT_SCHEMA
+
+def get_generator():
+    return _lazy('generator', lambda: PolicyGenerator(active_schema_path()))
+
+def get_history_manager():
+    return _lazy('history', HistoryManager)
+
+def get_approval_manager():
+    return _lazy('approvals', ApprovalManager)
+
+def get_chat_manager():
+    def build():
+        manager = ChatManager(max_messages=DEFAULT_MAX_MESSAGES,
+                              backend=create_session_backend(max_messages=DEFAULT_MAX_MESSAGES))
+        manager.start_sweeper()
+        return manager
+    return _lazy('chat', build)
+
+def get_search_index():
+    return _lazy('search', lambda: PolicySearchIndex({
+        'history': get_history_manager().store,
+        'approvals': get_approval_manager().store
+    }))
+
+def get_reference_index():
+    return _lazy('references', ReferenceIndex)
+
+def get_partial_evaluator(version):
+    """Partial evaluator over the approved policies, rebuilt when the approvals change"""
+    current = _state.get('partial')
+    if current is None or current[0] != version:
+        with _state_lock:
+            current = _state.get('partial')
+            if current is None or current[0] != version:
+                entities = None
+                if AUTHORIZATION_ENTITIES:
+                    with open(AUTHORIZATION_ENTITIES) as f:
+                        entities = Entities(json.load(f))
+                evaluator = PartialEvaluator(approved_policy_set(get_approval_manager().store), entities)
+                current = _state['partial'] = (version, evaluator)
+    return current[1]
+
+def warm_up():
+    """Load the schema, stores and search index before serving.
+
+    Under gunicorn this runs in the master before it forks, so workers start
+    warm and share the loaded data copy-on-write.
+    """
+    get_generator().get_recommendations()
+    get_history_manager()
+    get_reference_index().refresh(get_approval_manager().store)
+    get_search_index()
+    ready.set()
+
+def reload_schema():
+    """Swap in a generator for the active schema, built before it replaces the old one"""
+    generator = PolicyGenerator(active_schema_path())
+    generator.get_recommendations()
+    with _state_lock:
+        _state['generator'] = generator
+
+def cached_json(key, version, build, last_modified=None, mimetype='application/json', encode=None,
+                memoize=True):
+    """Serve build()'s JSON with validators; 304 when the client copy is current.
+
+    The serialized (and gzipped) body is memoized until ``version`` changes.
+    ``encode`` turns build()'s result into bytes for non-JSON payloads.
+    With ``memoize=False`` the body is built for each response that needs
+    one and then dropped, for payloads too large to keep per key.
+    """
+    payload = payload_cache.get(key, version, build, last_modified, encode) if memoize else None
+    etag = payload.etag if payload else make_etag(key, version)
+    if not_modified(request.headers.get('If-None-Match'), request.headers.get('If-Modified-Since'),
+                    etag, last_modified):
+        response = Response(status=304)
+    else:
+        if payload is None:
+            payload = build_payload(etag, last_modified, build, encode)
+        if len(payload.body) >= GZIP_MIN_BYTES and accepts_gzip(request.headers.get('Accept-Encoding')):
+            response = Response(payload.gzipped(), mimetype=mimetype)
+            response.headers['Content-Encoding'] = 'gzip'
+        else:
+            response = Response(payload.body, mimetype=mimetype)
+    response.headers['ETag'] = etag
+    if last_modified is not None:
+        response.headers['Last-Modified'] = http_date(last_modified)
+    # Browsers revalidate on every poll and get a 304 while nothing changed
+    response.headers['Cache-Control'] = 'no-cache'
+    response.vary.add('Accept-Encoding')
+    return response
+
+def store_version(store):
+    """Record count and newest timestamp; both change on every append, in any worker"""
+    last = store.last_timestamp()
+    return (store.count(), last), record_time(last)
+
+def write_atomic(path, text):
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with open(tmp, 'w') as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+# Gauges are read only when /metrics is scraped
+REGISTRY.gauge('policy_store_records', 'Records in each policy store', lambda: {
+    ('history',): get_history_manager().count(),
+    ('approvals',): get_approval_manager().store.count()
+}, ('store',))
+REGISTRY.gauge('policy_store_status_records', 'Approval records by status',
+               lambda: {(status,): n for status, n in get_approval_manager().store.status_counts().items()}, ('status',))
+REGISTRY.gauge('chat_sessions_live', 'Live chat sessions', lambda: get_chat_manager().get_stats()['live_sessions'])
+REGISTRY.gauge('chat_sessions_bytes', 'Approximate bytes held by chat messages',
+               lambda: get_chat_manager().get_stats()['bytes_held'])
+REGISTRY.callback_counter('chat_context_cache_total', 'Chat context cache lookups by result', lambda: {
+    ('hit',): default_builder.cache_hits,
+    ('miss',): default_builder.cache_misses
+}, ('result',))
+REGISTRY.callback_counter('http_payload_cache_total', 'Memoized response payload lookups by result', lambda: {
+    ('hit',): payload_cache.hits,
+    ('miss',): payload_cache.misses
+}, ('result',))
+REGISTRY.gauge('search_index_documents', 'Documents in the history search index',
+               lambda: len(_state['search']) if 'search' in _state else None)
+REGISTRY.gauge('scheduler_queue_depth', 'Model calls waiting for a slot', lambda: scheduler.get_stats()['queue_depth'])
+REGISTRY.gauge('scheduler_in_flight', 'Model calls holding a slot', lambda: scheduler.get_stats()['in_flight'])
+
+def scheduler_rejections():
+    stats = scheduler.get_stats()
+    return {(reason,): stats[reason] for reason in ('rate_limited', 'queue_full', 'timed_out')}
+
+REGISTRY.callback_counter('scheduler_rejections_total', 'Requests refused by the scheduler by reason',
+                          scheduler_rejections, ('reason',))
+REGISTRY.gauge('jobs_running', 'Background jobs running', lambda: job_manager.get_stats()['running'])
+
+@app.before_request
+def start_timer():
+    g.request_start = time.perf_counter()
+    start_trace(request.endpoint or 'unmatched')
+    g.profiled = profiler.select()
+
+@app.after_request
+def record_request(response):
+    start = g.pop('request_start', None)
+    if start is not None:
+        # Route names rather than paths keep label values bounded
+        endpoint = request.endpoint or 'unmatched'
+        HTTP_REQUEST_SECONDS.observe(time.perf_counter() - start, endpoint=endpoint, method=request.method)
+        HTTP_REQUESTS.inc(endpoint=endpoint, method=request.method, status=response.status_code)
+    trace = end_trace()
+    if trace is not None:
+        response.headers['Server-Timing'] = trace.server_timing()
+    return response
+
+@app.after_request
+def compress_response(response):
+    """gzip large JSON bodies for clients that accept it"""
+    if (response.status_code != 200 or response.direct_passthrough or response.mimetype != 'application/json'
+            or 'Content-Encoding' in response.headers):
+        return response
+    response.vary.add('Accept-Encoding')
+    if not accepts_gzip(request.headers.get('Accept-Encoding')):
+        return response
+    body = response.get_data()
+    if len(body) >= GZIP_MIN_BYTES:
+        response.set_data(gzip.compress(body, compresslevel=6))
+        response.headers['Content-Encoding'] = 'gzip'
+    return response
+
+@app.teardown_request
+def stop_profiling(error=None):
+    if g.pop('profiled', False):
+        profiler.release()
+
+def is_admin():
+    """Admin routes need the X-Admin-Token header to match ADMIN_TOKEN; without it they are off"""
+    token = os.environ.get('ADMIN_TOKEN')
+    return bool(token) and hmac.compare_digest(request.headers.get('X-Admin-Token', ''), token)
+
+def wants_async():
+    """Whether the client asked for a job id instead of waiting for the model"""
+    if request.args.get('async') in ('1', 'true'):
+        return True
+    return bool((request.get_json(silent=True) or {}).get('async'))
+
+def client_key():
+    """Fair-queuing key: the chat session if there is one, else the client address"""
+    return session.get('chat_id') or request.remote_addr or 'anonymous'
+
+def too_busy(error):
+    """429 with Retry-After for requests refused by the scheduler"""
+    retry_after = math.ceil(error.retry_after)
+    response = jsonify({'error': str(error), 'retry_after': retry_after})
+    return response, 429, {'Retry-After': str(retry_after)}
+
+def submit_job(fn, *args, kind='generate'):
+    """Queue fn as a background job and answer 202 with its status URL"""
+    try:
+        job = job_manager.submit(fn, *args, kind=kind, key=client_key())
+    except QueueFullError as e:
+        return too_busy(e)
+    response = jsonify({
+        'job_id': job.id,
+        'status': job.status,
+        'status_url': url_for('get_job', job_id=job.id),
+        'events_url': url_for('job_events', job_id=job.id)
+    })
+    return response, 202
+
+def latency_budget():
+    """(seconds from the request's latency_budget_ms or None for the router default, error response)"""
+    value = (request.get_json(silent=True) or {}).get('latency_budget_ms')
+    if value is None:
+        return None, None
+    try:
+        if isinstance(value, bool):
+            raise ValueError
+        milliseconds = float(value)
+    except (TypeError, ValueError):
+        milliseconds = math.nan
+    if not (math.isfinite(milliseconds) and milliseconds >= 0):
+        return None, (jsonify({'error': 'latency_budget_ms must be a non-negative number'}), 400)
+    return (milliseconds / 1000 or None), None
+
+def generate_result(requirement, budget=None):
+    result = get_generator().generate_and_validate_policy(requirement, latency_budget=budget)
+    return {
+        'policy': result['policy'],
+        'rationale': result['rationale'],
+        'validation': result['validation'],
+        'routing': result['routing']
+    }
+
+def chat_reply(chat_session, message, budget=None):
+    # Add user message to session
+    chat_session.add_message('user', message)
+    
+    # Get conversation context
+    context = chat_session.get_conversation_context()
+    
+    # Generate policy with context
+    result = get_generator().generate_and_validate_policy(message, context, latency_budget=budget)
+    
+    # Add assistant response to session
+    chat_session.add_message('assistant', f"Policy: {result['policy']}")
+    
+    return {
+        'policy': result['policy'],
+        'rationale': result['rationale'],
+        'validation': result['validation'],
+        'routing': result['routing'],
+        'session_id': chat_session.session_id
+    }
 
 @app.route('/')
 def index():
     return render_template('enhanced_index.html')
 
+@app.route('/ready')
+def readiness():
+    """Readiness probe: 503 until the schema and stores are loaded"""
+    if not ready.is_set():
+        return jsonify({'status': 'warming up'}), 503
+    return jsonify({'status': 'ready'})
+
+def schema_coverage():
+    """(build, version, last modified) for the active schema's coverage by approved policies.
+
+    The reference index only reads approvals recorded since it was last
+    refreshed, so building after an approval costs one policy, not all.
+    """
+    generator = get_generator()
+    store = get_approval_manager().store
+    index = get_reference_index()
+    version, last_modified = store_version(store)
+
+    def build():
+        index.refresh(store)
+        return coverage(generator.parser.get_schema_context(), index)
+
+    modified = [t for t in (last_modified, generator.parser.modified) if t is not None]
+    return build, (generator.parser.fingerprint, version), max(modified) if modified else None
+
 @app.route('/recommendations')
 def get_recommendations():
-    """Get policy recommendations based on schema"""
+    """Get policy recommendations based on schema.
+
+    ``?coverage=1`` returns only those that would govern schema elements no
+    approved policy covers yet, each with the elements it ``covers``.
+    """
     try:
-        recommendations = generator.get_recommendations()
-        return jsonify({'recommendations': recommendations})
+        generator = get_generator()
+        if request.args.get('coverage'):
+            build, version, last_modified = schema_coverage()
+            return cached_json(('recommendations', 'coverage'), version,
+                               lambda: {'recommendations': generator.get_recommendations(build())},
+                               last_modified)
+        return cached_json(('recommendations',), generator.parser.fingerprint,
+                           lambda: {'recommendations': generator.get_recommendations()},
+                           generator.parser.modified)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/coverage')
+def get_coverage():
+    """Schema actions, entity types and attributes that no approved policy governs"""
+    build, version, last_modified = schema_coverage()
+    return cached_json(('coverage',), version, build, last_modified)
+
 @app.route('/chat/start', methods=['POST'])
 def start_chat():
     """Start new chat session"""
-    session_id = chat_manager.create_session()
+    session_id = get_chat_manager().create_session()
     session['chat_id'] = session_id
     return jsonify({'session_id': session_id})
 
+@app.route('/chat/stats')
+def chat_stats():
+    """Get live chat session gauges"""
+    return jsonify(get_chat_manager().get_stats())
+
 @app.route('/chat/message', methods=['POST'])
 def chat_message():
     """Process chat message"""
@@ -48,28 +408,19 @@ def chat_message():
         if not session_id:
             return jsonify({'error': 'No active chat session'}), 400
         
-        chat_session = chat_manager.get_session(session_id)
+        chat_session = get_chat_manager().get_session(session_id)
         if not chat_session:
             return jsonify({'error': 'Chat session not found'}), 404
         
-        # Add user message to session
-        chat_session.add_message('user', message)
-        
-        # Get conversation context
-        context = chat_session.get_conversation_context()
-        
-        # Generate policy with context
-        result = generator.generate_and_validate_policy(message, context)
-        
-        # Add assistant response to session
-        chat_session.add_message('assistant', f"Policy: {result['policy']}")
-        
-        return jsonify({
-            'policy': result['policy'],
-            'rationale': result['rationale'],
-            'validation': result['validation'],
-            'session_id': session_id
-        })
+        budget, error = latency_budget()
+        if error:
+            return error
+        if wants_async():
+            return submit_job(chat_reply, chat_session, message, budget, kind='chat')
+        with scheduler.slot(client_key()):
+            return jsonify(chat_reply(chat_session, message, budget))
+    except QueueFullError as e:
+        return too_busy(e)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -87,16 +438,16 @@ def upload_schema():
         if not is_valid:
             return jsonify({'error': error_msg}), 400
         
-        # Save uploaded schema
-        with open('uploaded_schema.json', 'w') as f:
-            if isinstance(schema_data, str):
-                f.write(schema_data)
-            else:
-                json.dump(schema_data, f, indent=2)
+        # Save uploaded schema and make it the one every worker serves
+        write_atomic('uploaded_schema.json', schema_data if isinstance(schema_data, str)
+                     else json.dumps(schema_data, indent=2))
+        write_atomic(SCHEMA_POINTER, 'uploaded_schema.json')
         
         # Reload generator with new schema
-        global generator
-        generator = PolicyGenerator('uploaded_schema.json')
+        reload_schema()
+        if server_pid:
+            # gunicorn replaces every worker gracefully; see on_reload in gunicorn.conf.py
+            os.kill(server_pid, signal.SIGHUP)
         
         return jsonify({
             'status': 'Schema uploaded successfully',
@@ -113,32 +464,85 @@ def generate_policy():
         if not requirement:
             return jsonify({'error': 'Requirement is required'}), 400
         
-        # Generate and validate policy
-        result = generator.generate_and_validate_policy(requirement)
+        budget, error = latency_budget()
+        if error:
+            return error
         
-        return jsonify({
-            'policy': result['policy'],
-            'rationale': result['rationale'],
-            'validation': result['validation']
-        })
+        # Generate and validate policy
+        if wants_async():
+            return submit_job(generate_result, requirement, budget)
+        with scheduler.slot(client_key()):
+            return jsonify(generate_result(requirement, budget))
+    except QueueFullError as e:
+        return too_busy(e)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def simulation_unavailable():
+    """Error response when no authorization log can be replayed, else None"""
+    if not SIMULATION_LOG:
+        return jsonify({'error': 'No authorization log configured (APPROVAL_SIMULATION_LOG)'}), 400
+    if not os.access(SIMULATION_LOG, os.R_OK):
+        return jsonify({'error': f'Authorization log {SIMULATION_LOG} cannot be read'}), 503
+    return None
+
+def simulate_impact(policy):
+    """Replay SIMULATION_LOG against the approved set with and without ``policy``.
+
+    A replay can take longer than a request may, so this runs as a job.
+    """
+    try:
+        return simulate(SIMULATION_LOG, approved_texts(get_approval_manager().store), policy,
+                        SIMULATION_ENTITIES, max_lines=SIMULATION_MAX_LINES)
+    except ValueError as e:
+        raise ValueError(f'Cannot simulate policy: {e}') from e
+    except OSError as e:
+        raise OSError(f'Cannot read authorization log: {e}') from e
+
+def approve_with_impact(policy_data, feedback, max_changes):
+    """Simulate, then approve unless more than ``max_changes`` logged decisions would change"""
+    impact = simulate_impact(policy_data.get('policy', ''))
+    if max_changes is not None and impact['changed'] > max_changes:
+        return {
+            'status': 'blocked',
+            'error': f"Policy would change {impact['changed']} logged decisions (limit {max_changes})",
+            'impact': impact
+        }
+    approval_id, _ = get_approval_manager().approve_with_history(policy_data, get_history_manager(), feedback)
+    return {'status': 'approved', 'approval_id': approval_id, 'impact': impact}
+
+@app.route('/simulate', methods=['POST'])
+def simulate_policy():
+    """Decisions in the authorization log that approving the policy would change, as a job"""
+    error = simulation_unavailable()
+    if error:
+        return error
+    return submit_job(simulate_impact, (request.get_json(silent=True) or {}).get('policy', ''), kind='simulate')
+
 @app.route('/approve', methods=['POST'])
 def approve_policy():
-    """Approve a generated policy"""
+    """Approve a generated policy.
+
+    With ``"simulate": true`` the policy is first replayed against the
+    authorization log in a job (202), and with ``"max_changes": N`` the
+    job does not approve it (status ``blocked``) when more than N logged
+    decisions would change.
+    """
     try:
         policy_data = request.json
         feedback = policy_data.get('feedback', '')
+        if policy_data.get('simulate'):
+            max_changes = policy_data.get('max_changes')
+            if max_changes is not None and (isinstance(max_changes, bool) or not isinstance(max_changes, int)
+                                            or max_changes < 0):
+                return jsonify({'error': 'max_changes must be a non-negative integer'}), 400
+            error = simulation_unavailable()
+            if error:
+                return error
+            return submit_job(approve_with_impact, policy_data, feedback, max_changes, kind='approve')
         
-        approval_id = approval_manager.approve_policy(policy_data, feedback)
-        
-        # Also save to history for backward compatibility
-        history.save_policy(
-            policy_data.get('requirement', ''),
-            policy_data.get('policy', ''),
-            policy_data.get('rationale', [])
-        )
+        # Approval and history entry are written together
+        approval_id, _ = get_approval_manager().approve_with_history(policy_data, get_history_manager(), feedback)
         
         return jsonify({
             'status': 'approved',
@@ -147,6 +551,27 @@ def approve_policy():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/residuals')
+def get_residuals():
+    """Approved policies left for ?principal= and ?action=, simplified to what depends on the resource.
+
+    ``?context=`` (a JSON record) is folded in too; without it, conditions
+    on the context stay in the residuals.
+    """
+    try:
+        principal = parse_uid(request.args.get('principal', ''))
+        action = parse_uid(request.args.get('action', ''))
+        context = json.loads(request.args['context']) if request.args.get('context') else None
+        if context is not None and not isinstance(context, dict):
+            raise ValueError('context must be a JSON object')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    version, last_modified = store_version(get_approval_manager().store)
+    evaluator = get_partial_evaluator(version)
+    key = ('residuals', principal, action, request.args.get('context'))
+    return cached_json(key, version, lambda: evaluator.residuals(principal, action, context).to_dict(),
+                       last_modified)
+
 @app.route('/reject', methods=['POST'])
 def reject_policy():
     """Reject a generated policy"""
@@ -154,7 +579,7 @@ def reject_policy():
         policy_data = request.json
         reason = policy_data.get('reason', 'No reason provided')
         
-        rejection_id = approval_manager.reject_policy(policy_data, reason)
+        rejection_id = get_approval_manager().reject_policy(policy_data, reason)
         
         return jsonify({
             'status': 'rejected',
@@ -166,14 +591,139 @@ def reject_policy():
 @app.route('/stats')
 def get_stats():
     """Get approval statistics"""
-    return jsonify(approval_manager.get_approval_stats())
+    approval_manager = get_approval_manager()
+    version, last_modified = store_version(approval_manager.store)
+    return cached_json(('stats',), version, approval_manager.get_approval_stats, last_modified)
+
+@app.route('/bundle')
+def get_bundle():
+    """Approved policies compiled into a bundle: binary by default, ?format=cedar for text.
+
+    ``?since=<version>`` returns only the changes since that bundle version.
+    Both forms carry their own version (the binary header, the Cedar
+    header comment) to pass as ``since`` next time.
+    """
+    since = request.args.get('since')
+    if since is not None:
+        try:
+            since = int(since)
+        except ValueError:
+            since = -1
+        if since < 0:
+            return jsonify({'error': 'since must be a non-negative integer'}), 400
+    fmt = request.args.get('format', 'binary')
+    if fmt not in ('binary', 'cedar'):
+        return jsonify({'error': 'format must be binary or cedar'}), 400
+    store = get_approval_manager().store
+    version, last_modified = store_version(store)
+
+    def build():
+        policies, bundle_version = collect_policies(store, since)
+        if fmt == 'cedar':
+            return to_cedar(policies, bundle_version, since or 0).encode('utf-8')
+        return pack(policies, bundle_version, since or 0)
+
+    # Bundles grow with the policy set and differ per since, so they are not memoized
+    return cached_json(('bundle', since, fmt), version, build, last_modified,
+                       mimetype='text/plain' if fmt == 'cedar' else 'application/octet-stream',
+                       encode=bytes, memoize=False)
 
 @app.route('/history')
 def get_history():
-    return jsonify(history.get_history())
+    """Get one page of policy history, optionally filtered by status and time"""
+    try:
+        cursor = request.args.get('cursor', type=int)
+        limit = min(request.args.get('limit', 100, type=int), 1000)
+        status = request.args.get('status')
+        since = request.args.get('since')
+        history = get_history_manager()
+        version, last_modified = store_version(history.store)
+        
+        def build():
+            entries, next_cursor = history.query_history(status=status, since=since, cursor=cursor, limit=limit)
+            return {
+                'history': entries,
+                'next_cursor': next_cursor,
+                'total': history.count()
+            }
+        
+        return cached_json(('history', cursor, limit, status, since), version, build, last_modified)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/jobs/<job_id>')
+def get_job(job_id):
+    """Poll a background generation job"""
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job.to_dict())
+
+@app.route('/jobs/<job_id>/events')
+def job_events(job_id):
+    """Server-sent events stream that ends when the job finishes"""
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    
+    def stream():
+        yield f"event: status\ndata: {json.dumps(job.to_dict())}\n\n"
+        while not job.done.wait(15):
+            yield ": keep-alive\n\n"
+        yield f"event: {job.status}\ndata: {json.dumps(job.to_dict())}\n\n"
+    
+    return Response(stream(), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache'})
+
+@app.route('/jobs/stats')
+def job_stats():
+    """Job and scheduler queue depth, wait time and run time"""
+    return jsonify(job_manager.get_stats())
+
+@app.route('/models/stats')
+def model_stats():
+    """Per-route model latency, validation pass rate, escalations and hedging"""
+    return jsonify({**router.get_stats(), 'hedging': hedger.get_stats()})
+
+@app.route('/metrics')
+def metrics():
+    """Prometheus text-format metrics for this worker process"""
+    return Response(REGISTRY.render(), mimetype=None, content_type=CONTENT_TYPE)
+
+@app.route('/admin/profiler', methods=['GET', 'POST'])
+def admin_profiler():
+    """Show or change the sampling profiler settings for this worker"""
+    if not is_admin():
+        return jsonify({'error': 'Forbidden'}), 403
+    if request.method == 'POST':
+        data = request.get_json(silent=True) or {}
+        profiler.configure(
+            enabled=data.get('enabled', profiler.enabled),
+            sample_rate=data.get('sample_rate')
+        )
+        if data.get('reset'):
+            profiler.reset()
+    return jsonify(profiler.get_stats())
+
+@app.route('/history/search')
+def search_history():
+    """Ranked full-text search over history and approvals with facets"""
+    try:
+        return jsonify(get_search_index().search(
+            query=request.args.get('q', ''),
+            status=request.args.get('status'),
+            source=request.args.get('source'),
+            action=request.args.get('action'),
+            entity_type=request.args.get('entity_type'),
+            since=request.args.get('since'),
+            until=request.args.get('until'),
+            limit=min(request.args.get('limit', 20, type=int), 200)
+        ))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
 
 if __name__ == '__main__':
-    import os
+    # Development server; production uses gunicorn (see gunicorn.conf.py)
     port = int(os.environ.get('PORT', 5000))
     debug = os.environ.get('FLASK_ENV') != 'production'
+    warm_up()
     app.run(host='0.0.0.0', port=port, debug=debug)
\ No newline at end of file
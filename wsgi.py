@@ -0,0 +1,9 @@
+#!/usr/bin/env python3
+"""WSGI entry point for production servers.
+
+Loads the schema and stores at import, so with gunicorn's preload_app the
+work is done once in the master before the workers are forked.
+"""
+from web_app import app, warm_up
+
+warm_up()